@@ -9,7 +9,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.utils import timezone
-from django.core.mail import send_mail, EmailMultiAlternatives
+from base.emails import mettre_en_file
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
@@ -284,26 +284,21 @@ Cordialement,
 L'équipe ERP MEA
 """
             
-            # Envoyer l'email
-            try:
-                send_mail(
-                    subject='Réinitialisation de votre mot de passe - ERP MEA',
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email],
-                    fail_silently=False,
-                )
-                
-                messages.success(request, f'Un email de réinitialisation a été envoyé à {email}. Veuillez vérifier votre boîte de réception.')
-            except Exception as e:
-                messages.error(request, f'Erreur lors de l\'envoi de l\'email. Veuillez réessayer plus tard.')
-                print(f"Erreur d'envoi d'email : {e}")
+            # Mettre l'email en file d'envoi (envoyé par la commande envoyer_emails)
+            mettre_en_file(
+                sujet='Réinitialisation de votre mot de passe - ERP MEA',
+                corps=message,
+                destinataires=[user.email],
+                expediteur=settings.DEFAULT_FROM_EMAIL,
+            )
+            
+            messages.success(request, f'Un email de réinitialisation va être envoyé à {email} dans quelques instants. Veuillez vérifier votre boîte de réception.')
             
             return redirect('accounts:login')
         
         except User.DoesNotExist:
             # Ne pas révéler si l'email existe ou non (sécurité)
-            messages.success(request, 'Si cet email existe dans notre système, un lien de réinitialisation a été envoyé.')
+            messages.success(request, 'Si cet email existe dans notre système, un lien de réinitialisation va lui être envoyé.')
             return redirect('accounts:login')
     
     return render(request, 'accounts/mot_de_passe_oublie.jinja')
@@ -1,7 +1,7 @@
 # achats/admin.py - Administration basique du module achats
 
 from django.contrib import admin
-from .models import CommandeAchat, LigneCommandeAchat, PaiementFournisseur
+from .models import CommandeAchat, LigneCommandeAchat, PaiementFournisseur, PerformanceFournisseurMensuelle, PrixAchatFournisseur
 
 
 class LigneCommandeAchatInline(admin.TabularInline):
@@ -60,4 +60,32 @@ class PaiementFournisseurAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not change:
             obj.utilisateur = request.user
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(PerformanceFournisseurMensuelle)
+class PerformanceFournisseurMensuelleAdmin(admin.ModelAdmin):
+    """Indicateurs fournisseurs (lecture seule : tenus à jour par les réceptions)"""
+    list_display = ['fournisseur', 'mois', 'nb_commandes_livrees', 'nb_livraisons_a_temps', 'quantite_commandee', 'quantite_recue', 'montant_recu']
+    list_filter = ['mois']
+    search_fields = ['fournisseur__nom', 'fournisseur__code']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PrixAchatFournisseur)
+class PrixAchatFournisseurAdmin(admin.ModelAdmin):
+    """Index des prix d'achat (lecture seule : tenu à jour par les confirmations et réceptions)"""
+    list_display = ['fournisseur', 'produit', 'dernier_prix', 'date_dernier_prix', 'prix_min', 'prix_moyen']
+    list_filter = ['fournisseur']
+    search_fields = ['fournisseur__nom', 'produit__nom', 'produit__code']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
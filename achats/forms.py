@@ -1,6 +1,7 @@
 # achats/forms.py - Formulaires du module achats
 
 from django import forms
+from django.conf import settings
 from django.forms import inlineformset_factory
 from django.utils import timezone
 from decimal import Decimal
@@ -349,6 +350,66 @@ class PaiementFournisseurForm(forms.ModelForm):
         return date_paiement
 
 
+class ReglementFournisseursForm(forms.Form):
+    """Formulaire pour régler en une fois les échéances fournisseurs sélectionnées"""
+    
+    date_paiement = forms.DateField(
+        required=True,
+        widget=forms.DateInput(attrs={
+            'type': 'date',
+            'class': 'form-control',
+        }),
+        label='Date de paiement *'
+    )
+    
+    mode_paiement = forms.ChoiceField(
+        choices=PaiementFournisseur.MODES_PAIEMENT,
+        initial='VIREMENT',
+        widget=forms.Select(attrs={
+            'class': 'form-select',
+        }),
+        label='Mode de paiement *'
+    )
+    
+    banque = forms.ModelChoiceField(
+        queryset=None,
+        required=True,
+        widget=forms.Select(attrs={
+            'class': 'form-select',
+        }),
+        label='Banque *',
+        help_text='Compte bancaire débité du règlement'
+    )
+    
+    reference = forms.CharField(
+        max_length=100,
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'N° de remise, d\'ordre de virement... (optionnel)'
+        }),
+        label='Référence'
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        from comptabilite.models import Banque
+        
+        self.fields['banque'].queryset = Banque.objects.filter(est_actif=True).order_by('nom')
+        self.fields['date_paiement'].initial = timezone.now().date()
+    
+    def clean_date_paiement(self):
+        """Valide que la date de paiement n'est pas dans le futur"""
+        date_paiement = self.cleaned_data.get('date_paiement')
+        
+        if date_paiement and date_paiement > timezone.now().date():
+            raise forms.ValidationError(
+                "La date de paiement ne peut pas être dans le futur."
+            )
+        
+        return date_paiement
+
+
 class FiltreCommandeAchatForm(forms.Form):
     """Formulaire pour filtrer les commandes d'achat"""
     
@@ -428,10 +489,10 @@ class ImporterCommandeForm(forms.Form):
         required=True,
         widget=forms.FileInput(attrs={
             'class': 'form-control',
-            'accept': '.csv,.xlsx,.xls',
+            'accept': '.csv,.xlsx',
         }),
         label='Fichier à importer *',
-        help_text='Formats acceptés : CSV, Excel (XLSX, XLS)'
+        help_text='Formats acceptés : CSV (UTF-8, séparateur , ou ;), Excel (XLSX)'
     )
     
     type_fichier = forms.ChoiceField(
@@ -464,22 +525,38 @@ class ImporterCommandeForm(forms.Form):
         help_text='Entrepôt de destination pour tous les produits'
     )
     
+    EXTENSIONS = {
+        'csv': '.csv',
+        'excel': '.xlsx',
+    }
+    
     def clean_fichier(self):
         """Valide le fichier uploadé"""
         fichier = self.cleaned_data.get('fichier')
         
         if fichier:
-            # Vérifier la taille (max 5MB)
-            if fichier.size > 5 * 1024 * 1024:
-                raise forms.ValidationError("Le fichier ne doit pas dépasser 5 MB.")
+            # Le fichier est lu par lots (achats/importation.py) : la limite
+            # protège seulement l'espace disque des fichiers temporaires
+            taille_max = settings.ACHATS_IMPORT_TAILLE_MAX_MO
+            if fichier.size > taille_max * 1024 * 1024:
+                raise forms.ValidationError(f"Le fichier ne doit pas dépasser {taille_max} MB.")
             
             # Vérifier l'extension
             nom_fichier = fichier.name.lower()
-            extensions_valides = ['.csv', '.xlsx', '.xls']
             
-            if not any(nom_fichier.endswith(ext) for ext in extensions_valides):
+            if not any(nom_fichier.endswith(ext) for ext in self.EXTENSIONS.values()):
                 raise forms.ValidationError(
-                    "Format de fichier non supporté. Utilisez CSV ou Excel."
+                    "Format de fichier non supporté. Utilisez CSV ou Excel (XLSX)."
                 )
         
-        return fichier
\ No newline at end of file
+        return fichier
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        fichier = cleaned_data.get('fichier')
+        type_fichier = cleaned_data.get('type_fichier')
+        
+        if fichier and type_fichier and not fichier.name.lower().endswith(self.EXTENSIONS[type_fichier]):
+            self.add_error('type_fichier', "Le type choisi ne correspond pas à l'extension du fichier.")
+        
+        return cleaned_data
@@ -0,0 +1,259 @@
+# achats/importation.py
+"""
+Import d'une commande d'achat depuis un fichier CSV ou XLSX.
+
+Le fichier est lu ligne à ligne (csv.reader / openpyxl en lecture seule) et
+traité par lots de TAILLE_LOT lignes : pour chaque lot, les produits sont
+résolus en une requête (in_bulk sur le code) et les lignes créées en un seul
+bulk_create. La mémoire utilisée dépend donc de la taille d'un lot et non de
+celle du fichier. Les totaux de la commande sont calculés une seule fois à
+la fin.
+
+L'import est tout ou rien : si une ligne est en erreur, rien n'est
+enregistré et le rapport indique, pour chaque ligne rejetée, son numéro dans
+le fichier et la raison.
+
+Colonnes attendues (première ligne du fichier, ordre libre) :
+code (obligatoire), quantite (obligatoire), prix_unitaire et taux_tva
+(facultatifs : prix d'achat et TVA du produit par défaut), notes.
+"""
+
+import csv
+import io
+import itertools
+import unicodedata
+from zipfile import BadZipFile
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from stock.models import Produit
+from stock.tarifs import invalider_tarifs
+from .models import CommandeAchat, LigneCommandeAchat
+
+TAILLE_LOT = 1000
+MAX_ERREURS_RAPPORT = 500
+
+# Intitulés de colonnes acceptés (après normalisation) -> champ
+COLONNES = {
+    'code': 'code',
+    'code_produit': 'code',
+    'reference': 'code',
+    'quantite': 'quantite',
+    'qte': 'quantite',
+    'prix_unitaire': 'prix_unitaire',
+    'prix_achat': 'prix_unitaire',
+    'prix': 'prix_unitaire',
+    'taux_tva': 'taux_tva',
+    'tva': 'taux_tva',
+    'notes': 'notes',
+}
+
+
+class ErreurImport(Exception):
+    """Fichier inexploitable (format, en-tête, encodage)"""
+
+
+class RapportImport:
+    """Résultat d'un import : la commande créée (ou None) et les lignes rejetées"""
+
+    def __init__(self):
+        self.commande = None
+        self.lignes_lues = 0
+        self.lignes_importees = 0
+        self.nb_erreurs = 0
+        self.erreurs = []  # [(numéro de ligne dans le fichier, message)]
+
+    def ajouter_erreur(self, numero, message):
+        self.nb_erreurs += 1
+        if len(self.erreurs) < MAX_ERREURS_RAPPORT:
+            self.erreurs.append((numero, message))
+
+    @property
+    def reussi(self):
+        return self.commande is not None
+
+
+# ========== LECTURE DU FICHIER ==========
+
+def _normaliser(intitule):
+    texte = unicodedata.normalize('NFKD', str(intitule or '')).encode('ascii', 'ignore').decode()
+    return texte.strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def _lire_csv(fichier):
+    texte = io.TextIOWrapper(fichier, encoding='utf-8-sig', newline='')
+    premiere = texte.readline()
+    separateur = ';' if premiere.count(';') > premiere.count(',') else ','
+    return csv.reader(itertools.chain([premiere], texte), delimiter=separateur)
+
+
+def _lire_xlsx(fichier):
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        classeur = load_workbook(fichier, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException, KeyError):
+        raise ErreurImport("Le fichier n'est pas un classeur Excel (XLSX) valide.")
+    try:
+        yield from classeur.active.iter_rows(values_only=True)
+    finally:
+        classeur.close()
+
+
+def lire_lignes(fichier, type_fichier):
+    """
+    Itère sur les lignes de données du fichier : (numéro de ligne, {champ: valeur}).
+    Les lignes vides sont ignorées.
+    """
+    try:
+        lignes = _lire_csv(fichier) if type_fichier == 'csv' else _lire_xlsx(fichier)
+        entete = next(iter(lignes), None)
+        if entete is None:
+            raise ErreurImport("Le fichier est vide.")
+
+        champs = [COLONNES.get(_normaliser(intitule)) for intitule in entete]
+        manquants = {'code', 'quantite'} - set(champs)
+        if manquants:
+            raise ErreurImport(
+                f"Colonne(s) obligatoire(s) absente(s) de l'en-tête : {', '.join(sorted(manquants))}."
+            )
+
+        for numero, valeurs in enumerate(lignes, start=2):
+            ligne = {
+                champ: valeur for champ, valeur in zip(champs, valeurs)
+                if champ and valeur not in (None, '')
+            }
+            if ligne:
+                yield numero, ligne
+    except UnicodeDecodeError:
+        raise ErreurImport("Le fichier CSV doit être encodé en UTF-8.")
+
+
+# ========== CONVERSION DES VALEURS ==========
+
+def _texte(valeur):
+    if isinstance(valeur, float) and valeur.is_integer():
+        valeur = int(valeur)
+    return str(valeur).strip()
+
+
+def _decimal(valeur, libelle):
+    try:
+        nombre = Decimal(_texte(valeur).replace('\u00a0', '').replace(' ', '').replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"{libelle} invalide : « {valeur} »")
+    if not nombre.is_finite():
+        raise ValueError(f"{libelle} invalide : « {valeur} »")
+    if nombre < 0:
+        raise ValueError(f"{libelle} négatif : {valeur}")
+    return nombre
+
+
+def _quantite(valeur):
+    quantite = _decimal(valeur, 'Quantité')
+    if quantite != quantite.to_integral_value() or quantite < 1:
+        raise ValueError(f"Quantité invalide : « {valeur} » (entier ≥ 1 attendu)")
+    return int(quantite)
+
+
+def _construire_ligne(commande, valeurs, produits):
+    code = _texte(valeurs.get('code', ''))
+    if not code:
+        raise ValueError("Code produit manquant")
+
+    produit = produits.get(code)
+    if produit is None:
+        raise ValueError(f"Produit inconnu : {code}")
+    if not produit.est_actif:
+        raise ValueError(f"Produit inactif : {code}")
+    if 'quantite' not in valeurs:
+        raise ValueError("Quantité manquante")
+
+    return LigneCommandeAchat(
+        commande=commande,
+        produit=produit,
+        quantite=_quantite(valeurs['quantite']),
+        prix_unitaire=(
+            _decimal(valeurs['prix_unitaire'], 'Prix unitaire').quantize(Decimal('0.01'))
+            if 'prix_unitaire' in valeurs else produit.prix_achat
+        ),
+        taux_tva=(
+            _decimal(valeurs['taux_tva'], 'Taux de TVA').quantize(Decimal('0.01'))
+            if 'taux_tva' in valeurs else produit.taux_tva
+        ),
+        notes=_texte(valeurs.get('notes', '')),
+    )
+
+
+# ========== IMPORT ==========
+
+def importer_commande(fichier, type_fichier, fournisseur, entrepot, utilisateur=None, taille_lot=TAILLE_LOT):
+    """
+    Crée une commande d'achat (brouillon) à partir du fichier et retourne un
+    RapportImport. `fichier` est un fichier binaire ouvert (UploadedFile).
+    """
+    rapport = RapportImport()
+    produits_importes = {}  # produit_id -> numéro de la ligne qui l'a importé
+
+    with transaction.atomic():
+        commande = CommandeAchat.objects.create(
+            fournisseur=fournisseur,
+            entrepot=entrepot,
+            cree_par=utilisateur,
+            statut='BROUILLON',
+            notes=f"Importée depuis {getattr(fichier, 'name', 'un fichier')}",
+        )
+
+        try:
+            lignes_fichier = lire_lignes(fichier, type_fichier)
+            while True:
+                lot = list(itertools.islice(lignes_fichier, taille_lot))
+                if not lot:
+                    break
+                rapport.lignes_lues += len(lot)
+
+                codes = {_texte(valeurs['code']) for _, valeurs in lot if 'code' in valeurs}
+                produits = Produit.objects.in_bulk(codes, field_name='code')
+
+                lignes = []
+                for numero, valeurs in lot:
+                    try:
+                        ligne = _construire_ligne(commande, valeurs, produits)
+                    except ValueError as erreur:
+                        rapport.ajouter_erreur(numero, str(erreur))
+                        continue
+
+                    # Une commande ne contient qu'une ligne par produit
+                    if ligne.produit_id in produits_importes:
+                        rapport.ajouter_erreur(
+                            numero,
+                            f"Produit {ligne.produit.code} déjà présent à la ligne {produits_importes[ligne.produit_id]}",
+                        )
+                        continue
+                    produits_importes[ligne.produit_id] = numero
+                    lignes.append(ligne)
+
+                if not rapport.nb_erreurs:
+                    LigneCommandeAchat.objects.bulk_create(lignes)
+                    rapport.lignes_importees += len(lignes)
+        except ErreurImport as erreur:
+            rapport.ajouter_erreur(None, str(erreur))
+
+        if not rapport.nb_erreurs and not rapport.lignes_importees:
+            rapport.ajouter_erreur(None, "Le fichier ne contient aucune ligne de commande.")
+
+        if rapport.nb_erreurs:
+            transaction.set_rollback(True)
+            rapport.lignes_importees = 0
+            return rapport
+
+        commande.calculer_totaux()
+
+        # bulk_create ne déclenche pas les signaux : invalider le dernier prix d'achat en cache
+        produit_ids = list(produits_importes)
+        transaction.on_commit(lambda: invalider_tarifs(*produit_ids))
+
+    rapport.commande = commande
+    return rapport
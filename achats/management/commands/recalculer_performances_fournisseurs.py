@@ -0,0 +1,12 @@
+# achats/management/commands/recalculer_performances_fournisseurs.py
+
+from django.core.management.base import BaseCommand
+from achats.performances import recalculer_performances
+
+class Command(BaseCommand):
+    help = "Reconstruit les indicateurs de performance des fournisseurs à partir des commandes réceptionnées"
+
+    def handle(self, *args, **options):
+        self.stdout.write('🚚 Reconstruction des indicateurs de performance des fournisseurs...')
+        nb = recalculer_performances()
+        self.stdout.write(self.style.SUCCESS(f'✓ {nb} mois fournisseur calculé(s)'))
@@ -0,0 +1,12 @@
+# achats/management/commands/reconstruire_prix_achat_fournisseurs.py
+
+from django.core.management.base import BaseCommand
+from achats.prix import reconstruire_prix
+
+class Command(BaseCommand):
+    help = "Recalcule l'index des prix d'achat par fournisseur et produit à partir des commandes confirmées"
+
+    def handle(self, *args, **options):
+        self.stdout.write('🏷️ Reconstruction de l\'index des prix d\'achat...')
+        nb = reconstruire_prix()
+        self.stdout.write(self.style.SUCCESS(f'✓ {nb} prix fournisseur/produit calculé(s)'))
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('achats', '0003_paiementfournisseur_alter_commandeachat_options_and_more'),
+        ('base', '0004_client_encours_credit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerformanceFournisseurMensuelle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField(help_text='Premier jour du mois', verbose_name='Mois')),
+                ('nb_commandes_livrees', models.PositiveIntegerField(default=0, verbose_name='Commandes livrées')),
+                ('cumul_delai_jours', models.IntegerField(default=0, verbose_name='Cumul des délais de livraison (jours)')),
+                ('nb_livraisons_prevues', models.PositiveIntegerField(default=0, verbose_name='Livraisons avec date prévue')),
+                ('nb_livraisons_a_temps', models.PositiveIntegerField(default=0, verbose_name='Livraisons à temps')),
+                ('quantite_commandee', models.IntegerField(default=0, verbose_name='Quantité commandée')),
+                ('quantite_recue', models.IntegerField(default=0, verbose_name='Quantité reçue')),
+                ('montant_recu', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Montant reçu (prix commande)')),
+                ('montant_reference', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name="Montant reçu (prix d'achat de référence)")),
+                ('date_maj', models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')),
+                ('fournisseur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='performances', to='base.fournisseur', verbose_name='Fournisseur')),
+            ],
+            options={
+                'verbose_name': 'Performance fournisseur mensuelle',
+                'verbose_name_plural': 'Performances fournisseurs mensuelles',
+                'ordering': ['-mois'],
+                'indexes': [models.Index(fields=['mois'], name='achats_perf_mois_ad4fd2_idx')],
+                'unique_together': {('fournisseur', 'mois')},
+            },
+        ),
+    ]
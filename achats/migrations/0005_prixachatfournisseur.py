@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('achats', '0004_performancefournisseurmensuelle'),
+        ('base', '0004_client_encours_credit'),
+        ('stock', '0002_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrixAchatFournisseur',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dernier_prix', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Dernier prix')),
+                ('date_dernier_prix', models.DateField(blank=True, null=True, verbose_name='Date du dernier prix')),
+                ('prix_min', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Prix minimum')),
+                ('quantite_recue', models.IntegerField(default=0, verbose_name='Quantité reçue cumulée')),
+                ('montant_recu', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Montant reçu cumulé')),
+                ('date_maj', models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')),
+                ('derniere_commande', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='achats.commandeachat', verbose_name='Dernière commande')),
+                ('fournisseur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prix_achat', to='base.fournisseur', verbose_name='Fournisseur')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prix_achat_fournisseurs', to='stock.produit', verbose_name='Produit')),
+            ],
+            options={
+                'verbose_name': "Prix d'achat fournisseur",
+                'verbose_name_plural': "Prix d'achat fournisseurs",
+                'unique_together': {('fournisseur', 'produit')},
+            },
+        ),
+    ]
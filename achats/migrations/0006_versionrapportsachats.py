@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:44
+
+from django.db import migrations, models
+
+
+def creer_version(apps, schema_editor):
+    """La ligne unique de version : invalider_rapports n'a plus qu'à l'incrémenter"""
+    apps.get_model('achats', 'VersionRapportsAchats').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('achats', '0005_prixachatfournisseur'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionRapportsAchats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='Version')),
+            ],
+            options={
+                'verbose_name': "Version des rapports d'achats",
+                'verbose_name_plural': "Versions des rapports d'achats",
+            },
+        ),
+        migrations.RunPython(creer_version, migrations.RunPython.noop),
+    ]
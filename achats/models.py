@@ -1,6 +1,7 @@
 # achats/models.py - Modèles du module achats (AMÉLIORÉ)
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum, Value, DecimalField, ExpressionWrapper
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator
@@ -157,6 +158,13 @@ class CommandeAchat(models.Model):
             self.numero_commande = self._generer_numero_commande()
         super().save(*args, **kwargs)
     
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        """Le statut relu devient le statut d'origine comparé par les signaux (achats/signals.py)"""
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'statut' in fields:
+            self._statut_initial = self.statut
+            self._statut_initial_connu = True
+    
     def _generer_numero_commande(self):
         """Génère un numéro de commande unique"""
         date = timezone.now().date()
@@ -181,10 +189,10 @@ class CommandeAchat(models.Model):
     
     def calculer_totaux(self):
         """Calcule les totaux de la commande"""
-        lignes = self.lignecommandeachat_set.all()
-        self.sous_total = sum(ligne.sous_total for ligne in lignes)
-        self.montant_tva = sum(ligne.montant_tva for ligne in lignes)
-        self.total = self.sous_total + self.montant_tva
+        totaux = self.lignecommandeachat_set.totaux()
+        self.sous_total = totaux['sous_total']
+        self.montant_tva = totaux['montant_tva']
+        self.total = totaux['total']
         self.save(update_fields=['sous_total', 'montant_tva', 'total'])
     
     def peut_etre_confirmee(self):
@@ -232,67 +240,75 @@ class CommandeAchat(models.Model):
         
         return (total_recu / total_commande) * 100
     
-    def generer_ecriture_comptable(self, journal, exercice):
+    def generer_ecriture_comptable(self, journal=None, exercice=None):
         """
         Génère l'écriture comptable lors de la réception
         Débit: Compte Achat (60X) et TVA déductible (4456)
         Crédit: Compte Fournisseur (401X)
+        
+        Comptes, et journal/exercice s'ils ne sont pas fournis : règle de
+        comptabilisation ACHAT (voir comptabilite/regles.py)
         """
         if self.piece_comptable:
             # Écriture déjà générée
             return self.piece_comptable
         
         # Import ici pour éviter les imports circulaires
-        from comptabilite.models import Piece, Ecriture, PlanComptable
+        from comptabilite.models import Piece, Ecriture
+        from comptabilite.regles import regle, exercice_ouvert
         
-        # Récupérer les comptes comptables
-        try:
-            compte_achat = PlanComptable.objects.get(numero_compte__startswith='60')
-            compte_tva = PlanComptable.objects.get(numero_compte__startswith='4456')
-            compte_fournisseur = PlanComptable.objects.get(numero_compte__startswith='401')
-        except PlanComptable.DoesNotExist:
-            raise ValueError("Les comptes comptables nécessaires n'existent pas dans le plan comptable")
+        date_piece = self.date_reception or timezone.now().date()
+        comptes = ['compte_debit', 'compte_credit'] + (['compte_tva'] if self.montant_tva > 0 else [])
+        regle_achat = regle('ACHAT', comptes)
+        journal = journal or regle_achat.journal
+        exercice = exercice or exercice_ouvert(date_piece)
+        if exercice is None:
+            raise ValueError(f"Aucun exercice ouvert ne couvre le {date_piece.strftime('%d/%m/%Y')}")
         
         # Créer la pièce comptable
         piece = Piece.objects.create(
             journal=journal,
             exercice=exercice,
-            date_piece=self.date_reception or timezone.now().date(),
+            date_piece=date_piece,
             libelle=f"Achat - {self.numero_commande} - {self.fournisseur.nom}",
             reference=self.numero_commande,
-            cree_par=self.cree_par
+            cree_par=self.cree_par,
+            # Écritures créées en bulk_create (sans signal) : totaux renseignés ici
+            total_debit=self.sous_total + max(self.montant_tva, Decimal('0')),
+            total_credit=self.total,
         )
         
         # Écriture 1 : Débit compte Achat
-        Ecriture.objects.create(
+        ecritures = [Ecriture(
             piece=piece,
-            compte=compte_achat,
+            compte=regle_achat.compte_debit,
             libelle=f"Achat {self.numero_commande}",
             debit=self.sous_total,
             credit=Decimal('0.00'),
             fournisseur=self.fournisseur
-        )
+        )]
         
         # Écriture 2 : Débit TVA déductible (si TVA > 0)
         if self.montant_tva > 0:
-            Ecriture.objects.create(
+            ecritures.append(Ecriture(
                 piece=piece,
-                compte=compte_tva,
+                compte=regle_achat.compte_tva,
                 libelle=f"TVA déductible {self.numero_commande}",
                 debit=self.montant_tva,
                 credit=Decimal('0.00'),
                 fournisseur=self.fournisseur
-            )
+            ))
         
         # Écriture 3 : Crédit compte Fournisseur
-        Ecriture.objects.create(
+        ecritures.append(Ecriture(
             piece=piece,
-            compte=compte_fournisseur,
+            compte=regle_achat.compte_credit,
             libelle=f"Fournisseur {self.fournisseur.nom} - {self.numero_commande}",
             debit=Decimal('0.00'),
             credit=self.total,
             fournisseur=self.fournisseur
-        )
+        ))
+        Ecriture.objects.bulk_create(ecritures)
         
         # Lier la pièce à la commande
         self.piece_comptable = piece
@@ -301,6 +317,33 @@ class CommandeAchat(models.Model):
         return piece
 
 
+class LigneCommandeAchatQuerySet(models.QuerySet):
+    """
+    Montants des lignes d'achat calculés en SQL, avec les mêmes formules que
+    les propriétés sous_total / montant_tva / total (pas d'arrondi par ligne).
+    """
+    
+    def avec_montants(self):
+        champ = DecimalField(max_digits=20, decimal_places=6)
+        montant_ht = ExpressionWrapper(F('quantite') * F('prix_unitaire'), output_field=champ)
+        montant_tva = ExpressionWrapper(montant_ht * F('taux_tva') * Value(Decimal('0.01')), output_field=champ)
+        return self.annotate(
+            montant_ht=montant_ht,
+            montant_tva_ligne=montant_tva,
+            montant_ttc=ExpressionWrapper(montant_ht + montant_tva, output_field=champ),
+        )
+    
+    def totaux(self):
+        """Sous-total, TVA et total des lignes en une requête"""
+        resultat = self.avec_montants().order_by().aggregate(
+            sous_total=Sum('montant_ht'),
+            montant_tva=Sum('montant_tva_ligne'),
+        )
+        sous_total = resultat['sous_total'] or Decimal('0')
+        montant_tva = resultat['montant_tva'] or Decimal('0')
+        return {'sous_total': sous_total, 'montant_tva': montant_tva, 'total': sous_total + montant_tva}
+
+
 class LigneCommandeAchat(models.Model):
     """Modèle pour les lignes de commande d'achat"""
     
@@ -352,6 +395,8 @@ class LigneCommandeAchat(models.Model):
         verbose_name="Date de création"
     )
     
+    objects = LigneCommandeAchatQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Ligne de commande d'achat"
         verbose_name_plural = "Lignes de commande d'achat"
@@ -389,18 +434,8 @@ class LigneCommandeAchat(models.Model):
         if self.quantite == 0:
             return 0
         return (self.quantite_recue / self.quantite) * 100
-    
-    def save(self, *args, **kwargs):
-        """Recalcule les totaux de la commande après sauvegarde"""
-        super().save(*args, **kwargs)
-        # Recalculer les totaux de la commande parent
-        self.commande.calculer_totaux()
-    
-    def delete(self, *args, **kwargs):
-        """Recalcule les totaux de la commande après suppression"""
-        commande = self.commande
-        super().delete(*args, **kwargs)
-        commande.calculer_totaux()
+
+    # Les totaux de la commande sont recalculés par signal (achats/signals.py)
 
 
 class PaiementFournisseur(models.Model):
@@ -495,14 +530,55 @@ class PaiementFournisseur(models.Model):
     def __str__(self):
         return f"{self.numero_paiement} - {self.fournisseur.nom} - {self.montant} FCFA"
     
+    # Nombre d'essais d'un numéro (ou d'une plage de numéros) avant d'abandonner
+    TENTATIVES_NUMERO = 5
+    
     def save(self, *args, **kwargs):
-        """Génère automatiquement le numéro de paiement"""
-        if not self.numero_paiement:
+        """
+        Génère automatiquement le numéro de paiement. Numéro pris entre-temps
+        par un paiement simultané : l'insertion est annulée (point de
+        sauvegarde) et refaite avec le numéro suivant.
+        """
+        if self.numero_paiement:
+            super().save(*args, **kwargs)
+            return
+        
+        for tentative in range(1, self.TENTATIVES_NUMERO + 1):
             self.numero_paiement = self._generer_numero_paiement()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # Autre contrainte violée, ou trop d'essais : l'erreur remonte
+                if tentative == self.TENTATIVES_NUMERO or not PaiementFournisseur.objects.filter(numero_paiement=self.numero_paiement).exists():
+                    self.numero_paiement = ''
+                    raise
     
     def _generer_numero_paiement(self):
         """Génère un numéro de paiement unique"""
+        return self.prochains_numeros(1)[0]
+    
+    @classmethod
+    def creer_en_lot(cls, paiements):
+        """
+        Numérote et crée les paiements en un bulk_create. Plage de numéros
+        entamée par un paiement simultané : nouvel essai avec la plage suivante.
+        """
+        for tentative in range(1, cls.TENTATIVES_NUMERO + 1):
+            numeros = cls.prochains_numeros(len(paiements))
+            for paiement, numero in zip(paiements, numeros):
+                paiement.numero_paiement = numero
+            try:
+                with transaction.atomic():
+                    return cls.objects.bulk_create(paiements)
+            except IntegrityError:
+                if tentative == cls.TENTATIVES_NUMERO or not cls.objects.filter(numero_paiement__in=numeros).exists():
+                    raise
+    
+    @classmethod
+    def prochains_numeros(cls, nombre):
+        """Réserve `nombre` numéros de paiement consécutifs (une seule requête)"""
         date = timezone.now().date()
         prefixe = "PAY"
         annee_mois = date.strftime('%y%m')
@@ -520,23 +596,29 @@ class PaiementFournisseur(models.Model):
         else:
             nouveau_seq = 1
         
-        return f"{prefixe}{annee_mois}{nouveau_seq:04d}"
+        return [f"{prefixe}{annee_mois}{seq:04d}" for seq in range(nouveau_seq, nouveau_seq + nombre)]
     
-    def generer_ecriture_comptable(self, journal, exercice, banque):
+    def generer_ecriture_comptable(self, journal=None, exercice=None, banque=None):
         """
         Génère l'écriture comptable du paiement
         Débit: Compte Fournisseur (401X)
         Crédit: Compte Banque (512X)
+        
+        Comptes, et journal/exercice/banque s'ils ne sont pas fournis : règle
+        de comptabilisation PAIEMENT_FOURNISSEUR (voir comptabilite/regles.py)
         """
         if self.piece_comptable:
             return self.piece_comptable
         
-        from comptabilite.models import Piece, Ecriture, PlanComptable
+        from comptabilite.models import Piece, Ecriture
+        from comptabilite.regles import regle, exercice_ouvert
         
-        try:
-            compte_fournisseur = PlanComptable.objects.get(numero_compte__startswith='401')
-            compte_banque = banque.compte_comptable
-        except PlanComptable.DoesNotExist:
+        regle_paiement = regle('PAIEMENT_FOURNISSEUR', ['compte_debit'])
+        journal = journal or regle_paiement.journal
+        exercice = exercice or exercice_ouvert(self.date_paiement)
+        banque = banque or regle_paiement.banque
+        compte_banque = regle_paiement.compte_credit or (banque.compte_comptable if banque else None)
+        if exercice is None or compte_banque is None:
             raise ValueError("Les comptes comptables nécessaires n'existent pas")
         
         # Créer la pièce
@@ -546,30 +628,115 @@ class PaiementFournisseur(models.Model):
             date_piece=self.date_paiement,
             libelle=f"Paiement fournisseur {self.fournisseur.nom} - {self.numero_paiement}",
             reference=self.numero_paiement,
-            cree_par=self.utilisateur
-        )
-        
-        # Débit Fournisseur
-        Ecriture.objects.create(
-            piece=piece,
-            compte=compte_fournisseur,
-            libelle=f"Paiement {self.fournisseur.nom}",
-            debit=self.montant,
-            credit=Decimal('0.00'),
-            fournisseur=self.fournisseur
+            cree_par=self.utilisateur,
+            total_debit=self.montant,
+            total_credit=self.montant,
         )
         
-        # Crédit Banque
-        Ecriture.objects.create(
-            piece=piece,
-            compte=compte_banque,
-            libelle=f"Paiement {self.fournisseur.nom} - {self.mode_paiement}",
-            debit=Decimal('0.00'),
-            credit=self.montant,
-            fournisseur=self.fournisseur
-        )
+        Ecriture.objects.bulk_create([
+            # Débit Fournisseur
+            Ecriture(
+                piece=piece,
+                compte=regle_paiement.compte_debit,
+                libelle=f"Paiement {self.fournisseur.nom}",
+                debit=self.montant,
+                credit=Decimal('0.00'),
+                fournisseur=self.fournisseur
+            ),
+            # Crédit Banque
+            Ecriture(
+                piece=piece,
+                compte=compte_banque,
+                libelle=f"Paiement {self.fournisseur.nom} - {self.mode_paiement}",
+                debit=Decimal('0.00'),
+                credit=self.montant,
+                fournisseur=self.fournisseur
+            ),
+        ])
         
         self.piece_comptable = piece
         self.save(update_fields=['piece_comptable'])
         
-        return piece
\ No newline at end of file
+        return piece
+
+class PerformanceFournisseurMensuelle(models.Model):
+    """
+    Indicateurs de performance d'un fournisseur pour un mois de réception.
+    Compteurs cumulés par receptionner_commande() (achats/performances.py) :
+    une réception saisie dans l'admin n'est pas comptée. Ne pas modifier à
+    la main (commande recalculer_performances_fournisseurs).
+    """
+    fournisseur = models.ForeignKey(Fournisseur, on_delete=models.CASCADE, related_name='performances', verbose_name="Fournisseur")
+    mois = models.DateField(verbose_name="Mois", help_text="Premier jour du mois")
+    nb_commandes_livrees = models.PositiveIntegerField(default=0, verbose_name="Commandes livrées")
+    cumul_delai_jours = models.IntegerField(default=0, verbose_name="Cumul des délais de livraison (jours)")
+    nb_livraisons_prevues = models.PositiveIntegerField(default=0, verbose_name="Livraisons avec date prévue")
+    nb_livraisons_a_temps = models.PositiveIntegerField(default=0, verbose_name="Livraisons à temps")
+    quantite_commandee = models.IntegerField(default=0, verbose_name="Quantité commandée")
+    quantite_recue = models.IntegerField(default=0, verbose_name="Quantité reçue")
+    montant_recu = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Montant reçu (prix commande)")
+    montant_reference = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Montant reçu (prix d'achat de référence)")
+    date_maj = models.DateTimeField(auto_now=True, verbose_name="Dernière mise à jour")
+    
+    class Meta:
+        verbose_name = "Performance fournisseur mensuelle"
+        verbose_name_plural = "Performances fournisseurs mensuelles"
+        unique_together = ['fournisseur', 'mois']
+        ordering = ['-mois']
+        indexes = [
+            models.Index(fields=['mois']),
+        ]
+    
+    def __str__(self):
+        return f"{self.fournisseur_id} - {self.mois:%m/%Y}"
+
+
+class PrixAchatFournisseur(models.Model):
+    """
+    Prix d'achat pratiqués par un fournisseur pour un produit : dernier prix
+    et prix minimum des commandes confirmées, prix moyen pondéré des
+    quantités reçues. Tenu à jour par achats/prix.py ; ne pas modifier à la
+    main (commande reconstruire_prix_achat_fournisseurs).
+    """
+    fournisseur = models.ForeignKey(Fournisseur, on_delete=models.CASCADE, related_name='prix_achat', verbose_name="Fournisseur")
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='prix_achat_fournisseurs', verbose_name="Produit")
+    dernier_prix = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name="Dernier prix")
+    date_dernier_prix = models.DateField(null=True, blank=True, verbose_name="Date du dernier prix")
+    derniere_commande = models.ForeignKey(
+        CommandeAchat, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Dernière commande"
+    )
+    prix_min = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name="Prix minimum")
+    quantite_recue = models.IntegerField(default=0, verbose_name="Quantité reçue cumulée")
+    montant_recu = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Montant reçu cumulé")
+    date_maj = models.DateTimeField(auto_now=True, verbose_name="Dernière mise à jour")
+    
+    class Meta:
+        verbose_name = "Prix d'achat fournisseur"
+        verbose_name_plural = "Prix d'achat fournisseurs"
+        unique_together = ['fournisseur', 'produit']
+    
+    def __str__(self):
+        return f"{self.fournisseur_id} - {self.produit_id} : {self.dernier_prix}"
+    
+    @property
+    def prix_moyen(self):
+        """Prix moyen pondéré par les quantités reçues"""
+        if not self.quantite_recue:
+            return None
+        return (self.montant_recu / self.quantite_recue).quantize(Decimal('0.01'))
+
+
+class VersionRapportsAchats(models.Model):
+    """
+    Version des rapports d'historique des achats en cache (une seule ligne).
+    Incrémentée par achats/rapports.invalider_rapports ; partagée par tous
+    les processus, contrairement au cache par défaut.
+    """
+    version = models.PositiveIntegerField(default=1, verbose_name="Version")
+    
+    class Meta:
+        verbose_name = "Version des rapports d'achats"
+        verbose_name_plural = "Versions des rapports d'achats"
+    
+    def __str__(self):
+        return f"Rapports d'achats v{self.version}"
@@ -0,0 +1,194 @@
+# achats/paiements.py
+"""
+Règlement groupé des fournisseurs.
+
+echeances_fournisseurs() propose les commandes reçues qui restent à payer,
+avec leur échéance : date de commande + délai de paiement du fournisseur.
+
+regler_echeances() paie en une transaction les commandes retenues, pour
+leur solde restant. Tous les PaiementFournisseur sont créés par un seul
+bulk_create. Le règlement est comptabilisé dans une seule pièce du journal
+de banque : une écriture au débit du compte fournisseur (401) par
+fournisseur et une écriture au crédit de la banque pour le total. Le
+journal, l'exercice et le compte fournisseur viennent de la règle de
+comptabilisation PAIEMENT_FOURNISSEUR (comptabilite/regles.py, en cache).
+Le nombre de requêtes ne dépend pas du nombre de commandes payées.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CommandeAchat, PaiementFournisseur
+
+# Commandes dont la marchandise a été reçue : elles sont dues au fournisseur
+STATUTS_A_PAYER = ['RECUE', 'FACTUREE']
+
+
+class ErreurReglement(Exception):
+    """Règlement impossible : rien n'a été enregistré"""
+
+
+class Echeance:
+    """Solde restant dû sur une commande d'achat"""
+
+    def __init__(self, commande, deja_paye):
+        self.commande = commande
+        self.fournisseur = commande.fournisseur
+        self.date_echeance = commande.date_commande + timedelta(days=commande.fournisseur.delai_paiement)
+        self.deja_paye = deja_paye
+        self.solde = commande.total - deja_paye
+
+    @property
+    def jours_retard(self):
+        return (timezone.localdate() - self.date_echeance).days
+
+
+def _commandes_a_payer():
+    return (
+        CommandeAchat.objects
+        .filter(statut__in=STATUTS_A_PAYER)
+        .annotate(deja_paye=Coalesce(
+            Sum('paiements__montant'), Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2)
+        ))
+    )
+
+
+def echeances_fournisseurs(date_limite=None, fournisseur=None):
+    """
+    Soldes restant dus arrivés à échéance au plus tard le `date_limite`
+    (aujourd'hui par défaut), triés par échéance puis fournisseur. Une requête.
+    """
+    date_limite = date_limite or timezone.localdate()
+    # L'échéance n'est jamais avant la date de commande : les commandes plus
+    # récentes que date_limite et les commandes soldées sont écartées en SQL,
+    # l'échéance exacte (délai du fournisseur) est vérifiée ci-dessous.
+    commandes = (
+        _commandes_a_payer()
+        .filter(date_commande__lte=date_limite, total__gt=F('deja_paye'))
+        .select_related('fournisseur')
+        .order_by('date_commande', 'id')
+    )
+    if fournisseur is not None:
+        commandes = commandes.filter(fournisseur=fournisseur)
+
+    echeances = [Echeance(commande, commande.deja_paye) for commande in commandes]
+    echeances = [echeance for echeance in echeances if echeance.date_echeance <= date_limite]
+    echeances.sort(key=lambda echeance: (echeance.date_echeance, echeance.fournisseur.nom))
+    return echeances
+
+
+def _parametres_comptables(date_paiement):
+    from comptabilite.regles import regle, exercice_ouvert, RegleIntrouvable
+
+    try:
+        regle_paiement = regle('PAIEMENT_FOURNISSEUR', ['compte_debit'])
+    except RegleIntrouvable as erreur:
+        raise ErreurReglement(str(erreur))
+    exercice = exercice_ouvert(date_paiement)
+    if exercice is None:
+        raise ErreurReglement(f"Aucun exercice ouvert ne couvre le {date_paiement.strftime('%d/%m/%Y')}.")
+    return regle_paiement.journal, exercice, regle_paiement.compte_debit
+
+
+def regler_echeances(commande_ids, date_paiement, mode_paiement, banque, utilisateur=None, reference=''):
+    """
+    Paie le solde des commandes `commande_ids` et comptabilise le règlement
+    dans une seule pièce. Retourne (pièce, liste des paiements créés).
+    """
+    from comptabilite.models import Piece, Ecriture
+
+    commande_ids = set(commande_ids)
+    if not commande_ids:
+        raise ErreurReglement("Sélectionnez au moins une commande à régler.")
+
+    with transaction.atomic():
+        # Verrouiller les commandes : deux règlements simultanés ne paient pas deux fois le même solde
+        commandes = list(
+            CommandeAchat.objects
+            .select_for_update(of=('self',))
+            .filter(pk__in=commande_ids, statut__in=STATUTS_A_PAYER)
+            .select_related('fournisseur')
+            .order_by('fournisseur__nom', 'id')
+        )
+        if len(commandes) != len(commande_ids):
+            raise ErreurReglement("Certaines commandes sélectionnées n'existent pas ou ne sont pas à payer.")
+
+        deja_payes = dict(
+            PaiementFournisseur.objects
+            .filter(commande_id__in=commande_ids)
+            .values('commande_id')
+            .annotate(total=Sum('montant'))
+            .values_list('commande_id', 'total')
+        )
+        echeances = [Echeance(commande, deja_payes.get(commande.pk) or Decimal('0')) for commande in commandes]
+        soldees = [echeance.commande.numero_commande for echeance in echeances if echeance.solde <= 0]
+        if soldees:
+            raise ErreurReglement(f"Commande(s) déjà entièrement payée(s) : {', '.join(soldees)}.")
+
+        journal, exercice, compte_fournisseur = _parametres_comptables(date_paiement)
+        total = sum(echeance.solde for echeance in echeances)
+
+        # Numéros de pièce et de paiements : nouveaux essais si un règlement
+        # simultané les a pris, puis abandon (rien n'est enregistré)
+        try:
+            piece = Piece.objects.create(
+                journal=journal,
+                exercice=exercice,
+                date_piece=date_paiement,
+                libelle=f"Règlement fournisseurs du {date_paiement.strftime('%d/%m/%Y')} ({len(echeances)} paiement(s))",
+                reference=reference,
+                cree_par=utilisateur,
+                total_debit=total,
+                total_credit=total,
+            )
+            paiements = PaiementFournisseur.creer_en_lot([
+                PaiementFournisseur(
+                    commande=echeance.commande,
+                    fournisseur=echeance.fournisseur,
+                    montant=echeance.solde,
+                    date_paiement=date_paiement,
+                    mode_paiement=mode_paiement,
+                    reference=reference,
+                    notes=f"Règlement groupé {piece.numero_piece}",
+                    piece_comptable=piece,
+                    utilisateur=utilisateur,
+                )
+                for echeance in echeances
+            ])
+        except IntegrityError:
+            raise ErreurReglement("Numérotation en conflit avec un règlement simultané : veuillez réessayer.")
+
+        # Débit 401 : une écriture par fournisseur ; crédit banque : le total
+        par_fournisseur = defaultdict(Decimal)
+        fournisseurs = {}
+        for echeance in echeances:
+            par_fournisseur[echeance.fournisseur.pk] += echeance.solde
+            fournisseurs[echeance.fournisseur.pk] = echeance.fournisseur
+
+        ecritures = [
+            Ecriture(
+                piece=piece,
+                compte=compte_fournisseur,
+                libelle=f"Règlement {fournisseurs[fournisseur_id].nom}",
+                debit=montant,
+                credit=Decimal('0.00'),
+                fournisseur=fournisseurs[fournisseur_id],
+            )
+            for fournisseur_id, montant in par_fournisseur.items()
+        ]
+        ecritures.append(Ecriture(
+            piece=piece,
+            compte=banque.compte_comptable,
+            libelle=f"Règlement fournisseurs - {banque.nom}",
+            debit=Decimal('0.00'),
+            credit=total,
+        ))
+        Ecriture.objects.bulk_create(ecritures)
+
+    return piece, paiements
@@ -0,0 +1,224 @@
+# achats/performances.py
+"""
+Indicateurs de performance des fournisseurs (PerformanceFournisseurMensuelle).
+
+Une ligne par (fournisseur, mois de réception) avec des compteurs cumulés,
+mis à jour à chaque réception par receptionner_commande() (voir
+achats/reception.py) en 2 requêtes :
+
+- délai moyen de livraison : cumul des jours entre la date de commande et
+  la première réception / nombre de commandes livrées ;
+- ponctualité : livraisons reçues au plus tard à la date de livraison
+  prévue / livraisons qui avaient une date prévue ;
+- taux de service : quantités reçues / quantités commandées ;
+- écart de prix : montant reçu au prix de la commande comparé au même
+  montant valorisé au prix d'achat de référence du produit.
+
+Les compteurs liés à la commande (délai, ponctualité, quantités commandées)
+sont comptés à sa première réception ; les quantités et montants reçus le
+sont à chaque réception, dans le mois où elle a lieu. La fiche fournisseur
+et le classement des fournisseurs lisent ces lignes au lieu de parcourir
+les commandes.
+
+Seul receptionner_commande() alimente la table : une réception saisie
+autrement (quantités reçues ou statut RECUE modifiés dans l'admin, mise à
+jour directe en base) n'y figure pas tant que la table n'a pas été
+reconstruite.
+
+La commande recalculer_performances_fournisseurs reconstruit la table à
+partir des commandes. Seule la date de première réception étant conservée
+sur la commande, toutes les quantités reçues sont alors rattachées au mois
+de cette date.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum, F, DecimalField, ExpressionWrapper
+from django.utils import timezone
+
+from .models import CommandeAchat, LigneCommandeAchat, PerformanceFournisseurMensuelle
+
+CHAMPS_CUMULES = [
+    'nb_commandes_livrees',
+    'cumul_delai_jours',
+    'nb_livraisons_prevues',
+    'nb_livraisons_a_temps',
+    'quantite_commandee',
+    'quantite_recue',
+    'montant_recu',
+    'montant_reference',
+]
+
+# Clés de tri du classement : (indicateur, ordre décroissant)
+TRIS_CLASSEMENT = {
+    'ponctualite': ('taux_ponctualite', True),
+    'delai': ('delai_moyen', False),
+    'service': ('taux_service', True),
+    'prix': ('ecart_prix', False),
+    'montant': ('montant_recu', True),
+}
+
+
+def _ratio(numerateur, denominateur, facteur=1):
+    return float(numerateur) / float(denominateur) * facteur if denominateur else None
+
+
+def calculer_indicateurs(compteurs):
+    """Ajoute les indicateurs (None faute de données) à un dict de compteurs cumulés"""
+    compteurs = dict(compteurs)
+    for champ in CHAMPS_CUMULES:
+        compteurs[champ] = compteurs.get(champ) or 0
+    ecart = _ratio(compteurs['montant_recu'] - compteurs['montant_reference'], compteurs['montant_reference'], 100)
+    compteurs.update({
+        'delai_moyen': _ratio(compteurs['cumul_delai_jours'], compteurs['nb_commandes_livrees']),
+        'taux_ponctualite': _ratio(compteurs['nb_livraisons_a_temps'], compteurs['nb_livraisons_prevues'], 100),
+        'taux_service': _ratio(compteurs['quantite_recue'], compteurs['quantite_commandee'], 100),
+        'ecart_prix': ecart,
+    })
+    return compteurs
+
+
+def _ajouter(performances):
+    """Cumule {(fournisseur_id, mois): {champ: incrément}} dans la table"""
+    with transaction.atomic():
+        PerformanceFournisseurMensuelle.objects.bulk_create(
+            [
+                PerformanceFournisseurMensuelle(fournisseur_id=fournisseur_id, mois=mois)
+                for fournisseur_id, mois in performances
+            ],
+            ignore_conflicts=True,
+        )
+        for (fournisseur_id, mois), increments in performances.items():
+            PerformanceFournisseurMensuelle.objects.filter(fournisseur_id=fournisseur_id, mois=mois).update(
+                date_maj=timezone.now(),
+                **{champ: F(champ) + valeur for champ, valeur in increments.items() if valeur},
+            )
+
+
+# ========== MISE À JOUR À LA RÉCEPTION ==========
+
+def enregistrer_reception(commande, lignes, quantites, premiere_reception, jour):
+    """
+    Cumule une réception de `commande` : `lignes` sont toutes ses lignes
+    (produit chargé), `quantites` les quantités reçues ({id de ligne: quantité}).
+    """
+    increments = defaultdict(int)
+    for ligne in lignes:
+        quantite = quantites.get(ligne.pk)
+        if quantite:
+            increments['quantite_recue'] += quantite
+            increments['montant_recu'] += quantite * ligne.prix_unitaire
+            increments['montant_reference'] += quantite * ligne.produit.prix_achat
+        if premiere_reception:
+            increments['quantite_commandee'] += ligne.quantite
+
+    if premiere_reception:
+        increments['nb_commandes_livrees'] = 1
+        increments['cumul_delai_jours'] = (jour - commande.date_commande).days
+        if commande.date_livraison_prevue:
+            increments['nb_livraisons_prevues'] = 1
+            increments['nb_livraisons_a_temps'] = int(jour <= commande.date_livraison_prevue)
+
+    _ajouter({(commande.fournisseur_id, jour.replace(day=1)): increments})
+
+
+# ========== LECTURE ==========
+
+def debut_periode(fin, nb_mois=12):
+    """Premier jour de la période de `nb_mois` mois qui se termine par le mois de `fin`"""
+    debut = fin.replace(day=1)
+    for _ in range(nb_mois - 1):
+        debut = (debut - timedelta(days=1)).replace(day=1)
+    return debut
+
+
+def indicateurs_fournisseur(fournisseur, nb_mois=12):
+    """
+    Indicateurs d'un fournisseur sur ses `nb_mois` derniers mois : (totaux de
+    la période, détail par mois du plus récent au plus ancien)
+    """
+    debut = debut_periode(timezone.localdate(), nb_mois)
+    mois = list(
+        fournisseur.performances.filter(mois__gte=debut).order_by('-mois').values('mois', *CHAMPS_CUMULES)
+    )
+    totaux = {champ: sum(ligne[champ] for ligne in mois) for champ in CHAMPS_CUMULES}
+    return calculer_indicateurs(totaux), [calculer_indicateurs(ligne) for ligne in mois]
+
+
+def classement_fournisseurs(debut, fin, tri='ponctualite'):
+    """Indicateurs de chaque fournisseur livré entre les mois `debut` et `fin`, triés selon `tri`"""
+    cle, decroissant = TRIS_CLASSEMENT.get(tri, TRIS_CLASSEMENT['ponctualite'])
+    lignes = (
+        PerformanceFournisseurMensuelle.objects
+        .filter(mois__gte=debut.replace(day=1), mois__lte=fin)
+        .values('fournisseur_id', 'fournisseur__code', 'fournisseur__nom')
+        .annotate(**{champ: Sum(champ) for champ in CHAMPS_CUMULES})
+        .order_by()
+    )
+    classement = [calculer_indicateurs(ligne) for ligne in lignes]
+
+    # Fournisseurs sans donnée pour l'indicateur en fin de liste
+    avec = [ligne for ligne in classement if ligne[cle] is not None]
+    sans = [ligne for ligne in classement if ligne[cle] is None]
+    avec.sort(key=lambda ligne: ligne[cle], reverse=decroissant)
+    return avec + sorted(sans, key=lambda ligne: ligne['fournisseur__nom'])
+
+
+# ========== RECONSTRUCTION ==========
+
+def recalculer_performances(fournisseurs=None):
+    """
+    Reconstruit la table à partir des commandes réceptionnées (de tous les
+    fournisseurs, ou seulement de `fournisseurs`). Retourne le nombre de
+    lignes créées.
+    """
+    commandes = CommandeAchat.objects.filter(date_reception__isnull=False)
+    if fournisseurs is not None:
+        commandes = commandes.filter(fournisseur__in=fournisseurs)
+
+    champ_montant = DecimalField(max_digits=14, decimal_places=2)
+    lignes = {
+        ligne['commande_id']: ligne
+        for ligne in LigneCommandeAchat.objects
+        .filter(commande__in=commandes)
+        .values('commande_id')
+        .annotate(
+            commandee=Sum('quantite'),
+            recue=Sum('quantite_recue'),
+            montant_recu=Sum(ExpressionWrapper(F('quantite_recue') * F('prix_unitaire'), output_field=champ_montant)),
+            montant_reference=Sum(ExpressionWrapper(F('quantite_recue') * F('produit__prix_achat'), output_field=champ_montant)),
+        )
+        .order_by()
+    }
+
+    performances = defaultdict(lambda: defaultdict(int))
+    for commande in commandes.values('id', 'fournisseur_id', 'date_commande', 'date_reception', 'date_livraison_prevue').iterator():
+        compteurs = performances[(commande['fournisseur_id'], commande['date_reception'].replace(day=1))]
+        compteurs['nb_commandes_livrees'] += 1
+        compteurs['cumul_delai_jours'] += (commande['date_reception'] - commande['date_commande']).days
+        if commande['date_livraison_prevue']:
+            compteurs['nb_livraisons_prevues'] += 1
+            compteurs['nb_livraisons_a_temps'] += int(commande['date_reception'] <= commande['date_livraison_prevue'])
+        ligne = lignes.get(commande['id'], {})
+        compteurs['quantite_commandee'] += ligne.get('commandee') or 0
+        compteurs['quantite_recue'] += ligne.get('recue') or 0
+        compteurs['montant_recu'] += ligne.get('montant_recu') or 0
+        compteurs['montant_reference'] += ligne.get('montant_reference') or 0
+
+    with transaction.atomic():
+        existantes = PerformanceFournisseurMensuelle.objects.all()
+        if fournisseurs is not None:
+            existantes = existantes.filter(fournisseur__in=fournisseurs)
+        existantes.delete()
+        PerformanceFournisseurMensuelle.objects.bulk_create([
+            PerformanceFournisseurMensuelle(
+                fournisseur_id=fournisseur_id,
+                mois=mois,
+                **{champ: compteurs[champ] for champ in CHAMPS_CUMULES},
+            )
+            for (fournisseur_id, mois), compteurs in performances.items()
+        ], batch_size=1000)
+
+    return len(performances)
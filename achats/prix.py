@@ -0,0 +1,160 @@
+# achats/prix.py
+"""
+Index des prix d'achat par (fournisseur, produit) : PrixAchatFournisseur.
+
+- À la confirmation d'une commande (première sortie du statut BROUILLON,
+  voir achats/signals.py), ses prix deviennent les derniers prix du
+  fournisseur pour ces produits et le prix minimum est mis à jour.
+- À chaque réception (achats/reception.py), les quantités reçues et leur
+  montant sont cumulés pour le prix moyen pondéré.
+
+Chaque mise à jour coûte 3 requêtes quel que soit le nombre de lignes :
+création des couples absents (bulk_create ignore_conflicts), lecture
+verrouillée des lignes de l'index, puis bulk_update. La saisie d'une
+commande lit les prix de tous ses produits chez un fournisseur en une
+requête sur l'index unique (fournisseur, produit).
+
+Les commandes annulées après confirmation ne sont pas retirées de l'index ;
+la commande reconstruire_prix_achat_fournisseurs le recalcule entièrement.
+"""
+
+from django.db import transaction
+from django.db.models import F, Sum, Min, DecimalField, ExpressionWrapper
+from django.utils import timezone
+
+from .models import LigneCommandeAchat, PrixAchatFournisseur
+
+STATUTS_HORS_INDEX = ['BROUILLON', 'ANNULEE']
+
+
+def _prix_a_mettre_a_jour(fournisseur_id, produit_ids):
+    """Lignes de l'index des produits, créées au besoin et verrouillées : {produit_id: prix}"""
+    PrixAchatFournisseur.objects.bulk_create(
+        [PrixAchatFournisseur(fournisseur_id=fournisseur_id, produit_id=produit_id) for produit_id in produit_ids],
+        ignore_conflicts=True,
+    )
+    index = {
+        prix.produit_id: prix
+        for prix in PrixAchatFournisseur.objects.select_for_update().filter(
+            fournisseur_id=fournisseur_id, produit_id__in=produit_ids
+        )
+    }
+    # bulk_update() ne renseigne pas les champs auto_now
+    maintenant = timezone.now()
+    for prix in index.values():
+        prix.date_maj = maintenant
+    return index
+
+
+def enregistrer_prix_commande(commande):
+    """Prend les prix de `commande` (qui vient d'être confirmée) comme derniers prix du fournisseur"""
+    lignes = dict(commande.lignecommandeachat_set.values_list('produit_id', 'prix_unitaire'))
+    if not lignes:
+        return
+
+    with transaction.atomic():
+        index = _prix_a_mettre_a_jour(commande.fournisseur_id, list(lignes))
+        for produit_id, prix_unitaire in lignes.items():
+            prix = index[produit_id]
+            # Une commande plus ancienne confirmée en retard ne remplace pas un prix plus récent
+            if prix.date_dernier_prix is None or commande.date_commande >= prix.date_dernier_prix:
+                prix.dernier_prix = prix_unitaire
+                prix.date_dernier_prix = commande.date_commande
+                prix.derniere_commande = commande
+            if prix.prix_min is None or prix_unitaire < prix.prix_min:
+                prix.prix_min = prix_unitaire
+        PrixAchatFournisseur.objects.bulk_update(
+            index.values(), ['dernier_prix', 'date_dernier_prix', 'derniere_commande', 'prix_min', 'date_maj']
+        )
+
+
+def enregistrer_prix_reception(commande, lignes, quantites):
+    """Cumule les quantités reçues (`quantites` : {id de ligne: quantité}) pour le prix moyen"""
+    lignes = [ligne for ligne in lignes if quantites.get(ligne.pk)]
+    if not lignes:
+        return
+
+    with transaction.atomic():
+        index = _prix_a_mettre_a_jour(commande.fournisseur_id, [ligne.produit_id for ligne in lignes])
+        for ligne in lignes:
+            prix = index[ligne.produit_id]
+            prix.quantite_recue += quantites[ligne.pk]
+            prix.montant_recu += quantites[ligne.pk] * ligne.prix_unitaire
+            # Commande confirmée avant la mise en place de l'index
+            if prix.dernier_prix is None:
+                prix.dernier_prix = ligne.prix_unitaire
+                prix.date_dernier_prix = commande.date_commande
+                prix.derniere_commande = commande
+                prix.prix_min = ligne.prix_unitaire
+        PrixAchatFournisseur.objects.bulk_update(
+            index.values(),
+            ['quantite_recue', 'montant_recu', 'dernier_prix', 'date_dernier_prix', 'derniere_commande', 'prix_min', 'date_maj'],
+        )
+
+
+def prix_fournisseur(fournisseur_id, produit_id):
+    """Prix pratiqués par le fournisseur pour le produit (None si jamais acheté chez lui)"""
+    return PrixAchatFournisseur.objects.filter(fournisseur_id=fournisseur_id, produit_id=produit_id).first()
+
+
+def prix_fournisseur_produits(fournisseur_id, produit_ids):
+    """Prix pratiqués par le fournisseur pour plusieurs produits, en une requête : {id produit: prix}"""
+    return {
+        prix.produit_id: prix
+        for prix in PrixAchatFournisseur.objects.filter(fournisseur_id=fournisseur_id, produit_id__in=produit_ids)
+    }
+
+
+def prix_fournisseur_json(prix):
+    """Prix du fournisseur pour les API de saisie des commandes (None si jamais acheté chez lui)"""
+    if prix is None or prix.dernier_prix is None:
+        return None
+    prix_moyen = prix.prix_moyen
+    return {
+        'dernier_prix': float(prix.dernier_prix),
+        'date_dernier_prix': prix.date_dernier_prix.strftime('%d/%m/%Y') if prix.date_dernier_prix else None,
+        'prix_min': float(prix.prix_min) if prix.prix_min is not None else None,
+        'prix_moyen': float(prix_moyen) if prix_moyen is not None else None,
+    }
+
+
+# ========== RECONSTRUCTION ==========
+
+def reconstruire_prix():
+    """Recalcule tout l'index à partir des commandes confirmées. Retourne le nombre de couples."""
+    lignes = LigneCommandeAchat.objects.exclude(commande__statut__in=STATUTS_HORS_INDEX)
+    champ_montant = DecimalField(max_digits=14, decimal_places=2)
+
+    index = {}
+    for ligne in (
+        lignes.values('commande__fournisseur_id', 'produit_id')
+        .annotate(
+            minimum=Min('prix_unitaire'),
+            recue=Sum('quantite_recue'),
+            montant=Sum(ExpressionWrapper(F('quantite_recue') * F('prix_unitaire'), output_field=champ_montant)),
+        )
+        .order_by()
+    ):
+        index[(ligne['commande__fournisseur_id'], ligne['produit_id'])] = PrixAchatFournisseur(
+            fournisseur_id=ligne['commande__fournisseur_id'],
+            produit_id=ligne['produit_id'],
+            prix_min=ligne['minimum'],
+            quantite_recue=ligne['recue'] or 0,
+            montant_recu=ligne['montant'] or 0,
+        )
+
+    # Dernier prix : lignes parcourues de la plus ancienne à la plus récente commande
+    derniers = lignes.order_by('commande__date_commande', 'commande_id').values_list(
+        'commande__fournisseur_id', 'produit_id', 'prix_unitaire', 'commande__date_commande', 'commande_id'
+    )
+    for fournisseur_id, produit_id, prix_unitaire, date_commande, commande_id in derniers.iterator():
+        prix = index[(fournisseur_id, produit_id)]
+        prix.dernier_prix = prix_unitaire
+        prix.date_dernier_prix = date_commande
+        prix.derniere_commande_id = commande_id
+
+    with transaction.atomic():
+        PrixAchatFournisseur.objects.all().delete()
+        PrixAchatFournisseur.objects.bulk_create(index.values(), batch_size=1000)
+
+    return len(index)
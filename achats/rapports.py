@@ -0,0 +1,228 @@
+# achats/rapports.py
+"""
+Rapport d'historique des achats (statistiques, répartition par statut,
+tops fournisseurs et produits, évolution mensuelle).
+
+La page d'historique, sa version imprimable, le PDF téléchargé et les
+exports Excel/CSV/PDF affichent les mêmes chiffres : ils sont calculés ici
+en 4 requêtes, quel que soit le nombre de statuts ou de mois :
+
+- un seul aggregate() pour les statistiques globales et la répartition par
+  statut (agrégats conditionnels Count/Sum(filter=...)) ;
+- un regroupement par fournisseur et un par produit pour les tops ;
+- un regroupement TruncMonth pour l'évolution des 6 derniers mois
+  calendaires (du 1er au dernier jour du mois).
+
+Le rapport est mis en cache par jeu de filtres (période, fournisseur) pour
+TTL_RAPPORT secondes. Tout enregistrement ou suppression d'une commande
+change la version des rapports (voir achats/signals.py), ce qui rend
+obsolètes toutes les entrées en cache ; les modifications de lignes
+passent elles aussi par là, puisqu'elles recalculent les totaux de leur
+commande.
+
+La version est tenue en base (VersionRapportsAchats, relue à chaque appel :
+une requête) et non dans le cache par défaut, propre à chaque processus :
+une modification enregistrée par un worker invalide les rapports de tous
+les workers. Elle est incrémentée une fois par transaction, à sa
+validation : la ligne n'est pas verrouillée pendant la transaction de
+l'enregistrement.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q, Sum, Count, Avg
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import CommandeAchat, LigneCommandeAchat, VersionRapportsAchats
+
+TTL_RAPPORT = 300  # secondes
+NB_MOIS_EVOLUTION = 6
+PERIODE_PAR_DEFAUT = 30  # jours
+
+STATUTS_RECUS = ['RECUE', 'FACTUREE']
+STATUTS_CLOS = ['RECUE', 'FACTUREE', 'ANNULEE']
+
+_en_attente = threading.local()
+
+
+def invalider_rapports():
+    """
+    Rend obsolètes tous les rapports d'historique en cache, à la validation
+    de la transaction. Le premier rappel exécuté incrémente la version, les
+    suivants de la même transaction n'ont plus rien à faire.
+    """
+    _en_attente.invalidation = True
+    transaction.on_commit(_incrementer_version)
+
+
+def _incrementer_version():
+    if not getattr(_en_attente, 'invalidation', False):
+        return
+    _en_attente.invalidation = False
+    if not VersionRapportsAchats.objects.update(version=F('version') + 1):
+        VersionRapportsAchats.objects.get_or_create(pk=1, defaults={'version': 2})
+
+
+def _cle_rapport(date_debut, date_fin, fournisseur_id):
+    version = VersionRapportsAchats.objects.values_list('version', flat=True).first() or 1
+    return f'achats:historique:{version}:{date_debut.isoformat()}:{date_fin.isoformat()}:{fournisseur_id or "tous"}'
+
+
+# ========== FILTRES ==========
+
+def _date(valeur):
+    try:
+        return datetime.strptime(valeur, '%Y-%m-%d').date() if valeur else None
+    except ValueError:
+        return None
+
+
+def filtres_historique(parametres):
+    """
+    Lit les filtres de l'historique dans `parametres` (request.GET) :
+    (date_debut, date_fin, fournisseur_id). Période par défaut : les 30
+    derniers jours ; une date invalide est remplacée par la valeur par défaut.
+    """
+    aujourdhui = timezone.localdate()
+    date_debut = _date(parametres.get('date_debut')) or aujourdhui - timedelta(days=PERIODE_PAR_DEFAUT)
+    date_fin = _date(parametres.get('date_fin')) or aujourdhui
+
+    fournisseur_id = parametres.get('fournisseur')
+    fournisseur_id = int(fournisseur_id) if fournisseur_id and fournisseur_id.isdigit() else None
+
+    return date_debut, date_fin, fournisseur_id
+
+
+# ========== RAPPORT ==========
+
+class RapportHistorique:
+    """Statistiques de l'historique des achats pour une période et un fournisseur"""
+
+    def __init__(self, date_debut, date_fin, fournisseur_id=None):
+        self.date_debut = date_debut
+        self.date_fin = date_fin
+        self.fournisseur_id = fournisseur_id
+        self.date_calcul = timezone.now()
+
+        commandes = CommandeAchat.objects.filter(date_commande__gte=date_debut, date_commande__lte=date_fin)
+        if fournisseur_id:
+            commandes = commandes.filter(fournisseur_id=fournisseur_id)
+
+        self._calculer_statistiques(commandes)
+        self._calculer_tops(commandes)
+        self._calculer_evolution(commandes)
+
+    def _calculer_statistiques(self, commandes):
+        statuts = [code for code, _ in CommandeAchat.STATUTS]
+        agregats = {
+            'nombre_commandes': Count('id'),
+            'montant_total': Sum('total'),
+            'montant_moyen': Avg('total'),
+            'nombre_fournisseurs': Count('fournisseur', distinct=True),
+            'commandes_recues': Count('id', filter=Q(statut__in=STATUTS_RECUS)),
+            'commandes_confirmees': Count('id', filter=~Q(statut='BROUILLON')),
+            'commandes_retard': Count('id', filter=(
+                Q(date_livraison_prevue__lt=timezone.localdate()) & ~Q(statut__in=STATUTS_CLOS)
+            )),
+        }
+        for statut in statuts:
+            agregats[f'nombre_{statut}'] = Count('id', filter=Q(statut=statut))
+            agregats[f'montant_{statut}'] = Sum('total', filter=Q(statut=statut))
+        resultat = commandes.aggregate(**agregats)
+
+        nombre = resultat['nombre_commandes']
+        self.stats_globales = {
+            'nombre_commandes': nombre,
+            'montant_total': resultat['montant_total'] or Decimal('0'),
+            'nombre_fournisseurs': resultat['nombre_fournisseurs'],
+            'montant_moyen': resultat['montant_moyen'] or Decimal('0'),
+            'taux_reception': (resultat['commandes_recues'] / nombre * 100) if nombre else 0,
+            'commandes_retard': resultat['commandes_retard'],
+            'taux_confirmation': (resultat['commandes_confirmees'] / nombre * 100) if nombre else 0,
+        }
+
+        # N'inclure que les statuts qui ont des commandes
+        libelles = dict(CommandeAchat.STATUTS)
+        self.stats_par_statut = [
+            {
+                'statut': statut,
+                'statut_display': libelles[statut],
+                'nombre': resultat[f'nombre_{statut}'],
+                'montant': resultat[f'montant_{statut}'] or Decimal('0'),
+                'pourcentage': resultat[f'nombre_{statut}'] / nombre * 100,
+            }
+            for statut in statuts
+            if resultat[f'nombre_{statut}']
+        ]
+
+    def _calculer_tops(self, commandes):
+        self.top_fournisseurs = list(
+            commandes.values('fournisseur__nom')
+            .annotate(nombre=Count('id'), montant=Sum('total'))
+            .order_by('-montant')[:10]
+        )
+        self.top_produits = list(
+            LigneCommandeAchat.objects.filter(commande__in=commandes)
+            .avec_montants()
+            .values('produit__nom', 'produit__code')
+            .annotate(quantite_totale=Sum('quantite'), montant_total=Sum('montant_ht'))
+            .order_by('-montant_total')[:10]
+        )
+
+    def _calculer_evolution(self, commandes):
+        """Les NB_MOIS_EVOLUTION mois calendaires se terminant par celui de date_fin"""
+        mois = [self.date_fin.replace(day=1)]
+        for _ in range(NB_MOIS_EVOLUTION - 1):
+            mois.insert(0, (mois[0] - timedelta(days=1)).replace(day=1))
+
+        par_mois = {
+            ligne['mois']: ligne
+            for ligne in commandes
+            .filter(date_commande__gte=mois[0])
+            .annotate(mois=TruncMonth('date_commande'))
+            .values('mois')
+            .annotate(
+                nombre=Count('id'),
+                montant=Sum('total'),
+                recues=Count('id', filter=Q(statut__in=STATUTS_RECUS)),
+            )
+            .order_by('mois')
+        }
+
+        self.evolution_mensuelle = []
+        montant_precedent = None
+        for debut_mois in mois:
+            ligne = par_mois.get(debut_mois, {})
+            nombre = ligne.get('nombre', 0)
+            montant = ligne.get('montant') or Decimal('0')
+
+            # Évolution par rapport au mois précédent
+            evolution = 0
+            if montant_precedent:
+                evolution = float((montant - montant_precedent) / montant_precedent * 100)
+            montant_precedent = montant
+
+            self.evolution_mensuelle.append({
+                'mois': debut_mois.strftime('%B %Y'),
+                'debut': debut_mois,
+                'nombre': nombre,
+                'montant': montant,
+                'montant_moyen': montant / nombre if nombre else 0,
+                'taux_reception': (ligne.get('recues', 0) / nombre * 100) if nombre else 0,
+                'evolution': evolution,
+            })
+
+
+def rapport_historique(date_debut, date_fin, fournisseur_id=None):
+    """Rapport d'historique pour ces filtres, depuis le cache si possible"""
+    cle = _cle_rapport(date_debut, date_fin, fournisseur_id)
+    rapport = cache.get(cle)
+    if rapport is None:
+        rapport = RapportHistorique(date_debut, date_fin, fournisseur_id)
+        cache.set(cle, rapport, TTL_RAPPORT)
+    return rapport
@@ -0,0 +1,102 @@
+# achats/reception.py
+"""
+Réception (totale ou partielle) d'une commande d'achat.
+
+La commande puis ses lignes sont verrouillées (deux réceptions simultanées
+de la même commande sont sérialisées ; statut, date de réception et notes
+sont relus sous le verrou), les quantités vérifiées en mémoire, puis tout est écrit en bloc : bulk_update des
+quantités reçues et mouvements d'entrée en stock via
+stock.mouvements.enregistrer_mouvements(). Le nombre de requêtes ne dépend
+pas du nombre de lignes reçues. La réception est aussi cumulée dans les
+indicateurs de performance du fournisseur (achats/performances.py) et
+dans l'index des prix d'achat (achats/prix.py).
+
+Les quantités reçues n'entrent pas dans les totaux de la commande : ceux-ci
+ne sont donc pas recalculés.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from stock.models import MouvementStock
+from stock.mouvements import enregistrer_mouvements
+from .models import CommandeAchat, LigneCommandeAchat
+from .performances import enregistrer_reception
+from .prix import enregistrer_prix_reception
+
+
+class ErreurReception(Exception):
+    """Quantités saisies incohérentes : rien n'a été enregistré"""
+
+
+def receptionner_commande(commande, quantites, utilisateur=None, notes_reception=''):
+    """
+    Enregistre la réception des quantités `quantites` ({id de ligne: quantité
+    reçue}) et retourne le nombre de mouvements de stock créés.
+    La commande passe au statut RECUE si toutes ses lignes sont soldées.
+    """
+    quantites = {ligne_id: quantite for ligne_id, quantite in quantites.items() if quantite}
+    if not quantites:
+        raise ErreurReception("Veuillez saisir au moins une quantité à réceptionner.")
+
+    with transaction.atomic():
+        commande.refresh_from_db(
+            fields=['statut', 'date_reception', 'notes'],
+            from_queryset=CommandeAchat.objects.select_for_update(),
+        )
+        lignes = list(
+            commande.lignecommandeachat_set
+            .select_for_update(of=('self',))
+            .select_related('produit')
+        )
+        lignes_par_id = {ligne.pk: ligne for ligne in lignes}
+
+        inconnues = set(quantites) - set(lignes_par_id)
+        if inconnues:
+            raise ErreurReception("Certaines lignes ne font pas partie de cette commande.")
+
+        lignes_recues = []
+        for ligne_id, quantite in quantites.items():
+            ligne = lignes_par_id[ligne_id]
+            if quantite < 0:
+                raise ErreurReception(f"La quantité reçue pour {ligne.produit.nom} ne peut pas être négative.")
+            if quantite > ligne.quantite_restante():
+                raise ErreurReception(
+                    f"La quantité reçue pour {ligne.produit.nom} dépasse la quantité restante ({ligne.quantite_restante()})."
+                )
+            ligne.quantite_recue += quantite
+            lignes_recues.append(ligne)
+
+        LigneCommandeAchat.objects.bulk_update(lignes_recues, ['quantite_recue'])
+
+        enregistrer_mouvements([
+            MouvementStock(
+                produit_id=ligne.produit_id,
+                entrepot_id=commande.entrepot_id,
+                type_mouvement='ENTREE',
+                quantite=quantites[ligne.pk],
+                reference=commande.numero_commande,
+                notes=f'Réception commande achat {commande.numero_commande} - {commande.fournisseur.nom}',
+                utilisateur=utilisateur,
+            )
+            for ligne in lignes_recues
+        ])
+
+        aujourdhui = timezone.now()
+        premiere_reception = not commande.date_reception
+        if premiere_reception:
+            commande.date_reception = aujourdhui.date()
+
+        enregistrer_reception(commande, lignes, quantites, premiere_reception, aujourdhui.date())
+        enregistrer_prix_reception(commande, lignes, quantites)
+
+        if all(ligne.est_completement_recue() for ligne in lignes):
+            commande.statut = 'RECUE'
+
+        if notes_reception:
+            note = f"[Réception {aujourdhui.strftime('%d/%m/%Y')}]: {notes_reception}"
+            commande.notes = f"{commande.notes}\n\n{note}" if commande.notes else note
+
+        commande.save()
+
+    return len(lignes_recues)
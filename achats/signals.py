@@ -1,19 +1,127 @@
 # achats/signals.py - Signaux pour l'automatisation du module achats
 
-from django.db.models.signals import post_save, pre_save
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete, post_init
 from django.dispatch import receiver
 from decimal import Decimal
+from stock.tarifs import invalider_tarifs
+from .rapports import invalider_rapports
+from .prix import enregistrer_prix_commande, STATUTS_HORS_INDEX
 from .models import CommandeAchat, LigneCommandeAchat, PaiementFournisseur
 
 
+# ========== REGROUPEMENT DU CALCUL DES TOTAUX ==========
+
+_differe = threading.local()
+
+
+@contextmanager
+def differer_calcul_totaux():
+    """
+    Pendant le bloc, les enregistrements de lignes ne recalculent plus les
+    totaux de leur commande : les commandes touchées sont notées (dans le
+    bloc le plus externe en cas d'imbrication) et leurs totaux recalculés une
+    seule fois, à la validation de la transaction (aussitôt hors transaction).
+    À utiliser pour les traitements qui enregistrent beaucoup de lignes.
+    """
+    if getattr(_differe, 'niveau', 0) == 0:
+        _differe.commandes = set()
+    _differe.niveau = getattr(_differe, 'niveau', 0) + 1
+    termine = False
+    try:
+        yield
+        termine = True
+    finally:
+        _differe.niveau -= 1
+        if _differe.niveau == 0:
+            commande_ids, _differe.commandes = _differe.commandes, set()
+            # En cas d'exception, la transaction englobante sera annulée
+            if termine and commande_ids:
+                planifier_calcul_totaux(commande_ids)
+
+
+def planifier_calcul_totaux(commande_ids):
+    """
+    Note les commandes dont les totaux sont à recalculer. Le premier rappel
+    exécuté après la validation de la transaction les traite toutes, les
+    suivants n'ont plus rien à faire.
+    """
+    if getattr(_differe, 'a_recalculer', None) is None:
+        _differe.a_recalculer = set()
+    _differe.a_recalculer.update(commande_ids)
+    transaction.on_commit(_executer_calculs_totaux)
+
+
+def _executer_calculs_totaux():
+    commande_ids = getattr(_differe, 'a_recalculer', None)
+    if not commande_ids:
+        return
+    _differe.a_recalculer = set()
+    for commande in CommandeAchat.objects.filter(pk__in=commande_ids):
+        commande.calculer_totaux()
+
+
 @receiver(post_save, sender=LigneCommandeAchat)
-def recalculer_totaux_commande(sender, instance, created, **kwargs):
+@receiver(post_delete, sender=LigneCommandeAchat)
+def recalculer_totaux_commande(sender, instance, **kwargs):
     """
     Signal pour recalculer automatiquement les totaux de la commande
-    après chaque modification de ligne
+    après chaque modification ou suppression de ligne (ou une seule fois à
+    la validation de la transaction, dans un bloc differer_calcul_totaux())
     """
-    if instance.commande:
-        instance.commande.calculer_totaux()
+    if getattr(_differe, 'niveau', 0):
+        _differe.commandes.add(instance.commande_id)
+        return
+    
+    # Suppression de la commande elle-même (lignes supprimées en cascade)
+    origine = kwargs.get('origin')
+    if isinstance(origine, CommandeAchat) or getattr(origine, 'model', None) is CommandeAchat:
+        return
+    
+    instance.commande.calculer_totaux()
+
+
+# ========== STATUT D'ORIGINE DES COMMANDES ==========
+
+@receiver(post_init, sender=CommandeAchat)
+def memoriser_statut_initial(sender, instance, **kwargs):
+    """Statut tel que chargé depuis la base (None pour une nouvelle commande)"""
+    # __dict__ : ne pas charger le champ s'il a été différé (only()/defer())
+    instance._statut_initial = instance.__dict__.get('statut') if instance.pk else None
+    instance._statut_initial_connu = instance.pk is None or 'statut' in instance.__dict__
+
+
+@receiver(post_save, sender=CommandeAchat)
+def actualiser_statut_initial(sender, instance, **kwargs):
+    instance._statut_initial = instance.statut
+    instance._statut_initial_connu = True
+
+
+def statut_initial(instance):
+    """Statut de la commande en base avant l'enregistrement en cours"""
+    if not getattr(instance, '_statut_initial_connu', False):
+        instance._statut_initial = (
+            CommandeAchat.objects.filter(pk=instance.pk).values_list('statut', flat=True).first()
+        )
+        instance._statut_initial_connu = True
+    return instance._statut_initial
+
+
+@receiver(post_save, sender=LigneCommandeAchat)
+@receiver(post_delete, sender=LigneCommandeAchat)
+def invalider_dernier_prix_achat(sender, instance, **kwargs):
+    """Le dernier prix d'achat mis en cache pour le produit a pu changer"""
+    invalider_tarifs(instance.produit_id)
+
+
+@receiver(post_save, sender=CommandeAchat)
+@receiver(post_delete, sender=CommandeAchat)
+def invalider_rapports_historique(sender, instance, **kwargs):
+    """Les rapports d'historique en cache ne reflètent plus cette commande"""
+    invalider_rapports()
 
 
 @receiver(pre_save, sender=CommandeAchat)
@@ -24,17 +132,31 @@ def verifier_statut_commande(sender, instance, **kwargs):
     """
     # Si la commande existe déjà (modification)
     if instance.pk:
-        try:
-            ancienne_commande = CommandeAchat.objects.get(pk=instance.pk)
-            
-            # Si le statut passe à RECUE, vérifier que toutes les lignes sont reçues
-            if instance.statut == 'RECUE' and ancienne_commande.statut != 'RECUE':
-                if not instance.est_completement_recue():
-                    # Ne pas permettre de passer à RECUE si pas complètement reçu
-                    instance.statut = ancienne_commande.statut
-            
-        except CommandeAchat.DoesNotExist:
-            pass
+        ancien_statut = statut_initial(instance)
+        
+        # Si le statut passe à RECUE, vérifier que toutes les lignes sont reçues
+        if ancien_statut is not None and instance.statut == 'RECUE' and ancien_statut != 'RECUE':
+            if not instance.est_completement_recue():
+                # Ne pas permettre de passer à RECUE si pas complètement reçu
+                instance.statut = ancien_statut
+
+
+@receiver(pre_save, sender=CommandeAchat)
+def noter_confirmation(sender, instance, **kwargs):
+    """La commande sort du statut BROUILLON (après verifier_statut_commande)"""
+    instance._confirmation = (
+        instance.pk is not None
+        and statut_initial(instance) == 'BROUILLON'
+        and instance.statut not in STATUTS_HORS_INDEX
+    )
+
+
+@receiver(post_save, sender=CommandeAchat)
+def indexer_prix_confirmation(sender, instance, **kwargs):
+    """Les prix d'une commande confirmée deviennent les derniers prix du fournisseur"""
+    if getattr(instance, '_confirmation', False):
+        instance._confirmation = False
+        enregistrer_prix_commande(instance)
 
 
 @receiver(post_save, sender=CommandeAchat)
@@ -50,26 +172,9 @@ def generer_ecriture_automatique(sender, instance, created, **kwargs):
     """
     if instance.statut == 'RECUE' and not instance.piece_comptable:
         try:
-            from comptabilite.models import Journal, Exercice
-            from django.utils import timezone
-            
-            # Trouver le journal d'achats
-            journal_achat = Journal.objects.filter(
-                type_journal='ACHAT', 
-                est_actif=True
-            ).first()
-            
-            # Trouver l'exercice en cours
-            aujourdhui = timezone.now().date()
-            exercice = Exercice.objects.filter(
-                est_cloture=False,
-                date_debut__lte=aujourdhui,
-                date_fin__gte=aujourdhui
-            ).first()
-            
-            if journal_achat and exercice:
-                instance.generer_ecriture_comptable(journal_achat, exercice)
-                
+            # Journal, exercice et comptes : règle de comptabilisation ACHAT
+            # (comptabilite/regles.py, en cache : aucune requête de recherche)
+            instance.generer_ecriture_comptable()
         except Exception as e:
             # Logger l'erreur sans bloquer l'enregistrement
             import logging
@@ -92,29 +197,9 @@ def generer_ecriture_paiement(sender, instance, created, **kwargs):
     """
     if created and not instance.piece_comptable:
         try:
-            from comptabilite.models import Journal, Exercice, Banque
-            from django.utils import timezone
-            
-            # Trouver le journal de banque
-            journal_banque = Journal.objects.filter(
-                type_journal='BANQUE',
-                est_actif=True
-            ).first()
-            
-            # Trouver l'exercice en cours
-            aujourdhui = timezone.now().date()
-            exercice = Exercice.objects.filter(
-                est_cloture=False,
-                date_debut__lte=aujourdhui,
-                date_fin__gte=aujourdhui
-            ).first()
-            
-            # Trouver la banque par défaut
-            banque = Banque.objects.filter(est_actif=True).first()
-            
-            if journal_banque and exercice and banque:
-                instance.generer_ecriture_comptable(journal_banque, exercice, banque)
-                
+            # Journal, exercice, comptes et banque par défaut : règle de
+            # comptabilisation PAIEMENT_FOURNISSEUR (comptabilite/regles.py, en cache)
+            instance.generer_ecriture_comptable()
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -130,38 +215,13 @@ def logger_changement_statut(sender, instance, **kwargs):
     Signal pour logger les changements de statut dans les logs
     """
     if instance.pk:
-        try:
-            ancienne_commande = CommandeAchat.objects.get(pk=instance.pk)
-            
-            if ancienne_commande.statut != instance.statut:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.info(
-                    f"Commande {instance.numero_commande}: "
-                    f"Statut changé de {ancienne_commande.get_statut_display()} "
-                    f"à {instance.get_statut_display()}"
-                )
-        except CommandeAchat.DoesNotExist:
-            pass
-
-
-# Signal pour notifier les utilisateurs (optionnel - à implémenter selon vos besoins)
-@receiver(post_save, sender=CommandeAchat)
-def notifier_changement_commande(sender, instance, created, **kwargs):
-    """
-    Signal pour envoyer des notifications lors de changements importants
-    
-    Exemples d'utilisation:
-    - Envoyer un email au fournisseur quand la commande passe à ENVOYEE
-    - Notifier l'équipe logistique quand une commande est RECUE
-    - Alerter la comptabilité quand une commande est FACTUREE
-    
-    NOTE: À implémenter selon vos besoins de notification
-    """
-    # TODO: Implémenter la logique de notification
-    # Exemples:
-    # - Email
-    # - SMS
-    # - Notification push
-    # - Webhook
-    pass
\ No newline at end of file
+        ancien_statut = statut_initial(instance)
+        
+        if ancien_statut is not None and ancien_statut != instance.statut:
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.info(
+                f"Commande {instance.numero_commande}: "
+                f"Statut changé de {dict(CommandeAchat.STATUTS).get(ancien_statut, ancien_statut)} "
+                f"à {instance.get_statut_display()}"
+            )
@@ -14,9 +14,12 @@ urlpatterns = [
     path('historique/imprimer/', views.imprimer_historique_achats, name='imprimer_historique_achats'),
     path('historique/telecharger-pdf/', views.telecharger_historique_pdf, name='telecharger_historique_pdf'),
     path('commandes/exporter/', views.exporter_commandes_achat, name='exporter_commandes_achat'),
+    path('fournisseurs/performances/', views.performances_fournisseurs, name='performances_fournisseurs'),
+    path('paiements/reglement/', views.reglement_fournisseurs, name='reglement_fournisseurs'),
     
     # ========== CRUD COMMANDES D'ACHAT ==========
     path('nouvelle/', views.creer_commande_achat, name='creer_commande_achat'),
+    path('importer/', views.importer_commande_achat, name='importer_commande_achat'),
     path('<int:pk>/', views.details_commande_achat, name='details_commande_achat'),
     path('<int:pk>/modifier/', views.modifier_commande_achat, name='modifier_commande_achat'),
     path('<int:pk>/supprimer/', views.supprimer_commande_achat, name='supprimer_commande_achat'),
@@ -8,15 +8,24 @@ from django.db.models import Q, Sum, Count, F, Avg
 from django.http import JsonResponse
 from django.utils import timezone
 from datetime import datetime, timedelta, date
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
 from .models import CommandeAchat, LigneCommandeAchat, PaiementFournisseur
 from stock.models import MouvementStock, Produit, Entrepot
+from stock.tarifs import tarifs_produits
 from base.models import Fournisseur
 from .forms import (
     CommandeAchatForm, LigneCommandeAchatFormSet, 
-    RecevoirCommandeForm, AnnulerCommandeForm
+    RecevoirCommandeForm, AnnulerCommandeForm, ImporterCommandeForm,
+    ReglementFournisseursForm
 )
+from .importation import importer_commande
+from .reception import receptionner_commande, ErreurReception
+from .rapports import filtres_historique, rapport_historique
+from .performances import classement_fournisseurs, debut_periode, TRIS_CLASSEMENT
+from .prix import prix_fournisseur, prix_fournisseur_json
+from .paiements import echeances_fournisseurs, regler_echeances, ErreurReglement
+from .signals import differer_calcul_totaux
 
 
 # ========== LISTE DES COMMANDES D'ACHAT ==========
@@ -124,35 +133,34 @@ def creer_commande_achat(request):
         prix_unitaires = request.POST.getlist('prix_unitaire[]')
         taux_tvas = request.POST.getlist('taux_tva[]')
         
-        lignes_creees = 0
-        for i, produit_id in enumerate(produits_ids):
-            if produit_id and quantites[i]:
-                try:
-                    produit = Produit.objects.get(pk=produit_id)
-                    quantite = int(quantites[i])
-                    prix_unitaire = Decimal(prix_unitaires[i]) if prix_unitaires[i] else produit.prix_achat
-                    taux_tva = Decimal(taux_tvas[i]) if taux_tvas[i] else produit.taux_tva
+        # Totaux calculés une seule fois, à la validation de la transaction
+        with differer_calcul_totaux():
+            lignes_creees = 0
+            for i, produit_id in enumerate(produits_ids):
+                if produit_id and quantites[i]:
+                    try:
+                        produit = Produit.objects.get(pk=produit_id)
+                        quantite = int(quantites[i])
+                        prix_unitaire = Decimal(prix_unitaires[i]) if prix_unitaires[i] else produit.prix_achat
+                        taux_tva = Decimal(taux_tvas[i]) if taux_tvas[i] else produit.taux_tva
                     
-                    LigneCommandeAchat.objects.create(
-                        commande=commande,
-                        produit=produit,
-                        quantite=quantite,
-                        prix_unitaire=prix_unitaire,
-                        taux_tva=taux_tva
-                    )
-                    lignes_creees += 1
-                except (Produit.DoesNotExist, ValueError, Decimal.InvalidOperation) as e:
-                    messages.warning(request, f'Ligne {i+1} ignorée : {str(e)}')
-                    continue
+                        LigneCommandeAchat.objects.create(
+                            commande=commande,
+                            produit=produit,
+                            quantite=quantite,
+                            prix_unitaire=prix_unitaire,
+                            taux_tva=taux_tva
+                        )
+                        lignes_creees += 1
+                    except (Produit.DoesNotExist, ValueError, InvalidOperation) as e:
+                        messages.warning(request, f'Ligne {i+1} ignorée : {str(e)}')
+                        continue
         
         if lignes_creees == 0:
             commande.delete()
             messages.error(request, 'Veuillez ajouter au moins un produit à la commande.')
             return redirect('achats:creer_commande_achat')
         
-        # Calculer les totaux
-        commande.calculer_totaux()
-        
         messages.success(request, f'Commande {commande.numero_commande} créée avec succès avec {lignes_creees} ligne(s)!')
         return redirect('achats:details_commande_achat', pk=commande.pk)
     
@@ -177,6 +185,34 @@ def creer_commande_achat(request):
 
 # ========== DÉTAILS D'UNE COMMANDE ==========
 
+@login_required
+def importer_commande_achat(request):
+    """Vue pour créer une commande d'achat à partir d'un fichier CSV / Excel"""
+    rapport = None
+    
+    if request.method == 'POST':
+        form = ImporterCommandeForm(request.POST, request.FILES)
+        if form.is_valid():
+            rapport = importer_commande(
+                form.cleaned_data['fichier'],
+                form.cleaned_data['type_fichier'],
+                form.cleaned_data['fournisseur'],
+                form.cleaned_data['entrepot'],
+                utilisateur=request.user,
+            )
+            if rapport.reussi:
+                messages.success(
+                    request,
+                    f'Commande {rapport.commande.numero_commande} importée avec {rapport.lignes_importees} ligne(s)!'
+                )
+                return redirect('achats:details_commande_achat', pk=rapport.commande.pk)
+            messages.error(request, f"Import refusé : {rapport.nb_erreurs} erreur(s). Aucune ligne n'a été enregistrée.")
+    else:
+        form = ImporterCommandeForm()
+    
+    return render(request, 'achats/importer_commande.jinja', {'form': form, 'rapport': rapport})
+
+
 @login_required
 def details_commande_achat(request, pk):
     """Vue pour afficher les détails d'une commande d'achat"""
@@ -233,36 +269,36 @@ def modifier_commande_achat(request, pk):
         commande.notes = request.POST.get('notes', '')
         commande.save()
         
-        # Supprimer les anciennes lignes et créer les nouvelles
-        commande.lignecommandeachat_set.all().delete()
-        
         produits_ids = request.POST.getlist('produit[]')
         quantites = request.POST.getlist('quantite[]')
         prix_unitaires = request.POST.getlist('prix_unitaire[]')
         taux_tvas = request.POST.getlist('taux_tva[]')
         
-        lignes_creees = 0
-        for i, produit_id in enumerate(produits_ids):
-            if produit_id and quantites[i]:
-                try:
-                    produit = Produit.objects.get(pk=produit_id)
-                    LigneCommandeAchat.objects.create(
-                        commande=commande,
-                        produit=produit,
-                        quantite=int(quantites[i]),
-                        prix_unitaire=Decimal(prix_unitaires[i]) if prix_unitaires[i] else produit.prix_achat,
-                        taux_tva=Decimal(taux_tvas[i]) if taux_tvas[i] else produit.taux_tva
-                    )
-                    lignes_creees += 1
-                except (Produit.DoesNotExist, ValueError, Decimal.InvalidOperation):
-                    continue
+        # Supprimer les anciennes lignes et créer les nouvelles
+        # (totaux calculés une seule fois, à la validation de la transaction)
+        with differer_calcul_totaux():
+            commande.lignecommandeachat_set.all().delete()
+            
+            lignes_creees = 0
+            for i, produit_id in enumerate(produits_ids):
+                if produit_id and quantites[i]:
+                    try:
+                        produit = Produit.objects.get(pk=produit_id)
+                        LigneCommandeAchat.objects.create(
+                            commande=commande,
+                            produit=produit,
+                            quantite=int(quantites[i]),
+                            prix_unitaire=Decimal(prix_unitaires[i]) if prix_unitaires[i] else produit.prix_achat,
+                            taux_tva=Decimal(taux_tvas[i]) if taux_tvas[i] else produit.taux_tva
+                        )
+                        lignes_creees += 1
+                    except (Produit.DoesNotExist, ValueError, InvalidOperation):
+                        continue
         
         if lignes_creees == 0:
             messages.error(request, 'Veuillez ajouter au moins un produit à la commande.')
             return redirect('achats:modifier_commande_achat', pk=pk)
         
-        commande.calculer_totaux()
-        
         messages.success(request, f'Commande {commande.numero_commande} modifiée avec succès!')
         return redirect('achats:details_commande_achat', pk=pk)
     
@@ -347,84 +383,33 @@ def recevoir_commande_achat(request, pk):
         quantites_recues = request.POST.getlist('quantite_recue[]')
         notes_reception = request.POST.get('notes_reception', '')
         
-        # Vérifier qu'il y a au moins une quantité à réceptionner
-        total_recu = sum([int(q) if q else 0 for q in quantites_recues])
-        
-        if total_recu == 0:
-            messages.error(request, "Veuillez saisir au moins une quantité à réceptionner.")
+        try:
+            quantites = {
+                int(ligne_id): int(quantite) if quantite else 0
+                for ligne_id, quantite in zip(ligne_ids, quantites_recues)
+            }
+        except ValueError:
+            messages.error(request, "Les quantités saisies doivent être des nombres entiers.")
             return redirect('achats:recevoir_commande_achat', pk=pk)
         
-        # Traiter chaque ligne
-        mouvements_crees = 0
-        for i, ligne_id in enumerate(ligne_ids):
-            quantite_recue = int(quantites_recues[i]) if quantites_recues[i] else 0
-            
-            if quantite_recue > 0:
-                ligne = LigneCommandeAchat.objects.get(pk=ligne_id)
-                
-                # Vérifier que la quantité ne dépasse pas le restant
-                quantite_restante = ligne.quantite - ligne.quantite_recue
-                if quantite_recue > quantite_restante:
-                    messages.error(
-                        request, 
-                        f"La quantité reçue pour {ligne.produit.nom} dépasse la quantité restante ({quantite_restante})."
-                    )
-                    return redirect('achats:recevoir_commande_achat', pk=pk)
-                
-                # Mettre à jour la quantité reçue
-                ligne.quantite_recue += quantite_recue
-                ligne.save()
-                
-                # Créer le mouvement de stock (ENTRÉE)
-                MouvementStock.objects.create(
-                    produit=ligne.produit,
-                    entrepot=commande.entrepot,
-                    type_mouvement='ENTREE',
-                    quantite=quantite_recue,
-                    reference=commande.numero_commande,
-                    notes=f'Réception commande achat {commande.numero_commande} - {commande.fournisseur.nom}',
-                    utilisateur=request.user
-                )
-                
-                mouvements_crees += 1
-        
-        # Mettre à jour la date de réception si c'est la première fois
-        if not commande.date_reception:
-            commande.date_reception = timezone.now().date()
+        try:
+            mouvements_crees = receptionner_commande(commande, quantites, request.user, notes_reception)
+        except ErreurReception as erreur:
+            messages.error(request, str(erreur))
+            return redirect('achats:recevoir_commande_achat', pk=pk)
         
-        # Vérifier si toutes les lignes sont complètement reçues
-        if commande.est_completement_recue():
-            commande.statut = 'RECUE'
-            
-            # Générer l'écriture comptable automatiquement
+        # Commande entièrement reçue : générer l'écriture comptable
+        if commande.statut == 'RECUE':
+            # Générer l'écriture comptable automatiquement (journal, exercice et
+            # comptes : règle de comptabilisation ACHAT, en cache)
             try:
-                from comptabilite.models import Journal, Exercice
-                
-                journal_achat = Journal.objects.filter(type_journal='ACHAT', est_actif=True).first()
-                aujourdhui = timezone.now().date()
-                exercice = Exercice.objects.filter(
-                    est_cloture=False,
-                    date_debut__lte=aujourdhui,
-                    date_fin__gte=aujourdhui
-                ).first()
-                
-                if journal_achat and exercice:
-                    piece = commande.generer_ecriture_comptable(journal_achat, exercice)
-                    messages.success(request, f'Écriture comptable {piece.numero_piece} générée automatiquement!')
-                else:
-                    messages.warning(request, 'Impossible de générer l\'écriture comptable : journal ou exercice introuvable.')
+                piece = commande.generer_ecriture_comptable()
+                messages.success(request, f'Écriture comptable {piece.numero_piece} générée automatiquement!')
+            except ValueError as e:
+                messages.warning(request, f'Impossible de générer l\'écriture comptable : {str(e)}')
             except Exception as e:
                 messages.warning(request, f'Erreur lors de la génération de l\'écriture comptable : {str(e)}')
         
-        # Ajouter les notes de réception
-        if notes_reception:
-            if commande.notes:
-                commande.notes += f"\n\n[Réception {timezone.now().strftime('%d/%m/%Y')}]: {notes_reception}"
-            else:
-                commande.notes = f"[Réception {timezone.now().strftime('%d/%m/%Y')}]: {notes_reception}"
-        
-        commande.save()
-        
         messages.success(
             request, 
             f'Réception enregistrée ! {mouvements_crees} mouvement(s) de stock créé(s). Le stock a été mis à jour automatiquement.'
@@ -499,166 +484,148 @@ def supprimer_commande_achat(request, pk):
 @login_required
 def historique_achats(request):
     """Vue pour afficher l'historique et les statistiques des achats"""
+    date_debut, date_fin, fournisseur_id = filtres_historique(request.GET)
+    rapport = rapport_historique(date_debut, date_fin, fournisseur_id)
     
-    # Récupérer les paramètres de filtrage
-    date_debut = request.GET.get('date_debut')
-    date_fin = request.GET.get('date_fin')
-    fournisseur_id = request.GET.get('fournisseur')
+    # Liste des fournisseurs pour le filtre
+    fournisseurs = Fournisseur.objects.all().order_by('nom')
     
-    # Date par défaut (30 derniers jours)
-    if not date_debut:
-        date_debut = (timezone.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    if not date_fin:
-        date_fin = timezone.now().strftime('%Y-%m-%d')
+    context = {
+        'stats_globales': rapport.stats_globales,
+        'stats_par_statut': rapport.stats_par_statut,
+        'top_fournisseurs': rapport.top_fournisseurs,
+        'top_produits': rapport.top_produits,
+        'evolution_mensuelle': rapport.evolution_mensuelle,
+        'fournisseurs': fournisseurs,
+        'date_debut': date_debut.strftime('%Y-%m-%d'),
+        'date_fin': date_fin.strftime('%Y-%m-%d'),
+    }
     
-    # Filtrer les commandes
-    commandes = CommandeAchat.objects.all()
+    return render(request, 'achats/historique_achats.jinja', context)
+
+# ========== PERFORMANCE DES FOURNISSEURS ==========
+
+@login_required
+def performances_fournisseurs(request):
+    """Vue pour classer les fournisseurs selon leurs indicateurs de performance"""
+    aujourdhui = timezone.localdate()
     
-    if date_debut:
-        commandes = commandes.filter(date_commande__gte=date_debut)
-    if date_fin:
-        commandes = commandes.filter(date_commande__lte=date_fin)
-    if fournisseur_id:
-        commandes = commandes.filter(fournisseur_id=fournisseur_id)
+    def mois_parametre(nom, defaut):
+        try:
+            return datetime.strptime(request.GET.get(nom, ''), '%Y-%m').date()
+        except ValueError:
+            return defaut
     
-    # Statistiques globales
-    stats_globales = {
-        'nombre_commandes': commandes.count(),
-        'montant_total': commandes.aggregate(total=Sum('total'))['total'] or 0,
-        'nombre_fournisseurs': commandes.values('fournisseur').distinct().count(),
-        'montant_moyen': commandes.aggregate(moyenne= Avg('total'))['moyenne'] or 0,
-        'taux_reception': 0,
-        'commandes_retard': 0,
-        'taux_confirmation': 0,
+    # Période par défaut : les 12 derniers mois
+    mois_fin = mois_parametre('mois_fin', aujourdhui.replace(day=1))
+    mois_debut = mois_parametre('mois_debut', debut_periode(mois_fin))
+    
+    tri = request.GET.get('tri', 'ponctualite')
+    if tri not in TRIS_CLASSEMENT:
+        tri = 'ponctualite'
+    
+    context = {
+        'classement': classement_fournisseurs(mois_debut, mois_fin, tri),
+        'mois_debut': mois_debut.strftime('%Y-%m'),
+        'mois_fin': mois_fin.strftime('%Y-%m'),
+        'tri': tri,
     }
     
-    # Calculer les taux
-    if stats_globales['nombre_commandes'] > 0:
-        commandes_recues = commandes.filter(statut__in=['RECUE', 'FACTUREE']).count()
-        stats_globales['taux_reception'] = (commandes_recues / stats_globales['nombre_commandes']) * 100
-        
-        aujourd_hui = timezone.now().date()
-        commandes_retard = commandes.filter(
-            date_livraison_prevue__lt=aujourd_hui
-        ).exclude(statut__in=['RECUE', 'FACTUREE', 'ANNULEE']).count()
-        stats_globales['commandes_retard'] = commandes_retard
-        
-        commandes_confirmees = commandes.exclude(statut='BROUILLON').count()
-        stats_globales['taux_confirmation'] = (commandes_confirmees / stats_globales['nombre_commandes']) * 100
+    return render(request, 'achats/performances_fournisseurs.jinja', context)
+
+# ========== RÈGLEMENT GROUPÉ DES FOURNISSEURS ==========
+
+@login_required
+def reglement_fournisseurs(request):
+    """Vue pour proposer les échéances fournisseurs et les régler en une seule pièce comptable"""
+    aujourdhui = timezone.localdate()
     
-    # Répartition par statut
-    stats_par_statut = []
-    statuts = ['BROUILLON', 'CONFIRMEE', 'ENVOYEE', 'RECUE', 'FACTUREE', 'ANNULEE']
-    
-    for statut in statuts:
-        commandes_statut = commandes.filter(statut=statut)
-        nombre = commandes_statut.count()
-        montant = commandes_statut.aggregate(total=Sum('total'))['total'] or 0
-        pourcentage = (nombre / stats_globales['nombre_commandes'] * 100) if stats_globales['nombre_commandes'] > 0 else 0
+    try:
+        date_limite = datetime.strptime(request.GET.get('date_limite', ''), '%Y-%m-%d').date()
+    except ValueError:
+        date_limite = aujourdhui
+    
+    fournisseur_id = request.GET.get('fournisseur', '')
+    fournisseur = None
+    if fournisseur_id.isdigit():
+        fournisseur = Fournisseur.objects.filter(pk=fournisseur_id).first()
+    
+    if request.method == 'POST':
+        form = ReglementFournisseursForm(request.POST)
+        commande_ids = [pk for pk in request.POST.getlist('commandes') if pk.isdigit()]
         
-        if nombre > 0:  # N'ajouter que les statuts qui ont des commandes
-            stats_par_statut.append({
-                'statut': statut,
-                'nombre': nombre,
-                'montant': montant,
-                'pourcentage': pourcentage
-            })
-    
-    # Top 10 fournisseurs
-    top_fournisseurs = commandes.values(
-        'fournisseur__nom'
-    ).annotate(
-        nombre=Count('id'),
-        montant=Sum('total')
-    ).order_by('-montant')[:10]
-    
-    # Top 10 produits
-    top_produits = LigneCommandeAchat.objects.filter(
-        commande__in=commandes
-    ).values(
-        'produit__nom',
-        'produit__code'
-    ).annotate(
-        quantite_totale=Sum('quantite'),
-        montant_total=Sum(F('quantite') * F('prix_unitaire'))
-    ).order_by('-montant_total')[:10]
-    
-    # Évolution mensuelle (6 derniers mois)
-    evolution_mensuelle = []
-    for i in range(6):
-        mois_debut = (timezone.now() - timedelta(days=30*i)).replace(day=1)
-        if i == 0:
-            mois_fin = timezone.now()
+        if not commande_ids:
+            messages.error(request, "Sélectionnez au moins une commande à régler.")
+        elif form.is_valid():
+            try:
+                piece, paiements = regler_echeances(
+                    commande_ids,
+                    date_paiement=form.cleaned_data['date_paiement'],
+                    mode_paiement=form.cleaned_data['mode_paiement'],
+                    banque=form.cleaned_data['banque'],
+                    utilisateur=request.user,
+                    reference=form.cleaned_data['reference'],
+                )
+            except ErreurReglement as e:
+                messages.error(request, str(e))
+            else:
+                total = sum(paiement.montant for paiement in paiements)
+                messages.success(
+                    request,
+                    f"✓ {len(paiements)} paiement(s) enregistré(s) pour {total:,.0f} FCFA "
+                    f"(pièce comptable {piece.numero_piece})."
+                )
+                return redirect('achats:reglement_fournisseurs')
         else:
-            mois_fin = mois_debut.replace(day=1) + timedelta(days=32)
-            mois_fin = mois_fin.replace(day=1) - timedelta(days=1)
-        
-        commandes_mois = commandes.filter(
-            date_commande__gte=mois_debut,
-            date_commande__lte=mois_fin
-        )
-        
-        nombre = commandes_mois.count()
-        montant = commandes_mois.aggregate(total=Sum('total'))['total'] or 0
-        montant_moyen = montant / nombre if nombre > 0 else 0
-        
-        # Taux de réception du mois
-        recues = commandes_mois.filter(statut__in=['RECUE', 'FACTUREE']).count()
-        taux_reception = (recues / nombre * 100) if nombre > 0 else 0
-        
-        # Évolution par rapport au mois précédent
-        evolution = 0
-        if i < 5 and len(evolution_mensuelle) > 0:
-            mois_precedent = evolution_mensuelle[-1]['montant']
-            if mois_precedent > 0:
-                evolution = ((montant - mois_precedent) / mois_precedent) * 100
-        
-        evolution_mensuelle.insert(0, {
-            'mois': mois_debut.strftime('%B %Y'),
-            'nombre': nombre,
-            'montant': montant,
-            'montant_moyen': montant_moyen,
-            'taux_reception': taux_reception,
-            'evolution': evolution
-        })
+            messages.error(request, "Veuillez corriger les erreurs du formulaire.")
+    else:
+        form = ReglementFournisseursForm()
     
-    # Liste des fournisseurs pour le filtre
-    fournisseurs = Fournisseur.objects.all().order_by('nom')
+    echeances = echeances_fournisseurs(date_limite, fournisseur)
     
     context = {
-        'stats_globales': stats_globales,
-        'stats_par_statut': stats_par_statut,
-        'top_fournisseurs': top_fournisseurs,
-        'top_produits': top_produits,
-        'evolution_mensuelle': evolution_mensuelle,
-        'fournisseurs': fournisseurs,
-        'date_debut': date_debut,
-        'date_fin': date_fin,
+        'form': form,
+        'echeances': echeances,
+        'total_du': sum(echeance.solde for echeance in echeances),
+        'fournisseurs': Fournisseur.objects.filter(est_actif=True).order_by('nom'),
+        'fournisseur_id': fournisseur.pk if fournisseur else None,
+        'date_limite': date_limite.strftime('%Y-%m-%d'),
     }
     
-    return render(request, 'achats/historique_achats.jinja', context)
+    return render(request, 'achats/reglement_fournisseurs.jinja', context)
 
 # ========== API AJAX POUR OBTENIR LE PRIX D'ACHAT D'UN PRODUIT ==========
 
 @login_required
 def obtenir_prix_produit(request, pk):
-    """API AJAX pour obtenir le prix d'achat d'un produit"""
-    try:
-        produit = Produit.objects.get(pk=pk)
-        return JsonResponse({
-            'succes': True,
-            'prix_achat': float(produit.prix_achat),
-            'taux_tva': float(produit.taux_tva),
-            'stock_actuel': produit.stock_actuel,
-            'code': produit.code,
-            'unite': produit.unite,
-        })
-    except Produit.DoesNotExist:
+    """
+    API AJAX pour obtenir le prix d'achat d'un produit ; avec ?fournisseur=<id>,
+    ajoute les prix pratiqués par ce fournisseur (index PrixAchatFournisseur)
+    """
+    tarif = tarifs_produits([pk]).get(pk)
+    if tarif is None:
         return JsonResponse({
             'succes': False,
             'erreur': 'Produit non trouvé'
         }, status=404)
     
+    donnees = {
+        'succes': True,
+        'prix_achat': tarif['prix_achat'],
+        'taux_tva': tarif['taux_tva'],
+        'stock_actuel': tarif['stock_actuel'],
+        'code': tarif['code'],
+        'unite': tarif['unite'],
+    }
+    
+    fournisseur_id = request.GET.get('fournisseur', '')
+    if fournisseur_id.isdigit():
+        prix = prix_fournisseur_json(prix_fournisseur(int(fournisseur_id), pk))
+        if prix is not None:
+            donnees['fournisseur'] = prix
+    
+    return JsonResponse(donnees)
+    
 # ========== FONCTION D'EXPORTATION POUR COMMANDES D'ACHAT ==========
 # À AJOUTER à la fin de achats/views.py
 
@@ -675,18 +642,32 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 from reportlab.lib.units import cm
 
-@login_required
-def exporter_commandes_achat(request):
-    """
-    Vue pour exporter les commandes d'achat en Excel, CSV ou PDF
-    """
-    format_export = request.GET.get('format', 'excel')
-    filtre_statut = request.GET.get('statut', '')
-    recherche = request.GET.get('recherche', '')
-    ids = request.GET.get('ids', '')
+from base.exports import (
+    Colonne, DefinitionExport, format_date, format_choix, reponse_csv, reponse_xlsx,
+    reponse_export_differe, nom_fichier_horodate,
+)
+
+COLONNES_EXPORT_COMMANDES_ACHAT = [
+    Colonne('N° Commande', 'numero_commande'),
+    Colonne('Fournisseur', 'fournisseur__nom', largeur=30),
+    Colonne('Date Commande', 'date_commande', format=format_date),
+    Colonne('Date Livraison', 'date_livraison_prevue', format=format_date),
+    Colonne('Statut', 'statut', format=format_choix(CommandeAchat.STATUTS)),
+    Colonne('Entrepôt', 'entrepot__nom', largeur=20),
+    Colonne('Sous-total', 'sous_total', montant=True, total=True),
+    Colonne('TVA', 'montant_tva', montant=True, total=True),
+    Colonne('Total', 'total', montant=True, total=True),
+    Colonne('Créé par', 'cree_par__username'),
+]
+
+
+def filtrer_commandes_achat_export(parametres):
+    """Commandes d'achat à exporter selon les paramètres de la liste (statut, recherche ou sélection)"""
+    filtre_statut = parametres.get('statut', '')
+    recherche = parametres.get('recherche', '')
+    ids = parametres.get('ids', '')
     
-    # Filtrer les commandes
-    commandes = CommandeAchat.objects.select_related('fournisseur', 'entrepot', 'cree_par')
+    commandes = CommandeAchat.objects.all()
     
     # Si des IDs spécifiques sont fournis (sélection)
     if ids:
@@ -700,174 +681,45 @@ def exporter_commandes_achat(request):
         if recherche:
             commandes = commandes.filter(
                 Q(numero_commande__icontains=recherche) |
-                Q(fournisseur__nom__icontains=recherche) |
-                Q(reference__icontains=recherche)
+                Q(fournisseur__nom__icontains=recherche)
             )
     
-    commandes = commandes.order_by('-date_creation')
+    return commandes.order_by('-date_creation')
+
+
+EXPORT_COMMANDES_ACHAT = DefinitionExport(
+    "Commandes d'Achat", 'commandes_achat', COLONNES_EXPORT_COMMANDES_ACHAT, filtrer_commandes_achat_export
+)
+
+
+@login_required
+def exporter_commandes_achat(request):
+    """
+    Vue pour exporter les commandes d'achat en Excel, CSV ou PDF
+    """
+    format_export = request.GET.get('format', 'excel')
+    commandes = filtrer_commandes_achat_export(request.GET)
+
+    # Gros volumes : le fichier est produit en arrière-plan (voir « Mes exports »)
+    if request.GET.get('arriere_plan') and format_export in ('excel', 'csv'):
+        return reponse_export_differe(request, 'commandes_achat')
     
     # Appeler la fonction appropriée selon le format
     if format_export == 'excel':
-        return exporter_commandes_achat_excel(commandes)
+        return reponse_xlsx(
+            commandes, COLONNES_EXPORT_COMMANDES_ACHAT,
+            nom_fichier_horodate('commandes_achat', 'xlsx'), "Commandes d'Achat"
+        )
     elif format_export == 'csv':
-        return exporter_commandes_achat_csv(commandes)
+        return reponse_csv(
+            commandes, COLONNES_EXPORT_COMMANDES_ACHAT, nom_fichier_horodate('commandes_achat', 'csv')
+        )
     elif format_export == 'pdf':
-        return exporter_commandes_achat_pdf(commandes)
+        return exporter_commandes_achat_pdf(commandes.select_related('fournisseur'))
     else:
         return HttpResponse("Format non supporté", status=400)
 
 
-def exporter_commandes_achat_excel(commandes):
-    """Exporter les commandes d'achat en format Excel"""
-    from datetime import datetime
-    
-    # Créer un workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Commandes d'Achat"
-    
-    # Styles
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="6366F1", end_color="6366F1", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # En-têtes
-    headers = [
-        'N° Commande',
-        'Référence',
-        'Fournisseur',
-        'Date Commande',
-        'Date Livraison',
-        'Statut',
-        'Entrepôt',
-        'Sous-total',
-        'TVA',
-        'Total',
-        'Créé par'
-    ]
-    
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    # Données
-    for row_idx, commande in enumerate(commandes, start=2):
-        data_row = [
-            commande.numero_commande,
-            commande.reference or '',
-            commande.fournisseur.nom,
-            commande.date_commande.strftime('%d/%m/%Y'),
-            commande.date_livraison_prevue.strftime('%d/%m/%Y') if commande.date_livraison_prevue else '',
-            commande.get_statut_display(),
-            commande.entrepot.nom if commande.entrepot else '',
-            float(commande.sous_total),
-            float(commande.montant_tva),
-            float(commande.total),
-            commande.cree_par.username if commande.cree_par else ''
-        ]
-        
-        for col_idx, value in enumerate(data_row, start=1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            cell.value = value
-            cell.border = border
-            
-            # Alignement pour les montants
-            if col_idx in [8, 9, 10]:
-                cell.alignment = Alignment(horizontal="right")
-                cell.number_format = '#,##0.00'
-    
-    # Ajuster la largeur des colonnes
-    column_widths = [15, 15, 30, 15, 15, 15, 20, 15, 15, 15, 15]
-    for i, width in enumerate(column_widths, start=1):
-        ws.column_dimensions[chr(64 + i)].width = width
-    
-    # Ligne de total
-    total_row = len(commandes) + 2
-    ws.cell(row=total_row, column=7).value = "TOTAL:"
-    ws.cell(row=total_row, column=7).font = Font(bold=True)
-    ws.cell(row=total_row, column=8).value = sum(float(c.sous_total) for c in commandes)
-    ws.cell(row=total_row, column=8).font = Font(bold=True)
-    ws.cell(row=total_row, column=8).number_format = '#,##0.00'
-    ws.cell(row=total_row, column=9).value = sum(float(c.montant_tva) for c in commandes)
-    ws.cell(row=total_row, column=9).font = Font(bold=True)
-    ws.cell(row=total_row, column=9).number_format = '#,##0.00'
-    ws.cell(row=total_row, column=10).value = sum(float(c.total) for c in commandes)
-    ws.cell(row=total_row, column=10).font = Font(bold=True)
-    ws.cell(row=total_row, column=10).number_format = '#,##0.00'
-    
-    # Sauvegarder dans un buffer
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    # Préparer la réponse
-    response = HttpResponse(
-        buffer.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    filename = f"commandes_achat_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
-
-
-def exporter_commandes_achat_csv(commandes):
-    """Exporter les commandes d'achat en format CSV"""
-    from datetime import datetime
-    
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    filename = f"commandes_achat_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    # Ajouter BOM UTF-8 pour Excel
-    response.write('\ufeff')
-    
-    writer = csv.writer(response, delimiter=';')
-    
-    # En-têtes
-    writer.writerow([
-        'N° Commande',
-        'Référence',
-        'Fournisseur',
-        'Date Commande',
-        'Date Livraison',
-        'Statut',
-        'Entrepôt',
-        'Sous-total',
-        'TVA',
-        'Total',
-        'Créé par'
-    ])
-    
-    # Données
-    for commande in commandes:
-        writer.writerow([
-            commande.numero_commande,
-            commande.reference or '',
-            commande.fournisseur.nom,
-            commande.date_commande.strftime('%d/%m/%Y'),
-            commande.date_livraison_prevue.strftime('%d/%m/%Y') if commande.date_livraison_prevue else '',
-            commande.get_statut_display(),
-            commande.entrepot.nom if commande.entrepot else '',
-            f"{commande.sous_total:.2f}",
-            f"{commande.montant_tva:.2f}",
-            f"{commande.total:.2f}",
-            commande.cree_par.username if commande.cree_par else ''
-        ])
-    
-    return response
-
-
 def exporter_commandes_achat_pdf(commandes):
     """Exporter les commandes d'achat en format PDF"""
     from datetime import datetime
@@ -976,91 +828,29 @@ def exporter_historique_achats(request):
     Vue pour exporter l'historique des achats en Excel, CSV ou PDF
     """
     format_export = request.GET.get('format', 'excel')
-    date_debut = request.GET.get('date_debut')
-    date_fin = request.GET.get('date_fin')
-    fournisseur_id = request.GET.get('fournisseur')
-    
-    # Date par défaut (30 derniers jours)
-    if not date_debut:
-        date_debut_obj = timezone.now() - timedelta(days=30)
-        date_debut = date_debut_obj.strftime('%Y-%m-%d')
-    else:
-        date_debut_obj = datetime.strptime(date_debut, '%Y-%m-%d')
-    
-    if not date_fin:
-        date_fin_obj = timezone.now()
-        date_fin = date_fin_obj.strftime('%Y-%m-%d')
-    else:
-        date_fin_obj = datetime.strptime(date_fin, '%Y-%m-%d')
-    
-    # Filtrer les commandes
-    commandes = CommandeAchat.objects.all()
-    
-    if date_debut:
-        commandes = commandes.filter(date_commande__gte=date_debut)
-    if date_fin:
-        commandes = commandes.filter(date_commande__lte=date_fin)
-    if fournisseur_id:
-        commandes = commandes.filter(fournisseur_id=fournisseur_id)
-    
-    # Calculer les statistiques
-    stats_globales = {
-        'nombre_commandes': commandes.count(),
-        'montant_total': commandes.aggregate(total=Sum('total'))['total'] or 0,
-        'nombre_fournisseurs': commandes.values('fournisseur').distinct().count(),
-        'montant_moyen': commandes.aggregate(moyenne=Avg('total'))['moyenne'] or 0,
-    }
+    date_debut, date_fin, fournisseur_id = filtres_historique(request.GET)
+    rapport = rapport_historique(date_debut, date_fin, fournisseur_id)
     
-    # Répartition par statut
-    stats_par_statut = []
-    statuts = ['BROUILLON', 'CONFIRMEE', 'ENVOYEE', 'RECUE', 'FACTUREE', 'ANNULEE']
-    
-    for statut in statuts:
-        commandes_statut = commandes.filter(statut=statut)
-        nombre = commandes_statut.count()
-        montant = commandes_statut.aggregate(total=Sum('total'))['total'] or 0
-        
-        if nombre > 0:
-            stats_par_statut.append({
-                'statut': statut,
-                'nombre': nombre,
-                'montant': montant
-            })
-    
-    # Top fournisseurs
-    top_fournisseurs = commandes.values(
-        'fournisseur__nom'
-    ).annotate(
-        nombre=Count('id'),
-        montant=Sum('total')
-    ).order_by('-montant')[:10]
-    
-    # Top produits
-    top_produits = LigneCommandeAchat.objects.filter(
-        commande__in=commandes
-    ).values(
-        'produit__nom',
-        'produit__code'
-    ).annotate(
-        quantite_totale=Sum('quantite'),
-        montant_total=Sum(F('quantite') * F('prix_unitaire'))
-    ).order_by('-montant_total')[:10]
+    stats_globales = rapport.stats_globales
+    stats_par_statut = rapport.stats_par_statut
+    top_fournisseurs = rapport.top_fournisseurs
+    top_produits = rapport.top_produits
     
     # Appeler la fonction appropriée selon le format
     if format_export == 'excel':
         return exporter_historique_excel(
             stats_globales, stats_par_statut, top_fournisseurs, 
-            top_produits, date_debut_obj, date_fin_obj
+            top_produits, date_debut, date_fin
         )
     elif format_export == 'csv':
         return exporter_historique_csv(
             stats_globales, stats_par_statut, top_fournisseurs, 
-            top_produits, date_debut_obj, date_fin_obj
+            top_produits, date_debut, date_fin
         )
     elif format_export == 'pdf':
         return exporter_historique_pdf(
             stats_globales, stats_par_statut, top_fournisseurs, 
-            top_produits, date_debut_obj, date_fin_obj
+            top_produits, date_debut, date_fin
         )
     else:
         return HttpResponse("Format non supporté", status=400)
@@ -1620,91 +1410,23 @@ def imprimer_historique_achats(request):
     """
     Vue pour afficher une version imprimable de l'historique des achats
     """
-    # Récupérer les paramètres de filtrage
-    date_debut = request.GET.get('date_debut')
-    date_fin = request.GET.get('date_fin')
-    fournisseur_id = request.GET.get('fournisseur')
-    
-    # Date par défaut (30 derniers jours)
-    if not date_debut:
-        date_debut = (timezone.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    if not date_fin:
-        date_fin = timezone.now().strftime('%Y-%m-%d')
-    
-    # Filtrer les commandes
-    commandes = CommandeAchat.objects.all()
-    
-    if date_debut:
-        commandes = commandes.filter(date_commande__gte=date_debut)
-    if date_fin:
-        commandes = commandes.filter(date_commande__lte=date_fin)
-    if fournisseur_id:
-        commandes = commandes.filter(fournisseur_id=fournisseur_id)
-    
-    # Statistiques globales
-    stats_globales = {
-        'nombre_commandes': commandes.count(),
-        'montant_total': commandes.aggregate(total=Sum('total'))['total'] or Decimal('0'),
-        'nombre_fournisseurs': commandes.values('fournisseur').distinct().count(),
-        'montant_moyen': commandes.aggregate(moyenne=Avg('total'))['moyenne'] or Decimal('0'),
-    }
-    
-    # Répartition par statut
-    stats_par_statut = []
-    statuts = ['BROUILLON', 'CONFIRMEE', 'ENVOYEE', 'RECUE', 'FACTUREE', 'ANNULEE']
-    
-    statut_labels = {
-        'BROUILLON': 'Brouillon',
-        'CONFIRMEE': 'Confirmée',
-        'ENVOYEE': 'Envoyée',
-        'RECUE': 'Reçue',
-        'FACTUREE': 'Facturée',
-        'ANNULEE': 'Annulée'
-    }
-    
-    for statut in statuts:
-        commandes_statut = commandes.filter(statut=statut)
-        nombre = commandes_statut.count()
-        montant = commandes_statut.aggregate(total=Sum('total'))['total'] or Decimal('0')
-        pourcentage = (nombre / stats_globales['nombre_commandes'] * 100) if stats_globales['nombre_commandes'] > 0 else 0
-        
-        if nombre > 0:
-            stats_par_statut.append({
-                'statut': statut,
-                'statut_display': statut_labels.get(statut, statut),
-                'nombre': nombre,
-                'montant': float(montant),
-                'pourcentage': float(pourcentage)
-            })
-    
-    # Top 10 fournisseurs
-    top_fournisseurs = list(commandes.values(
-        'fournisseur__nom'
-    ).annotate(
-        nombre=Count('id'),
-        montant=Sum('total')
-    ).order_by('-montant')[:10])
-    
-    # Convertir les Decimal en float pour éviter les problèmes de sérialisation
-    for f in top_fournisseurs:
-        if f.get('montant'):
-            f['montant'] = float(f['montant'])
-    
-    # Top 10 produits
-    top_produits = list(LigneCommandeAchat.objects.filter(
-        commande__in=commandes
-    ).values(
-        'produit__nom',
-        'produit__code'
-    ).annotate(
-        quantite_totale=Sum('quantite'),
-        montant_total=Sum(F('quantite') * F('prix_unitaire'))
-    ).order_by('-montant_total')[:10])
-    
-    # Convertir les Decimal en float
-    for p in top_produits:
-        if p.get('montant_total'):
-            p['montant_total'] = float(p['montant_total'])
+    date_debut, date_fin, fournisseur_id = filtres_historique(request.GET)
+    rapport = rapport_historique(date_debut, date_fin, fournisseur_id)
+    stats_globales = rapport.stats_globales
+    
+    # Convertir les Decimal en float pour l'affichage (copies : le rapport est partagé via le cache)
+    stats_par_statut = [
+        dict(stat, montant=float(stat['montant']), pourcentage=float(stat['pourcentage']))
+        for stat in rapport.stats_par_statut
+    ]
+    top_fournisseurs = [
+        dict(f, montant=float(f['montant'] or 0))
+        for f in rapport.top_fournisseurs
+    ]
+    top_produits = [
+        dict(p, montant_total=float(p['montant_total'] or 0))
+        for p in rapport.top_produits
+    ]
     
     context = {
         'stats_globales': {
@@ -1716,8 +1438,8 @@ def imprimer_historique_achats(request):
         'stats_par_statut': stats_par_statut,
         'top_fournisseurs': top_fournisseurs,
         'top_produits': top_produits,
-        'date_debut': date_debut,
-        'date_fin': date_fin,
+        'date_debut': date_debut.strftime('%Y-%m-%d'),
+        'date_fin': date_fin.strftime('%Y-%m-%d'),
         'date_impression': timezone.now().strftime('%d/%m/%Y à %H:%M'),
     }
     
@@ -1729,87 +1451,16 @@ def telecharger_historique_pdf(request):
     """
     Vue pour télécharger l'historique des achats en PDF professionnel
     """
-    from datetime import datetime
-    
-    # Récupérer les paramètres de filtrage
-    date_debut = request.GET.get('date_debut')
-    date_fin = request.GET.get('date_fin')
-    fournisseur_id = request.GET.get('fournisseur')
-    
-    # Date par défaut (30 derniers jours)
-    if not date_debut:
-        date_debut_obj = timezone.now() - timedelta(days=30)
-        date_debut = date_debut_obj.strftime('%Y-%m-%d')
-    else:
-        date_debut_obj = datetime.strptime(date_debut, '%Y-%m-%d')
-    
-    if not date_fin:
-        date_fin_obj = timezone.now()
-        date_fin = date_fin_obj.strftime('%Y-%m-%d')
-    else:
-        date_fin_obj = datetime.strptime(date_fin, '%Y-%m-%d')
+    date_debut_obj, date_fin_obj, fournisseur_id = filtres_historique(request.GET)
+    rapport = rapport_historique(date_debut_obj, date_fin_obj, fournisseur_id)
     
-    # Filtrer les commandes
-    commandes = CommandeAchat.objects.all()
-    
-    if date_debut:
-        commandes = commandes.filter(date_commande__gte=date_debut)
-    if date_fin:
-        commandes = commandes.filter(date_commande__lte=date_fin)
-    if fournisseur_id:
-        commandes = commandes.filter(fournisseur_id=fournisseur_id)
-    
-    # Statistiques globales
-    stats_globales = {
-        'nombre_commandes': commandes.count(),
-        'montant_total': commandes.aggregate(total=Sum('total'))['total'] or Decimal('0'),
-        'nombre_fournisseurs': commandes.values('fournisseur').distinct().count(),
-        'montant_moyen': commandes.aggregate(moyenne=Avg('total'))['moyenne'] or Decimal('0'),
-    }
-    
-    # Répartition par statut
-    stats_par_statut = []
-    statuts = ['BROUILLON', 'CONFIRMEE', 'ENVOYEE', 'RECUE', 'FACTUREE', 'ANNULEE']
-    
-    statut_labels = {
-        'BROUILLON': 'Brouillon',
-        'CONFIRMEE': 'Confirmée',
-        'ENVOYEE': 'Envoyée',
-        'RECUE': 'Reçue',
-        'FACTUREE': 'Facturée',
-        'ANNULEE': 'Annulée'
-    }
-    
-    for statut in statuts:
-        commandes_statut = commandes.filter(statut=statut)
-        nombre = commandes_statut.count()
-        montant = commandes_statut.aggregate(total=Sum('total'))['total'] or Decimal('0')
-        
-        if nombre > 0:
-            stats_par_statut.append({
-                'statut': statut_labels.get(statut, statut),
-                'nombre': nombre,
-                'montant': montant
-            })
-    
-    # Top 10 fournisseurs
-    top_fournisseurs = commandes.values(
-        'fournisseur__nom'
-    ).annotate(
-        nombre=Count('id'),
-        montant=Sum('total')
-    ).order_by('-montant')[:10]
-    
-    # Top 10 produits
-    top_produits = LigneCommandeAchat.objects.filter(
-        commande__in=commandes
-    ).values(
-        'produit__nom',
-        'produit__code'
-    ).annotate(
-        quantite_totale=Sum('quantite'),
-        montant_total=Sum(F('quantite') * F('prix_unitaire'))
-    ).order_by('-montant_total')[:10]
+    stats_globales = rapport.stats_globales
+    stats_par_statut = [
+        {'statut': stat['statut_display'], 'nombre': stat['nombre'], 'montant': stat['montant']}
+        for stat in rapport.stats_par_statut
+    ]
+    top_fournisseurs = rapport.top_fournisseurs
+    top_produits = rapport.top_produits
     
     # Créer le PDF avec ReportLab
     buffer = BytesIO()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Entreprise, Client, Fournisseur
+from .models import Entreprise, Client, Fournisseur, EmailSortant, TacheExport
 
 @admin.register(Entreprise)
 class AdminEntreprise(admin.ModelAdmin):
@@ -9,10 +9,11 @@ class AdminEntreprise(admin.ModelAdmin):
 
 @admin.register(Client)
 class AdminClient(admin.ModelAdmin):
-    list_display = ['code', 'nom', 'email', 'ville', 'pays', 'limite_credit', 'est_actif']
+    list_display = ['code', 'nom', 'email', 'ville', 'pays', 'limite_credit', 'encours_credit', 'est_actif']
     search_fields = ['code', 'nom', 'email']
     list_filter = ['est_actif', 'pays', 'ville', 'date_creation']
     ordering = ['-date_creation']
+    readonly_fields = ['encours_credit']
     
     fieldsets = (
         ('Informations générales', {
@@ -22,7 +23,7 @@ class AdminClient(admin.ModelAdmin):
             'fields': ('adresse', 'ville', 'pays')
         }),
         ('Informations financières', {
-            'fields': ('numero_fiscal', 'limite_credit')
+            'fields': ('numero_fiscal', 'limite_credit', 'encours_credit')
         }),
     )
 
@@ -32,3 +33,16 @@ class AdminFournisseur(admin.ModelAdmin):
     search_fields = ['code', 'nom', 'email']
     list_filter = ['est_actif', 'pays', 'ville', 'date_creation']
     ordering = ['-date_creation']
+
+@admin.register(EmailSortant)
+class AdminEmailSortant(admin.ModelAdmin):
+    list_display = ['sujet', 'destinataires', 'statut', 'tentatives', 'prochaine_tentative', 'date_envoi']
+    search_fields = ['sujet', 'destinataires']
+    list_filter = ['statut', 'date_creation']
+    readonly_fields = ['date_creation', 'date_envoi', 'derniere_erreur']
+
+@admin.register(TacheExport)
+class AdminTacheExport(admin.ModelAdmin):
+    list_display = ['type_export', 'format', 'statut', 'lignes_traitees', 'total_lignes', 'cree_par', 'date_creation', 'date_expiration']
+    list_filter = ['statut', 'type_export', 'format', 'date_creation']
+    readonly_fields = ['date_creation', 'date_debut', 'date_maj', 'date_fin', 'erreur']
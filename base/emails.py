@@ -0,0 +1,182 @@
+# base/emails.py
+"""
+File d'envoi des emails.
+
+Les vues ne parlent plus au serveur SMTP : elles déposent le message dans la
+table EmailSortant et rendent la main immédiatement. La commande
+`envoyer_emails` vide ensuite la file par lots, sur une seule connexion SMTP
+réutilisée, avec nouvelles tentatives et délai exponentiel en cas d'échec.
+Les messages d'un lot sont réservés (EN_COURS) dans une courte transaction,
+puis envoyés hors transaction : un serveur SMTP lent ne bloque pas la table.
+
+Les pièces jointes sont référencées par (type, id) et générées au moment de
+l'envoi par la fonction déclarée dans PIECES_JOINTES ; elle doit retourner
+un tuple (nom_fichier, contenu, type_mime).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import EmailSortant
+
+logger = logging.getLogger(__name__)
+
+PIECES_JOINTES = {
+    'facture': 'ventes.documents.piece_jointe_facture',
+    'commande_vente': 'ventes.documents.piece_jointe_commande',
+    'relance': 'ventes.documents.piece_jointe_relance',
+}
+
+TAILLE_LOT = getattr(settings, 'EMAIL_FILE_TAILLE_LOT', 50)
+MAX_TENTATIVES = getattr(settings, 'EMAIL_FILE_MAX_TENTATIVES', 5)
+DELAI_BASE = getattr(settings, 'EMAIL_FILE_DELAI_BASE', 60)  # secondes
+DELAI_MAX = 60 * 60 * 6
+DUREE_RESERVATION = getattr(settings, 'EMAIL_FILE_DUREE_RESERVATION', 60 * 15)  # secondes
+
+
+def mettre_en_file(sujet, corps, destinataires, est_html=False, piece_jointe=None, expediteur=None):
+    """
+    Dépose un email dans la file d'envoi.
+
+    `piece_jointe` est un tuple (type, id) dont le type figure dans PIECES_JOINTES.
+    """
+    if isinstance(destinataires, str):
+        destinataires = [destinataires]
+
+    type_piece_jointe, id_piece_jointe = piece_jointe if piece_jointe else ('', None)
+    if type_piece_jointe and type_piece_jointe not in PIECES_JOINTES:
+        raise ValueError(f"Type de pièce jointe inconnu : {type_piece_jointe}")
+
+    return EmailSortant.objects.create(
+        sujet=sujet,
+        corps=corps,
+        est_html=est_html,
+        expediteur=expediteur or '',
+        destinataires=', '.join(destinataires),
+        type_piece_jointe=type_piece_jointe,
+        id_piece_jointe=id_piece_jointe,
+    )
+
+
+def _construire_message(email, connexion):
+    message = EmailMessage(
+        subject=email.sujet,
+        body=email.corps,
+        from_email=email.expediteur or getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@erp-mea.com'),
+        to=email.liste_destinataires,
+        connection=connexion,
+    )
+    if email.est_html:
+        message.content_subtype = 'html'
+
+    if email.type_piece_jointe:
+        generer = import_string(PIECES_JOINTES[email.type_piece_jointe])
+        message.attach(*generer(email.id_piece_jointe))
+
+    return message
+
+
+def _planifier_nouvelle_tentative(email, erreur):
+    email.statut = 'EN_ATTENTE'
+    email.tentatives += 1
+    email.derniere_erreur = str(erreur)
+    if email.tentatives >= MAX_TENTATIVES:
+        email.statut = 'ECHEC'
+    else:
+        delai = min(DELAI_BASE * 2 ** (email.tentatives - 1), DELAI_MAX)
+        email.prochaine_tentative = timezone.now() + timedelta(seconds=delai)
+
+
+def _echec_definitif(email, erreur):
+    email.statut = 'ECHEC'
+    email.tentatives += 1
+    email.derniere_erreur = str(erreur)
+
+
+def reserver_lot(taille=TAILLE_LOT, ids=None):
+    """
+    Réserve un lot d'emails échus : ils passent EN_COURS jusqu'à
+    maintenant + DUREE_RESERVATION, dans une courte transaction (SKIP LOCKED :
+    plusieurs workers ne réservent jamais le même message). Un message dont
+    la réservation a expiré (worker arrêté pendant l'envoi) est de nouveau
+    réservable.
+    """
+    maintenant = timezone.now()
+    with transaction.atomic():
+        a_envoyer = EmailSortant.objects.filter(
+            statut__in=['EN_ATTENTE', 'EN_COURS'], prochaine_tentative__lte=maintenant
+        )
+        if ids is not None:
+            a_envoyer = a_envoyer.filter(pk__in=ids)
+        lot = list(
+            a_envoyer.select_for_update(skip_locked=True).order_by('prochaine_tentative', 'id')[:taille]
+        )
+        for email in lot:
+            email.statut = 'EN_COURS'
+            email.prochaine_tentative = maintenant + timedelta(seconds=DUREE_RESERVATION)
+        EmailSortant.objects.bulk_update(lot, ['statut', 'prochaine_tentative'])
+    return lot
+
+
+def envoyer_lot(taille=TAILLE_LOT, connexion=None, ids=None):
+    """
+    Envoie un lot d'emails échus sur une seule connexion SMTP.
+    `ids` restreint le lot à certains messages (ex. ceux d'une campagne).
+
+    Le lot est d'abord réservé (reserver_lot) ; l'envoi se fait ensuite hors
+    transaction, sans verrou sur la table. Une erreur SMTP replanifie le
+    message (délai exponentiel) ; une pièce jointe impossible à générer
+    (document supprimé...) est un échec définitif.
+    Retourne le tuple (envoyés, en échec).
+    """
+    lot = reserver_lot(taille, ids)
+    if not lot:
+        return 0, 0
+
+    envoyes = echecs = 0
+    connexion = connexion or get_connection()
+    restants = list(lot)
+    try:
+        connexion.open()
+        while restants:
+            email = restants.pop(0)
+            try:
+                message = _construire_message(email, connexion)
+            except Exception as e:
+                logger.error("Email %s impossible à construire : %s", email.pk, e)
+                _echec_definitif(email, e)
+                echecs += 1
+                continue
+            try:
+                connexion.send_messages([message])
+            except Exception as e:
+                logger.warning("Échec d'envoi de l'email %s : %s", email.pk, e)
+                _planifier_nouvelle_tentative(email, e)
+                echecs += 1
+                # La connexion peut être dans un état incertain : on la rouvre
+                connexion.close()
+                connexion.open()
+            else:
+                email.statut = 'ENVOYE'
+                email.date_envoi = timezone.now()
+                email.derniere_erreur = ''
+                envoyes += 1
+    except Exception as e:
+        # Serveur injoignable : le reste du lot est replanifié
+        logger.error("Connexion SMTP impossible : %s", e)
+        for email in restants:
+            _planifier_nouvelle_tentative(email, e)
+            echecs += 1
+    finally:
+        connexion.close()
+        EmailSortant.objects.bulk_update(
+            lot, ['statut', 'tentatives', 'prochaine_tentative', 'derniere_erreur', 'date_envoi']
+        )
+
+    return envoyes, echecs
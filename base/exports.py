@@ -0,0 +1,393 @@
+# base/exports.py
+"""
+Couche d'export commune (CSV / Excel) pour toutes les listes.
+
+Les lignes sont lues avec values_list() et .iterator(chunk_size=...) : aucun
+objet modèle n'est instancié et la mémoire reste bornée quel que soit le
+nombre de lignes.
+- CSV : flux StreamingHttpResponse (séparateur ';', BOM UTF-8 pour Excel) ;
+- Excel : openpyxl en mode write_only, écrit dans un fichier temporaire
+  « spooled » (en mémoire jusqu'à une certaine taille, puis sur disque).
+
+Chaque export est décrit par une liste de Colonne. Les exports déclarés dans
+EXPORTS_DISPONIBLES peuvent aussi être demandés en arrière-plan : une
+TacheExport est créée, la commande traiter_exports produit le fichier sous
+MEDIA_ROOT/exports/ et l'utilisateur le télécharge depuis « Mes exports ».
+"""
+
+import csv
+from datetime import datetime, timedelta
+from tempfile import SpooledTemporaryFile, TemporaryFile
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.http import StreamingHttpResponse, FileResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+
+from .models import TacheExport
+
+TAILLE_PAQUET = 2000
+TAILLE_MEMOIRE_XLSX = 10 * 1024 * 1024  # au-delà, le fichier temporaire passe sur disque
+TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class Colonne:
+    """
+    Colonne d'export.
+
+    - champ   : chemin values() (ex. 'client__nom') ou nom d'annotation ;
+    - format  : fonction appliquée à la valeur brute (dates, choix...) ;
+    - montant : valeur numérique, formatée 0.00 et totalisable ;
+    - total   : ajoute la somme de la colonne en dernière ligne (Excel).
+    """
+
+    def __init__(self, titre, champ, format=None, montant=False, total=False, largeur=15):
+        self.titre = titre
+        self.champ = champ
+        self.format = format
+        self.montant = montant
+        self.total = total
+        self.largeur = largeur
+
+
+# ========== FORMATS ==========
+
+def format_date(valeur):
+    return valeur.strftime('%d/%m/%Y') if valeur else ''
+
+
+def format_choix(choix):
+    """Affiche le libellé d'un champ à choix (ex. Model.STATUTS)"""
+    libelles = dict(choix)
+    return lambda valeur: libelles.get(valeur, valeur or '')
+
+
+def format_actif(valeur):
+    return 'Actif' if valeur else 'Inactif'
+
+
+def format_tiret(valeur):
+    return valeur or '-'
+
+
+# ========== LECTURE ==========
+
+def lignes_export(queryset, colonnes, taille_paquet=TAILLE_PAQUET):
+    """Itère sur les lignes formatées (listes de valeurs) sans instancier de modèles"""
+    champs = [colonne.champ for colonne in colonnes]
+    for valeurs in queryset.values_list(*champs).iterator(chunk_size=taille_paquet):
+        ligne = []
+        for colonne, valeur in zip(colonnes, valeurs):
+            if colonne.format:
+                valeur = colonne.format(valeur)
+            elif colonne.montant:
+                valeur = valeur or 0
+            elif valeur is None:
+                valeur = ''
+            ligne.append(valeur)
+        yield ligne
+
+
+def totaux_export(queryset, colonnes):
+    """Totaux des colonnes marquées total=True, en une seule requête d'agrégation"""
+    a_totaliser = [colonne.champ for colonne in colonnes if colonne.total]
+    if not a_totaliser:
+        return {}
+    resultat = queryset.order_by().aggregate(
+        **{f'somme_{i}': Sum(champ) for i, champ in enumerate(a_totaliser)}
+    )
+    return {champ: resultat[f'somme_{i}'] for i, champ in enumerate(a_totaliser)}
+
+
+def nom_fichier_horodate(prefixe, extension):
+    return f"{prefixe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+# ========== CSV ==========
+
+class _Tampon:
+    """Pseudo-fichier : csv.writer écrit une ligne, on la récupère aussitôt"""
+
+    def write(self, valeur):
+        return valeur
+
+
+def csv_lignes(titres, lignes):
+    """Génère le CSV de lignes déjà formatées (itérable de listes), ligne par ligne"""
+    writer = csv.writer(_Tampon(), delimiter=';')
+
+    # BOM UTF-8 pour Excel
+    yield '\ufeff' + writer.writerow(titres)
+
+    for ligne in lignes:
+        yield writer.writerow(ligne)
+
+
+def contenu_csv(queryset, colonnes, taille_paquet=TAILLE_PAQUET):
+    """Génère le CSV ligne par ligne (chaînes de caractères)"""
+    yield from csv_lignes(
+        [colonne.titre for colonne in colonnes],
+        (
+            [f"{valeur:.2f}" if colonne.montant else valeur for colonne, valeur in zip(colonnes, ligne)]
+            for ligne in lignes_export(queryset, colonnes, taille_paquet)
+        ),
+    )
+
+
+def ecrire_csv(fichier, queryset, colonnes, progression=None, taille_paquet=TAILLE_PAQUET):
+    """Écrit le CSV dans `fichier` (binaire, UTF-8) et retourne le nombre de lignes"""
+    nb_lignes = -1  # la première ligne produite est l'en-tête
+    for ligne in contenu_csv(queryset, colonnes, taille_paquet):
+        fichier.write(ligne.encode('utf-8'))
+        nb_lignes += 1
+        if progression and nb_lignes and nb_lignes % taille_paquet == 0:
+            progression(nb_lignes)
+    if progression:
+        progression(nb_lignes)
+    return nb_lignes
+
+
+def reponse_csv(queryset, colonnes, nom_fichier):
+    response = StreamingHttpResponse(contenu_csv(queryset, colonnes), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    return response
+
+
+# ========== EXCEL ==========
+
+def ecrire_xlsx(fichier, queryset, colonnes, titre, couleur='6366F1', progression=None,
+                taille_paquet=TAILLE_PAQUET):
+    """
+    Écrit le classeur dans `fichier` en mode write_only et retourne le nombre
+    de lignes. `progression(n)` est appelé après chaque paquet de lignes.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=titre[:31])
+
+    for i, colonne in enumerate(colonnes):
+        ws.column_dimensions[get_column_letter(i + 1)].width = colonne.largeur
+
+    police_entete = Font(bold=True, color="FFFFFF", size=12)
+    fond_entete = PatternFill(start_color=couleur, end_color=couleur, fill_type="solid")
+    entetes = []
+    for colonne in colonnes:
+        cellule = WriteOnlyCell(ws, value=colonne.titre)
+        cellule.font = police_entete
+        cellule.fill = fond_entete
+        cellule.alignment = Alignment(horizontal="center", vertical="center")
+        entetes.append(cellule)
+    ws.append(entetes)
+
+    def cellule_montant(valeur, gras=False):
+        cellule = WriteOnlyCell(ws, value=float(valeur or 0))
+        cellule.number_format = '#,##0.00'
+        cellule.alignment = Alignment(horizontal="right")
+        if gras:
+            cellule.font = Font(bold=True)
+        return cellule
+
+    nb_lignes = 0
+    for ligne in lignes_export(queryset, colonnes, taille_paquet):
+        ws.append([
+            cellule_montant(valeur) if colonne.montant else valeur
+            for colonne, valeur in zip(colonnes, ligne)
+        ])
+        nb_lignes += 1
+        if progression and nb_lignes % taille_paquet == 0:
+            progression(nb_lignes)
+
+    # Ligne de total : « TOTAL: » juste avant la première colonne totalisée
+    totaux = totaux_export(queryset, colonnes)
+    if totaux:
+        premiere = next(i for i, colonne in enumerate(colonnes) if colonne.total)
+        ligne_total = []
+        for i, colonne in enumerate(colonnes):
+            if colonne.total:
+                ligne_total.append(cellule_montant(totaux[colonne.champ], gras=True))
+            elif i == premiere - 1:
+                cellule = WriteOnlyCell(ws, value="TOTAL:")
+                cellule.font = Font(bold=True)
+                ligne_total.append(cellule)
+            else:
+                ligne_total.append(None)
+        ws.append(ligne_total)
+
+    wb.save(fichier)
+    if progression:
+        progression(nb_lignes)
+    return nb_lignes
+
+
+def reponse_xlsx(queryset, colonnes, nom_fichier, titre, couleur='6366F1'):
+    fichier = SpooledTemporaryFile(max_size=TAILLE_MEMOIRE_XLSX)
+    ecrire_xlsx(fichier, queryset, colonnes, titre, couleur)
+    fichier.seek(0)
+    return FileResponse(fichier, as_attachment=True, filename=nom_fichier, content_type=TYPE_XLSX)
+
+
+# ========== EXPORTS EN ARRIÈRE-PLAN ==========
+
+class DefinitionExport:
+    """
+    Export disponible en arrière-plan : `filtrer(parametres)` reconstruit le
+    queryset à partir des paramètres GET de la liste (un dict). Un export
+    dont les lignes ne sont pas celles d'un queryset redéfinit compter() et
+    ecrire() (voir comptabilite.grand_livre.ExportGrandLivre).
+    """
+
+    def __init__(self, titre, prefixe, colonnes, filtrer, couleur='6366F1'):
+        self.titre = titre
+        self.prefixe = prefixe
+        self.colonnes = colonnes
+        self.filtrer = filtrer
+        self.couleur = couleur
+
+    def compter(self, source):
+        """Nombre de lignes à produire (suivi de l'avancement)"""
+        return source.count()
+
+    def ecrire(self, fichier, source, format_export, progression=None):
+        """Écrit le fichier ('csv' ou 'excel') et retourne le nombre de lignes"""
+        if format_export == 'csv':
+            return ecrire_csv(fichier, source, self.colonnes, progression)
+        return ecrire_xlsx(fichier, source, self.colonnes, self.titre, self.couleur, progression)
+
+
+# Clé = TacheExport.type_export ; valeur = chemin de la DefinitionExport
+EXPORTS_DISPONIBLES = {
+    'clients': 'base.views.EXPORT_CLIENTS',
+    'fournisseurs': 'base.views.EXPORT_FOURNISSEURS',
+    'commandes_vente': 'ventes.views.EXPORT_COMMANDES_VENTE',
+    'commandes_achat': 'achats.views.EXPORT_COMMANDES_ACHAT',
+    'plan_comptable': 'comptabilite.views.EXPORT_PLAN_COMPTABLE',
+    'grand_livre': 'comptabilite.views.EXPORT_GRAND_LIVRE',
+}
+
+PARAMETRES_IGNORES = ('format', 'arriere_plan')
+
+
+def duree_conservation():
+    return timedelta(hours=getattr(settings, 'EXPORTS_DUREE_CONSERVATION', 24))
+
+
+def delai_reprise():
+    return timedelta(minutes=getattr(settings, 'EXPORTS_DELAI_REPRISE', 30))
+
+
+def reponse_export_differe(request, type_export):
+    """Enregistre la demande d'export et renvoie vers « Mes exports » (à la place du fichier)"""
+    format_export = request.GET.get('format', 'excel')
+    if format_export not in dict(TacheExport.FORMATS):
+        format_export = 'excel'
+    
+    TacheExport.objects.create(
+        type_export=type_export,
+        format=format_export,
+        parametres={cle: valeur for cle, valeur in request.GET.items() if cle not in PARAMETRES_IGNORES},
+        cree_par=request.user,
+    )
+    messages.success(request, 'Export en cours de préparation. Le lien de téléchargement apparaîtra ici dès qu\'il sera prêt.')
+    return redirect('mes_exports')
+
+
+def executer_tache_export(tache):
+    """
+    Produit le fichier d'une tâche (déjà passée EN_COURS) en suivant la
+    progression. Chaque progression rafraîchit date_maj (signe de vie). Les
+    mises à jour ne portent que sur la tâche telle que réservée (même
+    date_debut) : si elle a été reprise par un autre worker entre-temps, ce
+    worker-ci abandonne son fichier au lieu d'écraser celui de l'autre.
+    """
+    taches = TacheExport.objects.filter(pk=tache.pk, date_debut=tache.date_debut)
+    
+    def progression(nb_lignes):
+        taches.update(lignes_traitees=nb_lignes, date_maj=timezone.now())
+    
+    try:
+        if tache.type_export not in EXPORTS_DISPONIBLES:
+            raise ValueError(f"Type d'export inconnu : {tache.type_export}")
+        definition = import_string(EXPORTS_DISPONIBLES[tache.type_export])
+        source = definition.filtrer(tache.parametres)
+        tache.total_lignes = definition.compter(source)
+        taches.update(total_lignes=tache.total_lignes, date_maj=timezone.now())
+        
+        extension = 'csv' if tache.format == 'csv' else 'xlsx'
+        with TemporaryFile() as fichier:
+            nb_lignes = definition.ecrire(fichier, source, tache.format, progression)
+            fichier.seek(0)
+            tache.fichier.save(nom_fichier_horodate(definition.prefixe, extension), File(fichier), save=False)
+    except Exception as e:
+        tache.date_fin = timezone.now()
+        taches.update(
+            statut='ECHEC', erreur=str(e)[:2000], date_fin=tache.date_fin,
+            date_expiration=tache.date_fin + duree_conservation(),
+        )
+        return False
+    
+    tache.date_fin = timezone.now()
+    if not taches.update(
+        statut='TERMINE', lignes_traitees=nb_lignes, fichier=tache.fichier.name,
+        date_fin=tache.date_fin, date_maj=tache.date_fin, date_expiration=tache.date_fin + duree_conservation(),
+    ):
+        # Tâche reprise par un autre worker : son fichier fait foi
+        tache.fichier.delete(save=False)
+        return False
+    return True
+
+
+def traiter_exports(taille=1):
+    """
+    Réserve jusqu'à `taille` tâches en attente (skip_locked : plusieurs
+    workers peuvent tourner en parallèle) et les exécute. Une tâche EN_COURS
+    sans progression (date_maj) depuis EXPORTS_DELAI_REPRISE minutes (worker
+    arrêté en cours de route) est reprise depuis le début ; un long export
+    qui progresse n'est pas repris.
+    Retourne (terminees, echecs).
+    """
+    maintenant = timezone.now()
+    limite = maintenant - delai_reprise()
+    with transaction.atomic():
+        taches = list(
+            TacheExport.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(statut='EN_ATTENTE')
+                | Q(statut='EN_COURS', date_maj__lt=limite)
+                | Q(statut='EN_COURS', date_maj__isnull=True, date_debut__lt=limite)
+            )
+            .order_by('date_creation')[:taille]
+        )
+        TacheExport.objects.filter(pk__in=[tache.pk for tache in taches]).update(
+            statut='EN_COURS', date_debut=maintenant, date_maj=maintenant, lignes_traitees=0
+        )
+    
+    terminees = echecs = 0
+    for tache in taches:
+        tache.statut, tache.date_debut, tache.date_maj, tache.lignes_traitees = 'EN_COURS', maintenant, maintenant, 0
+        if executer_tache_export(tache):
+            terminees += 1
+        else:
+            echecs += 1
+    return terminees, echecs
+
+
+def purger_exports_expires():
+    """Supprime les fichiers (et les tâches) dont la date d'expiration est passée"""
+    expirees = TacheExport.objects.filter(date_expiration__lt=timezone.now())
+    nb = 0
+    for tache in expirees.iterator():
+        if tache.fichier:
+            tache.fichier.delete(save=False)
+        tache.delete()
+        nb += 1
+    return nb
@@ -0,0 +1,32 @@
+# base/management/commands/envoyer_emails.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from base.emails import envoyer_lot, TAILLE_LOT
+
+class Command(BaseCommand):
+    help = "Envoie les emails en attente dans la file d'envoi (worker)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=TAILLE_LOT, help='Nombre d\'emails par connexion SMTP')
+        parser.add_argument('--boucle', action='store_true', help='Tourne en continu (mode worker)')
+        parser.add_argument('--intervalle', type=int, default=10, help='Pause en secondes quand la file est vide')
+
+    def handle(self, *args, **options):
+        total_envoyes = total_echecs = 0
+
+        while True:
+            envoyes, echecs = envoyer_lot(options['lot'])
+            total_envoyes += envoyes
+            total_echecs += echecs
+
+            if envoyes or echecs:
+                self.stdout.write(f'📧 Lot traité : {envoyes} envoyé(s), {echecs} échec(s)')
+                continue
+
+            if not options['boucle']:
+                break
+            time.sleep(options['intervalle'])
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total_envoyes} email(s) envoyé(s), {total_echecs} échec(s)'))
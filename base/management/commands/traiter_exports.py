@@ -0,0 +1,36 @@
+# base/management/commands/traiter_exports.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from base.exports import traiter_exports, purger_exports_expires
+
+class Command(BaseCommand):
+    help = "Produit les exports demandés en arrière-plan et supprime les fichiers expirés (worker)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=1, help='Nombre de tâches réservées à la fois')
+        parser.add_argument('--boucle', action='store_true', help='Tourne en continu (mode worker)')
+        parser.add_argument('--intervalle', type=int, default=5, help='Pause en secondes quand il n\'y a rien à faire')
+
+    def handle(self, *args, **options):
+        total_terminees = total_echecs = 0
+
+        while True:
+            purges = purger_exports_expires()
+            if purges:
+                self.stdout.write(f'🗑️  {purges} export(s) expiré(s) supprimé(s)')
+
+            terminees, echecs = traiter_exports(options['lot'])
+            total_terminees += terminees
+            total_echecs += echecs
+
+            if terminees or echecs:
+                self.stdout.write(f'📦 Lot traité : {terminees} export(s) terminé(s), {echecs} échec(s)')
+                continue
+
+            if not options['boucle']:
+                break
+            time.sleep(options['intervalle'])
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total_terminees} export(s) produit(s), {total_echecs} échec(s)'))
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sujet', models.CharField(max_length=255, verbose_name='Sujet')),
+                ('corps', models.TextField(verbose_name='Corps du message')),
+                ('est_html', models.BooleanField(default=False, verbose_name='Corps HTML')),
+                ('expediteur', models.CharField(blank=True, max_length=254, verbose_name='Expéditeur')),
+                ('destinataires', models.TextField(help_text='Adresses séparées par des virgules', verbose_name='Destinataires')),
+                ('type_piece_jointe', models.CharField(blank=True, max_length=50, verbose_name='Type de pièce jointe')),
+                ('id_piece_jointe', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Id de la pièce jointe')),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('ENVOYE', 'Envoyé'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=20, verbose_name='Statut')),
+                ('tentatives', models.PositiveIntegerField(default=0, verbose_name='Tentatives')),
+                ('prochaine_tentative', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Prochaine tentative')),
+                ('derniere_erreur', models.TextField(blank=True, verbose_name='Dernière erreur')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('date_envoi', models.DateTimeField(blank=True, null=True, verbose_name="Date d'envoi")),
+            ],
+            options={
+                'verbose_name': 'Email sortant',
+                'verbose_name_plural': 'Emails sortants',
+                'ordering': ['prochaine_tentative', 'id'],
+                'indexes': [models.Index(fields=['statut', 'prochaine_tentative'], name='base_emails_statut_c8f869_idx')],
+            },
+        ),
+    ]
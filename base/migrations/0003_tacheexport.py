@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_emailsortant'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_export', models.CharField(choices=[('clients', 'Clients'), ('fournisseurs', 'Fournisseurs'), ('commandes_vente', 'Commandes de vente'), ('commandes_achat', "Commandes d'achat"), ('plan_comptable', 'Plan comptable')], max_length=50, verbose_name="Type d'export")),
+                ('format', models.CharField(choices=[('excel', 'Excel (.xlsx)'), ('csv', 'CSV (.csv)')], default='excel', max_length=10, verbose_name='Format')),
+                ('parametres', models.JSONField(blank=True, default=dict, verbose_name='Paramètres (filtres)')),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', 'En cours'), ('TERMINE', 'Terminé'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=20, verbose_name='Statut')),
+                ('total_lignes', models.PositiveIntegerField(blank=True, null=True, verbose_name='Nombre de lignes')),
+                ('lignes_traitees', models.PositiveIntegerField(default=0, verbose_name='Lignes traitées')),
+                ('fichier', models.FileField(blank=True, upload_to='exports/%Y/%m/', verbose_name='Fichier')),
+                ('erreur', models.TextField(blank=True, verbose_name='Erreur')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de demande')),
+                ('date_debut', models.DateTimeField(blank=True, null=True, verbose_name='Début du traitement')),
+                ('date_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fin du traitement')),
+                ('date_expiration', models.DateTimeField(blank=True, null=True, verbose_name="Date d'expiration")),
+                ('cree_par', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exports', to=settings.AUTH_USER_MODEL, verbose_name='Demandé par')),
+            ],
+            options={
+                'verbose_name': "Tâche d'export",
+                'verbose_name_plural': "Tâches d'export",
+                'ordering': ['-date_creation'],
+                'indexes': [models.Index(fields=['statut', 'date_creation'], name='base_tachee_statut_238fba_idx')],
+            },
+        ),
+    ]
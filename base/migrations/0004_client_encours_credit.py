@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_tacheexport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='encours_credit',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Factures non soldées + commandes confirmées non facturées (tenu à jour par le module ventes)', max_digits=14, verbose_name='Encours de crédit'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_client_encours_credit'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailsortant',
+            name='statut',
+            field=models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', "En cours d'envoi"), ('ENVOYE', 'Envoyé'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=20, verbose_name='Statut'),
+        ),
+    ]
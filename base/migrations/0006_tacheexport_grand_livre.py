@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_emailsortant_en_cours'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tacheexport',
+            name='type_export',
+            field=models.CharField(choices=[('clients', 'Clients'), ('fournisseurs', 'Fournisseurs'), ('commandes_vente', 'Commandes de vente'), ('commandes_achat', "Commandes d'achat"), ('plan_comptable', 'Plan comptable'), ('grand_livre', 'Grand livre')], max_length=50, verbose_name="Type d'export"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_tacheexport_grand_livre'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailsortant',
+            index=models.Index(fields=['type_piece_jointe', 'id_piece_jointe'], name='base_emails_type_pi_cb5af8_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_emailsortant_piece_jointe_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tacheexport',
+            name='date_maj',
+            field=models.DateTimeField(blank=True, help_text='Signe de vie du worker, mis à jour à chaque paquet de lignes', null=True, verbose_name='Dernière progression'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Entreprise(models.Model):
     """Modèle pour l'entreprise"""
@@ -29,6 +30,10 @@ class Client(models.Model):
     pays = models.CharField(max_length=100, verbose_name="Pays")
     numero_fiscal = models.CharField(max_length=50, blank=True, verbose_name="Numéro fiscal")
     limite_credit = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Limite de crédit")
+    encours_credit = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, editable=False, verbose_name="Encours de crédit",
+        help_text="Factures non soldées + commandes confirmées non facturées (tenu à jour par le module ventes)"
+    )
     est_actif = models.BooleanField(default=True, verbose_name="Est actif")
     date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     
@@ -59,3 +64,98 @@ class Fournisseur(models.Model):
     
     def __str__(self):
         return f"{self.code} - {self.nom}"
+
+class EmailSortant(models.Model):
+    """File d'attente des emails sortants, vidée par la commande envoyer_emails"""
+    STATUTS = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', "En cours d'envoi"),
+        ('ENVOYE', 'Envoyé'),
+        ('ECHEC', 'Échec'),
+    ]
+    
+    sujet = models.CharField(max_length=255, verbose_name="Sujet")
+    corps = models.TextField(verbose_name="Corps du message")
+    est_html = models.BooleanField(default=False, verbose_name="Corps HTML")
+    expediteur = models.CharField(max_length=254, blank=True, verbose_name="Expéditeur")
+    destinataires = models.TextField(verbose_name="Destinataires", help_text="Adresses séparées par des virgules")
+    type_piece_jointe = models.CharField(max_length=50, blank=True, verbose_name="Type de pièce jointe")
+    id_piece_jointe = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Id de la pièce jointe")
+    statut = models.CharField(max_length=20, choices=STATUTS, default='EN_ATTENTE', verbose_name="Statut")
+    tentatives = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    prochaine_tentative = models.DateTimeField(default=timezone.now, verbose_name="Prochaine tentative")
+    derniere_erreur = models.TextField(blank=True, verbose_name="Dernière erreur")
+    date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    date_envoi = models.DateTimeField(null=True, blank=True, verbose_name="Date d'envoi")
+    
+    class Meta:
+        verbose_name = "Email sortant"
+        verbose_name_plural = "Emails sortants"
+        ordering = ['prochaine_tentative', 'id']
+        indexes = [
+            models.Index(fields=['statut', 'prochaine_tentative']),
+            models.Index(fields=['type_piece_jointe', 'id_piece_jointe']),
+        ]
+    
+    def __str__(self):
+        return f"{self.sujet} → {self.destinataires}"
+    
+    @property
+    def liste_destinataires(self):
+        return [adresse.strip() for adresse in self.destinataires.split(',') if adresse.strip()]
+
+
+class TacheExport(models.Model):
+    """Export demandé par un utilisateur, produit en arrière-plan par la commande traiter_exports"""
+    TYPES_EXPORT = [
+        ('clients', 'Clients'),
+        ('fournisseurs', 'Fournisseurs'),
+        ('commandes_vente', 'Commandes de vente'),
+        ('commandes_achat', "Commandes d'achat"),
+        ('plan_comptable', 'Plan comptable'),
+        ('grand_livre', 'Grand livre'),
+    ]
+    FORMATS = [
+        ('excel', 'Excel (.xlsx)'),
+        ('csv', 'CSV (.csv)'),
+    ]
+    STATUTS = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINE', 'Terminé'),
+        ('ECHEC', 'Échec'),
+    ]
+    
+    type_export = models.CharField(max_length=50, choices=TYPES_EXPORT, verbose_name="Type d'export")
+    format = models.CharField(max_length=10, choices=FORMATS, default='excel', verbose_name="Format")
+    parametres = models.JSONField(default=dict, blank=True, verbose_name="Paramètres (filtres)")
+    statut = models.CharField(max_length=20, choices=STATUTS, default='EN_ATTENTE', verbose_name="Statut")
+    total_lignes = models.PositiveIntegerField(null=True, blank=True, verbose_name="Nombre de lignes")
+    lignes_traitees = models.PositiveIntegerField(default=0, verbose_name="Lignes traitées")
+    fichier = models.FileField(upload_to='exports/%Y/%m/', blank=True, verbose_name="Fichier")
+    erreur = models.TextField(blank=True, verbose_name="Erreur")
+    cree_par = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exports', verbose_name="Demandé par")
+    date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de demande")
+    date_debut = models.DateTimeField(null=True, blank=True, verbose_name="Début du traitement")
+    date_maj = models.DateTimeField(null=True, blank=True, verbose_name="Dernière progression", help_text="Signe de vie du worker, mis à jour à chaque paquet de lignes")
+    date_fin = models.DateTimeField(null=True, blank=True, verbose_name="Fin du traitement")
+    date_expiration = models.DateTimeField(null=True, blank=True, verbose_name="Date d'expiration")
+    
+    class Meta:
+        verbose_name = "Tâche d'export"
+        verbose_name_plural = "Tâches d'export"
+        ordering = ['-date_creation']
+        indexes = [
+            models.Index(fields=['statut', 'date_creation']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_type_export_display()} ({self.get_format_display()}) - {self.get_statut_display()}"
+    
+    @property
+    def pourcentage(self):
+        if self.statut == 'TERMINE':
+            return 100
+        if not self.total_lignes:
+            return 0
+        return min(99, int(self.lignes_traitees * 100 / self.total_lignes))
@@ -1,3 +1,270 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from smtplib import SMTPException
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .emails import DELAI_BASE, MAX_TENTATIVES, envoyer_lot, mettre_en_file
+from .exports import executer_tache_export, traiter_exports
+from .models import Client, EmailSortant, TacheExport
+
+
+class ServeurSMTPTest(EmailBackend):
+    """Serveur SMTP local (locmem) : compte les connexions et refuse les adresses de `refusees`"""
+
+    def __init__(self, refusees=(), pendant_envoi=None, **kwargs):
+        super().__init__(**kwargs)
+        self.refusees = set(refusees)
+        self.pendant_envoi = pendant_envoi
+        self.ouvertures = 0
+
+    def open(self):
+        self.ouvertures += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if self.pendant_envoi:
+            self.pendant_envoi()
+        for message in messages:
+            if self.refusees.intersection(message.to):
+                raise SMTPException(f"Destinataire refusé : {', '.join(message.to)}")
+        return super().send_messages(messages)
+
+
+class FileEmailsTests(TestCase):
+    """File d'envoi : une connexion par lot, réservation hors transaction, nouvelles tentatives"""
+
+    def test_lot_envoye_sur_une_seule_connexion(self):
+        for i in range(3):
+            mettre_en_file(f'Message {i}', 'Bonjour', f'client{i}@example.com')
+        serveur = ServeurSMTPTest()
+
+        self.assertEqual(envoyer_lot(connexion=serveur), (3, 0))
+        self.assertEqual(serveur.ouvertures, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(EmailSortant.objects.exclude(statut='ENVOYE').exists())
+        # Rien d'échu : lot vide, aucune connexion
+        self.assertEqual(envoyer_lot(connexion=serveur), (0, 0))
+        self.assertEqual(serveur.ouvertures, 1)
+
+    def test_messages_reserves_pendant_l_envoi(self):
+        email = mettre_en_file('Message', 'Bonjour', 'client@example.com')
+
+        def verifier_reservation():
+            email.refresh_from_db()
+            self.assertEqual(email.statut, 'EN_COURS')
+            # Un second worker ne reprend pas un message réservé
+            self.assertEqual(envoyer_lot(connexion=ServeurSMTPTest()), (0, 0))
+
+        envoyer_lot(connexion=ServeurSMTPTest(pendant_envoi=verifier_reservation))
+        email.refresh_from_db()
+        self.assertEqual(email.statut, 'ENVOYE')
+
+        # Réservation expirée (worker arrêté pendant l'envoi) : le message est repris
+        perdu = mettre_en_file('Perdu', 'Bonjour', 'client@example.com')
+        EmailSortant.objects.filter(pk=perdu.pk).update(
+            statut='EN_COURS', prochaine_tentative=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(envoyer_lot(connexion=ServeurSMTPTest()), (1, 0))
+
+    def test_echec_smtp_puis_delai_exponentiel(self):
+        refuse = mettre_en_file('Refusé', 'Bonjour', 'refuse@example.com')
+        mettre_en_file('Accepté', 'Bonjour', 'client@example.com')
+        serveur = ServeurSMTPTest(refusees=['refuse@example.com'])
+
+        avant = timezone.now()
+        with self.assertLogs('base.emails', 'WARNING'):
+            self.assertEqual(envoyer_lot(connexion=serveur), (1, 1))
+        # La connexion est rouverte après l'erreur, le message suivant part quand même
+        self.assertEqual(serveur.ouvertures, 2)
+        refuse.refresh_from_db()
+        self.assertEqual((refuse.statut, refuse.tentatives), ('EN_ATTENTE', 1))
+        self.assertIn('Destinataire refusé', refuse.derniere_erreur)
+        self.assertGreaterEqual(refuse.prochaine_tentative, avant + timedelta(seconds=DELAI_BASE))
+
+        # Pas encore échu : ignoré
+        self.assertEqual(envoyer_lot(connexion=serveur), (0, 0))
+
+        delais = []
+        for _ in range(MAX_TENTATIVES - 1):
+            EmailSortant.objects.filter(pk=refuse.pk).update(prochaine_tentative=timezone.now())
+            debut = timezone.now()
+            with self.assertLogs('base.emails', 'WARNING'):
+                envoyer_lot(connexion=serveur)
+            refuse.refresh_from_db()
+            delais.append((refuse.prochaine_tentative - debut).total_seconds())
+        # Délai doublé à chaque tentative, puis abandon
+        self.assertGreater(delais[1], delais[0] * 1.9)
+        self.assertEqual((refuse.statut, refuse.tentatives), ('ECHEC', MAX_TENTATIVES))
+
+    def test_piece_jointe_introuvable_echec_definitif(self):
+        email = mettre_en_file('Facture', 'Bonjour', 'client@example.com', piece_jointe=('facture', 999999))
+        serveur = ServeurSMTPTest()
+
+        with self.assertLogs('base.emails', 'ERROR'):
+            self.assertEqual(envoyer_lot(connexion=serveur), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.statut, email.tentatives), ('ECHEC', 1))
+        # Pas une erreur SMTP : la connexion n'est pas rouverte
+        self.assertEqual(serveur.ouvertures, 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class ExportsArrierePlanTests(TestCase):
+    """Exports produits par traiter_exports, suivis et téléchargés par leur seul demandeur"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        reglages = self.settings(MEDIA_ROOT=media)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+        self.utilisateur = User.objects.create_user('comptable')
+        for i in range(3):
+            Client.objects.create(
+                code=f'C{i:03d}', nom=f'Client {i}', email=f'c{i}@example.com', telephone='0',
+                adresse='-', ville='Dakar', pays='Sénégal',
+            )
+
+    def demander(self, **kwargs):
+        kwargs.setdefault('type_export', 'clients')
+        kwargs.setdefault('format', 'csv')
+        return TacheExport.objects.create(cree_par=self.utilisateur, **kwargs)
+
+    def test_traitement_csv_et_xlsx(self):
+        csv = self.demander(parametres={'recherche': 'Client 1'})
+        xlsx = self.demander(format='excel')
+        inconnu = self.demander(type_export='inexistant')
+
+        self.assertEqual(traiter_exports(10), (2, 1))
+        csv.refresh_from_db()
+        self.assertEqual((csv.statut, csv.total_lignes, csv.lignes_traitees), ('TERMINE', 1, 1))
+        with csv.fichier.open('rb') as fichier:
+            contenu = fichier.read().decode('utf-8-sig')
+        self.assertIn('Client 1', contenu)
+        self.assertNotIn('Client 2', contenu)
+        xlsx.refresh_from_db()
+        self.assertEqual((xlsx.statut, xlsx.lignes_traitees), ('TERMINE', 3))
+        self.assertTrue(xlsx.fichier.name.endswith('.xlsx'))
+        inconnu.refresh_from_db()
+        self.assertEqual(inconnu.statut, 'ECHEC')
+        self.assertIn('inexistant', inconnu.erreur)
+
+        # Plus rien en attente
+        self.assertEqual(traiter_exports(10), (0, 0))
+
+    def test_reprise_des_taches_abandonnees(self):
+        maintenant = timezone.now()
+        debut = maintenant - timedelta(hours=2)
+        abandonnee = self.demander(
+            statut='EN_COURS', date_debut=debut, date_maj=maintenant - timedelta(minutes=31), lignes_traitees=2
+        )
+        # Sans progression enregistrée : la date de début fait foi
+        muette = self.demander(statut='EN_COURS', date_debut=maintenant - timedelta(minutes=31))
+        # Long export qui progresse encore : pas repris
+        active = self.demander(statut='EN_COURS', date_debut=debut, date_maj=maintenant - timedelta(minutes=5))
+        self.demander(statut='EN_COURS', date_debut=maintenant - timedelta(minutes=5))
+
+        with self.settings(EXPORTS_DELAI_REPRISE=30):
+            self.assertEqual(traiter_exports(10), (2, 0))
+        for tache in (abandonnee, muette):
+            tache.refresh_from_db()
+            self.assertEqual((tache.statut, tache.lignes_traitees), ('TERMINE', 3))
+            self.assertGreater(tache.date_debut, maintenant)
+            self.assertGreaterEqual(tache.date_maj, tache.date_debut)
+        active.refresh_from_db()
+        self.assertEqual((active.statut, active.date_debut), ('EN_COURS', debut))
+        self.assertEqual(TacheExport.objects.filter(statut='EN_COURS').count(), 2)
+
+    def test_worker_depossede_abandonne_son_fichier(self):
+        tache = self.demander(statut='EN_COURS', date_debut=timezone.now() - timedelta(hours=1))
+        # Entre-temps, la tâche a été reprise par un autre worker
+        reprise = timezone.now()
+        TacheExport.objects.filter(pk=tache.pk).update(date_debut=reprise, date_maj=reprise)
+
+        self.assertFalse(executer_tache_export(tache))
+        tache.refresh_from_db()
+        self.assertEqual((tache.statut, tache.fichier.name, tache.date_debut), ('EN_COURS', '', reprise))
+        # Aucun fichier orphelin
+        self.assertEqual([nom for _, _, noms in os.walk(settings.MEDIA_ROOT) for nom in noms], [])
+
+    def test_suivi_et_telechargement_reserves_au_demandeur(self):
+        tache = self.demander()
+        statut = reverse('statut_export', args=[tache.pk])
+        telechargement = reverse('telecharger_export', args=[tache.pk])
+        self.client.force_login(self.utilisateur)
+
+        etat = self.client.get(statut).json()
+        self.assertEqual((etat['statut'], etat['url_telechargement']), ('EN_ATTENTE', None))
+        self.assertEqual(self.client.get(telechargement).status_code, 404)
+
+        traiter_exports()
+        self.assertEqual(self.client.get(statut).json()['url_telechargement'], telechargement)
+        reponse = self.client.get(telechargement)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('Client 0', b''.join(reponse.streaming_content).decode('utf-8-sig'))
+
+        self.client.force_login(User.objects.create_user('autre'))
+        self.assertEqual(self.client.get(statut).status_code, 404)
+        self.assertEqual(self.client.get(telechargement).status_code, 404)
+
+        # Fichier expiré : retour à « Mes exports »
+        self.client.force_login(self.utilisateur)
+        TacheExport.objects.filter(pk=tache.pk).update(date_expiration=timezone.now() - timedelta(seconds=1))
+        self.assertRedirects(self.client.get(telechargement), reverse('mes_exports'), fetch_redirect_response=False)
+
+
+class ExportsListesTests(TestCase):
+    """Exports CSV et Excel des listes, produits directement par les vues"""
+
+    URLS = [
+        'exporter_clients', 'exporter_fournisseurs', 'ventes:exporter_commandes_vente',
+        'achats:exporter_commandes_achat', 'comptabilite:exporter_plan_comptable',
+    ]
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('gestionnaire'))
+        for i in range(3):
+            Client.objects.create(
+                code=f'C{i:03d}', nom=f'Client {i}', email=f'c{i}@example.com', telephone='0',
+                adresse='-', ville='Dakar', pays='Sénégal',
+            )
+
+    def exporter(self, url, **parametres):
+        reponse = self.client.get(reverse(url), parametres)
+        self.assertEqual(reponse.status_code, 200, url)
+        return reponse, b''.join(reponse.streaming_content)
+
+    def test_csv(self):
+        for url in self.URLS:
+            reponse, contenu = self.exporter(url, format='csv')
+            self.assertTrue(reponse['Content-Disposition'].endswith('.csv"'), url)
+            self.assertTrue(contenu.decode('utf-8').startswith('\ufeff'), url)
+
+        _, contenu = self.exporter('exporter_clients', format='csv', recherche='Client 1')
+        lignes = contenu.decode('utf-8-sig').splitlines()
+        self.assertEqual(lignes[0].split(';')[:2], ['Code', 'Nom'])
+        self.assertEqual([ligne.split(';')[1] for ligne in lignes[1:]], ['Client 1'])
+
+    def test_xlsx(self):
+        for url in self.URLS:
+            _, contenu = self.exporter(url, format='excel')
+            self.assertTrue(load_workbook(BytesIO(contenu), read_only=True).worksheets, url)
 
-# Create your tests here.
+        _, contenu = self.exporter('exporter_clients', format='excel')
+        lignes = list(load_workbook(BytesIO(contenu), read_only=True).active.values)
+        # En-tête, trois clients puis la ligne de total
+        self.assertEqual(len(lignes), 5)
+        self.assertEqual(lignes[0][:2], ('Code', 'Nom'))
+        self.assertIn('TOTAL:', lignes[-1])
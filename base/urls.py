@@ -20,5 +20,10 @@ urlpatterns = [
     path('fournisseurs/<int:pk>/supprimer/', views.supprimer_fournisseur, name='supprimer_fournisseur'),
     path('fournisseurs/exporter/', views.exporter_fournisseurs, name='exporter_fournisseurs'),
     path('fournisseurs/action-groupee/', views.action_groupee_fournisseurs, name='action_groupee_fournisseurs'),
+    
+    # Exports en arrière-plan
+    path('exports/', views.mes_exports, name='mes_exports'),
+    path('exports/<int:pk>/statut/', views.statut_export, name='statut_export'),
+    path('exports/<int:pk>/telecharger/', views.telecharger_export, name='telecharger_export'),
 ]
 
@@ -3,17 +3,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Q, F
-from django.http import HttpResponse
+from django.db.models import Sum, Count, Q, F, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, JsonResponse, FileResponse
+from django.urls import reverse
 from datetime import datetime, date, timedelta
+from decimal import Decimal
 from django.utils import timezone
 from io import BytesIO
-import csv
 
-from .models import Client, Fournisseur
+from .models import Client, Fournisseur, TacheExport
 from .forms import FormulaireClient, FormulaireFournisseur
+from .exports import (
+    Colonne, DefinitionExport, format_actif, format_tiret, reponse_csv, reponse_xlsx,
+    reponse_export_differe,
+)
 from stock.models import Produit, MouvementStock
 from ventes.models import CommandeVente, Facture
+from ventes.analytique import chiffre_affaires
 
 # ========== TABLEAU DE BORD ==========
 
@@ -73,13 +80,8 @@ def tableau_bord(request):
     
     # ==================== STATISTIQUES VENTES ====================
     
-    # Ventes du mois en cours
-    ventes_mois = Facture.objects.filter(
-        date_facture__gte=debut_mois,
-        statut__in=['PAYEE', 'EN_ATTENTE', 'PARTIELLE']
-    ).aggregate(
-        total=Sum('total')
-    )['total'] or 0
+    # Ventes du mois en cours (table de faits des ventes)
+    ventes_mois = chiffre_affaires(debut_mois)
     
     # Nombre de commandes du mois
     commandes_mois = CommandeVente.objects.filter(
@@ -134,13 +136,7 @@ def tableau_bord(request):
     debut_mois_precedent = (debut_mois - timedelta(days=1)).replace(day=1)
     fin_mois_precedent = debut_mois - timedelta(days=1)
     
-    ventes_mois_precedent = Facture.objects.filter(
-        date_facture__gte=debut_mois_precedent,
-        date_facture__lte=fin_mois_precedent,
-        statut__in=['PAYEE', 'EN_ATTENTE', 'PARTIELLE']
-    ).aggregate(
-        total=Sum('total')
-    )['total'] or 0
+    ventes_mois_precedent = chiffre_affaires(debut_mois_precedent, fin_mois_precedent)
     
     # Calcul du taux de croissance
     if ventes_mois_precedent > 0:
@@ -393,6 +389,7 @@ def modifier_fournisseur(request, pk):
 def details_fournisseur(request, pk):
     """Vue pour afficher les détails d'un fournisseur"""
     from achats.models import CommandeAchat
+    from achats.performances import indicateurs_fournisseur
     
     fournisseur = get_object_or_404(Fournisseur, pk=pk)
     
@@ -448,12 +445,17 @@ def details_fournisseur(request, pk):
     except ImportError:
         factures = []
     
+    # Indicateurs de performance des 12 derniers mois (précalculés à chaque réception)
+    performance, performance_mensuelle = indicateurs_fournisseur(fournisseur)
+    
     contexte = {
         'fournisseur': fournisseur,
         'commandes': commandes,
         'factures': factures,
         'total_achats': total_achats,
         'commandes_ce_mois': commandes_ce_mois,
+        'performance': performance,
+        'performance_mensuelle': performance_mensuelle,
     }
     
     return render(request, 'base/details_fournisseur.jinja', contexte)
@@ -475,16 +477,23 @@ def supprimer_fournisseur(request, pk):
 
 # ========== EXPORT DES FOURNISSEURS ==========
 
-@login_required
-def exporter_fournisseurs(request):
-    """
-    Exporte la liste des fournisseurs en Excel, CSV ou PDF
-    """
-    format_export = request.GET.get('format', 'excel')
-    recherche = request.GET.get('recherche', '')
-    ids = request.GET.get('ids', '')  # Pour export sélection
+COLONNES_EXPORT_FOURNISSEURS = [
+    Colonne('Code', 'code'),
+    Colonne('Nom', 'nom', largeur=30),
+    Colonne('Email', 'email', format=format_tiret, largeur=30),
+    Colonne('Téléphone', 'telephone', format=format_tiret),
+    Colonne('Ville', 'ville', format=format_tiret),
+    Colonne('Pays', 'pays', format=format_tiret),
+    Colonne('Délai paiement', 'delai_paiement', format=lambda valeur: f"{valeur or 0} jours"),
+    Colonne('Statut', 'est_actif', format=format_actif),
+]
+
+
+def filtrer_fournisseurs_export(parametres):
+    """Fournisseurs actifs à exporter (recherche ou sélection)"""
+    recherche = parametres.get('recherche', '')
+    ids = parametres.get('ids', '')  # Pour export sélection
     
-    # Récupérer les fournisseurs
     fournisseurs = Fournisseur.objects.filter(est_actif=True)
     
     # Filtrer par recherche si spécifiée
@@ -497,98 +506,36 @@ def exporter_fournisseurs(request):
     
     # Filtrer par IDs si sélection spécifique
     if ids:
-        id_list = [int(id) for id in ids.split(',')]
+        id_list = [int(id) for id in ids.split(',') if id.isdigit()]
         fournisseurs = fournisseurs.filter(pk__in=id_list)
     
-    fournisseurs = fournisseurs.order_by('nom')
+    return fournisseurs.order_by('nom')
+
+
+EXPORT_FOURNISSEURS = DefinitionExport(
+    'Fournisseurs', 'fournisseurs', COLONNES_EXPORT_FOURNISSEURS, filtrer_fournisseurs_export, '0EA5E9'
+)
+
+
+@login_required
+def exporter_fournisseurs(request):
+    """
+    Exporte la liste des fournisseurs en Excel, CSV ou PDF
+    """
+    format_export = request.GET.get('format', 'excel')
+    fournisseurs = filtrer_fournisseurs_export(request.GET)
+
+    # Gros volumes : le fichier est produit en arrière-plan (voir « Mes exports »)
+    if request.GET.get('arriere_plan') and format_export in ('excel', 'csv'):
+        return reponse_export_differe(request, 'fournisseurs')
     
     # ==================== EXPORT EXCEL ====================
     if format_export == 'excel':
-        try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-            
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Fournisseurs"
-            
-            # En-têtes
-            headers = ['Code', 'Nom', 'Email', 'Téléphone', 'Ville', 'Pays', 'Délai paiement', 'Type', 'Statut']
-            ws.append(headers)
-            
-            # Style des en-têtes
-            header_fill = PatternFill(start_color="0ea5e9", end_color="0ea5e9", fill_type="solid")
-            header_font = Font(bold=True, color="FFFFFF", size=12)
-            
-            for cell in ws[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-            
-            # Données
-            for fournisseur in fournisseurs:
-                ws.append([
-                    fournisseur.code,
-                    fournisseur.nom,
-                    fournisseur.email or '-',
-                    fournisseur.telephone or '-',
-                    fournisseur.ville or '-',
-                    fournisseur.pays or '-',
-                    f"{fournisseur.delai_paiement or 0} jours",
-                    fournisseur.get_type_fournisseur_display() if hasattr(fournisseur, 'type_fournisseur') else '-',
-                    'Actif' if fournisseur.est_actif else 'Inactif'
-                ])
-            
-            # Ajuster la largeur des colonnes
-            for column in ws.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(cell.value)
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            # Créer la réponse HTTP
-            response = HttpResponse(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = 'attachment; filename="fournisseurs.xlsx"'
-            wb.save(response)
-            return response
-            
-        except ImportError:
-            messages.error(request, 'La bibliothèque openpyxl n\'est pas installée. Utilisez: pip install openpyxl')
-            return redirect('liste_fournisseurs')
+        return reponse_xlsx(fournisseurs, COLONNES_EXPORT_FOURNISSEURS, 'fournisseurs.xlsx', 'Fournisseurs', '0EA5E9')
     
     # ==================== EXPORT CSV ====================
     elif format_export == 'csv':
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="fournisseurs.csv"'
-        
-        # BOM UTF-8 pour Excel
-        response.write('\ufeff')
-        
-        writer = csv.writer(response, delimiter=';')
-        writer.writerow(['Code', 'Nom', 'Email', 'Téléphone', 'Ville', 'Pays', 'Délai paiement', 'Type', 'Statut'])
-        
-        for fournisseur in fournisseurs:
-            writer.writerow([
-                fournisseur.code,
-                fournisseur.nom,
-                fournisseur.email or '-',
-                fournisseur.telephone or '-',
-                fournisseur.ville or '-',
-                fournisseur.pays or '-',
-                f"{fournisseur.delai_paiement or 0} jours",
-                fournisseur.get_type_fournisseur_display() if hasattr(fournisseur, 'type_fournisseur') else '-',
-                'Actif' if fournisseur.est_actif else 'Inactif'
-            ])
-        
-        return response
+        return reponse_csv(fournisseurs, COLONNES_EXPORT_FOURNISSEURS, 'fournisseurs.csv')
     
     # ==================== EXPORT PDF ====================
     elif format_export == 'pdf':
@@ -733,17 +680,42 @@ def action_groupee_fournisseurs(request):
     return redirect('liste_fournisseurs')
 # Fonctions à ajouter dans base/views.py pour l'export des clients
 
-@login_required
-def exporter_clients(request):
+COLONNES_EXPORT_CLIENTS = [
+    Colonne('Code', 'code'),
+    Colonne('Nom', 'nom', largeur=30),
+    Colonne('Email', 'email', format=format_tiret, largeur=30),
+    Colonne('Téléphone', 'telephone', format=format_tiret),
+    Colonne('Ville', 'ville', format=format_tiret),
+    Colonne('Pays', 'pays', format=format_tiret),
+    Colonne('Limite crédit', 'limite_credit', montant=True),
+    Colonne('Solde actuel', 'solde_calcule', montant=True, total=True),
+    Colonne('Statut', 'est_actif', format=format_actif),
+]
+
+
+def filtrer_clients_export(parametres):
     """
-    Exporte la liste des clients en Excel, CSV ou PDF
+    Clients actifs à exporter (recherche ou sélection), annotés de leur solde
+    (somme des factures non réglées) calculé par sous-requête
     """
-    format_export = request.GET.get('format', 'excel')
-    recherche = request.GET.get('recherche', '')
-    ids = request.GET.get('ids', '')  # Pour export sélection
-    
-    # Récupérer les clients
-    clients = Client.objects.filter(est_actif=True)
+    recherche = parametres.get('recherche', '')
+    ids = parametres.get('ids', '')  # Pour export sélection
+    
+    solde = (
+        Facture.objects
+        .filter(client=OuterRef('pk'))
+        .order_by()
+        .values('client')
+        .annotate(solde=Sum(F('total') - F('montant_paye')))
+        .values('solde')
+    )
+    clients = Client.objects.filter(est_actif=True).annotate(
+        solde_calcule=Coalesce(
+            Subquery(solde, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+    )
     
     # Filtrer par recherche si spécifiée
     if recherche:
@@ -755,108 +727,36 @@ def exporter_clients(request):
     
     # Filtrer par IDs si sélection spécifique
     if ids:
-        id_list = [int(id) for id in ids.split(',')]
+        id_list = [int(id) for id in ids.split(',') if id.isdigit()]
         clients = clients.filter(pk__in=id_list)
     
-    clients = clients.order_by('nom')
-    
-    # Calculer le solde pour chaque client
-    for client in clients:
-        # Calculer le solde du client (somme des factures impayées)
-        solde = Facture.objects.filter(client=client).aggregate(
-            total_solde=Sum(F('total') - F('montant_paye'))
-        )['total_solde'] or 0
-        client.solde_calcule = solde
+    return clients.order_by('nom')
+
+
+EXPORT_CLIENTS = DefinitionExport(
+    'Clients', 'clients', COLONNES_EXPORT_CLIENTS, filtrer_clients_export, '1E40AF'
+)
+
+
+@login_required
+def exporter_clients(request):
+    """
+    Exporte la liste des clients en Excel, CSV ou PDF
+    """
+    format_export = request.GET.get('format', 'excel')
+    clients = filtrer_clients_export(request.GET)
+
+    # Gros volumes : le fichier est produit en arrière-plan (voir « Mes exports »)
+    if request.GET.get('arriere_plan') and format_export in ('excel', 'csv'):
+        return reponse_export_differe(request, 'clients')
     
     # ==================== EXPORT EXCEL ====================
     if format_export == 'excel':
-        try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, PatternFill, Alignment
-            
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Clients"
-            
-            # En-têtes
-            headers = ['Code', 'Nom', 'Email', 'Téléphone', 'Ville', 'Pays', 'Limite crédit', 'Solde actuel', 'Type', 'Statut']
-            ws.append(headers)
-            
-            # Style des en-têtes
-            header_fill = PatternFill(start_color="1e40af", end_color="1e40af", fill_type="solid")
-            header_font = Font(bold=True, color="FFFFFF", size=12)
-            
-            for cell in ws[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-            
-            # Données
-            for client in clients:
-                ws.append([
-                    client.code,
-                    client.nom,
-                    client.email or '-',
-                    client.telephone or '-',
-                    client.ville or '-',
-                    client.pays or '-',
-                    client.limite_credit,
-                    client.solde_calcule,
-                    client.get_type_client_display() if hasattr(client, 'type_client') else '-',
-                    'Actif' if client.est_actif else 'Inactif'
-                ])
-            
-            # Ajuster la largeur des colonnes
-            for column in ws.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(cell.value)
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            # Créer la réponse HTTP
-            response = HttpResponse(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = 'attachment; filename="clients.xlsx"'
-            wb.save(response)
-            return response
-            
-        except ImportError:
-            messages.error(request, 'La bibliothèque openpyxl n\'est pas installée. Utilisez: pip install openpyxl')
-            return redirect('liste_clients')
+        return reponse_xlsx(clients, COLONNES_EXPORT_CLIENTS, 'clients.xlsx', 'Clients', '1E40AF')
     
     # ==================== EXPORT CSV ====================
     elif format_export == 'csv':
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="clients.csv"'
-        
-        # BOM UTF-8 pour Excel
-        response.write('\ufeff')
-        
-        writer = csv.writer(response, delimiter=';')
-        writer.writerow(['Code', 'Nom', 'Email', 'Téléphone', 'Ville', 'Pays', 'Limite crédit', 'Solde actuel', 'Type', 'Statut'])
-        
-        for client in clients:
-            writer.writerow([
-                client.code,
-                client.nom,
-                client.email or '-',
-                client.telephone or '-',
-                client.ville or '-',
-                client.pays or '-',
-                client.limite_credit,
-                client.solde_calcule,
-                client.get_type_client_display() if hasattr(client, 'type_client') else '-',
-                'Actif' if client.est_actif else 'Inactif'
-            ])
-        
-        return response
+        return reponse_csv(clients, COLONNES_EXPORT_CLIENTS, 'clients.csv')
     
     # ==================== EXPORT PDF ====================
     elif format_export == 'pdf':
@@ -998,4 +898,50 @@ def action_groupee_clients(request):
         
         return redirect('liste_clients')
     
-    return redirect('liste_clients')
\ No newline at end of file
+    return redirect('liste_clients')
+
+# ========== EXPORTS EN ARRIÈRE-PLAN ==========
+
+def _etat_export(tache):
+    """Représentation JSON d'une tâche d'export pour le suivi (polling)"""
+    return {
+        'id': tache.pk,
+        'statut': tache.statut,
+        'statut_libelle': tache.get_statut_display(),
+        'lignes_traitees': tache.lignes_traitees,
+        'total_lignes': tache.total_lignes,
+        'pourcentage': tache.pourcentage,
+        'erreur': tache.erreur,
+        'url_telechargement': reverse('telecharger_export', args=[tache.pk]) if tache.statut == 'TERMINE' else None,
+    }
+
+
+@login_required
+def mes_exports(request):
+    """Liste des exports demandés par l'utilisateur, avec leur avancement"""
+    taches = TacheExport.objects.filter(cree_par=request.user)[:50]
+    
+    context = {
+        'taches': taches,
+        'en_cours': any(tache.statut in ('EN_ATTENTE', 'EN_COURS') for tache in taches),
+    }
+    return render(request, 'base/mes_exports.jinja', context)
+
+
+@login_required
+def statut_export(request, pk):
+    """Avancement d'un export (JSON, interrogé périodiquement par la page « Mes exports »)"""
+    tache = get_object_or_404(TacheExport, pk=pk, cree_par=request.user)
+    return JsonResponse(_etat_export(tache))
+
+
+@login_required
+def telecharger_export(request, pk):
+    """Télécharge le fichier d'un export terminé et non expiré"""
+    tache = get_object_or_404(TacheExport, pk=pk, cree_par=request.user, statut='TERMINE')
+    
+    if not tache.fichier or (tache.date_expiration and tache.date_expiration < timezone.now()):
+        messages.error(request, 'Ce fichier d\'export a expiré. Veuillez relancer l\'export.')
+        return redirect('mes_exports')
+    
+    return FileResponse(tache.fichier.open('rb'), as_attachment=True, filename=tache.fichier.name.rsplit('/', 1)[-1])
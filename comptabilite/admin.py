@@ -5,8 +5,9 @@
 from django.contrib import admin
 from .models import (
     PlanComptable, Exercice, Journal, Piece, Ecriture,
-    Banque, MouvementBancaire, Budget
+    Banque, MouvementBancaire, Budget, RegleComptabilisation, SoldeCompte
 )
+from .soldes import valider_pieces as valider_pieces_comptables
 
 @admin.register(PlanComptable)
 class AdminPlanComptable(admin.ModelAdmin):
@@ -30,10 +31,28 @@ class AdminJournal(admin.ModelAdmin):
     search_fields = ['code', 'libelle']
 
 
+def piece_modifiable(piece):
+    """
+    Une pièce validée est reportée dans SoldeCompte : ni elle ni ses
+    écritures ne se modifient plus (une correction passe par une nouvelle
+    pièce, ou par recalculer_soldes_comptes après reprise de données).
+    """
+    return piece is None or not piece.est_validee
+
+
 class EcritureEnLigne(admin.TabularInline):
     model = Ecriture
     extra = 2
     fields = ['compte', 'libelle', 'debit', 'credit']
+    
+    def has_add_permission(self, request, obj=None):
+        return piece_modifiable(obj) and super().has_add_permission(request, obj)
+    
+    def has_change_permission(self, request, obj=None):
+        return piece_modifiable(obj) and super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        return piece_modifiable(obj) and super().has_delete_permission(request, obj)
 
 
 @admin.register(Piece)
@@ -43,7 +62,25 @@ class AdminPiece(admin.ModelAdmin):
     search_fields = ['numero_piece', 'libelle', 'reference']
     ordering = ['-date_piece']
     inlines = [EcritureEnLigne]
-    readonly_fields = ['numero_piece', 'date_validation', 'validee_par', 'cree_par', 'date_creation']
+    readonly_fields = [
+        'numero_piece', 'total_debit', 'total_credit', 'est_validee', 'date_validation', 'validee_par',
+        'cree_par', 'date_creation',
+    ]
+    actions = ['valider_pieces']
+    
+    def has_change_permission(self, request, obj=None):
+        return piece_modifiable(obj) and super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        return piece_modifiable(obj) and super().has_delete_permission(request, obj)
+    
+    @admin.action(description="Valider les pièces sélectionnées")
+    def valider_pieces(self, request, queryset):
+        """Validation en lot par comptabilite/soldes.py : les soldes des comptes sont mis à jour"""
+        validees, refusees = valider_pieces_comptables(list(queryset.values_list('pk', flat=True)), request.user)
+        for numero_piece, motif in refusees:
+            self.message_user(request, f"Pièce {numero_piece} non validée : {motif}.", level='error')
+        self.message_user(request, f"{validees} pièce(s) validée(s).")
 
 
 @admin.register(Ecriture)
@@ -52,6 +89,18 @@ class AdminEcriture(admin.ModelAdmin):
     list_filter = ['piece__journal', 'compte__type_compte']
     search_fields = ['libelle', 'piece__numero_piece', 'compte__numero_compte']
     ordering = ['-piece__date_piece']
+    
+    def has_change_permission(self, request, obj=None):
+        return (obj is None or piece_modifiable(obj.piece)) and super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        return (obj is None or piece_modifiable(obj.piece)) and super().has_delete_permission(request, obj)
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Pas de nouvelle écriture dans une pièce validée
+        if db_field.name == 'piece':
+            kwargs['queryset'] = Piece.objects.filter(est_validee=False)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(Banque)
@@ -73,6 +122,26 @@ class AdminMouvementBancaire(admin.ModelAdmin):
 @admin.register(Budget)
 class AdminBudget(admin.ModelAdmin):
     list_display = ['exercice', 'compte', 'mois', 'montant_prevu', 'montant_realise', 'ecart']
+    list_select_related = ['exercice', 'compte']
     list_filter = ['exercice', 'mois']
     search_fields = ['compte__numero_compte', 'compte__libelle']
     ordering = ['exercice', 'mois', 'compte']
+
+
+@admin.register(RegleComptabilisation)
+class AdminRegleComptabilisation(admin.ModelAdmin):
+    list_display = ['type_document', 'journal', 'compte_debit', 'compte_tva', 'compte_credit', 'banque']
+    autocomplete_fields = ['compte_debit', 'compte_tva', 'compte_credit']
+
+
+@admin.register(SoldeCompte)
+class AdminSoldeCompte(admin.ModelAdmin):
+    list_display = ['compte', 'exercice', 'mois', 'debit', 'credit', 'date_maj']
+    list_filter = ['exercice']
+    search_fields = ['compte__numero_compte', 'compte__libelle']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ComptabiliteConfig(AppConfig):
     name = 'comptabilite'
+    
+    def ready(self):
+        import comptabilite.signals  # Cache des règles de comptabilisation
@@ -0,0 +1,312 @@
+# comptabilite/balance.py
+"""
+Balance générale : pour chaque compte, solde d'ouverture, mouvements de la
+période (débit, crédit) et solde de clôture, sur les pièces validées.
+
+Les montants viennent des soldes mensuels (SoldeCompte, voir soldes.py) :
+une seule requête groupée par compte, avec des agrégats conditionnels pour
+l'ouverture (mois de l'exercice avant la période) et la période. Son coût
+ne dépend pas du nombre d'écritures. Une deuxième requête lit le plan
+comptable.
+
+Les totaux sont ensuite remontés en mémoire dans la hiérarchie des
+comptes : le parent d'un compte est son compte_parent s'il est renseigné,
+sinon le compte existant le plus long dont le numéro est un préfixe du sien
+(601 est rattaché à 60). Chaque classe SYSCOHADA (premier chiffre) totalise
+ses comptes de premier niveau.
+
+Le solde d'ouverture ne reprend que les pièces de l'exercice : les reports
+des exercices précédents sont à passer en écritures d'à-nouveaux.
+"""
+
+from decimal import Decimal
+from tempfile import SpooledTemporaryFile
+
+from django.db.models import Q, Sum
+from django.http import FileResponse
+
+from base.exports import TAILLE_MEMOIRE_XLSX, TYPE_XLSX
+from .models import PlanComptable, SoldeCompte
+
+CLASSES_SYSCOHADA = [
+    ('1', 'Classe 1 - Comptes de ressources durables'),
+    ('2', 'Classe 2 - Comptes d\'actif immobilisé'),
+    ('3', 'Classe 3 - Comptes de stocks'),
+    ('4', 'Classe 4 - Comptes de tiers'),
+    ('5', 'Classe 5 - Comptes de trésorerie'),
+    ('6', 'Classe 6 - Comptes de charges'),
+    ('7', 'Classe 7 - Comptes de produits'),
+    ('8', 'Classe 8 - Comptes des autres charges et produits'),
+]
+
+ZERO = Decimal('0')
+
+
+class LigneBalance:
+    """Ligne de la balance : un compte (ses sous-comptes inclus), une classe ou le total général"""
+
+    def __init__(self, numero, libelle, niveau, compte_id=None, est_total=False):
+        self.numero = numero
+        self.libelle = libelle
+        self.niveau = niveau
+        self.compte_id = compte_id
+        self.est_total = est_total
+        self.debit_ouverture = ZERO
+        self.credit_ouverture = ZERO
+        self.debit = ZERO
+        self.credit = ZERO
+
+    def ajouter(self, autre):
+        self.debit_ouverture += autre.debit_ouverture
+        self.credit_ouverture += autre.credit_ouverture
+        self.debit += autre.debit
+        self.credit += autre.credit
+
+    @property
+    def est_mouvemente(self):
+        return any((self.debit_ouverture, self.credit_ouverture, self.debit, self.credit))
+
+    @property
+    def solde_ouverture(self):
+        return self.debit_ouverture - self.credit_ouverture
+
+    @property
+    def solde_cloture(self):
+        return self.solde_ouverture + self.debit - self.credit
+
+    # Soldes présentés sur deux colonnes (débiteur / créditeur)
+    @property
+    def ouverture_debiteur(self):
+        return max(self.solde_ouverture, ZERO)
+
+    @property
+    def ouverture_crediteur(self):
+        return max(-self.solde_ouverture, ZERO)
+
+    @property
+    def cloture_debiteur(self):
+        return max(self.solde_cloture, ZERO)
+
+    @property
+    def cloture_crediteur(self):
+        return max(-self.solde_cloture, ZERO)
+
+    def montants(self):
+        return [
+            self.ouverture_debiteur, self.ouverture_crediteur, self.debit, self.credit,
+            self.cloture_debiteur, self.cloture_crediteur,
+        ]
+
+
+class BalanceGenerale:
+    """Balance d'un exercice entre deux mois inclus (premiers jours de mois)"""
+
+    def __init__(self, exercice, mois_debut, mois_fin, classe=None):
+        self.exercice = exercice
+        self.mois_debut = mois_debut.replace(day=1)
+        self.mois_fin = mois_fin.replace(day=1)
+        self.classe = classe
+
+        comptes = self._comptes()
+        montants = self._montants()
+        self.lignes, self.total = self._remonter(comptes, montants)
+
+    def _montants(self):
+        """Ouverture et mouvements de la période par compte : {compte_id: ligne}, en une requête"""
+        soldes = SoldeCompte.objects.filter(exercice=self.exercice, mois__lte=self.mois_fin)
+        if self.classe:
+            soldes = soldes.filter(compte__numero_compte__startswith=self.classe)
+        avant = Q(mois__lt=self.mois_debut)
+        return {
+            ligne['compte_id']: ligne
+            for ligne in soldes.values('compte_id').annotate(
+                debit_ouverture=Sum('debit', filter=avant),
+                credit_ouverture=Sum('credit', filter=avant),
+                debit_periode=Sum('debit', filter=~avant),
+                credit_periode=Sum('credit', filter=~avant),
+            ).order_by()
+        }
+
+    def _comptes(self):
+        comptes = PlanComptable.objects.all()
+        if self.classe:
+            comptes = comptes.filter(numero_compte__startswith=self.classe)
+        return list(comptes.values('id', 'numero_compte', 'libelle', 'compte_parent_id').order_by('numero_compte'))
+
+    def _remonter(self, comptes, montants):
+        lignes = {}
+        for compte in comptes:
+            ligne = LigneBalance(compte['numero_compte'], compte['libelle'], 0, compte_id=compte['id'])
+            montant = montants.get(compte['id'])
+            if montant:
+                ligne.debit_ouverture = montant['debit_ouverture'] or ZERO
+                ligne.credit_ouverture = montant['credit_ouverture'] or ZERO
+                ligne.debit = montant['debit_periode'] or ZERO
+                ligne.credit = montant['credit_periode'] or ZERO
+            lignes[compte['id']] = ligne
+
+        # Parent : compte_parent, sinon le plus long préfixe existant
+        par_numero = {compte['numero_compte']: compte['id'] for compte in comptes}
+        enfants = {compte['id']: [] for compte in comptes}
+        racines = []
+        for compte in comptes:
+            parent = compte['compte_parent_id'] if compte['compte_parent_id'] in lignes else None
+            numero = compte['numero_compte']
+            for longueur in range(len(numero) - 1, 0, -1):
+                if parent is not None:
+                    break
+                parent = par_numero.get(numero[:longueur])
+            if parent is None or parent == compte['id']:
+                racines.append(compte['id'])
+            else:
+                enfants[parent].append(compte['id'])
+
+        # Totaux des sous-comptes, puis ordre d'affichage (parcours en profondeur)
+        ordre = []
+        vus = set()
+
+        def parcourir(compte_id, niveau):
+            """Ajoute le compte et ses sous-comptes à `ordre` ; False si déjà vu (compte_parent circulaire)"""
+            if compte_id in vus:
+                return False
+            vus.add(compte_id)
+            ligne = lignes[compte_id]
+            ligne.niveau = niveau
+            ordre.append(ligne)
+            for enfant in sorted(enfants[compte_id], key=lambda pk: lignes[pk].numero):
+                if parcourir(enfant, niveau + 1):
+                    ligne.ajouter(lignes[enfant])
+                    ligne.est_total = True
+            return True
+
+        classes = {numero: LigneBalance(numero, libelle, 0, est_total=True) for numero, libelle in CLASSES_SYSCOHADA}
+        par_classe = {}
+        for compte_id in sorted(racines, key=lambda pk: lignes[pk].numero):
+            numero_classe = lignes[compte_id].numero[:1]
+            classe = classes.setdefault(numero_classe, LigneBalance(numero_classe, f'Classe {numero_classe}', 0, est_total=True))
+            debut = len(ordre)
+            parcourir(compte_id, 1)
+            classe.ajouter(lignes[compte_id])
+            par_classe.setdefault(numero_classe, []).extend(ordre[debut:])
+
+        total = LigneBalance('', 'Total général', 0, est_total=True)
+        resultat = []
+        for numero_classe in sorted(par_classe):
+            classe = classes[numero_classe]
+            comptes_classe = [ligne for ligne in par_classe[numero_classe] if ligne.est_mouvemente]
+            if not comptes_classe:
+                continue
+            resultat.append(classe)
+            resultat.extend(comptes_classe)
+            total.ajouter(classe)
+        return resultat, total
+
+    @property
+    def est_equilibree(self):
+        return self.total.debit == self.total.credit and self.total.solde_ouverture == 0
+
+
+# ========== EXPORTS ==========
+
+TITRES_COLONNES = [
+    'Ouverture débit', 'Ouverture crédit', 'Mouvements débit', 'Mouvements crédit',
+    'Clôture débit', 'Clôture crédit',
+]
+
+
+def _titre(balance):
+    return (
+        f"Balance générale - {balance.exercice.nom} - "
+        f"{balance.mois_debut.strftime('%m/%Y')} à {balance.mois_fin.strftime('%m/%Y')}"
+    )
+
+
+def reponse_balance_xlsx(balance, nom_fichier):
+    """Classeur en mode write_only, écrit dans un fichier temporaire « spooled »"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title='Balance générale')
+    for lettre, largeur in zip('ABCDEFGH', [14, 45, 16, 16, 16, 16, 16, 16]):
+        ws.column_dimensions[lettre].width = largeur
+
+    titre = WriteOnlyCell(ws, value=_titre(balance))
+    titre.font = Font(bold=True, size=14)
+    ws.append([titre])
+    ws.append([])
+
+    entetes = []
+    for valeur in ['Compte', 'Libellé'] + TITRES_COLONNES:
+        cellule = WriteOnlyCell(ws, value=valeur)
+        cellule.font = Font(bold=True, color="FFFFFF")
+        cellule.fill = PatternFill(start_color='6366F1', end_color='6366F1', fill_type="solid")
+        cellule.alignment = Alignment(horizontal="center")
+        entetes.append(cellule)
+    ws.append(entetes)
+
+    def ligne_excel(ligne):
+        cellules = [WriteOnlyCell(ws, value=ligne.numero), WriteOnlyCell(ws, value=ligne.libelle)]
+        cellules[1].alignment = Alignment(indent=max(ligne.niveau - 1, 0))
+        for montant in ligne.montants():
+            cellule = WriteOnlyCell(ws, value=float(montant))
+            cellule.number_format = '#,##0.00'
+            cellules.append(cellule)
+        if ligne.est_total:
+            for cellule in cellules:
+                cellule.font = Font(bold=True)
+        return cellules
+
+    for ligne in balance.lignes:
+        ws.append(ligne_excel(ligne))
+    ws.append(ligne_excel(balance.total))
+
+    fichier = SpooledTemporaryFile(max_size=TAILLE_MEMOIRE_XLSX)
+    wb.save(fichier)
+    fichier.seek(0)
+    return FileResponse(fichier, as_attachment=True, filename=nom_fichier, content_type=TYPE_XLSX)
+
+
+def reponse_balance_pdf(balance, nom_fichier):
+    """PDF A4 paysage, écrit dans un fichier temporaire « spooled »"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    fichier = SpooledTemporaryFile(max_size=TAILLE_MEMOIRE_XLSX)
+    doc = SimpleDocTemplate(
+        fichier, pagesize=landscape(A4),
+        leftMargin=1 * cm, rightMargin=1 * cm, topMargin=1.2 * cm, bottomMargin=1.2 * cm,
+    )
+    styles = getSampleStyleSheet()
+
+    donnees = [['Compte', 'Libellé'] + TITRES_COLONNES]
+    lignes_totaux = []
+    for ligne in balance.lignes + [balance.total]:
+        if ligne.est_total:
+            lignes_totaux.append(len(donnees))
+        donnees.append(
+            [ligne.numero, ('   ' * max(ligne.niveau - 1, 0)) + ligne.libelle[:45]]
+            + [f"{montant:,.2f}" if montant else '' for montant in ligne.montants()]
+        )
+
+    table = Table(donnees, repeatRows=1, colWidths=[2.2 * cm, 7.3 * cm] + [3 * cm] * 6)
+    style = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366F1')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#D1D5DB')),
+    ]
+    for index in lignes_totaux:
+        style.append(('FONTNAME', (0, index), (-1, index), 'Helvetica-Bold'))
+        style.append(('BACKGROUND', (0, index), (-1, index), colors.HexColor('#F3F4F6')))
+    table.setStyle(TableStyle(style))
+
+    doc.build([Paragraph(_titre(balance), styles['Title']), Spacer(1, 0.3 * cm), table])
+    fichier.seek(0)
+    return FileResponse(fichier, as_attachment=True, filename=nom_fichier, content_type='application/pdf')
@@ -0,0 +1,164 @@
+# comptabilite/budgets.py
+"""
+Suivi budgétaire : budget prévu et réalisé par compte et par mois.
+
+Le réalisé de tous les comptes budgétés d'un exercice est lu en une requête
+dans SoldeCompte (totaux déjà cumulés par compte et par mois, voir
+soldes.py) puis rapproché en mémoire des lignes de Budget : la matrice
+comptes × mois coûte 2 requêtes, quel que soit le nombre de comptes. Comme
+Budget.montant_realise, le réalisé est le total débit des comptes de charge
+et d'actif, le total crédit des autres comptes, sur les pièces validées.
+
+Budget.mois est le numéro du mois (1-12) ; il désigne le premier mois de ce
+numéro à partir du début de l'exercice (un exercice de juillet à juin place
+le mois 3 sur l'année suivante).
+
+enregistrer_budgets enregistre la grille des 12 mois d'un compte en une
+requête (INSERT ... ON CONFLICT DO UPDATE sur (exercice, compte, mois)).
+"""
+
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Budget, SoldeCompte
+
+NOMS_MOIS = ['Janv.', 'Févr.', 'Mars', 'Avr.', 'Mai', 'Juin', 'Juil.', 'Août', 'Sept.', 'Oct.', 'Nov.', 'Déc.']
+
+TYPES_DEBIT = ['CHARGE', 'ACTIF']
+
+
+def mois_exercice(exercice):
+    """Premiers jours des 12 mois de l'exercice, à partir de son premier mois"""
+    debut = exercice.date_debut.replace(day=1)
+    return [
+        debut.replace(year=debut.year + (debut.month - 1 + i) // 12, month=(debut.month - 1 + i) % 12 + 1)
+        for i in range(12)
+    ]
+
+
+def realise(type_compte, debit, credit):
+    """Montant réalisé d'un compte selon son type"""
+    return debit if type_compte in TYPES_DEBIT else credit
+
+
+@dataclass
+class CelluleBudget:
+    """Un mois d'un compte : prévu, réalisé et écart"""
+    prevu: Decimal = Decimal('0')
+    realise: Decimal = Decimal('0')
+    est_budgete: bool = False
+
+    @property
+    def ecart(self):
+        return self.prevu - self.realise
+
+    @property
+    def taux_realisation(self):
+        if not self.prevu:
+            return 0
+        return self.realise / self.prevu * 100
+
+    def ajouter(self, cellule):
+        self.prevu += cellule.prevu
+        self.realise += cellule.realise
+        self.est_budgete = self.est_budgete or cellule.est_budgete
+
+
+@dataclass
+class LigneBudget:
+    """Un compte budgété : une cellule par mois de l'exercice et le total"""
+    compte_id: int
+    numero: str
+    libelle: str
+    type_compte: str
+    cellules: list = field(default_factory=lambda: [CelluleBudget() for _ in range(12)])
+    total: CelluleBudget = field(default_factory=CelluleBudget)
+
+    def ajouter(self, ligne):
+        for cellule, autre in zip(self.cellules, ligne.cellules):
+            cellule.ajouter(autre)
+        self.total.ajouter(ligne.total)
+
+
+class SuiviBudgetaire:
+    """
+    Budget et réalisé de l'exercice, par compte budgété (lignes, triées par
+    numéro de compte) et par mois (colonnes : mois). Les comptes de charge et
+    de produit sont totalisés séparément (totaux, par type de compte).
+    """
+
+    def __init__(self, exercice):
+        self.exercice = exercice
+        self.mois = mois_exercice(exercice)
+        colonnes = {mois.month: i for i, mois in enumerate(self.mois)}
+
+        lignes = {}
+        for budget in (
+            Budget.objects.filter(exercice=exercice)
+            .values('compte_id', 'compte__numero_compte', 'compte__libelle', 'compte__type_compte', 'mois', 'montant_prevu')
+            .order_by()
+        ):
+            ligne = lignes.get(budget['compte_id'])
+            if ligne is None:
+                ligne = lignes[budget['compte_id']] = LigneBudget(
+                    budget['compte_id'], budget['compte__numero_compte'],
+                    budget['compte__libelle'], budget['compte__type_compte'],
+                )
+            colonne = colonnes.get(budget['mois'])
+            if colonne is not None:
+                ligne.cellules[colonne].prevu = budget['montant_prevu']
+                ligne.cellules[colonne].est_budgete = True
+
+        # Réalisé des comptes budgétés, tous les mois de l'exercice en une requête
+        for solde in SoldeCompte.objects.filter(
+            exercice=exercice, compte_id__in=list(lignes), mois__in=self.mois
+        ).values('compte_id', 'mois', 'debit', 'credit').order_by():
+            ligne = lignes[solde['compte_id']]
+            colonne = colonnes[solde['mois'].month]
+            ligne.cellules[colonne].realise = realise(ligne.type_compte, solde['debit'], solde['credit'])
+
+        self.lignes = sorted(lignes.values(), key=lambda ligne: ligne.numero)
+        self.totaux = {}
+        for ligne in self.lignes:
+            for cellule in ligne.cellules:
+                ligne.total.ajouter(cellule)
+            total = self.totaux.get(ligne.type_compte)
+            if total is None:
+                total = self.totaux[ligne.type_compte] = LigneBudget(None, '', f"Total {ligne.type_compte.lower()}", ligne.type_compte)
+            total.ajouter(ligne)
+
+    @property
+    def noms_mois(self):
+        return [f"{NOMS_MOIS[mois.month - 1]} {mois:%y}" for mois in self.mois]
+
+
+def montants_budget(exercice, compte):
+    """Montants prévus du compte pour l'exercice : {mois (1-12): montant}"""
+    return dict(
+        Budget.objects.filter(exercice=exercice, compte=compte).values_list('mois', 'montant_prevu')
+    )
+
+
+def enregistrer_budgets(exercice, compte, montants):
+    """
+    Enregistre la grille des 12 mois d'un compte : `montants` {mois (1-12):
+    montant ou None}. Les mois renseignés sont créés ou mis à jour en une
+    requête ; les mois vidés (None) sont supprimés.
+    """
+    renseignes = {mois: montant for mois, montant in montants.items() if montant is not None}
+    with transaction.atomic():
+        Budget.objects.bulk_create(
+            [
+                Budget(exercice=exercice, compte=compte, mois=mois, montant_prevu=montant)
+                for mois, montant in renseignes.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['exercice', 'compte', 'mois'],
+            update_fields=['montant_prevu'],
+        )
+        vides = [mois for mois, montant in montants.items() if montant is None]
+        if vides:
+            Budget.objects.filter(exercice=exercice, compte=compte, mois__in=vides).delete()
+    return len(renseignes)
@@ -0,0 +1,280 @@
+# comptabilite/etats.py
+"""
+États financiers SYSCOHADA : bilan et compte de résultat d'un exercice.
+
+Les montants sont les totaux par compte de l'exercice entier (soldes
+mensuels des pièces validées, voir soldes.totaux_par_compte) : 2 requêtes
+par exercice, quel que soit le nombre d'écritures. Chaque compte est
+rattaché à la rubrique dont un préfixe est le plus long préfixe de son
+numéro (409 va aux avances fournisseurs avant 40 fournisseurs).
+
+- Bilan : les comptes des classes 1 à 3 vont à l'actif (classes 2 et 3,
+  amortissements et dépréciations 28/29/39 en déduction) ou au passif
+  (classe 1). Les comptes de tiers et de trésorerie (classes 4 et 5) vont
+  à l'actif s'ils sont débiteurs, au passif s'ils sont créditeurs. Le
+  résultat de l'exercice (classes 6 à 8) s'ajoute au compte 13.
+- Compte de résultat : chaque ligne vaut crédit - débit (les charges sont
+  donc négatives) et les soldes intermédiaires (XA à XI) additionnent leurs
+  lignes, comme dans le modèle SYSCOHADA révisé.
+
+Les états d'un exercice sont mis en cache sous la version de l'exercice
+(Exercice.version_etats, relue en base à chaque appel : une requête). La
+version est incrémentée dans la transaction qui valide des pièces de
+l'exercice (voir soldes.cumuler_pieces) ; modifier le plan comptable ou
+les exercices incrémente celle de tous les exercices (voir
+comptabilite/signals.py). Le compteur étant en base, tous les processus
+voient le changement, même avec un cache propre à chaque processus.
+"""
+
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Exercice, PlanComptable
+from .soldes import totaux_par_compte
+
+ZERO = Decimal('0')
+
+TTL_ETATS = 60 * 60 * 24  # secondes ; une version remplacée n'est plus lue et expire
+
+# (référence, libellé, préfixes des comptes) ; une ligne sans préfixes (None)
+# est un total, calculé d'après TOTAUX.
+ACTIF = [
+    ('AD', 'Immobilisations incorporelles', ['21', '281', '291']),
+    ('AI', 'Immobilisations corporelles', ['2', '22', '23', '24', '282', '283', '284', '292', '293', '294']),
+    ('AP', 'Avances et acomptes versés sur immobilisations', ['25', '295']),
+    ('AQ', 'Immobilisations financières', ['26', '27', '296', '297']),
+    ('AZ', 'TOTAL ACTIF IMMOBILISÉ', None),
+    ('BA', 'Actif circulant HAO', ['485', '488']),
+    ('BB', 'Stocks et encours', ['3']),
+    ('BH', 'Fournisseurs, avances versées', ['409']),
+    ('BI', 'Clients', ['41', '491']),
+    ('BJ', 'Autres créances', ['4']),
+    ('BK', 'TOTAL ACTIF CIRCULANT', None),
+    ('BQ', 'Titres de placement', ['50', '590']),
+    ('BR', 'Valeurs à encaisser', ['51']),
+    ('BS', 'Banques, chèques postaux, caisse et assimilés', ['5']),
+    ('BT', 'TOTAL TRÉSORERIE-ACTIF', None),
+    ('BZ', 'TOTAL GÉNÉRAL', None),
+]
+
+PASSIF = [
+    ('CA', 'Capital', ['10']),
+    ('CD', 'Primes liées au capital social', ['105']),
+    ('CE', 'Écarts de réévaluation', ['106']),
+    ('CF', 'Réserves indisponibles', ['111', '112', '113']),
+    ('CG', 'Réserves libres', ['11']),
+    ('CH', 'Report à nouveau', ['12']),
+    ('CJ', "Résultat net de l'exercice", ['13']),
+    ('CL', "Subventions d'investissement", ['14']),
+    ('CM', 'Provisions réglementées', ['15']),
+    ('CP', 'TOTAL CAPITAUX PROPRES ET RESSOURCES ASSIMILÉES', None),
+    ('DA', 'Emprunts et dettes financières diverses', ['1', '16', '18']),
+    ('DB', 'Dettes de location-acquisition', ['17']),
+    ('DC', 'Provisions pour risques et charges', ['19']),
+    ('DD', 'TOTAL DETTES FINANCIÈRES ET RESSOURCES ASSIMILÉES', None),
+    ('DH', 'Dettes circulantes HAO', ['481', '482', '484']),
+    ('DI', 'Clients, avances reçues', ['419']),
+    ('DJ', "Fournisseurs d'exploitation", ['40']),
+    ('DK', 'Dettes fiscales et sociales', ['42', '43', '44']),
+    ('DM', 'Autres dettes', ['4']),
+    ('DP', 'TOTAL PASSIF CIRCULANT', None),
+    ('DQ', "Banques, crédits d'escompte", ['565']),
+    ('DR', 'Banques, établissements financiers et crédits de trésorerie', ['5']),
+    ('DT', 'TOTAL TRÉSORERIE-PASSIF', None),
+    ('DZ', 'TOTAL GÉNÉRAL', None),
+]
+
+RESULTAT = [
+    ('TA', 'Ventes de marchandises', ['70', '701']),
+    ('RA', 'Achats de marchandises', ['60', '601']),
+    ('RB', 'Variation de stocks de marchandises', ['6031']),
+    ('XA', 'MARGE COMMERCIALE', None),
+    ('TB', 'Ventes de produits fabriqués', ['702', '703', '704']),
+    ('TC', 'Travaux, services vendus', ['705', '706']),
+    ('TD', 'Produits accessoires', ['707']),
+    ('XB', "CHIFFRE D'AFFAIRES", None),
+    ('TE', 'Production stockée (ou déstockage)', ['73']),
+    ('TF', 'Production immobilisée', ['72']),
+    ('TG', "Subventions d'exploitation", ['71']),
+    ('TH', 'Autres produits', ['7', '75']),
+    ('TI', "Transferts de charges d'exploitation", ['781']),
+    ('RC', 'Achats de matières premières et fournitures liées', ['602']),
+    ('RD', 'Variation de stocks de matières premières et fournitures liées', ['6032']),
+    ('RE', 'Autres achats', ['604', '605', '608']),
+    ('RF', "Variation de stocks d'autres approvisionnements", ['6033']),
+    ('RG', 'Transports', ['61']),
+    ('RH', 'Services extérieurs', ['62', '63']),
+    ('RI', 'Impôts et taxes', ['64']),
+    ('RJ', 'Autres charges', ['6', '65']),
+    ('XC', 'VALEUR AJOUTÉE', None),
+    ('RK', 'Charges de personnel', ['66']),
+    ('XD', "EXCÉDENT BRUT D'EXPLOITATION", None),
+    ('TJ', "Reprises d'amortissements, provisions et dépréciations", ['791', '798', '799']),
+    ('RL', 'Dotations aux amortissements, aux provisions et dépréciations', ['68', '69']),
+    ('XE', "RÉSULTAT D'EXPLOITATION", None),
+    ('TK', 'Revenus financiers et assimilés', ['77']),
+    ('TL', 'Reprises de provisions et dépréciations financières', ['797']),
+    ('TM', 'Transferts de charges financières', ['787']),
+    ('RM', 'Frais financiers et charges assimilées', ['67']),
+    ('RN', 'Dotations aux provisions et aux dépréciations financières', ['697']),
+    ('XF', 'RÉSULTAT FINANCIER', None),
+    ('XG', 'RÉSULTAT DES ACTIVITÉS ORDINAIRES', None),
+    ('TN', "Produits des cessions d'immobilisations", ['82']),
+    ('TO', 'Autres produits HAO', ['8', '84', '86', '88']),
+    ('RO', "Valeurs comptables des cessions d'immobilisations", ['81']),
+    ('RP', 'Autres charges HAO', ['83', '85']),
+    ('XH', 'RÉSULTAT HORS ACTIVITÉS ORDINAIRES', None),
+    ('RQ', 'Participation des travailleurs', ['87']),
+    ('RS', 'Impôts sur le résultat', ['89']),
+    ('XI', 'RÉSULTAT NET', None),
+]
+
+# Lignes additionnées par chaque total
+TOTAUX = {
+    'AZ': ['AD', 'AI', 'AP', 'AQ'],
+    'BK': ['BA', 'BB', 'BH', 'BI', 'BJ'],
+    'BT': ['BQ', 'BR', 'BS'],
+    'BZ': ['AZ', 'BK', 'BT'],
+    'CP': ['CA', 'CD', 'CE', 'CF', 'CG', 'CH', 'CJ', 'CL', 'CM'],
+    'DD': ['DA', 'DB', 'DC'],
+    'DP': ['DH', 'DI', 'DJ', 'DK', 'DM'],
+    'DT': ['DQ', 'DR'],
+    'DZ': ['CP', 'DD', 'DP', 'DT'],
+    'XA': ['TA', 'RA', 'RB'],
+    'XB': ['TA', 'TB', 'TC', 'TD'],
+    'XC': ['XB', 'RA', 'RB', 'TE', 'TF', 'TG', 'TH', 'TI', 'RC', 'RD', 'RE', 'RF', 'RG', 'RH', 'RI', 'RJ'],
+    'XD': ['XC', 'RK'],
+    'XE': ['XD', 'TJ', 'RL'],
+    'XF': ['TK', 'TL', 'TM', 'RM', 'RN'],
+    'XG': ['XE', 'XF'],
+    'XH': ['TN', 'TO', 'RO', 'RP'],
+    'XI': ['XG', 'XH', 'RQ', 'RS'],
+}
+
+# Amortissements et dépréciations : en déduction de l'actif brut
+PREFIXES_AMORTISSEMENT = ('28', '29', '39', '49', '59')
+
+
+class LigneEtat:
+    """Rubrique ou total d'un état financier"""
+
+    def __init__(self, reference, libelle, est_total):
+        self.reference = reference
+        self.libelle = libelle
+        self.est_total = est_total
+        self.brut = ZERO
+        self.amortissement = ZERO
+
+    @property
+    def net(self):
+        return self.brut - self.amortissement
+
+
+def _index(rubriques):
+    """{préfixe: référence} des rubriques qui ont des comptes"""
+    return {prefixe: reference for reference, _, prefixes in rubriques if prefixes for prefixe in prefixes}
+
+
+def _rubrique(index, numero):
+    """Référence de la rubrique du plus long préfixe de `numero` (None s'il n'y en a pas)"""
+    for longueur in range(len(numero), 0, -1):
+        reference = index.get(numero[:longueur])
+        if reference:
+            return reference
+    return None
+
+
+def _lignes(rubriques):
+    return {reference: LigneEtat(reference, libelle, prefixes is None) for reference, libelle, prefixes in rubriques}
+
+
+def _totaliser(lignes):
+    # TOTAUX est dans l'ordre des états : un total n'utilise que des lignes déjà calculées
+    for reference, composantes in TOTAUX.items():
+        if reference in lignes:
+            ligne = lignes[reference]
+            ligne.brut = sum((lignes[composante].brut for composante in composantes), ZERO)
+            ligne.amortissement = sum((lignes[composante].amortissement for composante in composantes), ZERO)
+
+
+class EtatsFinanciers:
+    """Bilan et compte de résultat d'un exercice, à sa clôture"""
+
+    INDEX_ACTIF = _index(ACTIF)
+    INDEX_PASSIF = _index(PASSIF)
+    INDEX_RESULTAT = _index(RESULTAT)
+
+    def __init__(self, exercice):
+        self.exercice_id = exercice.pk
+        actif = _lignes(ACTIF)
+        passif = _lignes(PASSIF)
+        resultat = _lignes(RESULTAT)
+
+        totaux = totaux_par_compte(exercice)
+        numeros = dict(PlanComptable.objects.filter(pk__in=totaux).values_list('id', 'numero_compte'))
+        for compte_id, (debit, credit) in totaux.items():
+            numero = numeros[compte_id]
+            solde = debit - credit
+            if numero[:1] in '678':
+                resultat[_rubrique(self.INDEX_RESULTAT, numero) or 'TO'].brut -= solde
+            elif numero.startswith(PREFIXES_AMORTISSEMENT):
+                actif[_rubrique(self.INDEX_ACTIF, numero) or 'BJ'].amortissement -= solde
+            elif numero[:1] in '23' or (numero[:1] in '45' and solde > 0):
+                actif[_rubrique(self.INDEX_ACTIF, numero) or 'BJ'].brut += solde
+            else:
+                passif[_rubrique(self.INDEX_PASSIF, numero) or 'DM'].brut -= solde
+
+        _totaliser(resultat)
+        passif['CJ'].brut += resultat['XI'].brut
+        _totaliser(actif)
+        _totaliser(passif)
+
+        self.actif = [actif[reference] for reference, _, _ in ACTIF]
+        self.passif = [passif[reference] for reference, _, _ in PASSIF]
+        self.resultat = [resultat[reference] for reference, _, _ in RESULTAT]
+        self.montants = {ligne.reference: ligne.net for ligne in self.actif + self.passif + self.resultat}
+
+    @property
+    def total_actif(self):
+        return self.montants['BZ']
+
+    @property
+    def total_passif(self):
+        return self.montants['DZ']
+
+    @property
+    def resultat_net(self):
+        return self.montants['XI']
+
+    @property
+    def est_equilibre(self):
+        return self.total_actif == self.total_passif
+
+
+# ========== CACHE ==========
+
+def invalider_etats(exercice_ids=None):
+    """Rend obsolètes les états en cache des exercices `exercice_ids` (de tous les exercices par défaut)"""
+    exercices = Exercice.objects.all()
+    if exercice_ids is not None:
+        exercices = exercices.filter(pk__in=exercice_ids)
+    exercices.update(version_etats=F('version_etats') + 1)
+
+
+def etats_financiers(exercice):
+    """États financiers de `exercice`, depuis le cache si sa version n'a pas changé"""
+    version = Exercice.objects.filter(pk=exercice.pk).values_list('version_etats', flat=True).first()
+    cle = f'comptabilite:etats:{exercice.pk}:{version}'
+
+    etats = cache.get(cle)
+    if etats is None:
+        etats = EtatsFinanciers(exercice)
+        cache.set(cle, etats, TTL_ETATS)
+    return etats
+
+
+def exercice_precedent(exercice):
+    """Exercice terminé juste avant `exercice` (None s'il n'y en a pas)"""
+    return Exercice.objects.filter(date_fin__lt=exercice.date_debut).order_by('-date_fin').first()
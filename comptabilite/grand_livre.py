@@ -0,0 +1,363 @@
+# comptabilite/grand_livre.py
+"""
+Grand livre : écritures des pièces validées d'un exercice, par compte (ou
+plage de comptes) et par période, avec le solde progressif de chaque compte.
+
+Le solde progressif est calculé par la base, avec une fonction de fenêtre
+(somme de débit - crédit par compte, dans l'ordre date de pièce, id), à
+laquelle s'ajoute le solde d'ouverture du compte à la date de début : mois
+entiers de l'exercice lus dans SoldeCompte, plus les écritures du mois
+entamé.
+
+- Écran : pagination par curseur (numéro de compte, date, id) ; le curseur,
+  signé, porte aussi le solde atteint, dont repart la page suivante : la
+  fenêtre ne porte que sur les écritures de la page, qui coûte le même prix
+  qu'elle soit la première ou la millième.
+- Exports : les écritures sont lues par paquets (.iterator()), la mémoire
+  reste bornée quelle que soit la taille du grand livre d'un exercice. Le
+  CSV est envoyé en flux ; le classeur Excel (jusqu'à un million de lignes)
+  est produit en arrière-plan par une TacheExport (ExportGrandLivre), comme
+  le CSV quand il est demandé depuis « Mes exports ».
+"""
+
+from collections import deque
+from datetime import date
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import DecimalField, F, Q, Sum, Window
+from django.db.models.expressions import RowRange
+from django.http import StreamingHttpResponse
+
+from base.exports import TAILLE_PAQUET, DefinitionExport, csv_lignes
+from .models import Ecriture, SoldeCompte
+
+TAILLE_PAGE = 100
+LIGNES_MAX_XLSX = 1_000_000  # Excel s'arrête à 1 048 576 lignes : au-delà, exporter en CSV
+SEL_CURSEUR = 'comptabilite.grand_livre'
+
+ZERO = Decimal('0')
+
+CHAMPS = (
+    'id', 'compte_id', 'compte__numero_compte', 'compte__libelle', 'piece_id', 'piece__date_piece',
+    'piece__numero_piece', 'piece__journal__code', 'libelle', 'debit', 'credit', 'cumul',
+)
+
+ORDRE = ('compte__numero_compte', 'piece__date_piece', 'id')
+
+TITRES_COLONNES = ['Compte', 'Date', 'Pièce', 'Journal', 'Libellé', 'Débit', 'Crédit', 'Solde']
+
+
+class GrandLivre:
+    """Grand livre d'un exercice entre deux dates incluses, pour une plage de comptes (numéros)"""
+
+    def __init__(self, exercice, date_debut, date_fin, compte_debut='', compte_fin=''):
+        self.exercice = exercice
+        self.date_debut = date_debut
+        self.date_fin = date_fin
+        self.compte_debut = compte_debut
+        self.compte_fin = compte_fin
+
+    def _filtre_comptes(self, prefixe=''):
+        """Plage de comptes ; le compte de fin inclut ses sous-comptes (401 → 401100)"""
+        filtre = Q()
+        if self.compte_debut:
+            filtre &= Q(**{f'{prefixe}numero_compte__gte': self.compte_debut})
+        if self.compte_fin:
+            filtre &= (
+                Q(**{f'{prefixe}numero_compte__lte': self.compte_fin})
+                | Q(**{f'{prefixe}numero_compte__startswith': self.compte_fin})
+            )
+        return filtre
+
+    def _ecritures(self):
+        return Ecriture.objects.filter(
+            self._filtre_comptes('compte__'),
+            piece__est_validee=True,
+            piece__exercice=self.exercice,
+            piece__date_piece__gte=self.date_debut,
+            piece__date_piece__lte=self.date_fin,
+        )
+
+    @staticmethod
+    def _avec_cumul(ecritures):
+        """Ajoute le cumul (débit - crédit) de leur compte depuis la première des `ecritures`"""
+        return ecritures.annotate(cumul=Window(
+            Sum(F('debit') - F('credit'), output_field=DecimalField(max_digits=17, decimal_places=2)),
+            partition_by=[F('compte_id')],
+            order_by=[F('piece__date_piece').asc(), F('id').asc()],
+            frame=RowRange(start=None, end=0),
+        )).order_by(*ORDRE)
+
+    def ecritures(self):
+        """Écritures de la période, avec le cumul de leur compte depuis le début de la période"""
+        return self._avec_cumul(self._ecritures())
+
+    def soldes_ouverture(self, compte_ids=None):
+        """
+        Solde (débit - crédit) de chaque compte à la date de début, en 2
+        requêtes : {compte_id: (numéro, libellé, solde)}. Seuls les comptes
+        `compte_ids` si la liste est donnée.
+        """
+        debut_mois = self.date_debut.replace(day=1)
+        soldes = SoldeCompte.objects.filter(self._filtre_comptes('compte__'), exercice=self.exercice, mois__lt=debut_mois)
+        ecritures = Ecriture.objects.filter(
+            self._filtre_comptes('compte__'),
+            piece__est_validee=True,
+            piece__exercice=self.exercice,
+            piece__date_piece__gte=debut_mois,
+            piece__date_piece__lt=self.date_debut,
+        )
+        if compte_ids is not None:
+            soldes = soldes.filter(compte_id__in=compte_ids)
+            ecritures = ecritures.filter(compte_id__in=compte_ids)
+
+        ouvertures = {}
+        for requete in (soldes, ecritures):
+            for ligne in requete.values('compte_id', 'compte__numero_compte', 'compte__libelle').annotate(
+                total_debit=Sum('debit'), total_credit=Sum('credit')
+            ).order_by():
+                _, _, solde = ouvertures.get(ligne['compte_id'], (None, None, ZERO))
+                ouvertures[ligne['compte_id']] = (
+                    ligne['compte__numero_compte'], ligne['compte__libelle'],
+                    solde + (ligne['total_debit'] or ZERO) - (ligne['total_credit'] or ZERO),
+                )
+        return ouvertures
+
+    # ========== ÉCRAN ==========
+
+    def page(self, curseur=None, taille=TAILLE_PAGE):
+        """
+        Écritures qui suivent `curseur` (None : depuis le début) : (lignes,
+        curseur de la page suivante ou None). Chaque ligne est un dict
+        (CHAMPS) complété du solde progressif ; la première écriture d'un
+        compte dans la page porte son solde d'ouverture, ou le solde reporté
+        de la page précédente (report).
+        """
+        position = lire_curseur(curseur)
+        ecritures = self._ecritures()
+        if position:
+            numero, date_piece, ecriture_id = position['numero'], position['date'], position['id']
+            ecritures = ecritures.filter(
+                Q(compte__numero_compte__gt=numero)
+                | Q(compte__numero_compte=numero, piece__date_piece__gt=date_piece)
+                | Q(compte__numero_compte=numero, piece__date_piece=date_piece, id__gt=ecriture_id)
+            )
+        # Fenêtre sur les seules écritures de la page : le cumul repart du solde
+        # d'ouverture ou du solde reporté, ajouté ci-dessous
+        page = ecritures.order_by(*ORDRE).values('id')[:taille + 1]
+        lignes = list(self._avec_cumul(Ecriture.objects.filter(id__in=page)).values(*CHAMPS))
+        suivante = len(lignes) > taille
+        lignes = lignes[:taille]
+
+        nouveaux = {ligne['compte_id'] for ligne in lignes}
+        if position:
+            nouveaux.discard(position['compte_id'])
+        ouvertures = self.soldes_ouverture(nouveaux) if nouveaux else {}
+
+        compte_precedent = None
+        for ligne in lignes:
+            ligne['report'] = bool(position) and ligne['compte_id'] == position['compte_id']
+            if ligne['report']:
+                base = position['solde']
+            else:
+                base = ouvertures.get(ligne['compte_id'], (None, None, ZERO))[2]
+            ligne['nouveau_compte'] = ligne['compte_id'] != compte_precedent
+            ligne['solde_ouverture'] = base
+            ligne['solde'] = base + ligne['cumul']
+            compte_precedent = ligne['compte_id']
+
+        return lignes, (ecrire_curseur(lignes[-1]) if suivante else None)
+
+    # ========== EXPORTS ==========
+
+    def lignes(self, taille_paquet=TAILLE_PAQUET):
+        """
+        Lignes d'export (listes de valeurs) : pour chaque compte, solde
+        d'ouverture, écritures avec solde progressif et total. Les comptes
+        sans écriture sur la période mais avec un solde d'ouverture figurent
+        aussi.
+        """
+        ouvertures = self.soldes_ouverture()
+        sans_mouvement = deque(sorted(
+            (numero, libelle, solde) for numero, libelle, solde in ouvertures.values() if solde
+        ))
+        courant = None  # [compte_id, numéro, ouverture, total débit, total crédit, solde]
+
+        def ouverture(numero, libelle, solde):
+            return [numero, '', '', '', f"Solde d'ouverture - {libelle}", '', '', solde]
+
+        def total(numero, debit, credit, solde):
+            return [numero, '', '', '', f"Total compte {numero}", debit, credit, solde]
+
+        champs = ('compte_id', 'compte__numero_compte', 'compte__libelle', 'piece__date_piece',
+                  'piece__numero_piece', 'piece__journal__code', 'libelle', 'debit', 'credit', 'cumul')
+        for (compte_id, numero, libelle, date_piece, numero_piece, journal, libelle_ecriture,
+             debit, credit, cumul) in self.ecritures().values_list(*champs).iterator(chunk_size=taille_paquet):
+            if courant is None or courant[0] != compte_id:
+                if courant is not None:
+                    yield total(courant[1], courant[3], courant[4], courant[5])
+                while sans_mouvement and sans_mouvement[0][0] < numero:
+                    compte = sans_mouvement.popleft()
+                    yield ouverture(*compte)
+                    yield total(compte[0], ZERO, ZERO, compte[2])
+                if sans_mouvement and sans_mouvement[0][0] == numero:
+                    sans_mouvement.popleft()
+                solde_ouverture = ouvertures.get(compte_id, (None, None, ZERO))[2]
+                courant = [compte_id, numero, solde_ouverture, ZERO, ZERO, solde_ouverture]
+                yield ouverture(numero, libelle, solde_ouverture)
+
+            courant[3] += debit
+            courant[4] += credit
+            courant[5] = courant[2] + cumul
+            yield [numero, date_piece, numero_piece, journal, libelle_ecriture, debit, credit, courant[5]]
+
+        if courant is not None:
+            yield total(courant[1], courant[3], courant[4], courant[5])
+        for compte in sans_mouvement:
+            yield ouverture(*compte)
+            yield total(compte[0], ZERO, ZERO, compte[2])
+
+    @property
+    def titre(self):
+        return (
+            f"Grand livre - {self.exercice.nom} - "
+            f"{self.date_debut.strftime('%d/%m/%Y')} au {self.date_fin.strftime('%d/%m/%Y')}"
+        )
+
+
+# ========== CURSEUR ==========
+
+def ecrire_curseur(ligne):
+    """Curseur signé positionné après `ligne` (dict d'une page)"""
+    return signing.dumps([
+        ligne['compte__numero_compte'], ligne['piece__date_piece'].isoformat(), ligne['id'],
+        ligne['compte_id'], str(ligne['solde']),
+    ], salt=SEL_CURSEUR, compress=True)
+
+
+def lire_curseur(curseur):
+    """Position décodée du curseur, None s'il est absent ou invalide"""
+    if not curseur:
+        return None
+    try:
+        numero, date_piece, ecriture_id, compte_id, solde = signing.loads(curseur, salt=SEL_CURSEUR)
+        return {
+            'numero': numero, 'date': date.fromisoformat(date_piece), 'id': ecriture_id,
+            'compte_id': compte_id, 'solde': Decimal(solde),
+        }
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+# ========== RÉPONSES ==========
+
+def _lignes_csv(grand_livre):
+    for ligne in grand_livre.lignes():
+        yield [
+            valeur.strftime('%d/%m/%Y') if isinstance(valeur, date)
+            else f"{valeur:.2f}" if isinstance(valeur, Decimal)
+            else valeur
+            for valeur in ligne
+        ]
+
+
+def reponse_grand_livre_csv(grand_livre, nom_fichier):
+    """CSV en flux : aucune ligne n'est gardée en mémoire"""
+    response = StreamingHttpResponse(
+        csv_lignes(TITRES_COLONNES, _lignes_csv(grand_livre)), content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    return response
+
+
+def ecrire_grand_livre_csv(fichier, grand_livre, progression=None, taille_paquet=TAILLE_PAQUET):
+    """Écrit le CSV dans `fichier` (binaire, UTF-8) et retourne le nombre de lignes"""
+    nb_lignes = -1  # la première ligne produite est l'en-tête
+    for ligne in csv_lignes(TITRES_COLONNES, _lignes_csv(grand_livre)):
+        fichier.write(ligne.encode('utf-8'))
+        nb_lignes += 1
+        if progression and nb_lignes and nb_lignes % taille_paquet == 0:
+            progression(nb_lignes)
+    if progression:
+        progression(nb_lignes)
+    return nb_lignes
+
+
+def ecrire_grand_livre_xlsx(fichier, grand_livre, progression=None, taille_paquet=TAILLE_PAQUET):
+    """
+    Écrit le classeur dans `fichier` en mode write_only et retourne le nombre
+    de lignes. `progression(n)` est appelé après chaque paquet de lignes.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title='Grand livre')
+    for lettre, largeur in zip('ABCDEFGH', [12, 12, 16, 9, 50, 16, 16, 16]):
+        ws.column_dimensions[lettre].width = largeur
+
+    titre = WriteOnlyCell(ws, value=grand_livre.titre)
+    titre.font = Font(bold=True, size=14)
+    ws.append([titre])
+    ws.append([])
+
+    entetes = []
+    for valeur in TITRES_COLONNES:
+        cellule = WriteOnlyCell(ws, value=valeur)
+        cellule.font = Font(bold=True, color="FFFFFF")
+        cellule.fill = PatternFill(start_color='6366F1', end_color='6366F1', fill_type="solid")
+        cellule.alignment = Alignment(horizontal="center")
+        entetes.append(cellule)
+    ws.append(entetes)
+
+    gras = Font(bold=True)
+    nb_lignes = 0
+    for ligne in grand_livre.lignes(taille_paquet):
+        if nb_lignes >= LIGNES_MAX_XLSX:
+            ws.append([None, None, None, None, 'Export tronqué : exportez ce grand livre en CSV.'])
+            break
+        cellules = []
+        for valeur in ligne:
+            if isinstance(valeur, Decimal):
+                cellule = WriteOnlyCell(ws, value=float(valeur))
+                cellule.number_format = '#,##0.00'
+            elif isinstance(valeur, date):
+                cellule = WriteOnlyCell(ws, value=valeur)
+                cellule.number_format = 'DD/MM/YYYY'
+            else:
+                cellule = WriteOnlyCell(ws, value=valeur)
+            cellules.append(cellule)
+        if not ligne[1]:
+            # Solde d'ouverture et total du compte
+            for cellule in cellules:
+                cellule.font = gras
+        ws.append(cellules)
+        nb_lignes += 1
+        if progression and nb_lignes % taille_paquet == 0:
+            progression(nb_lignes)
+
+    wb.save(fichier)
+    if progression:
+        progression(nb_lignes)
+    return nb_lignes
+
+
+class ExportGrandLivre(DefinitionExport):
+    """
+    Grand livre produit en arrière-plan (TacheExport) : `filtrer(parametres)`
+    retourne le GrandLivre. L'avancement est compté en écritures ; les
+    lignes de solde d'ouverture et de total s'y ajoutent.
+    """
+
+    def __init__(self, filtrer):
+        super().__init__('Grand livre', 'grand_livre', TITRES_COLONNES, filtrer)
+
+    def compter(self, source):
+        return source._ecritures().count()
+
+    def ecrire(self, fichier, source, format_export, progression=None):
+        if format_export == 'csv':
+            return ecrire_grand_livre_csv(fichier, source, progression)
+        return ecrire_grand_livre_xlsx(fichier, source, progression)
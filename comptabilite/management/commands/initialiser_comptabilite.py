@@ -2,7 +2,7 @@
 # comptabilite/management/commands/initialiser_comptabilite.py
 
 from django.core.management.base import BaseCommand
-from comptabilite.models import PlanComptable, Exercice, Journal
+from comptabilite.models import PlanComptable, Exercice, Journal, RegleComptabilisation
 from datetime import date
 
 class Command(BaseCommand):
@@ -118,4 +118,26 @@ class Command(BaseCommand):
         if cree:
             self.stdout.write(self.style.SUCCESS('✓ Exercice créé'))
         
+        # Règles de comptabilisation automatique (achats et paiements fournisseurs)
+        regles = [
+            {'type': 'ACHAT', 'journal': 'AC', 'debit': '601', 'tva': '445', 'credit': '401'},
+            {'type': 'PAIEMENT_FOURNISSEUR', 'journal': 'BQ', 'debit': '401', 'tva': None, 'credit': None},
+        ]
+        
+        compteur_regles = 0
+        for regle_data in regles:
+            _, cree = RegleComptabilisation.objects.get_or_create(
+                type_document=regle_data['type'],
+                defaults={
+                    'journal': Journal.objects.get(code=regle_data['journal']),
+                    'compte_debit': PlanComptable.objects.get(numero_compte=regle_data['debit']),
+                    'compte_tva': PlanComptable.objects.filter(numero_compte=regle_data['tva']).first(),
+                    'compte_credit': PlanComptable.objects.filter(numero_compte=regle_data['credit']).first(),
+                }
+            )
+            if cree:
+                compteur_regles += 1
+        
+        self.stdout.write(self.style.SUCCESS(f'✓ {compteur_regles} règles de comptabilisation créées'))
+        
         self.stdout.write(self.style.SUCCESS('\n✅ Initialisation de la comptabilité terminée!\n'))
@@ -0,0 +1,12 @@
+# comptabilite/management/commands/recalculer_soldes_comptes.py
+
+from django.core.management.base import BaseCommand
+from comptabilite.soldes import recalculer_soldes
+
+class Command(BaseCommand):
+    help = "Reconstruit les soldes mensuels des comptes à partir des pièces validées"
+
+    def handle(self, *args, **options):
+        self.stdout.write('📒 Reconstruction des soldes des comptes...')
+        nb = recalculer_soldes()
+        self.stdout.write(self.style.SUCCESS(f'✓ {nb} solde(s) mensuel(s) calculé(s)'))
@@ -0,0 +1,48 @@
+# comptabilite/management/commands/valider_pieces.py
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from comptabilite.models import Piece
+from comptabilite.soldes import valider_pieces
+
+TAILLE_LOT = 5000
+
+
+class Command(BaseCommand):
+    help = "Valide en lot les pièces comptables équilibrées (et signale les pièces non équilibrées)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journal', help="Code du journal (tous par défaut)")
+        parser.add_argument('--exercice', type=int, help="Id de l'exercice (tous par défaut)")
+        parser.add_argument('--jusqu-au', dest='jusqu_au', help="Date de pièce maximale, AAAA-MM-JJ")
+        parser.add_argument('--taille-lot', dest='taille_lot', type=int, default=TAILLE_LOT,
+                            help=f"Pièces validées par transaction (défaut : {TAILLE_LOT})")
+
+    def handle(self, *args, **options):
+        pieces = Piece.objects.filter(est_validee=False)
+        if options['journal']:
+            pieces = pieces.filter(journal__code=options['journal'])
+        if options['exercice']:
+            pieces = pieces.filter(exercice_id=options['exercice'])
+        if options['jusqu_au']:
+            try:
+                pieces = pieces.filter(date_piece__lte=datetime.strptime(options['jusqu_au'], '%Y-%m-%d').date())
+            except ValueError:
+                raise CommandError("Date invalide pour --jusqu-au (format AAAA-MM-JJ)")
+
+        piece_ids = list(pieces.order_by('date_piece', 'pk').values_list('pk', flat=True))
+        self.stdout.write(f'📒 Validation de {len(piece_ids)} pièce(s)...')
+
+        total_validees = 0
+        total_refusees = 0
+        for debut in range(0, len(piece_ids), options['taille_lot']):
+            validees, refusees = valider_pieces(piece_ids[debut:debut + options['taille_lot']])
+            total_validees += validees
+            total_refusees += len(refusees)
+            for numero_piece, motif in refusees:
+                self.stdout.write(self.style.WARNING(f'  ⚠ {numero_piece} : {motif}'))
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total_validees} pièce(s) validée(s)'))
+        if total_refusees:
+            self.stdout.write(self.style.WARNING(f'⚠ {total_refusees} pièce(s) non validée(s)'))
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegleComptabilisation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_document', models.CharField(choices=[('ACHAT', "Réception d'achat"), ('PAIEMENT_FOURNISSEUR', 'Paiement fournisseur')], max_length=30, unique=True, verbose_name='Type de document')),
+                ('banque', models.ForeignKey(blank=True, help_text='Banque des paiements enregistrés sans banque', null=True, on_delete=django.db.models.deletion.SET_NULL, to='comptabilite.banque', verbose_name='Banque par défaut')),
+                ('compte_credit', models.ForeignKey(blank=True, help_text='Vide pour un paiement : compte comptable de la banque', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='comptabilite.plancomptable', verbose_name='Compte crédité')),
+                ('compte_debit', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='comptabilite.plancomptable', verbose_name='Compte débité')),
+                ('compte_tva', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='comptabilite.plancomptable', verbose_name='Compte de TVA')),
+                ('journal', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='comptabilite.journal', verbose_name='Journal')),
+            ],
+            options={
+                'verbose_name': 'Règle de comptabilisation',
+                'verbose_name_plural': 'Règles de comptabilisation',
+                'ordering': ['type_document'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0002_reglecomptabilisation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SoldeCompte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField(help_text='Premier jour du mois', verbose_name='Mois')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Total débit')),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Total crédit')),
+                ('date_maj', models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')),
+                ('compte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='soldes', to='comptabilite.plancomptable', verbose_name='Compte')),
+                ('exercice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='soldes', to='comptabilite.exercice', verbose_name='Exercice')),
+            ],
+            options={
+                'verbose_name': 'Solde de compte mensuel',
+                'verbose_name_plural': 'Soldes de comptes mensuels',
+                'ordering': ['compte', 'mois'],
+                'indexes': [models.Index(fields=['exercice', 'mois'], name='comptabilit_exercic_371aa7_idx')],
+                'unique_together': {('compte', 'exercice', 'mois')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:47
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calculer_totaux_pieces(apps, schema_editor):
+    """Totaux des pièces existantes, en un seul UPDATE"""
+    Piece = apps.get_model('comptabilite', 'Piece')
+    Ecriture = apps.get_model('comptabilite', 'Ecriture')
+
+    def total(champ):
+        somme = (
+            Ecriture.objects.filter(piece_id=OuterRef('pk'))
+            .order_by().values('piece_id').annotate(total=Sum(champ)).values('total')
+        )
+        return Coalesce(Subquery(somme), Value(0), output_field=models.DecimalField(max_digits=17, decimal_places=2))
+
+    Piece.objects.update(total_debit=total('debit'), total_credit=total('credit'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0003_soldecompte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='piece',
+            name='total_credit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Total crédit'),
+        ),
+        migrations.AddField(
+            model_name='piece',
+            name='total_debit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Total débit'),
+        ),
+        migrations.RunPython(calculer_totaux_pieces, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0004_piece_totaux'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercice',
+            name='version_etats',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Version des états financiers'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-19 06:10
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+
+def reconstruire_soldes(apps, schema_editor):
+    """
+    Soldes mensuels des pièces déjà validées avant SoldeCompte (0003) :
+    même calcul que soldes.recalculer_soldes, sur les modèles historiques.
+    """
+    Ecriture = apps.get_model('comptabilite', 'Ecriture')
+    SoldeCompte = apps.get_model('comptabilite', 'SoldeCompte')
+    Exercice = apps.get_model('comptabilite', 'Exercice')
+
+    mouvements = (
+        Ecriture.objects.filter(piece__est_validee=True)
+        .annotate(mois=TruncMonth('piece__date_piece'))
+        .values('compte_id', 'piece__exercice_id', 'mois')
+        .annotate(total_debit=Sum('debit'), total_credit=Sum('credit'))
+        .order_by()
+    )
+    SoldeCompte.objects.all().delete()
+    SoldeCompte.objects.bulk_create([
+        SoldeCompte(
+            compte_id=ligne['compte_id'], exercice_id=ligne['piece__exercice_id'], mois=ligne['mois'],
+            debit=ligne['total_debit'] or 0, credit=ligne['total_credit'] or 0,
+        )
+        for ligne in mouvements
+    ], batch_size=1000)
+    Exercice.objects.update(version_etats=models.F('version_etats') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0005_exercice_version_etats'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconstruire_soldes, migrations.RunPython.noop),
+    ]
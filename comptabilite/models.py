@@ -2,8 +2,9 @@
 # comptabilite/models.py - Modèles de comptabilité
 # ============================================
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
 from base.models import Client, Fournisseur
 from decimal import Decimal
 
@@ -33,9 +34,10 @@ class PlanComptable(models.Model):
     
     @property
     def solde(self):
-        """Calcule le solde du compte"""
-        debits = self.ecritures_debit.aggregate(total=models.Sum('montant'))['total'] or Decimal('0')
-        credits = self.ecritures_credit.aggregate(total=models.Sum('montant'))['total'] or Decimal('0')
+        """Calcule le solde du compte (pièces validées, lu dans SoldeCompte)"""
+        totaux = self.soldes.aggregate(debits=models.Sum('debit'), credits=models.Sum('credit'))
+        debits = totaux['debits'] or Decimal('0')
+        credits = totaux['credits'] or Decimal('0')
         
         if self.type_compte in ['ACTIF', 'CHARGE']:
             return debits - credits
@@ -50,6 +52,9 @@ class Exercice(models.Model):
     date_fin = models.DateField(verbose_name="Date de fin")
     est_cloture = models.BooleanField(default=False, verbose_name="Est clôturé")
     date_cloture = models.DateField(null=True, blank=True, verbose_name="Date de clôture")
+    version_etats = models.PositiveIntegerField(
+        default=1, editable=False, verbose_name="Version des états financiers"
+    )
     
     class Meta:
         verbose_name = "Exercice comptable"
@@ -58,6 +63,16 @@ class Exercice(models.Model):
     
     def __str__(self):
         return self.nom
+    
+    def save(self, *args, **kwargs):
+        # version_etats n'est modifiée que par etats.invalider_etats (UPDATE version + 1) :
+        # une instance chargée avant une validation ne doit pas remettre l'ancienne version
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                champ.name for champ in self._meta.concrete_fields
+                if not champ.primary_key and champ.name != 'version_etats'
+            ]
+        super().save(*args, **kwargs)
 
 
 class Journal(models.Model):
@@ -97,6 +112,10 @@ class Piece(models.Model):
     cree_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='pieces_creees', verbose_name="Créée par")
     date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     
+    # Totaux des écritures, tenus à jour à chaque modification d'écriture (signal)
+    total_debit = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total débit")
+    total_credit = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total crédit")
+    
     class Meta:
         verbose_name = "Pièce comptable"
         verbose_name_plural = "Pièces comptables"
@@ -105,15 +124,54 @@ class Piece(models.Model):
     def __str__(self):
         return f"{self.numero_piece} - {self.libelle}"
     
-    @property
-    def total_debit(self):
-        """Total des débits de la pièce"""
-        return self.ecritures.aggregate(total=models.Sum('debit'))['total'] or Decimal('0')
+    # Nombre d'essais d'un numéro généré avant d'abandonner
+    TENTATIVES_NUMERO = 5
     
-    @property
-    def total_credit(self):
-        """Total des crédits de la pièce"""
-        return self.ecritures.aggregate(total=models.Sum('credit'))['total'] or Decimal('0')
+    def save(self, *args, **kwargs):
+        """
+        Génère automatiquement le numéro de pièce si nécessaire. Deux pièces
+        du même journal et du même mois créées en même temps lisent la même
+        dernière séquence : la seconde insertion viole l'unicité du numéro,
+        elle est annulée (point de sauvegarde) et refaite avec le numéro
+        suivant.
+        """
+        if self.numero_piece:
+            super().save(*args, **kwargs)
+            return
+        
+        for tentative in range(1, self.TENTATIVES_NUMERO + 1):
+            self.numero_piece = self._generer_numero_piece()
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # Autre contrainte violée, ou trop d'essais : l'erreur remonte
+                if tentative == self.TENTATIVES_NUMERO or not Piece.objects.filter(numero_piece=self.numero_piece).exists():
+                    self.numero_piece = ''
+                    raise
+    
+    def _generer_numero_piece(self):
+        """Génère un numéro unique : code du journal + AAMM + séquence (ex. BQ25110001)"""
+        prefixe = f"{self.journal.code}{self.date_piece.strftime('%y%m')}"
+        
+        dernier = Piece.objects.filter(
+            numero_piece__startswith=prefixe
+        ).order_by('-numero_piece').values_list('numero_piece', flat=True).first()
+        
+        try:
+            nouveau_seq = int(dernier[len(prefixe):]) + 1 if dernier else 1
+        except ValueError:
+            nouveau_seq = 1
+        
+        return f"{prefixe}{nouveau_seq:04d}"
+    
+    def calculer_totaux(self):
+        """Recalcule les totaux de la pièce à partir de ses écritures"""
+        totaux = self.ecritures.aggregate(debit=models.Sum('debit'), credit=models.Sum('credit'))
+        self.total_debit = totaux['debit'] or Decimal('0')
+        self.total_credit = totaux['credit'] or Decimal('0')
+        self.save(update_fields=['total_debit', 'total_credit'])
     
     @property
     def est_equilibree(self):
@@ -121,15 +179,16 @@ class Piece(models.Model):
         return self.total_debit == self.total_credit
     
     def valider(self, utilisateur):
-        """Valider la pièce comptable"""
-        from django.utils import timezone
-        if self.est_equilibree:
-            self.est_validee = True
-            self.date_validation = timezone.now()
-            self.validee_par = utilisateur
-            self.save()
-            return True
-        return False
+        """Valider la pièce comptable (et reporter ses écritures dans les soldes)"""
+        from .soldes import valider_piece, ErreurValidation
+        try:
+            valide = valider_piece(self, utilisateur)
+        except ErreurValidation:
+            return False
+        self.est_validee = valide.est_validee
+        self.date_validation = valide.date_validation
+        self.validee_par = valide.validee_par
+        return True
 
 
 class Ecriture(models.Model):
@@ -155,6 +214,33 @@ class Ecriture(models.Model):
         return self.debit if self.debit > 0 else self.credit
 
 
+class SoldeCompte(models.Model):
+    """
+    Mouvements cumulés d'un compte pour un mois d'un exercice (pièces
+    validées). Tenu à jour à la validation des pièces par
+    comptabilite/soldes.py ; ne pas modifier à la main (commande
+    recalculer_soldes_comptes).
+    """
+    compte = models.ForeignKey(PlanComptable, on_delete=models.CASCADE, related_name='soldes', verbose_name="Compte")
+    exercice = models.ForeignKey(Exercice, on_delete=models.CASCADE, related_name='soldes', verbose_name="Exercice")
+    mois = models.DateField(verbose_name="Mois", help_text="Premier jour du mois")
+    debit = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total débit")
+    credit = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total crédit")
+    date_maj = models.DateTimeField(auto_now=True, verbose_name="Dernière mise à jour")
+    
+    class Meta:
+        verbose_name = "Solde de compte mensuel"
+        verbose_name_plural = "Soldes de comptes mensuels"
+        unique_together = ['compte', 'exercice', 'mois']
+        ordering = ['compte', 'mois']
+        indexes = [
+            models.Index(fields=['exercice', 'mois']),
+        ]
+    
+    def __str__(self):
+        return f"{self.compte_id} - {self.mois:%m/%Y}"
+
+
 class Banque(models.Model):
     """Compte bancaire"""
     nom = models.CharField(max_length=100, verbose_name="Nom de la banque")
@@ -233,30 +319,15 @@ class Budget(models.Model):
     def __str__(self):
         return f"{self.exercice.nom} - {self.compte.numero_compte} - Mois {self.mois}"
     
-    @property
+    @cached_property
     def montant_realise(self):
-        """Calcule le montant réalisé pour ce budget"""
-        from datetime import date
-        debut_mois = date(self.exercice.date_debut.year, self.mois, 1)
-        
-        if self.mois == 12:
-            fin_mois = date(self.exercice.date_debut.year, 12, 31)
-        else:
-            fin_mois = date(self.exercice.date_debut.year, self.mois + 1, 1)
-        
-        ecritures = Ecriture.objects.filter(
-            compte=self.compte,
-            piece__date_piece__gte=debut_mois,
-            piece__date_piece__lt=fin_mois,
-            piece__est_validee=True
-        )
-        
-        if self.compte.type_compte in ['CHARGE', 'ACTIF']:
-            realise = ecritures.aggregate(total=models.Sum('debit'))['total'] or Decimal('0')
-        else:
-            realise = ecritures.aggregate(total=models.Sum('credit'))['total'] or Decimal('0')
-        
-        return realise
+        """Montant réalisé sur le mois du budget (pièces validées, voir budgets.py)"""
+        from .budgets import mois_exercice, realise
+        mois = next(mois for mois in mois_exercice(self.exercice) if mois.month == self.mois)
+        solde = self.compte.soldes.filter(exercice=self.exercice, mois=mois).values('debit', 'credit').first()
+        if solde is None:
+            return Decimal('0')
+        return realise(self.compte.type_compte, solde['debit'], solde['credit'])
     
     @property
     def ecart(self):
@@ -268,4 +339,36 @@ class Budget(models.Model):
         """Calcule le taux de réalisation en %"""
         if self.montant_prevu == 0:
             return 0
-        return (self.montant_realise / self.montant_prevu) * 100
\ No newline at end of file
+        return (self.montant_realise / self.montant_prevu) * 100
+
+
+class RegleComptabilisation(models.Model):
+    """
+    Comptes et journal utilisés pour comptabiliser automatiquement un type
+    de document. Résolue et mise en cache par comptabilite/regles.py.
+    """
+    TYPES_DOCUMENT = [
+        ('ACHAT', 'Réception d\'achat'),
+        ('PAIEMENT_FOURNISSEUR', 'Paiement fournisseur'),
+    ]
+    
+    type_document = models.CharField(max_length=30, choices=TYPES_DOCUMENT, unique=True, verbose_name="Type de document")
+    journal = models.ForeignKey(Journal, on_delete=models.PROTECT, verbose_name="Journal")
+    compte_debit = models.ForeignKey(PlanComptable, on_delete=models.PROTECT, related_name='+', verbose_name="Compte débité")
+    compte_tva = models.ForeignKey(PlanComptable, on_delete=models.PROTECT, null=True, blank=True, related_name='+', verbose_name="Compte de TVA")
+    compte_credit = models.ForeignKey(
+        PlanComptable, on_delete=models.PROTECT, null=True, blank=True, related_name='+',
+        verbose_name="Compte crédité", help_text="Vide pour un paiement : compte comptable de la banque"
+    )
+    banque = models.ForeignKey(
+        Banque, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Banque par défaut",
+        help_text="Banque des paiements enregistrés sans banque"
+    )
+    
+    class Meta:
+        verbose_name = "Règle de comptabilisation"
+        verbose_name_plural = "Règles de comptabilisation"
+        ordering = ['type_document']
+    
+    def __str__(self):
+        return f"{self.get_type_document_display()} - {self.journal.code}"
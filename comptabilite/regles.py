@@ -0,0 +1,164 @@
+# comptabilite/regles.py
+"""
+Résolution des règles de comptabilisation automatique.
+
+Pour chaque type de document (RegleComptabilisation.TYPES_DOCUMENT), la
+règle donne le journal et les comptes à utiliser. Faute de règle
+configurée, REGLES_PAR_DEFAUT s'applique : premier journal actif du type
+indiqué et, pour chaque compte, premier compte actif du plan comptable
+commençant par l'un des préfixes, essayés dans l'ordre (un sous-compte
+601000 est donc retenu avant le compte de regroupement 60).
+
+Les règles, la banque par défaut et les exercices ouverts sont chargés
+ensemble, une fois, puis gardés en mémoire dans le processus : en régime
+établi, la comptabilisation d'un document ne fait aucune requête pour
+trouver ses comptes. Le cache est vidé à tout enregistrement ou suppression
+d'une règle, d'un compte, d'un journal, d'un exercice ou d'une banque (voir
+comptabilite/signals.py) ; dans les autres processus, il expire au bout de
+TTL_REGLES secondes.
+"""
+
+import threading
+import time
+
+from django.db.models import Q
+
+from .models import RegleComptabilisation, PlanComptable, Journal, Exercice, Banque
+
+TTL_REGLES = 300  # secondes
+
+REGLES_PAR_DEFAUT = {
+    'ACHAT': {
+        'type_journal': 'ACHAT',
+        'compte_debit': ['601', '60'],
+        'compte_tva': ['4456', '445'],
+        'compte_credit': ['401'],
+    },
+    'PAIEMENT_FOURNISSEUR': {
+        'type_journal': 'BANQUE',
+        'compte_debit': ['401'],
+        'compte_tva': [],
+        'compte_credit': [],
+    },
+}
+
+_verrou = threading.Lock()
+_cache = {'expiration': 0, 'regles': None, 'exercices': None}
+
+
+class RegleIntrouvable(ValueError):
+    """Journal ou compte nécessaire à la comptabilisation introuvable"""
+
+
+class Regle:
+    """Règle résolue : instances du journal, des comptes et de la banque par défaut"""
+
+    def __init__(self, type_document, journal, compte_debit, compte_tva=None, compte_credit=None, banque=None):
+        self.type_document = type_document
+        self.journal = journal
+        self.compte_debit = compte_debit
+        self.compte_tva = compte_tva
+        self.compte_credit = compte_credit
+        self.banque = banque
+
+
+def invalider_regles():
+    """Vide le cache du processus : les règles seront relues au prochain appel"""
+    with _verrou:
+        _cache['regles'] = None
+        _cache['exercices'] = None
+
+
+def _premier_compte(comptes, prefixes):
+    """Premier compte (par numéro) commençant par le premier préfixe qui en a un"""
+    for prefixe in prefixes:
+        for compte in comptes:
+            if compte.numero_compte.startswith(prefixe):
+                return compte
+    return None
+
+
+def _charger():
+    """Résout toutes les règles en 5 requêtes au plus"""
+    configurees = {
+        regle.type_document: regle
+        for regle in RegleComptabilisation.objects.select_related(
+            'journal', 'compte_debit', 'compte_tva', 'compte_credit', 'banque__compte_comptable'
+        )
+    }
+    banque_defaut = Banque.objects.filter(est_actif=True).select_related('compte_comptable').order_by('nom').first()
+
+    regles = {}
+    a_completer = [type_document for type_document in REGLES_PAR_DEFAUT if type_document not in configurees]
+    if a_completer:
+        prefixes = {
+            prefixe
+            for type_document in a_completer
+            for champ in ('compte_debit', 'compte_tva', 'compte_credit')
+            for prefixe in REGLES_PAR_DEFAUT[type_document][champ]
+        }
+        filtre = Q()
+        for prefixe in prefixes:
+            filtre |= Q(numero_compte__startswith=prefixe)
+        comptes = list(PlanComptable.objects.filter(filtre, est_actif=True).order_by('numero_compte'))
+        journaux = {}
+        for journal in Journal.objects.filter(est_actif=True).order_by('code'):
+            journaux.setdefault(journal.type_journal, journal)
+
+        for type_document in a_completer:
+            defaut = REGLES_PAR_DEFAUT[type_document]
+            regles[type_document] = Regle(
+                type_document,
+                journal=journaux.get(defaut['type_journal']),
+                compte_debit=_premier_compte(comptes, defaut['compte_debit']),
+                compte_tva=_premier_compte(comptes, defaut['compte_tva']),
+                compte_credit=_premier_compte(comptes, defaut['compte_credit']),
+                banque=banque_defaut,
+            )
+
+    for type_document, regle in configurees.items():
+        regles[type_document] = Regle(
+            type_document,
+            journal=regle.journal,
+            compte_debit=regle.compte_debit,
+            compte_tva=regle.compte_tva,
+            compte_credit=regle.compte_credit,
+            banque=regle.banque or banque_defaut,
+        )
+
+    exercices = list(Exercice.objects.filter(est_cloture=False).order_by('date_debut'))
+    return regles, exercices
+
+
+def _donnees():
+    with _verrou:
+        if _cache['regles'] is None or time.monotonic() >= _cache['expiration']:
+            _cache['regles'], _cache['exercices'] = _charger()
+            _cache['expiration'] = time.monotonic() + TTL_REGLES
+        return _cache['regles'], _cache['exercices']
+
+
+def regle(type_document, comptes=()):
+    """
+    Règle de comptabilisation de `type_document`. Lève RegleIntrouvable si
+    le journal ou l'un des `comptes` demandés n'est pas défini.
+    """
+    regles, _ = _donnees()
+    resolue = regles.get(type_document)
+    if resolue is None or resolue.journal is None:
+        raise RegleIntrouvable(f"Aucun journal actif pour la comptabilisation « {type_document} ».")
+    for champ in comptes:
+        if getattr(resolue, champ) is None:
+            raise RegleIntrouvable(
+                f"Les comptes comptables nécessaires n'existent pas dans le plan comptable ({type_document} : {champ})."
+            )
+    return resolue
+
+
+def exercice_ouvert(date):
+    """Exercice non clôturé qui couvre `date` (None s'il n'y en a pas)"""
+    _, exercices = _donnees()
+    for exercice in exercices:
+        if exercice.date_debut <= date <= exercice.date_fin:
+            return exercice
+    return None
@@ -0,0 +1,47 @@
+# comptabilite/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import RegleComptabilisation, PlanComptable, Journal, Exercice, Banque, Piece, Ecriture
+from .regles import invalider_regles
+from .etats import invalider_etats
+
+
+@receiver(post_save, sender=RegleComptabilisation)
+@receiver(post_delete, sender=RegleComptabilisation)
+@receiver(post_save, sender=PlanComptable)
+@receiver(post_delete, sender=PlanComptable)
+@receiver(post_save, sender=Journal)
+@receiver(post_delete, sender=Journal)
+@receiver(post_save, sender=Exercice)
+@receiver(post_delete, sender=Exercice)
+@receiver(post_save, sender=Banque)
+@receiver(post_delete, sender=Banque)
+def invalider_regles_comptabilisation(sender, instance, **kwargs):
+    """Les règles de comptabilisation en cache ne sont plus à jour"""
+    invalider_regles()
+    # Une lecture faite avant la validation de la transaction a pu remettre en cache l'ancien état
+    transaction.on_commit(invalider_regles)
+
+
+@receiver(post_save, sender=PlanComptable)
+@receiver(post_delete, sender=PlanComptable)
+@receiver(post_save, sender=Exercice)
+@receiver(post_delete, sender=Exercice)
+def invalider_etats_financiers(sender, instance, **kwargs):
+    """Numéros de comptes ou dates d'exercice changés : les états en cache ne sont plus à jour"""
+    invalider_etats()
+
+
+@receiver(post_save, sender=Ecriture)
+@receiver(post_delete, sender=Ecriture)
+def recalculer_totaux_piece(sender, instance, **kwargs):
+    """Totaux débit/crédit de la pièce après chaque modification ou suppression d'écriture"""
+    # Suppression de la pièce elle-même (écritures supprimées en cascade)
+    origine = kwargs.get('origin')
+    if isinstance(origine, Piece) or getattr(origine, 'model', None) is Piece:
+        return
+    
+    instance.piece.calculer_totaux()
@@ -0,0 +1,210 @@
+# comptabilite/soldes.py
+"""
+Soldes des comptes par (compte, exercice, mois) : SoldeCompte.
+
+Seules les pièces validées comptent. À la validation d'une pièce
+(valider_piece), ses écritures sont regroupées par compte et par mois et
+ajoutées aux lignes de SoldeCompte en 4 requêtes, quel que soit le nombre
+d'écritures : regroupement, création des lignes absentes (bulk_create
+ignore_conflicts), lecture verrouillée, puis bulk_update. valider_pieces
+valide en lot : un contrôle d'équilibre groupé pour toutes les pièces, un
+seul UPDATE pour les pièces équilibrées, un seul report dans les soldes.
+
+Le solde d'un compte, la balance et les états financiers lisent ces lignes
+(une par compte et par mois) au lieu de parcourir les écritures : leur coût
+ne dépend pas du volume des journaux. Les totaux sont mensuels : une
+période se termine à la fin d'un mois.
+
+La commande recalculer_soldes_comptes reconstruit la table à partir des
+écritures des pièces validées (reprise de données, correction d'écritures
+d'une pièce déjà validée).
+
+La version des états financiers des exercices concernés est incrémentée
+dans la même transaction (voir etats.py).
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Piece, Ecriture, SoldeCompte
+
+
+class ErreurValidation(Exception):
+    """Pièce impossible à valider : rien n'a été enregistré"""
+
+
+def _mouvements(ecritures):
+    """Totaux des écritures par (compte, exercice, mois) : {clé: (débit, crédit)}"""
+    return {
+        (ligne['compte_id'], ligne['piece__exercice_id'], ligne['mois']): (
+            ligne['total_debit'] or Decimal('0'), ligne['total_credit'] or Decimal('0')
+        )
+        for ligne in ecritures
+        .annotate(mois=TruncMonth('piece__date_piece'))
+        .values('compte_id', 'piece__exercice_id', 'mois')
+        .annotate(total_debit=Sum('debit'), total_credit=Sum('credit'))
+        .order_by()
+    }
+
+
+def cumuler_pieces(piece_ids):
+    """Ajoute aux soldes les écritures des pièces `piece_ids` (qui viennent d'être validées)"""
+    mouvements = _mouvements(Ecriture.objects.filter(piece_id__in=piece_ids))
+    if not mouvements:
+        return
+
+    with transaction.atomic():
+        SoldeCompte.objects.bulk_create(
+            [
+                SoldeCompte(compte_id=compte_id, exercice_id=exercice_id, mois=mois)
+                for compte_id, exercice_id, mois in mouvements
+            ],
+            ignore_conflicts=True,
+        )
+        comptes = {compte_id for compte_id, _, _ in mouvements}
+        exercices = {exercice_id for _, exercice_id, _ in mouvements}
+        mois = {mois for _, _, mois in mouvements}
+        soldes = SoldeCompte.objects.select_for_update().filter(
+            compte_id__in=comptes, exercice_id__in=exercices, mois__in=mois
+        ).order_by()
+
+        # bulk_update() ne renseigne pas les champs auto_now
+        maintenant = timezone.now()
+        a_mettre_a_jour = []
+        for solde in soldes:
+            mouvement = mouvements.get((solde.compte_id, solde.exercice_id, solde.mois))
+            if mouvement:
+                solde.debit += mouvement[0]
+                solde.credit += mouvement[1]
+                solde.date_maj = maintenant
+                a_mettre_a_jour.append(solde)
+        SoldeCompte.objects.bulk_update(a_mettre_a_jour, ['debit', 'credit', 'date_maj'], batch_size=1000)
+
+        # Les états financiers de ces exercices ne sont plus à jour (dans la même transaction)
+        from .etats import invalider_etats
+        invalider_etats(exercices)
+
+
+def valider_piece(piece, utilisateur=None):
+    """Valide une pièce équilibrée et reporte ses écritures dans les soldes"""
+    with transaction.atomic():
+        piece = Piece.objects.select_for_update().get(pk=piece.pk)
+        if piece.est_validee:
+            raise ErreurValidation(f"La pièce {piece.numero_piece} est déjà validée.")
+
+        totaux = piece.ecritures.aggregate(nombre=Count('id'), debit=Sum('debit'), credit=Sum('credit'))
+        if not totaux['nombre']:
+            raise ErreurValidation(f"La pièce {piece.numero_piece} n'a aucune écriture.")
+        if totaux['debit'] != totaux['credit']:
+            raise ErreurValidation(
+                f"La pièce {piece.numero_piece} n'est pas équilibrée "
+                f"(débit {totaux['debit']:,.2f} / crédit {totaux['credit']:,.2f})."
+            )
+
+        piece.est_validee = True
+        piece.date_validation = timezone.now()
+        piece.validee_par = utilisateur
+        piece.save(update_fields=['est_validee', 'date_validation', 'validee_par'])
+        cumuler_pieces([piece.pk])
+
+    return piece
+
+
+def valider_pieces(piece_ids, utilisateur=None):
+    """
+    Valide en lot les pièces équilibrées parmi `piece_ids` (les pièces déjà
+    validées sont ignorées) : une requête groupée contrôle l'équilibre de
+    toutes les pièces, un seul UPDATE valide les pièces équilibrées, puis
+    leurs écritures sont reportées dans les soldes (cumuler_pieces).
+
+    Retourne (nombre de pièces validées, pièces refusées : liste de
+    (numéro de pièce, motif)).
+    """
+    with transaction.atomic():
+        a_valider = dict(
+            Piece.objects.select_for_update()
+            .filter(pk__in=piece_ids, est_validee=False)
+            .order_by()
+            .values_list('pk', 'numero_piece')
+        )
+        if not a_valider:
+            return 0, []
+
+        totaux = {
+            ligne['piece_id']: ligne
+            for ligne in Ecriture.objects.filter(piece_id__in=list(a_valider))
+            .values('piece_id')
+            .annotate(nombre=Count('id'), debit=Sum('debit'), credit=Sum('credit'))
+            .order_by()
+        }
+        equilibrees = []
+        refusees = []
+        for piece_id, numero_piece in a_valider.items():
+            total = totaux.get(piece_id)
+            if total is None:
+                refusees.append((numero_piece, "aucune écriture"))
+            elif total['debit'] != total['credit']:
+                refusees.append((
+                    numero_piece,
+                    f"non équilibrée (débit {total['debit']:,.2f} / crédit {total['credit']:,.2f})",
+                ))
+            else:
+                equilibrees.append(piece_id)
+
+        if equilibrees:
+            Piece.objects.filter(pk__in=equilibrees).update(
+                est_validee=True, date_validation=timezone.now(), validee_par=utilisateur
+            )
+            cumuler_pieces(equilibrees)
+
+    return len(equilibrees), sorted(refusees)
+
+
+# ========== LECTURE ==========
+
+def totaux_compte(compte, exercice=None, mois_fin=None):
+    """(total débit, total crédit) du compte, pour un exercice et jusqu'au mois `mois_fin` inclus"""
+    soldes = compte.soldes.all()
+    if exercice is not None:
+        soldes = soldes.filter(exercice=exercice)
+    if mois_fin is not None:
+        soldes = soldes.filter(mois__lte=mois_fin)
+    totaux = soldes.aggregate(debit=Sum('debit'), credit=Sum('credit'))
+    return totaux['debit'] or Decimal('0'), totaux['credit'] or Decimal('0')
+
+
+def totaux_par_compte(exercice, mois_debut=None, mois_fin=None):
+    """
+    Totaux de chaque compte mouvementé dans l'exercice (entre deux mois
+    inclus) : {compte_id: (débit, crédit)}, en une requête.
+    """
+    soldes = SoldeCompte.objects.filter(exercice=exercice)
+    if mois_debut is not None:
+        soldes = soldes.filter(mois__gte=mois_debut.replace(day=1))
+    if mois_fin is not None:
+        soldes = soldes.filter(mois__lte=mois_fin)
+    return {
+        ligne['compte_id']: (ligne['total_debit'], ligne['total_credit'])
+        for ligne in soldes.values('compte_id').annotate(total_debit=Sum('debit'), total_credit=Sum('credit')).order_by()
+    }
+
+
+# ========== RECONSTRUCTION ==========
+
+def recalculer_soldes():
+    """Reconstruit toute la table à partir des pièces validées. Retourne le nombre de lignes."""
+    mouvements = _mouvements(Ecriture.objects.filter(piece__est_validee=True))
+    with transaction.atomic():
+        SoldeCompte.objects.all().delete()
+        SoldeCompte.objects.bulk_create([
+            SoldeCompte(compte_id=compte_id, exercice_id=exercice_id, mois=mois, debit=debit, credit=credit)
+            for (compte_id, exercice_id, mois), (debit, credit) in mouvements.items()
+        ], batch_size=1000)
+
+        from .etats import invalider_etats
+        invalider_etats()
+    return len(mouvements)
@@ -1,3 +1,312 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from achats.models import CommandeAchat, LigneCommandeAchat
+from base.exports import traiter_exports
+from base.models import Fournisseur, TacheExport
+from stock.models import Entrepot, Produit
+from .balance import BalanceGenerale
+from .budgets import SuiviBudgetaire, enregistrer_budgets
+from .etats import etats_financiers, exercice_precedent
+from .grand_livre import GrandLivre
+from .models import Budget, Exercice, Journal, Piece, PlanComptable
+from .regles import invalider_regles
+from .soldes import ErreurValidation, recalculer_soldes, totaux_compte, valider_piece, valider_pieces
+
+
+class PiecesAchatTestCase(TestCase):
+    """Deux commandes d'achat de 1 180 (1 000 HT + TVA 18 %) à comptabiliser dans l'exercice courant"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = User.objects.create_user('comptable')
+        aujourdhui = timezone.localdate()
+        Journal.objects.create(code='AC', libelle='Achats', type_journal='ACHAT')
+        Exercice.objects.create(
+            nom='Exercice courant', date_debut=aujourdhui - timedelta(days=365), date_fin=aujourdhui + timedelta(days=365)
+        )
+        cls.compte_achat = PlanComptable.objects.create(numero_compte='601', libelle='Achats', type_compte='CHARGE')
+        PlanComptable.objects.create(numero_compte='445', libelle='État - TVA', type_compte='PASSIF')
+        cls.compte_401 = PlanComptable.objects.create(numero_compte='401', libelle='Fournisseurs', type_compte='PASSIF')
+
+        fournisseur = Fournisseur.objects.create(
+            code='F001', nom='Fournisseur test', email='f@example.com', telephone='0',
+            adresse='-', ville='Dakar', pays='Sénégal',
+        )
+        entrepot = Entrepot.objects.create(code='E01', nom='Principal', adresse='-', responsable=cls.utilisateur)
+        produit = Produit.objects.create(code='PA', nom='A', prix_achat=Decimal('100'), prix_vente=Decimal('150'))
+        cls.commandes = []
+        for _ in range(2):
+            commande = CommandeAchat.objects.create(fournisseur=fournisseur, entrepot=entrepot, cree_par=cls.utilisateur)
+            LigneCommandeAchat.objects.create(
+                commande=commande, produit=produit, quantite=10, prix_unitaire=Decimal('100'), taux_tva=Decimal('18')
+            )
+            cls.commandes.append(CommandeAchat.objects.get(pk=commande.pk))
+
+    def setUp(self):
+        invalider_regles()
+
+
+class NumerotationPiecesTests(PiecesAchatTestCase):
+    """Numéro de pièce déjà pris entre la lecture de la séquence et l'insertion"""
+
+    def nouvelle_piece(self):
+        return Piece(
+            journal=Journal.objects.get(code='AC'), exercice=Exercice.objects.get(),
+            date_piece=timezone.localdate(), libelle='Pièce', cree_par=self.utilisateur,
+        )
+
+    def test_numero_suivant_si_deja_pris(self):
+        premiere = self.nouvelle_piece()
+        premiere.save()
+        # Une pièce concurrente a lu la même séquence : son numéro est déjà pris
+        with mock.patch.object(Piece, '_generer_numero_piece', side_effect=[premiere.numero_piece, 'AC-SUIVANT']) as generer:
+            seconde = self.nouvelle_piece()
+            seconde.save()
+        self.assertEqual(generer.call_count, 2)
+        self.assertEqual(Piece.objects.get(pk=seconde.pk).numero_piece, 'AC-SUIVANT')
+
+    def test_abandon_apres_plusieurs_essais(self):
+        premiere = self.nouvelle_piece()
+        premiere.save()
+        with mock.patch.object(Piece, '_generer_numero_piece', return_value=premiere.numero_piece) as generer:
+            with self.assertRaises(IntegrityError):
+                self.nouvelle_piece().save()
+        self.assertEqual(generer.call_count, Piece.TENTATIVES_NUMERO)
+        self.assertEqual(Piece.objects.count(), 1)
+
+
+class SoldeCompteTests(PiecesAchatTestCase):
+    """Soldes mensuels des comptes tenus à jour à la validation des pièces"""
+
+    def test_validation_puis_reconstruction(self):
+        pieces = [commande.generer_ecriture_comptable() for commande in self.commandes]
+        # Pièces non validées : aucun solde
+        self.assertEqual(self.compte_401.solde, 0)
+
+        with self.assertNumQueries(12):
+            valider_piece(pieces[0], self.utilisateur)
+        valider_piece(pieces[1], self.utilisateur)
+        with self.assertRaises(ErreurValidation):
+            valider_piece(pieces[1], self.utilisateur)
+
+        self.assertEqual(totaux_compte(self.compte_achat), (Decimal('2000'), Decimal('0')))
+        self.assertEqual(self.compte_401.solde, Decimal('2360'))
+
+        # La reconstruction depuis les écritures donne les mêmes soldes
+        avant = list(self.compte_401.soldes.values('exercice', 'mois', 'debit', 'credit'))
+        recalculer_soldes()
+        self.assertEqual(list(self.compte_401.soldes.values('exercice', 'mois', 'debit', 'credit')), avant)
+
+
+    def test_piece_validee_en_lecture_seule_dans_l_admin(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin_user)
+        brouillon, validee = [commande.generer_ecriture_comptable() for commande in self.commandes]
+        validee = valider_piece(validee, self.utilisateur)
+        ecriture = validee.ecritures.first()
+
+        # Pièce validée et ses écritures : consultation seulement
+        reponse = self.client.post(f'/admin/comptabilite/piece/{validee.pk}/change/', {'libelle': 'Modifiée'})
+        self.assertEqual(reponse.status_code, 403)
+        reponse = self.client.post(f'/admin/comptabilite/ecriture/{ecriture.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(reponse.status_code, 403)
+        self.assertTrue(validee.ecritures.filter(pk=ecriture.pk).exists())
+
+        # Pièce non validée : modifiable
+        modele_admin = admin.site._registry[Piece]
+        requete = RequestFactory().get('/')
+        requete.user = admin_user
+        self.assertTrue(modele_admin.has_view_permission(requete, validee))
+        self.assertFalse(modele_admin.has_delete_permission(requete, validee))
+        self.assertTrue(modele_admin.has_change_permission(requete, brouillon))
+
+
+class BalanceGeneraleTests(PiecesAchatTestCase):
+    """Balance générale lue dans les soldes mensuels, avec regroupement par préfixe"""
+
+    def test_balance_generale(self):
+        # Sous-compte rattaché par son préfixe au compte 601
+        PlanComptable.objects.create(numero_compte='601100', libelle='Achats locaux', type_compte='CHARGE')
+        for commande in self.commandes:
+            valider_piece(commande.generer_ecriture_comptable(), self.utilisateur)
+
+        mois = timezone.localdate().replace(day=1)
+        exercice = Exercice.objects.get()
+        with self.assertNumQueries(2):
+            balance = BalanceGenerale(exercice, mois, mois)
+
+        lignes = {ligne.numero: ligne for ligne in balance.lignes}
+        self.assertNotIn('601100', lignes)  # non mouvementé
+        self.assertEqual(lignes['6'].debit, Decimal('2000'))
+        self.assertEqual(lignes['4'].cloture_crediteur, Decimal('2000'))  # 445 débiteur 360, 401 créditeur 2360
+        self.assertEqual(lignes['401'].cloture_crediteur, Decimal('2360'))
+        self.assertEqual(balance.total.debit, Decimal('2360'))
+        self.assertTrue(balance.est_equilibree)
+
+
+class EtatsFinanciersTests(PiecesAchatTestCase):
+    """Bilan et compte de résultat, mis en cache sous la version de l'exercice"""
+
+    def test_etats_financiers(self):
+        cache.clear()
+        exercice = Exercice.objects.get()
+        valider_piece(self.commandes[0].generer_ecriture_comptable(), self.utilisateur)
+
+        etats = etats_financiers(exercice)
+        self.assertEqual(etats.montants['RA'], Decimal('-1000'))
+        self.assertEqual(etats.resultat_net, Decimal('-1000'))
+        self.assertEqual(etats.montants['BJ'], Decimal('180'))  # TVA récupérable
+        self.assertEqual(etats.montants['DJ'], Decimal('1180'))
+        self.assertEqual(etats.montants['CJ'], Decimal('-1000'))
+        self.assertTrue(etats.est_equilibre)
+        # En cache : seule la version de l'exercice est relue
+        with self.assertNumQueries(1):
+            etats_financiers(exercice)
+
+        # Une nouvelle validation dans l'exercice incrémente sa version en base :
+        # les états en cache de tous les processus sont obsolètes
+        version = Exercice.objects.get().version_etats
+        valider_piece(self.commandes[1].generer_ecriture_comptable(), self.utilisateur)
+        self.assertEqual(Exercice.objects.get().version_etats, version + 1)
+        etats = etats_financiers(exercice)
+        self.assertEqual(etats.resultat_net, Decimal('-2000'))
+        self.assertEqual(etats.total_actif, Decimal('360'))
+
+        # Une instance chargée avant la validation ne remet pas l'ancienne version
+        exercice.nom = 'Exercice renommé'
+        exercice.save()
+        self.assertEqual(Exercice.objects.get(pk=exercice.pk).version_etats, version + 2)
+
+        # Comparaison avec l'exercice précédent, vide
+        precedent = Exercice.objects.create(
+            nom='Exercice précédent', date_debut=exercice.date_debut - timedelta(days=365),
+            date_fin=exercice.date_debut - timedelta(days=1), est_cloture=True,
+        )
+        self.assertEqual(exercice_precedent(exercice), precedent)
+        self.assertEqual(etats_financiers(precedent).resultat_net, 0)
+        self.assertEqual(etats_financiers(exercice).resultat_net, Decimal('-2000'))
+
+
+class GrandLivreTests(PiecesAchatTestCase):
+    """Grand livre : solde progressif d'une page à l'autre et export"""
+
+    def test_grand_livre(self):
+        for commande in self.commandes:
+            valider_piece(commande.generer_ecriture_comptable(), self.utilisateur)
+        exercice = Exercice.objects.get()
+        livre = GrandLivre(exercice, exercice.date_debut, exercice.date_fin, compte_debut='401', compte_fin='401')
+
+        # Pages d'une écriture : le solde progressif continue d'une page à l'autre
+        premiere, curseur = livre.page(taille=1)
+        seconde, fin = livre.page(curseur, taille=1)
+        self.assertIsNone(fin)
+        self.assertEqual([ligne['solde'] for ligne in premiere + seconde], [Decimal('-1180'), Decimal('-2360')])
+        self.assertTrue(seconde[0]['report'])
+        # Curseur altéré : retour à la première page
+        self.assertEqual(livre.page('curseur-altere', taille=1)[0], premiere)
+
+        # Export : ouverture, 2 écritures, total du compte
+        lignes = list(livre.lignes())
+        self.assertEqual(len(lignes), 4)
+        self.assertEqual(lignes[-1][5:], [Decimal('0'), Decimal('2360'), Decimal('-2360')])
+
+    def test_exports(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        for commande in self.commandes:
+            valider_piece(commande.generer_ecriture_comptable(), self.utilisateur)
+        self.client.force_login(self.utilisateur)
+        url = reverse('comptabilite:grand_livre') + '?compte_debut=401&compte_fin=401'
+
+        # CSV en flux, dans la réponse
+        reponse = self.client.get(url + '&format=csv')
+        contenu = b''.join(reponse.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(contenu), 5)  # en-tête, ouverture, 2 écritures, total
+        self.assertTrue(contenu[-1].endswith(';0.00;2360.00;-2360.00'))
+
+        # Excel : tâche d'arrière-plan, fichier produit par traiter_exports
+        reponse = self.client.get(url + '&format=excel')
+        self.assertRedirects(reponse, reverse('mes_exports'), fetch_redirect_response=False)
+        tache = TacheExport.objects.get()
+        self.assertEqual((tache.type_export, tache.format, tache.parametres['compte_fin']), ('grand_livre', 'excel', '401'))
+        with self.settings(MEDIA_ROOT=media):
+            self.assertEqual(traiter_exports(), (1, 0))
+        tache.refresh_from_db()
+        self.assertEqual((tache.statut, tache.total_lignes, tache.lignes_traitees), ('TERMINE', 2, 4))
+        self.assertTrue(tache.fichier.name.endswith('.xlsx'))
+
+
+class ValidationParLotTests(PiecesAchatTestCase):
+    """Totaux des pièces tenus à jour et validation en lot"""
+
+    def test_validation_par_lot(self):
+        pieces = [commande.generer_ecriture_comptable() for commande in self.commandes]
+        # Totaux renseignés à la création, sans agrégat à la lecture
+        self.assertEqual((pieces[0].total_debit, pieces[0].total_credit), (Decimal('1180'), Decimal('1180')))
+
+        # Modifier une écriture met à jour les totaux de sa pièce
+        ecriture = pieces[1].ecritures.get(compte=self.compte_401)
+        ecriture.credit = Decimal('1000')
+        ecriture.save()
+        pieces[1].refresh_from_db()
+        self.assertEqual(pieces[1].total_credit, Decimal('1000'))
+        self.assertFalse(pieces[1].est_equilibree)
+
+        # Verrou, contrôle groupé, UPDATE, report dans les soldes (4), version des états, savepoints (4) : quel que soit le nombre de pièces
+        with self.assertNumQueries(12):
+            validees, refusees = valider_pieces([piece.pk for piece in pieces], self.utilisateur)
+        self.assertEqual(validees, 1)
+        self.assertEqual(refusees, [(pieces[1].numero_piece, 'non équilibrée (débit 1,180.00 / crédit 1,000.00)')])
+        self.assertTrue(Piece.objects.get(pk=pieces[0].pk).est_validee)
+        self.assertFalse(Piece.objects.get(pk=pieces[1].pk).est_validee)
+        self.assertEqual(self.compte_401.solde, Decimal('1180'))
+
+        # Pièce déjà validée : ignorée
+        self.assertEqual(valider_pieces([pieces[0].pk]), (0, []))
+
+
+class SuiviBudgetaireTests(PiecesAchatTestCase):
+    """Budget et réalisé de l'exercice par compte et par mois"""
+
+    def test_suivi_budgetaire(self):
+        mois = timezone.localdate().replace(day=1)
+        Exercice.objects.update(date_debut=mois, date_fin=mois + timedelta(days=364))
+        exercice = Exercice.objects.get()
+        for commande in self.commandes:
+            valider_piece(commande.generer_ecriture_comptable(), self.utilisateur)
+
+        # Grille des 12 mois : une requête d'upsert, les mois vidés sont supprimés
+        grille = {numero: Decimal('1500') for numero in range(1, 13)}
+        enregistrer_budgets(exercice, self.compte_achat, grille)
+        # Upsert des 12 mois (1), savepoints (2)
+        with self.assertNumQueries(3):
+            enregistrer_budgets(exercice, self.compte_achat, {**grille, mois.month: Decimal('2500')})
+        enregistrer_budgets(exercice, self.compte_401, {mois.month: Decimal('2000'), 1 + mois.month % 12: None})
+        self.assertEqual(Budget.objects.count(), 13)
+
+        # Budget et réalisé de tous les comptes et de tous les mois : 2 requêtes
+        with self.assertNumQueries(2):
+            suivi = SuiviBudgetaire(exercice)
+        fournisseurs, achats = suivi.lignes  # triées par numéro de compte
+        self.assertEqual((achats.cellules[0].prevu, achats.cellules[0].realise), (Decimal('2500'), Decimal('2000')))
+        self.assertEqual(achats.cellules[0].ecart, Decimal('500'))
+        self.assertEqual(achats.total.prevu, Decimal('19000'))
+        self.assertEqual(fournisseurs.total.realise, Decimal('2360'))  # crédit d'un compte de passif
+        self.assertEqual(suivi.totaux['CHARGE'].total.realise, Decimal('2000'))
+
+        # Même réalisé ligne par ligne
+        budget = Budget.objects.get(compte=self.compte_achat, mois=mois.month)
+        self.assertEqual(budget.montant_realise, Decimal('2000'))
+        self.assertEqual(budget.ecart, Decimal('500'))
@@ -11,6 +11,7 @@ urlpatterns = [
     path('plan-comptable/', views.liste_plan_comptable, name='liste_plan_comptable'),
     path('plan-comptable/nouveau/', views.creer_compte, name='creer_compte'),
     path('plan-comptable/<int:pk>/', views.details_compte, name='details_compte'),
+    path('plan-comptable/exporter/', views.exporter_plan_comptable, name='exporter_plan_comptable'),
     
     # Exercices
     path('exercices/', views.liste_exercices, name='liste_exercices'),
@@ -23,6 +24,7 @@ urlpatterns = [
     # Pièces comptables
     path('pieces/', views.liste_pieces, name='liste_pieces'),
     path('pieces/nouvelle/', views.creer_piece, name='creer_piece'),
+    path('pieces/valider/', views.valider_pieces, name='valider_pieces'),
     path('pieces/<int:pk>/', views.details_piece, name='details_piece'),
     path('pieces/<int:pk>/valider/', views.valider_piece, name='valider_piece'),
     
@@ -37,6 +39,8 @@ urlpatterns = [
     path('budgets/nouveau/', views.creer_budget, name='creer_budget'),
     
     # Rapports
+    path('rapports/balance/', views.balance_generale, name='balance_generale'),
+    path('rapports/grand-livre/', views.grand_livre, name='grand_livre'),
     path('rapports/bilan/', views.bilan, name='bilan'),
     path('rapports/compte-resultat/', views.compte_resultat, name='compte_resultat'),
 ]
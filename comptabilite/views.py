@@ -1,21 +1,33 @@
 # comptabilite/views.py - VUES COMPLÈTES DU MODULE COMPTABILITÉ
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Sum, Count
+from django.db.models import Q, Sum, Count, Case, When, Value, CharField
+from django.db.models.functions import Concat
 from django.http import HttpResponse
 from django.utils import timezone
 from datetime import datetime, timedelta
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
 from .models import (
     PlanComptable, Exercice, Journal, Piece, Ecriture,
     Banque, MouvementBancaire, Budget
 )
-from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from .soldes import (
+    valider_piece as valider_piece_comptable, valider_pieces as valider_pieces_comptables, ErreurValidation,
+)
+from .balance import BalanceGenerale, CLASSES_SYSCOHADA, reponse_balance_xlsx, reponse_balance_pdf
+from .etats import etats_financiers, exercice_precedent
+from .budgets import NOMS_MOIS, SuiviBudgetaire, enregistrer_budgets, mois_exercice, montants_budget
+from .grand_livre import ExportGrandLivre, GrandLivre, reponse_grand_livre_csv
+from .regles import exercice_ouvert
+from base.exports import (
+    Colonne, DefinitionExport, format_actif, format_choix, reponse_csv, reponse_xlsx,
+    reponse_export_differe, nom_fichier_horodate,
+)
 
 
 # ========== TABLEAU DE BORD COMPTABILITÉ ==========
@@ -104,16 +116,7 @@ def liste_plan_comptable(request):
         })
     
     # Répartition par classe SYSCOHADA
-    classes_syscohada = [
-        ('1', 'Classe 1 - Comptes de ressources durables'),
-        ('2', 'Classe 2 - Comptes d\'actif immobilisé'),
-        ('3', 'Classe 3 - Comptes de stocks'),
-        ('4', 'Classe 4 - Comptes de tiers'),
-        ('5', 'Classe 5 - Comptes de trésorerie'),
-        ('6', 'Classe 6 - Comptes de charges'),
-        ('7', 'Classe 7 - Comptes de produits'),
-        ('8', 'Classe 8 - Comptes des autres charges et produits'),
-    ]
+    classes_syscohada = CLASSES_SYSCOHADA
     
     stats_par_classe = []
     for classe_num, classe_label in classes_syscohada:
@@ -185,52 +188,37 @@ def creer_compte(request):
 
 @login_required
 def details_compte(request, pk):
-    """Vue pour afficher les détails d'un compte comptable"""
+    """Vue pour afficher les détails d'un compte comptable : son grand livre"""
     compte = get_object_or_404(PlanComptable, pk=pk)
-    
-    ecritures = Ecriture.objects.filter(compte=compte).select_related(
-        'piece', 'piece__journal'
-    ).order_by('-piece__date_piece')[:50]
-    
-    debits = Ecriture.objects.filter(compte=compte, piece__est_validee=True).aggregate(
-        total=Sum('debit')
-    )['total'] or Decimal('0')
-    
-    credits = Ecriture.objects.filter(compte=compte, piece__est_validee=True).aggregate(
-        total=Sum('credit')
-    )['total'] or Decimal('0')
-    
-    if compte.type_compte in ['ACTIF', 'CHARGE']:
-        solde = debits - credits
-        sens_solde = 'Débiteur' if solde >= 0 else 'Créditeur'
-    else:
-        solde = credits - debits
-        sens_solde = 'Créditeur' if solde >= 0 else 'Débiteur'
-    
-    nombre_ecritures = ecritures.count()
-    
-    context = {
-        'compte': compte,
-        'ecritures': ecritures,
-        'solde': abs(solde),
-        'sens_solde': sens_solde,
-        'debits': debits,
-        'credits': credits,
-        'nombre_ecritures': nombre_ecritures,
-    }
-    
-    return render(request, 'comptabilite/details_compte.jinja', context)
+    return redirect(
+        reverse('comptabilite:grand_livre') + '?'
+        + urlencode({'compte_debut': compte.numero_compte, 'compte_fin': compte.numero_compte})
+    )
 
 
-@login_required
-def exporter_plan_comptable(request):
-    """Vue pour exporter le plan comptable en Excel"""
-    recherche = request.GET.get('recherche', '')
-    type_compte = request.GET.get('type_compte', '')
-    classe = request.GET.get('classe', '')
-    statut = request.GET.get('statut', 'actif')
+COLONNES_EXPORT_PLAN_COMPTABLE = [
+    Colonne('Numéro de compte', 'numero_compte', largeur=20),
+    Colonne('Libellé', 'libelle', largeur=40),
+    Colonne('Type', 'type_compte', format=format_choix(PlanComptable.TYPES_COMPTE)),
+    Colonne('Compte parent', 'libelle_parent', largeur=35),
+    Colonne('Statut', 'est_actif', format=format_actif, largeur=12),
+]
+
+
+def filtrer_plan_comptable_export(parametres):
+    """Comptes à exporter selon les filtres de la liste, avec le libellé du parent annoté"""
+    recherche = parametres.get('recherche', '')
+    type_compte = parametres.get('type_compte', '')
+    classe = parametres.get('classe', '')
+    statut = parametres.get('statut', 'actif')
     
-    comptes = PlanComptable.objects.all()
+    comptes = PlanComptable.objects.annotate(
+        libelle_parent=Case(
+            When(compte_parent__isnull=True, then=Value('')),
+            default=Concat('compte_parent__numero_compte', Value(' - '), 'compte_parent__libelle'),
+            output_field=CharField(),
+        )
+    )
     
     if statut == 'actif':
         comptes = comptes.filter(est_actif=True)
@@ -249,62 +237,33 @@ def exporter_plan_comptable(request):
     if classe:
         comptes = comptes.filter(numero_compte__startswith=classe)
     
-    comptes = comptes.order_by('numero_compte')
+    return comptes.order_by('numero_compte')
+
+
+EXPORT_PLAN_COMPTABLE = DefinitionExport(
+    'Plan Comptable', 'plan_comptable', COLONNES_EXPORT_PLAN_COMPTABLE, filtrer_plan_comptable_export
+)
+
+
+@login_required
+def exporter_plan_comptable(request):
+    """Vue pour exporter le plan comptable en Excel ou CSV"""
+    format_export = request.GET.get('format', 'excel')
+    comptes = filtrer_plan_comptable_export(request.GET)
+
+    # Gros volumes : le fichier est produit en arrière-plan (voir « Mes exports »)
+    if request.GET.get('arriere_plan') and format_export in ('excel', 'csv'):
+        return reponse_export_differe(request, 'plan_comptable')
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Plan Comptable"
-    
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="6366F1", end_color="6366F1", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    if format_export == 'csv':
+        return reponse_csv(
+            comptes, COLONNES_EXPORT_PLAN_COMPTABLE, nom_fichier_horodate('plan_comptable', 'csv')
+        )
     
-    headers = ['Numéro de compte', 'Libellé', 'Type', 'Compte parent', 'Statut']
-    
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    for row_idx, compte in enumerate(comptes, start=2):
-        data_row = [
-            compte.numero_compte,
-            compte.libelle,
-            compte.get_type_compte_display(),
-            f"{compte.compte_parent.numero_compte} - {compte.compte_parent.libelle}" if compte.compte_parent else '',
-            'Actif' if compte.est_actif else 'Inactif'
-        ]
-        
-        for col_idx, value in enumerate(data_row, start=1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            cell.value = value
-            cell.border = border
-    
-    column_widths = [20, 40, 15, 35, 12]
-    for i, width in enumerate(column_widths, start=1):
-        ws.column_dimensions[chr(64 + i)].width = width
-    
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    response = HttpResponse(
-        buffer.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return reponse_xlsx(
+        comptes, COLONNES_EXPORT_PLAN_COMPTABLE,
+        nom_fichier_horodate('plan_comptable', 'xlsx'), 'Plan Comptable'
     )
-    filename = f"plan_comptable_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
 
 
 # ========== EXERCICES ==========
@@ -351,20 +310,76 @@ def creer_journal(request):
 
 # ========== PIÈCES COMPTABLES ==========
 
+NB_PIECES_AFFICHEES = 500
+
+
+def pieces_filtrees(parametres):
+    """Pièces filtrées par les paramètres de la liste : statut (a_valider, validees), journal, exercice"""
+    pieces = Piece.objects.all()
+    statut = parametres.get('statut', '')
+    if statut == 'a_valider':
+        pieces = pieces.filter(est_validee=False)
+    elif statut == 'validees':
+        pieces = pieces.filter(est_validee=True)
+    
+    journal = parametres.get('journal', '')
+    if journal.isdigit():
+        pieces = pieces.filter(journal_id=journal)
+    exercice = parametres.get('exercice', '')
+    if exercice.isdigit():
+        pieces = pieces.filter(exercice_id=exercice)
+    return pieces
+
+
 @login_required
 def liste_pieces(request):
-    """Vue pour lister les pièces comptables"""
-    pieces = Piece.objects.select_related(
-        'journal', 'exercice', 'cree_par'
-    ).order_by('-date_piece')
+    """Vue pour lister les pièces comptables (totaux lus sur la pièce, sans agrégat par ligne)"""
+    pieces = pieces_filtrees(request.GET)
     
     context = {
-        'pieces': pieces,
+        'pieces': pieces.select_related('journal', 'exercice').order_by('-date_piece', '-pk')[:NB_PIECES_AFFICHEES],
+        'nb_pieces': pieces.count(),
+        'nb_pieces_affichees': NB_PIECES_AFFICHEES,
+        'journaux': Journal.objects.filter(est_actif=True).order_by('code'),
+        'exercices': Exercice.objects.order_by('-date_debut'),
+        'statut': request.GET.get('statut', ''),
+        'journal_id': request.GET.get('journal', ''),
+        'exercice_id': request.GET.get('exercice', ''),
     }
     
     return render(request, 'comptabilite/liste_pieces.jinja', context)
 
 
+@login_required
+def valider_pieces(request):
+    """
+    Vue pour valider en lot les pièces cochées, ou toutes les pièces à
+    valider de la liste filtrée (toutes=1)
+    """
+    if request.method != 'POST':
+        return redirect('comptabilite:liste_pieces')
+    
+    if request.POST.get('toutes') == '1':
+        piece_ids = list(pieces_filtrees(request.POST).filter(est_validee=False).values_list('pk', flat=True))
+    else:
+        piece_ids = [pk for pk in request.POST.getlist('pieces') if pk.isdigit()]
+    
+    validees, refusees = valider_pieces_comptables(piece_ids, request.user)
+    if validees:
+        messages.success(request, f'{validees} pièce(s) validée(s) avec succès!')
+    if refusees:
+        apercu = ', '.join(f'{numero} : {motif}' for numero, motif in refusees[:10])
+        suite = f' (et {len(refusees) - 10} autre(s))' if len(refusees) > 10 else ''
+        messages.error(request, f'{len(refusees)} pièce(s) non validée(s) — {apercu}{suite}')
+    if not validees and not refusees:
+        messages.info(request, 'Aucune pièce à valider.')
+    
+    parametres = urlencode({
+        cle: request.POST.get(cle) for cle in ('statut', 'journal', 'exercice') if request.POST.get(cle)
+    })
+    return redirect(reverse('comptabilite:liste_pieces') + (f'?{parametres}' if parametres else ''))
+
+
 @login_required
 def creer_piece(request):
     """Vue pour créer une nouvelle pièce comptable"""
@@ -386,8 +401,17 @@ def details_piece(request, pk):
 
 @login_required
 def valider_piece(request, pk):
-    """Vue pour valider une pièce comptable"""
-    messages.info(request, 'Fonctionnalité en cours de développement.')
+    """Vue pour valider une pièce comptable et reporter ses écritures dans les soldes"""
+    piece = get_object_or_404(Piece, pk=pk)
+    
+    if request.method == 'POST':
+        try:
+            valider_piece_comptable(piece, request.user)
+        except ErreurValidation as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f'Pièce {piece.numero_piece} validée avec succès!')
+    
     return redirect('comptabilite:details_piece', pk=pk)
 
 
@@ -435,11 +459,16 @@ def creer_mouvement_bancaire(request):
 
 @login_required
 def liste_budgets(request):
-    """Vue pour lister les budgets"""
-    budgets = Budget.objects.select_related('exercice', 'compte').all()
+    """Vue pour afficher le suivi budgétaire de l'exercice : prévu, réalisé et écart par compte et par mois"""
+    exercice = exercice_rapport(request.GET)
+    if exercice is None:
+        messages.warning(request, 'Créez un exercice comptable pour saisir des budgets.')
+        return redirect('comptabilite:tableau_bord')
     
     context = {
-        'budgets': budgets,
+        'exercice': exercice,
+        'exercices': Exercice.objects.order_by('-date_debut'),
+        'suivi': SuiviBudgetaire(exercice),
     }
     
     return render(request, 'comptabilite/liste_budgets.jinja', context)
@@ -447,22 +476,223 @@ def liste_budgets(request):
 
 @login_required
 def creer_budget(request):
-    """Vue pour créer un budget"""
-    messages.info(request, 'Fonctionnalité en cours de développement.')
-    return redirect('comptabilite:liste_budgets')
+    """Vue pour saisir (ou modifier) les montants prévus des 12 mois d'un compte"""
+    parametres = request.POST if request.method == 'POST' else request.GET
+    exercice = exercice_rapport(parametres)
+    if exercice is None:
+        messages.warning(request, 'Créez un exercice comptable pour saisir des budgets.')
+        return redirect('comptabilite:tableau_bord')
+    
+    compte_id = parametres.get('compte', '')
+    compte = PlanComptable.objects.filter(pk=compte_id).first() if compte_id.isdigit() else None
+    
+    if request.method == 'POST':
+        if compte is None:
+            messages.error(request, 'Veuillez choisir un compte.')
+            return redirect(reverse('comptabilite:creer_budget') + f'?exercice={exercice.pk}')
+        
+        montants = {}
+        for mois in range(1, 13):
+            valeur = request.POST.get(f'mois_{mois}', '').strip().replace(' ', '').replace(',', '.')
+            try:
+                montants[mois] = Decimal(valeur) if valeur else None
+                if montants[mois] is not None and not montants[mois].is_finite():
+                    raise InvalidOperation
+            except InvalidOperation:
+                messages.error(request, f'Montant invalide pour le mois {mois} : {valeur}')
+                return redirect(reverse('comptabilite:creer_budget') + f'?exercice={exercice.pk}&compte={compte.pk}')
+        
+        nombre = enregistrer_budgets(exercice, compte, montants)
+        messages.success(request, f'Budget du compte {compte.numero_compte} enregistré : {nombre} mois renseigné(s).')
+        return redirect(reverse('comptabilite:liste_budgets') + f'?exercice={exercice.pk}')
+    
+    montants = montants_budget(exercice, compte) if compte else {}
+    context = {
+        'exercice': exercice,
+        'exercices': Exercice.objects.order_by('-date_debut'),
+        'compte': compte,
+        'comptes': PlanComptable.objects.filter(est_actif=True).order_by('numero_compte'),
+        'mois': [
+            (mois.month, f"{NOMS_MOIS[mois.month - 1]} {mois:%Y}", montants.get(mois.month))
+            for mois in mois_exercice(exercice)
+        ],
+    }
+    
+    return render(request, 'comptabilite/formulaire_budget.jinja', context)
 
 
 # ========== RAPPORTS ==========
 
+def exercice_rapport(parametres):
+    """Exercice d'un rapport : paramètre GET exercice, par défaut l'exercice en cours (ou le dernier)"""
+    exercice_id = parametres.get('exercice', '')
+    exercice = None
+    if exercice_id.isdigit():
+        exercice = Exercice.objects.filter(pk=exercice_id).first()
+    return exercice or exercice_ouvert(timezone.localdate()) or Exercice.objects.order_by('-date_debut').first()
+
+
+def periode_rapport(parametres):
+    """
+    Exercice et mois (premiers jours) d'un rapport : paramètres GET exercice,
+    mois_debut, mois_fin (AAAA-MM). Par défaut, l'exercice en cours, de son
+    premier mois au mois courant.
+    """
+    aujourdhui = timezone.localdate()
+    exercice = exercice_rapport(parametres)
+    if exercice is None:
+        return None, None, None
+    
+    def mois_parametre(nom, defaut):
+        try:
+            return datetime.strptime(parametres.get(nom, ''), '%Y-%m').date()
+        except ValueError:
+            return defaut
+    
+    mois_fin_defaut = min(max(aujourdhui, exercice.date_debut), exercice.date_fin).replace(day=1)
+    mois_debut = mois_parametre('mois_debut', exercice.date_debut.replace(day=1))
+    mois_fin = mois_parametre('mois_fin', mois_fin_defaut)
+    return exercice, mois_debut, max(mois_debut, mois_fin)
+
+
+@login_required
+def balance_generale(request):
+    """Vue pour afficher (ou exporter en Excel/PDF) la balance générale"""
+    exercice, mois_debut, mois_fin = periode_rapport(request.GET)
+    if exercice is None:
+        messages.warning(request, 'Créez un exercice comptable pour consulter la balance.')
+        return redirect('comptabilite:tableau_bord')
+    
+    classe = request.GET.get('classe', '')
+    if classe not in dict(CLASSES_SYSCOHADA):
+        classe = ''
+    
+    balance = BalanceGenerale(exercice, mois_debut, mois_fin, classe=classe or None)
+    
+    format_export = request.GET.get('format')
+    if format_export == 'excel':
+        return reponse_balance_xlsx(balance, nom_fichier_horodate('balance_generale', 'xlsx'))
+    if format_export == 'pdf':
+        return reponse_balance_pdf(balance, nom_fichier_horodate('balance_generale', 'pdf'))
+    
+    context = {
+        'balance': balance,
+        'exercices': Exercice.objects.order_by('-date_debut'),
+        'exercice': exercice,
+        'mois_debut': mois_debut.strftime('%Y-%m'),
+        'mois_fin': mois_fin.strftime('%Y-%m'),
+        'classe': classe,
+        'classes_syscohada': CLASSES_SYSCOHADA,
+    }
+    
+    return render(request, 'comptabilite/balance_generale.jinja', context)
+
+
+def grand_livre_rapport(parametres):
+    """
+    Grand livre demandé par les paramètres GET exercice, date_debut,
+    date_fin (AAAA-MM-JJ, bornées à l'exercice), compte_debut et compte_fin.
+    None s'il n'existe aucun exercice.
+    """
+    exercice = exercice_rapport(parametres)
+    if exercice is None:
+        return None
+    
+    def date_parametre(nom, defaut):
+        try:
+            valeur = datetime.strptime(parametres.get(nom, ''), '%Y-%m-%d').date()
+        except ValueError:
+            return defaut
+        return min(max(valeur, exercice.date_debut), exercice.date_fin)
+    
+    date_debut = date_parametre('date_debut', exercice.date_debut)
+    date_fin = date_parametre('date_fin', exercice.date_fin)
+    return GrandLivre(
+        exercice, date_debut, max(date_debut, date_fin),
+        compte_debut=parametres.get('compte_debut', '').strip(),
+        compte_fin=parametres.get('compte_fin', '').strip(),
+    )
+
+
+def filtrer_grand_livre_export(parametres):
+    livre = grand_livre_rapport(parametres)
+    if livre is None:
+        raise ValueError("Aucun exercice comptable")
+    return livre
+
+
+EXPORT_GRAND_LIVRE = ExportGrandLivre(filtrer_grand_livre_export)
+
+
+@login_required
+def grand_livre(request):
+    """
+    Vue pour afficher (page par page) ou exporter le grand livre : CSV en
+    flux, Excel produit en arrière-plan (voir « Mes exports »)
+    """
+    livre = grand_livre_rapport(request.GET)
+    if livre is None:
+        messages.warning(request, 'Créez un exercice comptable pour consulter le grand livre.')
+        return redirect('comptabilite:tableau_bord')
+    
+    format_export = request.GET.get('format')
+    if format_export == 'csv' and not request.GET.get('arriere_plan'):
+        return reponse_grand_livre_csv(livre, nom_fichier_horodate('grand_livre', 'csv'))
+    if format_export in ('csv', 'excel'):
+        return reponse_export_differe(request, 'grand_livre')
+    
+    curseur = request.GET.get('curseur')
+    lignes, curseur_suivant = livre.page(curseur)
+    
+    parametres = request.GET.copy()
+    parametres.pop('curseur', None)
+    parametres.pop('format', None)
+    
+    context = {
+        'grand_livre': livre,
+        'lignes': lignes,
+        'curseur': curseur,
+        'curseur_suivant': curseur_suivant,
+        'parametres': parametres.urlencode(),
+        'exercices': Exercice.objects.order_by('-date_debut'),
+        'exercice': livre.exercice,
+    }
+    
+    return render(request, 'comptabilite/grand_livre.jinja', context)
+
+
+def _contexte_etats(request):
+    """États de l'exercice demandé et de l'exercice précédent (pour comparaison)"""
+    exercice = exercice_rapport(request.GET)
+    if exercice is None:
+        return None
+    precedent = exercice_precedent(exercice)
+    return {
+        'exercice': exercice,
+        'exercices': Exercice.objects.order_by('-date_debut'),
+        'etats': etats_financiers(exercice),
+        'exercice_precedent': precedent,
+        'etats_precedents': etats_financiers(precedent) if precedent else None,
+    }
+
+
 @login_required
 def bilan(request):
     """Vue pour afficher le bilan"""
-    messages.info(request, 'Fonctionnalité en cours de développement.')
-    return redirect('comptabilite:tableau_bord')
+    context = _contexte_etats(request)
+    if context is None:
+        messages.warning(request, 'Créez un exercice comptable pour consulter le bilan.')
+        return redirect('comptabilite:tableau_bord')
+    
+    return render(request, 'comptabilite/bilan.jinja', context)
 
 
 @login_required
 def compte_resultat(request):
     """Vue pour afficher le compte de résultat"""
-    messages.info(request, 'Fonctionnalité en cours de développement.')
-    return redirect('comptabilite:tableau_bord')
\ No newline at end of file
+    context = _contexte_etats(request)
+    if context is None:
+        messages.warning(request, 'Créez un exercice comptable pour consulter le compte de résultat.')
+        return redirect('comptabilite:tableau_bord')
+    
+    return render(request, 'comptabilite/compte_resultat.jinja', context)
\ No newline at end of file
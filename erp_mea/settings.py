@@ -170,6 +170,42 @@ STORAGES = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Exports en arrière-plan : durée de conservation des fichiers (heures)
+EXPORTS_DUREE_CONSERVATION = int(os.environ.get('EXPORTS_DUREE_CONSERVATION', 24))
+# Délai (minutes) sans progression au-delà duquel une tâche EN_COURS est
+# considérée abandonnée (worker arrêté) et reprise par un autre worker
+EXPORTS_DELAI_REPRISE = int(os.environ.get('EXPORTS_DELAI_REPRISE', 30))
+
+# Ventes : refuser (True) ou seulement signaler (False) la confirmation d'une
+# commande qui ferait dépasser la limite de crédit du client
+VENTES_BLOCAGE_LIMITE_CREDIT = os.environ.get('VENTES_BLOCAGE_LIMITE_CREDIT', 'True') == 'True'
+
+# Achats : taille maximale (MB) d'un fichier d'import de commande
+ACHATS_IMPORT_TAILLE_MAX_MO = int(os.environ.get('ACHATS_IMPORT_TAILLE_MAX_MO', 50))
+
+# Formulaires à nombreuses lignes (réception d'une commande d'achat : 2 champs
+# par ligne) ; la valeur par défaut de Django (1000) bloque au-delà de 500 lignes
+DATA_UPLOAD_MAX_NUMBER_FIELDS = int(os.environ.get('DATA_UPLOAD_MAX_NUMBER_FIELDS', 10000))
+
+# Cache
+# 'documents' : PDF rendus (factures, commandes), conservés sur disque et
+# partagés entre les workers gunicorn ; les entrées les plus anciennes sont
+# éliminées au-delà de MAX_ENTRIES.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'documents': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DOCUMENTS_CACHE_DIR', str(BASE_DIR / 'cache' / 'documents')),
+        'TIMEOUT': 60 * 60 * 24 * 30,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DOCUMENTS_CACHE_MAX', 2000)),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
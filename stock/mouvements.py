@@ -0,0 +1,73 @@
+# stock/mouvements.py
+"""
+Enregistrement de mouvements de stock en masse.
+
+MouvementStock.objects.create() met à jour la table Stock par un signal
+(stock/signals.py), soit plusieurs requêtes par mouvement. Pour les
+opérations qui créent beaucoup de mouvements d'un coup (réception d'une
+commande d'achat), enregistrer_mouvements() fait la même chose en un nombre
+fixe de requêtes : un bulk_create des mouvements, puis une seule mise à jour
+des quantités en stock par incrément F(), avec les mêmes règles que le
+signal (ENTREE et AJUSTEMENT ajoutent, SORTIE retire, TRANSFERT ne change
+rien).
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, When, Value, F, IntegerField
+from django.utils import timezone
+
+from .models import MouvementStock, Stock
+from .tarifs import invalider_tarifs
+
+SENS_MOUVEMENT = {
+    'ENTREE': 1,
+    'AJUSTEMENT': 1,
+    'SORTIE': -1,
+}
+
+
+def enregistrer_mouvements(mouvements):
+    """Enregistre une liste de MouvementStock (non sauvegardés) et met le stock à jour"""
+    if not mouvements:
+        return []
+
+    variations = defaultdict(int)
+    for mouvement in mouvements:
+        sens = SENS_MOUVEMENT.get(mouvement.type_mouvement, 0)
+        if sens:
+            variations[(mouvement.produit_id, mouvement.entrepot_id)] += sens * mouvement.quantite
+
+    with transaction.atomic():
+        mouvements = MouvementStock.objects.bulk_create(mouvements)
+
+        if variations:
+            # Créer les lignes de stock manquantes, puis les incrémenter en une requête
+            Stock.objects.bulk_create(
+                [Stock(produit_id=produit_id, entrepot_id=entrepot_id, quantite=0) for produit_id, entrepot_id in variations],
+                ignore_conflicts=True,
+            )
+            produit_ids = {produit_id for produit_id, _ in variations}
+            stocks = (
+                Stock.objects
+                .filter(produit_id__in=produit_ids, entrepot_id__in={entrepot_id for _, entrepot_id in variations})
+                .values_list('id', 'produit_id', 'entrepot_id')
+            )
+            increments = {
+                stock_id: variations[(produit_id, entrepot_id)]
+                for stock_id, produit_id, entrepot_id in stocks
+                if (produit_id, entrepot_id) in variations
+            }
+            Stock.objects.filter(pk__in=increments).update(
+                quantite=F('quantite') + Case(
+                    *[When(pk=stock_id, then=Value(quantite)) for stock_id, quantite in increments.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+                date_derniere_maj=timezone.now(),
+            )
+            # update() ne déclenche pas les signaux de Stock
+            transaction.on_commit(lambda: invalider_tarifs(*produit_ids))
+
+    return mouvements
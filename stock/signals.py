@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import MouvementStock, Stock
+from .models import MouvementStock, Stock, Produit
+from .tarifs import invalider_tarifs
 
 @receiver(post_save, sender=MouvementStock)
 def mettre_a_jour_stock(sender, instance, created, **kwargs):
@@ -19,4 +20,13 @@ def mettre_a_jour_stock(sender, instance, created, **kwargs):
         elif instance.type_mouvement == 'SORTIE':
             stock.quantite -= instance.quantite
         
-        stock.save()
\ No newline at end of file
+        stock.save()
+
+
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def invalider_tarif_produit(sender, instance, **kwargs):
+    """Le tarif en cache du produit (prix, stock par entrepôt) n'est plus à jour"""
+    invalider_tarifs(instance.pk if sender is Produit else instance.produit_id)
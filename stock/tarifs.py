@@ -0,0 +1,106 @@
+# stock/tarifs.py
+"""
+Tarifs et disponibilités des produits pour la saisie des commandes.
+
+Les formulaires de commande demandent les informations de plusieurs
+produits à la fois : prix, TVA, dernier prix d'achat et stock par entrepôt.
+Le stock est lu dans la table Stock (tenue à jour par les mouvements) et
+non recalculé à partir de tous les mouvements. Chaque produit est mis en
+cache pour une durée courte (TTL_TARIFS). L'entrée est invalidée dès que
+le produit, son stock ou ses lignes d'achat changent (voir stock/signals.py
+et achats/signals.py).
+
+Le cache par défaut est propre à chaque processus : l'invalidation ne vaut
+que pour le processus qui a enregistré la modification. Les autres servent
+l'ancien tarif au plus TTL_TARIFS secondes. Le tarif n'est qu'une
+proposition de saisie (le prix enregistré est celui du formulaire) ; avec
+un cache partagé (Redis, Memcached) dans CACHES['default'], l'invalidation
+vaut pour tous les processus.
+"""
+
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+
+from .models import Produit, Stock
+
+TTL_TARIFS = 60  # secondes : retard maximal d'un autre processus sur une modification
+
+
+def cle_tarif(produit_id):
+    return f'tarif:produit:{produit_id}'
+
+
+def invalider_tarifs(*produit_ids):
+    cache.delete_many([cle_tarif(produit_id) for produit_id in produit_ids])
+
+
+def _charger_tarifs(produit_ids):
+    """Lit en 2 requêtes les informations des produits absents du cache"""
+    from achats.models import LigneCommandeAchat
+
+    dernier_prix_achat = (
+        LigneCommandeAchat.objects
+        .filter(produit=OuterRef('pk'))
+        .exclude(commande__statut='ANNULEE')
+        .order_by('-commande__date_commande', '-id')
+        .values('prix_unitaire')[:1]
+    )
+    produits = (
+        Produit.objects
+        .filter(pk__in=produit_ids)
+        .annotate(dernier_prix_achat=Subquery(dernier_prix_achat))
+        .values('id', 'code', 'nom', 'unite', 'prix_vente', 'prix_achat', 'taux_tva', 'dernier_prix_achat')
+    )
+
+    tarifs = {}
+    for produit in produits:
+        tarifs[produit['id']] = {
+            'id': produit['id'],
+            'code': produit['code'],
+            'nom': produit['nom'],
+            'unite': produit['unite'],
+            'prix_vente': float(produit['prix_vente']),
+            'prix_achat': float(produit['prix_achat']),
+            'taux_tva': float(produit['taux_tva']),
+            'dernier_prix_achat': (
+                float(produit['dernier_prix_achat']) if produit['dernier_prix_achat'] is not None else None
+            ),
+            'stock_actuel': 0,
+            'stocks': [],
+        }
+
+    stocks = (
+        Stock.objects
+        .filter(produit_id__in=tarifs.keys())
+        .order_by('entrepot__code')
+        .values('produit_id', 'entrepot_id', 'entrepot__code', 'entrepot__nom', 'quantite')
+    )
+    for stock in stocks:
+        tarif = tarifs[stock['produit_id']]
+        tarif['stock_actuel'] += stock['quantite']
+        tarif['stocks'].append({
+            'entrepot_id': stock['entrepot_id'],
+            'entrepot': stock['entrepot__code'],
+            'nom': stock['entrepot__nom'],
+            'quantite': stock['quantite'],
+        })
+
+    return tarifs
+
+
+def tarifs_produits(produit_ids):
+    """
+    Retourne {id produit: tarif} pour les produits demandés ; les produits
+    inexistants sont simplement absents du résultat.
+    """
+    produit_ids = list(dict.fromkeys(produit_ids))
+    en_cache = cache.get_many([cle_tarif(produit_id) for produit_id in produit_ids])
+    tarifs = {produit_id: en_cache[cle_tarif(produit_id)] for produit_id in produit_ids if cle_tarif(produit_id) in en_cache}
+
+    manquants = [produit_id for produit_id in produit_ids if produit_id not in tarifs]
+    if manquants:
+        charges = _charger_tarifs(manquants)
+        cache.set_many({cle_tarif(produit_id): tarif for produit_id, tarif in charges.items()}, TTL_TARIFS)
+        tarifs.update(charges)
+
+    return tarifs
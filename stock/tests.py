@@ -1,3 +1,82 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from achats.models import PrixAchatFournisseur
+from base.models import Fournisseur
+from .models import Entrepot, Produit, Stock
+from .tarifs import tarifs_produits
+
+
+class APITarifsProduitsTests(TestCase):
+    """Tarifs de tous les produits d'un formulaire en un appel, revalidés par ETag"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = User.objects.create_user('vendeur')
+        cls.entrepot = Entrepot.objects.create(code='E01', nom='Principal', adresse='-', responsable=cls.utilisateur)
+        cls.produits = [
+            Produit.objects.create(code=f'P{i}', nom=f'Produit {i}', prix_achat=Decimal('100'), prix_vente=Decimal('150'))
+            for i in range(3)
+        ]
+        Stock.objects.create(produit=cls.produits[0], entrepot=cls.entrepot, quantite=12)
+        cls.fournisseur = Fournisseur.objects.create(
+            code='F001', nom='Fournisseur test', email='f@example.com', telephone='0',
+            adresse='-', ville='Dakar', pays='Sénégal',
+        )
+        PrixAchatFournisseur.objects.create(
+            fournisseur=cls.fournisseur, produit=cls.produits[1], dernier_prix=Decimal('95'), prix_min=Decimal('90'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.utilisateur)
+        self.url = '/stock/api/produits/tarifs/?ids=' + ','.join(str(produit.pk) for produit in self.produits) + ',999999'
+
+    def test_tarifs_en_un_appel_puis_cache(self):
+        # Produits puis stocks : 2 requêtes pour tous les produits, aucune ensuite
+        ids = [produit.pk for produit in self.produits]
+        with self.assertNumQueries(2):
+            tarifs_produits(ids)
+        with self.assertNumQueries(0):
+            tarifs_produits(ids)
+
+        donnees = self.client.get(self.url).json()
+        self.assertEqual(len(donnees['produits']), 3)
+        self.assertEqual(donnees['introuvables'], [999999])
+        tarif = donnees['produits'][str(self.produits[0].pk)]
+        self.assertEqual((tarif['prix_vente'], tarif['stock_actuel']), (150.0, 12))
+        self.assertEqual(tarif['stocks'][0]['entrepot_id'], self.entrepot.pk)
+
+    def test_revalidation_etag(self):
+        reponse = self.client.get(self.url)
+        etag = reponse['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Produit modifié : le cache est invalidé, nouvelle réponse complète
+        produit = self.produits[2]
+        produit.prix_vente = Decimal('175')
+        produit.save()
+        reponse = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()['produits'][str(produit.pk)]['prix_vente'], 175.0)
+
+    def test_prix_du_fournisseur(self):
+        # Une requête pour les prix du fournisseur de tous les produits
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(f'{self.url}&fournisseur={self.fournisseur.pk}')
+        self.assertEqual(sum('achats_prixachatfournisseur' in requete['sql'] for requete in requetes), 1)
+        produits = reponse.json()['produits']
+        self.assertEqual(produits[str(self.produits[1].pk)]['fournisseur']['dernier_prix'], 95.0)
+        self.assertIsNone(produits[str(self.produits[0].pk)]['fournisseur'])
+        # Le tarif en cache n'est pas modifié
+        self.assertNotIn('fournisseur', self.client.get(self.url).json()['produits'][str(self.produits[1].pk)])
 
-# Create your tests here.
+    def test_parametres_invalides(self):
+        self.assertEqual(self.client.get('/stock/api/produits/tarifs/').status_code, 400)
+        ids = ','.join(str(i) for i in range(1, 202))
+        self.assertEqual(self.client.get(f'/stock/api/produits/tarifs/?ids={ids}').status_code, 400)
@@ -36,4 +36,7 @@ urlpatterns = [
 
     # URLs pour les rapports
     path('rapport/', views.rapport_stock, name='rapport_stock'),
+    
+    # API pour la saisie des commandes
+    path('api/produits/tarifs/', views.api_tarifs_produits, name='api_tarifs_produits'),
 ]
\ No newline at end of file
@@ -2,10 +2,16 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Sum, Q, F
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+import hashlib
+import json
 
 from .models import MouvementStock, Stock
 from .models import Produit, Categorie, MouvementStock, Entrepot
 from .forms import FormulaireProduit, FormulaireMouvementStock, FormulaireCategorie, FormulaireEntrepot
+from .tarifs import tarifs_produits
 
 
 # ========== GESTION DES PRODUITS ==========
@@ -669,4 +675,53 @@ def rapport_stock(request):
         'total_produits': produits_stock.count(),
     }
     
-    return render(request, 'stock/rapport_stock.jinja', contexte)
\ No newline at end of file
+    return render(request, 'stock/rapport_stock.jinja', contexte)
+
+
+# ========== API TARIFS (SAISIE DES COMMANDES) ==========
+
+MAX_PRODUITS_PAR_APPEL = 200
+
+
+@login_required
+def api_tarifs_produits(request):
+    """
+    API AJAX : tarifs de plusieurs produits en un appel (?ids=1,2,3).
+    Retourne prix, TVA, dernier prix d'achat et stock par entrepôt ; avec
+    ?fournisseur=<id>, ajoute les prix pratiqués par ce fournisseur.
+    Réponse avec ETag : le formulaire peut revalider avec If-None-Match
+    et recevoir un 304 si rien n'a changé.
+    """
+    ids = [int(id) for id in request.GET.get('ids', '').split(',') if id.strip().isdigit()]
+    if not ids:
+        return JsonResponse({'succes': False, 'erreur': 'Aucun produit demandé'}, status=400)
+    if len(ids) > MAX_PRODUITS_PAR_APPEL:
+        return JsonResponse(
+            {'succes': False, 'erreur': f'{MAX_PRODUITS_PAR_APPEL} produits maximum par appel'}, status=400
+        )
+    
+    tarifs = tarifs_produits(ids)
+    fournisseur_id = request.GET.get('fournisseur', '')
+    if fournisseur_id.isdigit():
+        from achats.prix import prix_fournisseur_json, prix_fournisseur_produits
+        prix = prix_fournisseur_produits(int(fournisseur_id), list(tarifs))
+        # Copie : les tarifs viennent du cache
+        tarifs = {
+            produit_id: {**tarif, 'fournisseur': prix_fournisseur_json(prix.get(produit_id))}
+            for produit_id, tarif in tarifs.items()
+        }
+    
+    donnees = {
+        'succes': True,
+        'produits': {str(produit_id): tarifs[produit_id] for produit_id in ids if produit_id in tarifs},
+        'introuvables': [produit_id for produit_id in ids if produit_id not in tarifs],
+    }
+    contenu = json.dumps(donnees, sort_keys=True)
+    etag = quote_etag(hashlib.md5(contenu.encode()).hexdigest())
+    
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(donnees)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import CommandeVente, LigneCommandeVente, Facture, LigneFacture
+from .models import (
+    CommandeVente, LigneCommandeVente, Facture, LigneFacture, HistoriqueStatutFacture,
+    CampagneRelance, RelanceClient, FaitVenteJournalier,
+)
 
 # ==================== COMMANDES DE VENTE ====================
 
@@ -101,10 +104,10 @@ class AdminFacture(admin.ModelAdmin):
         formset.save_m2m()
         # Recalculer les totaux après modification des lignes
         facture = form.instance
-        lignes = facture.lignes.all()
-        facture.sous_total = sum(ligne.sous_total for ligne in lignes)
-        facture.montant_tva = sum(ligne.montant_tva for ligne in lignes)
-        facture.total = facture.sous_total + facture.montant_tva
+        totaux = facture.lignes.totaux()
+        facture.sous_total = totaux['sous_total']
+        facture.montant_tva = totaux['montant_tva']
+        facture.total = totaux['total']
         facture.save()
 
 # ==================== LIGNES (optionnel) ====================
@@ -129,4 +132,35 @@ class AdminLigneFacture(admin.ModelAdmin):
     def total_display(self, obj):
         """Affiche le total de la ligne"""
         return f"{obj.total:,.2f} FCFA"
-    total_display.short_description = "Total TTC"
\ No newline at end of file
+    total_display.short_description = "Total TTC"
+
+@admin.register(HistoriqueStatutFacture)
+class AdminHistoriqueStatutFacture(admin.ModelAdmin):
+    list_display = ['facture', 'ancien_statut', 'nouveau_statut', 'origine', 'date_changement']
+    search_fields = ['facture__numero_facture', 'facture__client__nom']
+    list_filter = ['nouveau_statut', 'origine', 'date_changement']
+
+# ==================== RELANCES ====================
+
+class RelanceClientEnLigne(admin.TabularInline):
+    model = RelanceClient
+    extra = 0
+    fields = ['client', 'montant_du', 'email']
+    readonly_fields = ['client', 'montant_du', 'email']
+    can_delete = False
+
+@admin.register(CampagneRelance)
+class AdminCampagneRelance(admin.ModelAdmin):
+    list_display = ['periode', 'date_execution', 'nb_clients', 'nb_factures', 'montant_total', 'cree_par']
+    list_filter = ['periode', 'date_execution']
+    inlines = [RelanceClientEnLigne]
+
+# ==================== ANALYTIQUE ====================
+
+@admin.register(FaitVenteJournalier)
+class AdminFaitVenteJournalier(admin.ModelAdmin):
+    list_display = ['jour', 'client', 'produit', 'entrepot', 'quantite', 'montant_ht', 'montant_tva', 'marge']
+    list_filter = ['jour', 'entrepot']
+    search_fields = ['client__nom', 'produit__code', 'produit__nom']
+    date_hierarchy = 'jour'
+    list_select_related = ['client', 'produit', 'entrepot']
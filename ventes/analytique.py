@@ -0,0 +1,205 @@
+# ventes/analytique.py
+"""
+Table de faits des ventes (FaitVenteJournalier).
+
+Une ligne par (jour, client, produit, entrepôt) avec quantités, CA HT, TVA,
+coût d'achat et marge. Seules les factures émises sont comptées (STATUTS_VENTE).
+Quand une facture n'a pas de lignes propres, on reprend les lignes de sa
+commande, comme pour l'impression (voir documents.lignes_facture).
+
+La table est tenue à jour par tranche (jour, client). Les signaux
+(ventes/signals.py) notent les tranches touchées, et chacune est recalculée
+une seule fois quand la transaction est validée. La commande
+reconstruire_faits_ventes recalcule toute la table ou une partie.
+
+Le coût d'achat est valorisé au prix d'achat du produit au moment du calcul.
+"""
+
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum, Count, F, Q, DecimalField, ExpressionWrapper
+from django.db.models.functions import TruncMonth, TruncQuarter, TruncYear
+
+from .models import Facture, LigneFacture, LigneCommandeVente, FaitVenteJournalier
+
+STATUTS_VENTE = ['ENVOYEE', 'PAYEE', 'EN_RETARD']
+DEUX_DECIMALES = Decimal('0.01')
+
+TRONCATURES = {
+    'mois': TruncMonth,
+    'trimestre': TruncQuarter,
+    'annee': TruncYear,
+}
+
+
+# ========== CALCUL ==========
+
+def _agreger_lignes(lignes, prefixe_facture):
+    """
+    Agrège un queryset de lignes (facture ou commande) par clé de fait.
+    `prefixe_facture` : chemin de la ligne vers la facture.
+    """
+    return (
+        lignes
+        .avec_montants()
+        .order_by()
+        .values(
+            'produit_id',
+            jour=F(f'{prefixe_facture}__date_facture'),
+            client_id=F(f'{prefixe_facture}__client_id'),
+            entrepot_id=F(f'{prefixe_facture}__commande_vente__entrepot_id'),
+        )
+        .annotate(
+            qte=Sum('quantite'),
+            ht=Sum('montant_ht'),
+            tva=Sum('montant_tva_ligne'),
+            cout=Sum(ExpressionWrapper(
+                F('quantite') * F('produit__prix_achat'), output_field=DecimalField(max_digits=20, decimal_places=6)
+            )),
+            factures=Count(prefixe_facture, distinct=True),
+        )
+    )
+
+
+def calculer_faits(factures):
+    """Calcule (sans les enregistrer) les faits correspondant au queryset de factures"""
+    factures = factures.filter(statut__in=STATUTS_VENTE)
+
+    sources = [
+        _agreger_lignes(LigneFacture.objects.filter(facture__in=factures), 'facture'),
+        # Factures sans lignes propres : lignes de la commande d'origine
+        _agreger_lignes(
+            LigneCommandeVente.objects.filter(
+                commande__facture__in=factures.filter(lignes__isnull=True),
+            ),
+            'commande__facture',
+        ),
+    ]
+
+    faits = {}
+    for source in sources:
+        for ligne in source:
+            cle = (ligne['jour'], ligne['client_id'], ligne['produit_id'], ligne['entrepot_id'])
+            fait = faits.get(cle)
+            if fait is None:
+                fait = faits[cle] = defaultdict(Decimal)
+            fait['quantite'] += ligne['qte'] or 0
+            fait['montant_ht'] += ligne['ht'] or 0
+            fait['montant_tva'] += ligne['tva'] or 0
+            fait['cout_achat'] += ligne['cout'] or 0
+            fait['nb_factures'] += ligne['factures']
+
+    resultat = []
+    for (jour, client_id, produit_id, entrepot_id), valeurs in faits.items():
+        montant_ht = Decimal(valeurs['montant_ht']).quantize(DEUX_DECIMALES)
+        cout_achat = Decimal(valeurs['cout_achat']).quantize(DEUX_DECIMALES)
+        resultat.append(FaitVenteJournalier(
+            jour=jour,
+            client_id=client_id,
+            produit_id=produit_id,
+            entrepot_id=entrepot_id,
+            quantite=int(valeurs['quantite']),
+            montant_ht=montant_ht,
+            montant_tva=Decimal(valeurs['montant_tva']).quantize(DEUX_DECIMALES),
+            cout_achat=cout_achat,
+            marge=montant_ht - cout_achat,
+            nb_factures=int(valeurs['nb_factures']),
+        ))
+    return resultat
+
+
+def recalculer_tranches(tranches):
+    """Recalcule les faits des tranches {(jour, client_id)} données"""
+    tranches = set(tranches)
+    if not tranches:
+        return 0
+
+    filtre_faits = Q()
+    filtre_factures = Q()
+    for jour, client_id in tranches:
+        filtre_faits |= Q(jour=jour, client_id=client_id)
+        filtre_factures |= Q(date_facture=jour, client_id=client_id)
+
+    with transaction.atomic():
+        FaitVenteJournalier.objects.filter(filtre_faits).delete()
+        faits = calculer_faits(Facture.objects.filter(filtre_factures))
+        FaitVenteJournalier.objects.bulk_create(faits, batch_size=1000)
+    return len(faits)
+
+
+def reconstruire_faits(depuis=None):
+    """Recalcule toute la table (ou à partir de la date `depuis`) ; retourne le nombre de faits"""
+    factures = Facture.objects.all()
+    faits_existants = FaitVenteJournalier.objects.all()
+    if depuis:
+        factures = factures.filter(date_facture__gte=depuis)
+        faits_existants = faits_existants.filter(jour__gte=depuis)
+
+    with transaction.atomic():
+        faits_existants.delete()
+        faits = calculer_faits(factures)
+        FaitVenteJournalier.objects.bulk_create(faits, batch_size=1000)
+    return len(faits)
+
+
+# ========== MISE À JOUR INCRÉMENTALE ==========
+
+_en_attente = threading.local()
+
+
+def planifier_recalcul(jour, client_id):
+    """
+    Note la tranche (jour, client) à recalculer. Le premier rappel exécuté
+    après la validation de la transaction traite toutes les tranches notées,
+    les suivants n'ont plus rien à faire.
+    """
+    if jour is None or client_id is None:
+        return
+
+    if getattr(_en_attente, 'tranches', None) is None:
+        _en_attente.tranches = set()
+    _en_attente.tranches.add((jour, client_id))
+    transaction.on_commit(_executer_recalculs)
+
+
+def _executer_recalculs():
+    tranches = getattr(_en_attente, 'tranches', None)
+    if not tranches:
+        return
+    _en_attente.tranches = set()
+    recalculer_tranches(tranches)
+
+
+# ========== LECTURE ==========
+
+def chiffre_affaires(debut, fin=None):
+    """CA TTC (HT + TVA) entre deux dates incluses"""
+    faits = FaitVenteJournalier.objects.filter(jour__gte=debut)
+    if fin:
+        faits = faits.filter(jour__lte=fin)
+    resultat = faits.aggregate(ht=Sum('montant_ht'), tva=Sum('montant_tva'))
+    return (resultat['ht'] or 0) + (resultat['tva'] or 0)
+
+
+def ventes_par_periode(debut, fin, regroupement='mois', par=None):
+    """
+    Ventes agrégées par mois, trimestre ou année (et éventuellement par
+    'client', 'produit' ou 'entrepot') entre deux dates incluses.
+    """
+    champs = ['periode', f'{par}_id'] if par else ['periode']
+    return (
+        FaitVenteJournalier.objects
+        .filter(jour__gte=debut, jour__lte=fin)
+        .annotate(periode=TRONCATURES[regroupement]('jour'))
+        .values(*champs)
+        .annotate(
+            quantite=Sum('quantite'),
+            montant_ht=Sum('montant_ht'),
+            montant_tva=Sum('montant_tva'),
+            marge=Sum('marge'),
+        )
+        .order_by('periode')
+    )
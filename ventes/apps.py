@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class VentesConfig(AppConfig):
     name = 'ventes'
+    
+    def ready(self):
+        import ventes.signals  # Table de faits des ventes
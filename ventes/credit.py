@@ -0,0 +1,110 @@
+# ventes/credit.py
+"""
+Encours de crédit des clients (Client.encours_credit).
+
+L'encours est la somme des factures non soldées (hors annulées) et des
+commandes confirmées ou expédiées, pas encore facturées. On ne le recalcule
+pas à chaque confirmation : les signaux (ventes/signals.py) lui appliquent
+la différence de contribution de chaque commande ou facture enregistrée,
+par une mise à jour F() (pas de mise à jour perdue en cas d'accès
+concurrents).
+
+À la confirmation d'une commande, verifier_limite_credit() verrouille la
+ligne du client (select_for_update). Deux confirmations simultanées pour le
+même client sont donc vérifiées l'une après l'autre, et la seconde voit
+l'encours mis à jour par la première. Une limite à 0 signifie « pas de
+limite ».
+"""
+
+from decimal import Decimal
+
+from django.db.models import F, Sum, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+
+from base.models import Client
+from .models import CommandeVente, Facture
+
+STATUTS_COMMANDE_ENGAGES = ['CONFIRME', 'EXPEDIE']
+ZERO = Decimal('0')
+
+
+def contribution_commande(statut, total):
+    """Part d'une commande dans l'encours : son total tant qu'elle est confirmée et non facturée"""
+    return (total or ZERO) if statut in STATUTS_COMMANDE_ENGAGES else ZERO
+
+
+def contribution_facture(statut, total, montant_paye):
+    """Part d'une facture dans l'encours : son solde restant dû (hors annulée)"""
+    if statut == 'ANNULEE':
+        return ZERO
+    return max((total or ZERO) - (montant_paye or ZERO), ZERO)
+
+
+def ajuster_encours(client_id, delta):
+    if client_id and delta:
+        Client.objects.filter(pk=client_id).update(encours_credit=F('encours_credit') + delta)
+
+
+def appliquer_variation(avant, apres):
+    """
+    Applique la variation de contribution d'une pièce.
+    `avant` / `apres` : (client_id, contribution), ou None si la pièce n'existait pas ou plus.
+    """
+    client_avant, montant_avant = avant or (None, ZERO)
+    client_apres, montant_apres = apres or (None, ZERO)
+    if client_avant == client_apres:
+        ajuster_encours(client_apres, montant_apres - montant_avant)
+    else:
+        ajuster_encours(client_avant, -montant_avant)
+        ajuster_encours(client_apres, montant_apres)
+
+
+def verifier_limite_credit(commande):
+    """
+    À appeler dans la transaction de confirmation, avant de changer le statut.
+    Verrouille le client et retourne None si la commande passe, sinon un dict
+    décrivant le dépassement (limite, encours, montant, nouvel_encours).
+    """
+    client = Client.objects.select_for_update().only('limite_credit', 'encours_credit').get(pk=commande.client_id)
+    if not client.limite_credit:
+        return None
+
+    nouvel_encours = client.encours_credit + (commande.total or ZERO)
+    if nouvel_encours <= client.limite_credit:
+        return None
+
+    return {
+        'limite': client.limite_credit,
+        'encours': client.encours_credit,
+        'montant': commande.total or ZERO,
+        'nouvel_encours': nouvel_encours,
+    }
+
+
+def recalculer_encours(clients=None):
+    """Recalcule l'encours à partir des pièces (reprise de données, contrôle de dérive)"""
+    champ = DecimalField(max_digits=14, decimal_places=2)
+    factures = (
+        Facture.objects
+        .filter(client=OuterRef('pk'), total__gt=F('montant_paye'))
+        .exclude(statut='ANNULEE')
+        .order_by()
+        .values('client')
+        .annotate(solde=Sum(F('total') - F('montant_paye')))
+        .values('solde')
+    )
+    commandes = (
+        CommandeVente.objects
+        .filter(client=OuterRef('pk'), statut__in=STATUTS_COMMANDE_ENGAGES)
+        .order_by()
+        .values('client')
+        .annotate(montant=Sum('total'))
+        .values('montant')
+    )
+    clients = clients if clients is not None else Client.objects.all()
+    return clients.update(
+        encours_credit=(
+            Coalesce(Subquery(factures, output_field=champ), Value(ZERO), output_field=champ)
+            + Coalesce(Subquery(commandes, output_field=champ), Value(ZERO), output_field=champ)
+        )
+    )
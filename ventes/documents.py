@@ -0,0 +1,447 @@
+# ventes/documents.py
+"""
+Rendu PDF des documents de vente (factures, commandes de vente).
+
+Les styles reportlab sont construits une seule fois par processus. Chaque
+document est rendu une seule fois par version de contenu, et le PDF est
+conservé dans le cache disque 'documents' (voir CACHES dans les settings).
+La clé de cache combine l'id du document et une empreinte de tout ce qui
+est imprimé : champs du document (dont sa date de modification), client,
+entrepôt et lignes avec le nom de leur produit, lus en une requête. Modifier
+une ligne, renommer un client ou un produit change donc la clé, sans que le
+document lui-même ait été enregistré.
+
+La commande mesurer_rendu_pdf compare le rendu à froid et la lecture en cache.
+"""
+
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+
+# ========== STYLES (construits une fois par processus) ==========
+
+@lru_cache(maxsize=None)
+def obtenir_styles():
+    """Retourne les styles de paragraphe et de tableau partagés par tous les documents"""
+    base = getSampleStyleSheet()
+
+    return {
+        'titre_commande': ParagraphStyle(
+            'TitreCommande', parent=base['Heading1'], fontSize=24,
+            textColor=colors.HexColor('#6366f1'), spaceAfter=30, alignment=1,
+        ),
+        'titre_facture': ParagraphStyle(
+            'TitreFacture', parent=base['Heading1'], fontSize=28,
+            textColor=colors.HexColor('#6366f1'), spaceAfter=30, alignment=1,
+        ),
+        'date': ParagraphStyle(
+            'Date', parent=base['Normal'], fontSize=10,
+            textColor=colors.grey, alignment=1,
+        ),
+        'section': ParagraphStyle(
+            'Section', parent=base['Heading2'], fontSize=16,
+            textColor=colors.HexColor('#1e293b'), spaceAfter=15,
+        ),
+        'notes': ParagraphStyle(
+            'Notes', parent=base['Normal'], fontSize=10,
+            textColor=colors.HexColor('#78350f'), leftIndent=10, rightIndent=10,
+        ),
+        'pied': ParagraphStyle(
+            'Pied', parent=base['Normal'], fontSize=8,
+            textColor=colors.grey, alignment=1,
+        ),
+        'normal': base['Normal'],
+        'tableau_infos': TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
+            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#64748b')),
+            ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#1e293b')),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('LEFTPADDING', (0, 0), (-1, -1), 12),
+        ]),
+        'tableau_lignes': TableStyle([
+            # En-tête
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+            # Contenu
+            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('TOPPADDING', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+        ]),
+    }
+
+
+def _style_lignes(nb_totaux, extra):
+    """
+    Complète le style de tableau des lignes pour un tableau se terminant
+    par `nb_totaux` lignes de totaux.
+    """
+    fin_lignes = -(nb_totaux + 1)
+    commandes = [
+        ('BACKGROUND', (0, 1), (-1, fin_lignes), colors.white),
+        ('FONTNAME', (0, 1), (-1, fin_lignes), 'Helvetica'),
+        ('GRID', (0, 0), (-1, fin_lignes), 0.5, colors.HexColor('#e2e8f0')),
+        ('ROWBACKGROUNDS', (0, 1), (-1, fin_lignes), [colors.white, colors.HexColor('#f8fafc')]),
+    ]
+    return TableStyle(commandes + extra, parent=obtenir_styles()['tableau_lignes'])
+
+
+def _construire(elements):
+    """Assemble les éléments en un PDF A4 et retourne son contenu"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        topMargin=2*cm,
+        bottomMargin=2*cm,
+        leftMargin=2*cm,
+        rightMargin=2*cm
+    )
+    doc.build(elements)
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def _pied_de_page():
+    return Paragraph(
+        f"Document généré automatiquement - {getattr(settings, 'SITE_NAME', 'ERP MEA')}",
+        obtenir_styles()['pied']
+    )
+
+
+def _date_version(document):
+    """Ligne de date affichée sous le titre : date de la version rendue"""
+    date_version = timezone.localtime(document.date_modification)
+    return Paragraph(f"Mis à jour le {date_version.strftime('%d/%m/%Y à %H:%M')}", obtenir_styles()['date'])
+
+
+# ========== CACHE ==========
+
+def _cle_cache(type_document, document, contenu):
+    """Clé de cache : type, id et empreinte du contenu imprimé du document"""
+    empreinte = hashlib.sha256(repr(contenu).encode('utf-8')).hexdigest()[:32]
+    return f'pdf:{type_document}:{document.pk}:{empreinte}'
+
+
+def _obtenir_ou_rendre(type_document, document, contenu, fonction_rendu):
+    cache = caches['documents']
+    cle = _cle_cache(type_document, document, contenu)
+
+    pdf = cache.get(cle)
+    if pdf is None:
+        pdf = fonction_rendu(document)
+        cache.set(cle, pdf)
+    return pdf
+
+
+CHAMPS_LIGNE = ('produit__nom', 'quantite', 'prix_unitaire', 'remise', 'taux_tva')
+
+
+def contenu_commande(commande):
+    """Valeurs imprimées sur le PDF de la commande (1 requête pour les lignes)"""
+    return (
+        commande.numero_commande, commande.date_modification, commande.statut, commande.date_commande,
+        commande.date_livraison, commande.notes, commande.sous_total, commande.montant_tva, commande.total,
+        commande.client.nom, commande.client.code, commande.entrepot.nom,
+        list(commande.lignecommandevente_set.order_by('pk').values_list(*CHAMPS_LIGNE)),
+    )
+
+
+def contenu_facture(facture):
+    """Valeurs imprimées sur le PDF de la facture (lignes propres, sinon celles de la commande)"""
+    lignes = list(facture.lignes.order_by('pk').values_list(*CHAMPS_LIGNE))
+    if not lignes and facture.commande_vente_id:
+        lignes = list(facture.commande_vente.lignecommandevente_set.order_by('pk').values_list(*CHAMPS_LIGNE))
+    return (
+        facture.numero_facture, facture.date_modification, facture.statut, facture.date_facture,
+        facture.date_echeance, facture.sous_total, facture.montant_tva, facture.total, facture.montant_paye,
+        facture.client.nom, facture.client.code, lignes,
+    )
+
+
+# ========== COMMANDE DE VENTE ==========
+
+def rendre_commande_pdf(commande):
+    """Rend le PDF d'une commande de vente (sans passer par le cache)"""
+    styles = obtenir_styles()
+    lignes = commande.lignecommandevente_set.select_related('produit').all()
+
+    elements = [
+        Paragraph(f"Commande {commande.numero_commande}", styles['titre_commande']),
+        _date_version(commande),
+        Spacer(1, 30),
+    ]
+
+    # ========== INFORMATIONS COMMANDE ==========
+    info_data = [
+        ['Client:', commande.client.nom],
+        ['Code client:', commande.client.code or '-'],
+        ['Entrepôt:', commande.entrepot.nom],
+        ['Date commande:', commande.date_commande.strftime('%d/%m/%Y')],
+        ['Date livraison:', commande.date_livraison.strftime('%d/%m/%Y') if commande.date_livraison else '-'],
+        ['Statut:', commande.get_statut_display()],
+    ]
+    info_table = Table(info_data, colWidths=[4*cm, 12*cm])
+    info_table.setStyle(styles['tableau_infos'])
+    elements.append(info_table)
+    elements.append(Spacer(1, 30))
+
+    # ========== LIGNES DE COMMANDE ==========
+    elements.append(Paragraph("Lignes de commande", styles['section']))
+
+    table_data = [['Produit', 'Qté', 'Prix unit.', 'Remise', 'TVA', 'Total']]
+    for ligne in lignes:
+        table_data.append([
+            ligne.produit.nom if ligne.produit else 'Produit supprimé',
+            str(ligne.quantite),
+            f"{ligne.prix_unitaire:,.0f} FCFA",
+            f"{ligne.remise}%" if ligne.remise else "0%",
+            f"{ligne.taux_tva}%",
+            f"{ligne.total:,.0f} FCFA",
+        ])
+
+    table_data.append(['', '', '', '', 'Sous-total:', f"{commande.sous_total:,.0f} FCFA"])
+    table_data.append(['', '', '', '', 'TVA:', f"{commande.montant_tva:,.0f} FCFA"])
+    table_data.append(['', '', '', '', 'TOTAL:', f"{commande.total:,.0f} FCFA"])
+
+    table = Table(table_data, colWidths=[6*cm, 1.5*cm, 2.5*cm, 1.5*cm, 2*cm, 3*cm])
+    table.setStyle(_style_lignes(3, [
+        # Lignes de totaux
+        ('BACKGROUND', (0, -3), (-1, -2), colors.HexColor('#f8fafc')),
+        ('FONTNAME', (4, -3), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (4, -3), (-1, -1), 'RIGHT'),
+
+        # Ligne total final
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e0e7ff')),
+        ('TEXTCOLOR', (4, -1), (-1, -1), colors.HexColor('#6366f1')),
+        ('FONTSIZE', (4, -1), (-1, -1), 11),
+    ]))
+    elements.append(table)
+
+    # ========== NOTES ==========
+    if commande.notes:
+        elements.append(Spacer(1, 30))
+        elements.append(Paragraph("Notes", styles['section']))
+        elements.append(Paragraph(commande.notes, styles['notes']))
+
+    elements.append(Spacer(1, 40))
+    elements.append(_pied_de_page())
+
+    return _construire(elements)
+
+
+def pdf_commande(commande):
+    """PDF de la commande, servi depuis le cache disque si cette version a déjà été rendue"""
+    return _obtenir_ou_rendre('commande', commande, contenu_commande(commande), rendre_commande_pdf)
+
+
+# ========== FACTURE ==========
+
+def lignes_facture(facture):
+    """
+    Lignes à imprimer pour une facture. Les factures issues d'une commande
+    sans lignes propres reprennent les lignes de la commande.
+    """
+    lignes = list(facture.lignes.select_related('produit'))
+    if not lignes and facture.commande_vente_id:
+        lignes = list(facture.commande_vente.lignecommandevente_set.select_related('produit'))
+    return lignes
+
+
+def rendre_facture_pdf(facture):
+    """Rend le PDF d'une facture (sans passer par le cache)"""
+    styles = obtenir_styles()
+
+    total = facture.total if facture.total else 0
+    paye = facture.montant_paye if facture.montant_paye else 0
+    solde = total - paye
+
+    # Taux de TVA affiché (18% par défaut)
+    taux_tva = 18
+    if facture.montant_tva and facture.sous_total and facture.sous_total > 0:
+        taux_tva = round((facture.montant_tva / facture.sous_total) * 100, 2)
+
+    elements = [
+        Paragraph(f"FACTURE {facture.numero_facture}", styles['titre_facture']),
+        _date_version(facture),
+        Spacer(1, 30),
+    ]
+
+    # ========== INFORMATIONS FACTURE ==========
+    info_data = [
+        ['Client:', facture.client.nom],
+        ['Code client:', facture.client.code or '-'],
+        ['Date facture:', facture.date_facture.strftime('%d/%m/%Y') if facture.date_facture else
+                         facture.date_creation.strftime('%d/%m/%Y') if facture.date_creation else '-'],
+        ['Date échéance:', facture.date_echeance.strftime('%d/%m/%Y') if facture.date_echeance else '-'],
+        ['Statut:', facture.get_statut_display()],
+    ]
+    info_table = Table(info_data, colWidths=[4*cm, 12*cm])
+    info_table.setStyle(styles['tableau_infos'])
+    elements.append(info_table)
+    elements.append(Spacer(1, 30))
+
+    # ========== LIGNES DE FACTURE ==========
+    elements.append(Paragraph("Articles facturés", styles['section']))
+
+    table_data = [['Description', 'Qté', 'Prix unit.', 'Total']]
+    for ligne in lignes_facture(facture):
+        table_data.append([
+            ligne.produit.nom if ligne.produit else 'Produit supprimé',
+            str(ligne.quantite),
+            f"{ligne.prix_unitaire:,.0f} FCFA",
+            f"{(ligne.prix_unitaire * ligne.quantite):,.0f} FCFA",
+        ])
+
+    totaux = [['', '', 'Sous-total HT:', f"{facture.sous_total:,.0f} FCFA" if facture.sous_total else '0 FCFA']]
+    if facture.montant_tva and facture.montant_tva > 0:
+        totaux.append(['', '', f'TVA ({taux_tva}%):', f"{facture.montant_tva:,.0f} FCFA"])
+    totaux.append(['', '', 'TOTAL TTC:', f"{total:,.0f} FCFA"])
+    totaux.append(['', '', 'Montant payé:', f"{paye:,.0f} FCFA"])
+    totaux.append(['', '', 'SOLDE:', f"{solde:,.0f} FCFA"])
+    table_data.extend(totaux)
+
+    nb_totaux = len(totaux)
+    table = Table(table_data, colWidths=[9*cm, 2*cm, 2.5*cm, 3*cm])
+    table.setStyle(_style_lignes(nb_totaux, [
+        # Lignes de totaux
+        ('BACKGROUND', (0, -nb_totaux), (-1, -2), colors.HexColor('#f8fafc')),
+        ('FONTNAME', (2, -nb_totaux), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (2, -nb_totaux), (-1, -1), 'RIGHT'),
+
+        # Ligne total TTC
+        ('BACKGROUND', (0, -3), (-1, -3), colors.HexColor('#e0e7ff')),
+        ('TEXTCOLOR', (2, -3), (-1, -3), colors.HexColor('#6366f1')),
+        ('FONTSIZE', (2, -3), (-1, -3), 11),
+
+        # Ligne solde final
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fef3c7') if solde > 0 else colors.HexColor('#dcfce7')),
+        ('TEXTCOLOR', (2, -1), (-1, -1), colors.HexColor('#f59e0b') if solde > 0 else colors.HexColor('#10b981')),
+        ('FONTSIZE', (2, -1), (-1, -1), 12),
+    ]))
+    elements.append(table)
+
+    elements.append(Spacer(1, 40))
+    elements.append(_pied_de_page())
+
+    return _construire(elements)
+
+
+def pdf_facture(facture):
+    """PDF de la facture, servi depuis le cache disque si cette version a déjà été rendue"""
+    return _obtenir_ou_rendre('facture', facture, contenu_facture(facture), rendre_facture_pdf)
+
+
+# ========== RELEVÉ DE RELANCE ==========
+
+def rendre_releve_pdf(donnees):
+    """
+    Rend la lettre de relance d'un client à partir de données simples
+    (dictionnaires, Decimal, chaînes) : aucune requête n'est faite, ce qui
+    permet d'appeler cette fonction depuis un pool de processus.
+    """
+    styles = obtenir_styles()
+    client = donnees['client']
+
+    elements = [
+        Paragraph("RELANCE - FACTURES EN RETARD", styles['titre_facture']),
+        Paragraph(f"Relevé au {donnees['date']}", styles['date']),
+        Spacer(1, 30),
+    ]
+
+    info_data = [
+        ['Client:', client['nom']],
+        ['Code client:', client['code'] or '-'],
+        ['Adresse:', f"{client['adresse']}, {client['ville']}"],
+        ['Montant dû:', f"{donnees['total_du']:,.0f} FCFA"],
+    ]
+    info_table = Table(info_data, colWidths=[4*cm, 12*cm])
+    info_table.setStyle(styles['tableau_infos'])
+    elements.append(info_table)
+    elements.append(Spacer(1, 30))
+
+    elements.append(Paragraph("Factures échues non réglées", styles['section']))
+
+    table_data = [['Facture', 'Date', 'Échéance', 'Retard', 'Total', 'Solde']]
+    for facture in donnees['factures']:
+        table_data.append([
+            facture['numero'],
+            facture['date_facture'],
+            facture['date_echeance'],
+            f"{facture['jours_retard']} j",
+            f"{facture['total']:,.0f} FCFA",
+            f"{facture['solde']:,.0f} FCFA",
+        ])
+    table_data.append(['', '', '', '', 'TOTAL DÛ:', f"{donnees['total_du']:,.0f} FCFA"])
+
+    table = Table(table_data, colWidths=[3.5*cm, 2.5*cm, 2.5*cm, 1.5*cm, 3*cm, 3*cm])
+    table.setStyle(_style_lignes(1, [
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fef3c7')),
+        ('TEXTCOLOR', (4, -1), (-1, -1), colors.HexColor('#f59e0b')),
+        ('FONTNAME', (4, -1), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (4, 1), (-1, -1), 'RIGHT'),
+    ]))
+    elements.append(table)
+
+    elements.append(Spacer(1, 30))
+    elements.append(Paragraph(
+        "Sauf erreur de notre part, les factures ci-dessus restent impayées à ce jour. "
+        "Nous vous remercions de bien vouloir procéder à leur règlement dans les meilleurs délais. "
+        "Si votre paiement a été effectué entre-temps, merci de ne pas tenir compte de ce courrier.",
+        styles['normal']
+    ))
+
+    elements.append(Spacer(1, 40))
+    elements.append(Paragraph(f"Document généré automatiquement - {donnees['site']}", styles['pied']))
+
+    return _construire(elements)
+
+
+# ========== PIÈCES JOINTES (file d'envoi des emails) ==========
+
+def piece_jointe_facture(pk):
+    from .models import Facture
+    facture = Facture.objects.select_related('client', 'commande_vente').get(pk=pk)
+    return f'facture_{facture.numero_facture}.pdf', pdf_facture(facture), 'application/pdf'
+
+
+def piece_jointe_commande(pk):
+    from .models import CommandeVente
+    commande = CommandeVente.objects.select_related('client', 'entrepot').get(pk=pk)
+    return f'commande_{commande.numero_commande}.pdf', pdf_commande(commande), 'application/pdf'
+
+
+def piece_jointe_relance(pk):
+    from .models import RelanceClient
+    from .relances import donnees_releve_relance
+    relance = RelanceClient.objects.select_related('client').get(pk=pk)
+    cle = f'pdf:relance:{pk}'
+    pdf = caches['documents'].get(cle)
+    if pdf is None:
+        pdf = rendre_releve_pdf(donnees_releve_relance(relance))
+        caches['documents'].set(cle, pdf)
+    return f'relance_{relance.periode}_{relance.client.code}.pdf', pdf, 'application/pdf'
@@ -0,0 +1,37 @@
+# ventes/management/commands/lancer_relances.py
+
+from django.core.management.base import BaseCommand, CommandError
+from ventes.relances import lancer_relances
+
+class Command(BaseCommand):
+    help = 'Lance la campagne de relance des factures en retard (une relance par client et par mois)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periode', help='Période au format AAAA-MM (par défaut : mois en cours)')
+        parser.add_argument('--processus', type=int, default=None, help='Nombre de processus pour le rendu des PDF')
+        parser.add_argument(
+            '--sans-envoi', action='store_true',
+            help="Met les emails en file sans les envoyer (le worker envoyer_emails s'en chargera)",
+        )
+
+    def handle(self, *args, **options):
+        periode = options['periode']
+        if periode and (len(periode) != 7 or periode[4] != '-' or not periode.replace('-', '').isdigit()):
+            raise CommandError('Période invalide, format attendu : AAAA-MM')
+
+        self.stdout.write('🚀 Campagne de relance en cours...\n')
+
+        campagne = lancer_relances(
+            periode=periode,
+            processus=options['processus'],
+            envoyer=not options['sans_envoi'],
+        )
+
+        if campagne is None:
+            self.stdout.write(self.style.SUCCESS('✓ Aucun client à relancer'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {campagne.nb_clients} client(s) relancé(s) pour {campagne.nb_factures} facture(s), '
+            f'{campagne.montant_total:,.0f} FCFA'
+        ))
@@ -0,0 +1,27 @@
+# ventes/management/commands/marquer_factures_en_retard.py
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from ventes.models import Facture
+
+class Command(BaseCommand):
+    help = 'Passe en retard les factures échues dont le solde reste ouvert (à lancer par cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help="Date de référence au format AAAA-MM-JJ (par défaut : aujourd'hui)",
+        )
+
+    def handle(self, *args, **options):
+        date_reference = None
+        if options['date']:
+            try:
+                date_reference = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Date invalide, format attendu : AAAA-MM-JJ')
+
+        ids = Facture.marquer_en_retard(date_reference)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {len(ids)} facture(s) passée(s) en retard'))
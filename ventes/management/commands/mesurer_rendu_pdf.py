@@ -0,0 +1,44 @@
+# ventes/management/commands/mesurer_rendu_pdf.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from ventes.documents import pdf_commande, pdf_facture, rendre_commande_pdf, rendre_facture_pdf
+from ventes.models import CommandeVente, Facture
+
+class Command(BaseCommand):
+    help = "Compare le rendu PDF à froid et la lecture depuis le cache 'documents' (facture ou commande)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('type', choices=['facture', 'commande'], help='Type de document')
+        parser.add_argument('pk', type=int, help='Identifiant du document')
+        parser.add_argument('--repetitions', type=int, default=20, help='Nombre de mesures de chaque sorte')
+
+    def handle(self, *args, **options):
+        if options['type'] == 'facture':
+            modele, rendre, obtenir = Facture, rendre_facture_pdf, pdf_facture
+            document = Facture.objects.select_related('client', 'commande_vente').filter(pk=options['pk']).first()
+        else:
+            modele, rendre, obtenir = CommandeVente, rendre_commande_pdf, pdf_commande
+            document = CommandeVente.objects.select_related('client', 'entrepot').filter(pk=options['pk']).first()
+        if document is None:
+            raise CommandError(f"{modele._meta.verbose_name} {options['pk']} introuvable")
+
+        repetitions = max(1, options['repetitions'])
+
+        # À froid : rendu complet, sans lire ni écrire le cache
+        debut = time.perf_counter()
+        for _ in range(repetitions):
+            rendre(document)
+        froid = time.perf_counter() - debut
+
+        # En cache : empreinte du contenu et lecture du PDF déjà rendu
+        obtenir(document)
+        debut = time.perf_counter()
+        for _ in range(repetitions):
+            obtenir(document)
+        chaud = time.perf_counter() - debut
+
+        self.stdout.write(f'🧊 À froid : {froid / repetitions * 1000:.2f} ms par document')
+        self.stdout.write(f'🔥 En cache : {chaud / repetitions * 1000:.2f} ms par document')
+        self.stdout.write(self.style.SUCCESS(f'✓ {repetitions} mesure(s) de chaque sorte'))
@@ -0,0 +1,12 @@
+# ventes/management/commands/recalculer_encours_clients.py
+
+from django.core.management.base import BaseCommand
+from ventes.credit import recalculer_encours
+
+class Command(BaseCommand):
+    help = "Recalcule l'encours de crédit des clients à partir des factures et commandes en cours"
+
+    def handle(self, *args, **options):
+        self.stdout.write('💳 Recalcul de l\'encours de crédit des clients...')
+        nb = recalculer_encours()
+        self.stdout.write(self.style.SUCCESS(f'✓ Encours recalculé pour {nb} client(s)'))
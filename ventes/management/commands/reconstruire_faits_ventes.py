@@ -0,0 +1,24 @@
+# ventes/management/commands/reconstruire_faits_ventes.py
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from ventes.analytique import reconstruire_faits
+
+class Command(BaseCommand):
+    help = "Recalcule la table de faits des ventes (FaitVenteJournalier) à partir des factures"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depuis', type=str, help='Ne recalculer qu\'à partir de cette date (AAAA-MM-JJ)')
+
+    def handle(self, *args, **options):
+        depuis = None
+        if options['depuis']:
+            try:
+                depuis = datetime.strptime(options['depuis'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Date invalide, format attendu : AAAA-MM-JJ')
+
+        self.stdout.write('📊 Reconstruction de la table de faits des ventes...')
+        nb = reconstruire_faits(depuis)
+        self.stdout.write(self.style.SUCCESS(f'✓ {nb} fait(s) de vente calculé(s)'))
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventes', '0002_lignefacture'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoriqueStatutFacture',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancien_statut', models.CharField(choices=[('BROUILLON', 'Brouillon'), ('ENVOYEE', 'Envoyée'), ('PAYEE', 'Payée'), ('EN_RETARD', 'En retard'), ('ANNULEE', 'Annulée')], max_length=20, verbose_name='Ancien statut')),
+                ('nouveau_statut', models.CharField(choices=[('BROUILLON', 'Brouillon'), ('ENVOYEE', 'Envoyée'), ('PAYEE', 'Payée'), ('EN_RETARD', 'En retard'), ('ANNULEE', 'Annulée')], max_length=20, verbose_name='Nouveau statut')),
+                ('origine', models.CharField(choices=[('ECHEANCE', 'Échéance dépassée'), ('MANUEL', 'Manuel')], default='MANUEL', max_length=20, verbose_name='Origine')),
+                ('date_changement', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Date du changement')),
+                ('facture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historique_statuts', to='ventes.facture', verbose_name='Facture')),
+            ],
+            options={
+                'verbose_name': 'Historique de statut de facture',
+                'verbose_name_plural': 'Historiques de statut de facture',
+                'ordering': ['-date_changement'],
+            },
+        ),
+    ]
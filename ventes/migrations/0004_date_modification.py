@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventes', '0003_historiquestatutfacture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandevente',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, verbose_name='Date de modification'),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, verbose_name='Date de modification'),
+        ),
+    ]
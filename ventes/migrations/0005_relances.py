@@ -0,0 +1,53 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_emailsortant'),
+        ('ventes', '0004_date_modification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampagneRelance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.CharField(help_text='AAAA-MM', max_length=7, verbose_name='Période')),
+                ('date_execution', models.DateTimeField(auto_now_add=True, verbose_name="Date d'exécution")),
+                ('nb_clients', models.PositiveIntegerField(default=0, verbose_name='Clients relancés')),
+                ('nb_factures', models.PositiveIntegerField(default=0, verbose_name='Factures relancées')),
+                ('montant_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Montant total relancé')),
+                ('cree_par', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Lancée par')),
+            ],
+            options={
+                'verbose_name': 'Campagne de relance',
+                'verbose_name_plural': 'Campagnes de relance',
+                'ordering': ['-date_execution'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RelanceClient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.CharField(max_length=7, verbose_name='Période')),
+                ('montant_du', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Montant dû')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('campagne', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relances', to='ventes.campagnerelance', verbose_name='Campagne')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='relances', to='base.client', verbose_name='Client')),
+                ('email', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='base.emailsortant', verbose_name='Email')),
+                ('factures', models.ManyToManyField(related_name='relances', to='ventes.facture', verbose_name='Factures relancées')),
+            ],
+            options={
+                'verbose_name': 'Relance client',
+                'verbose_name_plural': 'Relances clients',
+                'ordering': ['-date_creation'],
+                'unique_together': {('client', 'periode')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_tacheexport'),
+        ('stock', '0002_stock'),
+        ('ventes', '0005_relances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaitVenteJournalier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField(verbose_name='Jour')),
+                ('quantite', models.IntegerField(default=0, verbose_name='Quantité vendue')),
+                ('montant_ht', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name="Chiffre d'affaires HT")),
+                ('montant_tva', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Montant TVA')),
+                ('cout_achat', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name="Coût d'achat")),
+                ('marge', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Marge')),
+                ('nb_factures', models.PositiveIntegerField(default=0, verbose_name='Nombre de factures')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='faits_ventes', to='base.client', verbose_name='Client')),
+                ('entrepot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='faits_ventes', to='stock.entrepot', verbose_name='Entrepôt')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='faits_ventes', to='stock.produit', verbose_name='Produit')),
+            ],
+            options={
+                'verbose_name': 'Fait de vente journalier',
+                'verbose_name_plural': 'Faits de vente journaliers',
+                'ordering': ['-jour'],
+                'indexes': [models.Index(fields=['jour'], name='ventes_fait_jour_cd77d0_idx'), models.Index(fields=['produit', 'jour'], name='ventes_fait_produit_8b3a54_idx')],
+                'unique_together': {('jour', 'client', 'produit', 'entrepot')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventes', '0006_faitventejournalier'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['statut', 'date_facture'], name='ventes_fact_statut_b7ebfe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['client', 'statut'], name='ventes_fact_client__2b79f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['date_echeance'], name='ventes_fact_date_ec_a2e296_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['-date_facture', '-id'], name='ventes_fact_date_fa_bf548f_idx'),
+        ),
+    ]
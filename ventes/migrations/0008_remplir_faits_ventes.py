@@ -0,0 +1,96 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:20
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+
+STATUTS_VENTE = ['ENVOYEE', 'PAYEE', 'EN_RETARD']
+DEUX_DECIMALES = Decimal('0.01')
+
+
+def _montant(expression):
+    return ExpressionWrapper(expression, output_field=DecimalField(max_digits=20, decimal_places=6))
+
+
+def _agreger_lignes(lignes, prefixe_facture):
+    montant_ht = _montant(
+        F('quantite') * F('prix_unitaire') * (Value(Decimal('1')) - F('remise') * Value(Decimal('0.01')))
+    )
+    return (
+        lignes
+        .annotate(montant_ht=montant_ht, montant_tva_ligne=_montant(montant_ht * F('taux_tva') * Value(Decimal('0.01'))))
+        .order_by()
+        .values(
+            'produit_id',
+            jour=F(f'{prefixe_facture}__date_facture'),
+            client_id=F(f'{prefixe_facture}__client_id'),
+            entrepot_id=F(f'{prefixe_facture}__commande_vente__entrepot_id'),
+        )
+        .annotate(
+            qte=Sum('quantite'),
+            ht=Sum('montant_ht'),
+            tva=Sum('montant_tva_ligne'),
+            cout=Sum(_montant(F('quantite') * F('produit__prix_achat'))),
+            factures=Count(prefixe_facture, distinct=True),
+        )
+    )
+
+
+def remplir_faits_ventes(apps, schema_editor):
+    """
+    Faits des factures émises avant FaitVenteJournalier (0006) : même calcul
+    que analytique.reconstruire_faits, sur les modèles historiques.
+    """
+    Facture = apps.get_model('ventes', 'Facture')
+    LigneFacture = apps.get_model('ventes', 'LigneFacture')
+    LigneCommandeVente = apps.get_model('ventes', 'LigneCommandeVente')
+    FaitVenteJournalier = apps.get_model('ventes', 'FaitVenteJournalier')
+
+    factures = Facture.objects.filter(statut__in=STATUTS_VENTE)
+    sources = [
+        _agreger_lignes(LigneFacture.objects.filter(facture__in=factures), 'facture'),
+        # Factures sans lignes propres : lignes de la commande d'origine
+        _agreger_lignes(
+            LigneCommandeVente.objects.filter(commande__facture__in=factures.filter(lignes__isnull=True)),
+            'commande__facture',
+        ),
+    ]
+
+    faits = defaultdict(lambda: defaultdict(Decimal))
+    for source in sources:
+        for ligne in source:
+            fait = faits[(ligne['jour'], ligne['client_id'], ligne['produit_id'], ligne['entrepot_id'])]
+            fait['quantite'] += ligne['qte'] or 0
+            fait['montant_ht'] += ligne['ht'] or 0
+            fait['montant_tva'] += ligne['tva'] or 0
+            fait['cout_achat'] += ligne['cout'] or 0
+            fait['nb_factures'] += ligne['factures']
+
+    FaitVenteJournalier.objects.all().delete()
+    nouveaux = []
+    for (jour, client_id, produit_id, entrepot_id), valeurs in faits.items():
+        montant_ht = Decimal(valeurs['montant_ht']).quantize(DEUX_DECIMALES)
+        cout_achat = Decimal(valeurs['cout_achat']).quantize(DEUX_DECIMALES)
+        nouveaux.append(FaitVenteJournalier(
+            jour=jour, client_id=client_id, produit_id=produit_id, entrepot_id=entrepot_id,
+            quantite=int(valeurs['quantite']),
+            montant_ht=montant_ht,
+            montant_tva=Decimal(valeurs['montant_tva']).quantize(DEUX_DECIMALES),
+            cout_achat=cout_achat,
+            marge=montant_ht - cout_achat,
+            nb_factures=int(valeurs['nb_factures']),
+        ))
+    FaitVenteJournalier.objects.bulk_create(nouveaux, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventes', '0007_index_factures'),
+    ]
+
+    operations = [
+        migrations.RunPython(remplir_faits_ventes, migrations.RunPython.noop),
+    ]
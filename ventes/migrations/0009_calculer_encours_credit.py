@@ -0,0 +1,57 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:05
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+STATUTS_COMMANDE_ENGAGES = ['CONFIRME', 'EXPEDIE']
+
+
+def calculer_encours_credit(apps, schema_editor):
+    """
+    Encours des clients qui avaient déjà des pièces avant Client.encours_credit
+    (base 0004) : même calcul que credit.recalculer_encours, sur les modèles
+    historiques.
+    """
+    Client = apps.get_model('base', 'Client')
+    Facture = apps.get_model('ventes', 'Facture')
+    CommandeVente = apps.get_model('ventes', 'CommandeVente')
+
+    champ = DecimalField(max_digits=14, decimal_places=2)
+    factures = (
+        Facture.objects
+        .filter(client=OuterRef('pk'), total__gt=F('montant_paye'))
+        .exclude(statut='ANNULEE')
+        .order_by()
+        .values('client')
+        .annotate(solde=Sum(F('total') - F('montant_paye')))
+        .values('solde')
+    )
+    commandes = (
+        CommandeVente.objects
+        .filter(client=OuterRef('pk'), statut__in=STATUTS_COMMANDE_ENGAGES)
+        .order_by()
+        .values('client')
+        .annotate(montant=Sum('total'))
+        .values('montant')
+    )
+    Client.objects.update(
+        encours_credit=(
+            Coalesce(Subquery(factures, output_field=champ), Value(Decimal('0')), output_field=champ)
+            + Coalesce(Subquery(commandes, output_field=champ), Value(Decimal('0')), output_field=champ)
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_client_encours_credit'),
+        ('ventes', '0008_remplir_faits_ventes'),
+    ]
+
+    operations = [
+        migrations.RunPython(calculer_encours_credit, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum, Value, DecimalField, ExpressionWrapper
+from decimal import Decimal
 from django.contrib.auth.models import User
-from base.models import Client
+from django.utils import timezone
+from base.models import Client, EmailSortant
 from stock.models import Produit, Entrepot
 
 class CommandeVente(models.Model):
@@ -25,6 +28,7 @@ class CommandeVente(models.Model):
     notes = models.TextField(blank=True, verbose_name="Notes")
     cree_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name="Créé par")
     date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    date_modification = models.DateTimeField(auto_now=True, verbose_name="Date de modification")
     
     class Meta:
         verbose_name = "Commande de vente"
@@ -36,12 +40,43 @@ class CommandeVente(models.Model):
     
     def calculer_totaux(self):
         """Calcule les totaux de la commande"""
-        lignes = self.lignecommandevente_set.all()
-        self.sous_total = sum(ligne.sous_total for ligne in lignes)
-        self.montant_tva = sum(ligne.montant_tva for ligne in lignes)
-        self.total = self.sous_total + self.montant_tva
+        totaux = self.lignecommandevente_set.totaux()
+        self.sous_total = totaux['sous_total']
+        self.montant_tva = totaux['montant_tva']
+        self.total = totaux['total']
         self.save()
 
+def _montant(expression):
+    return ExpressionWrapper(expression, output_field=DecimalField(max_digits=20, decimal_places=6))
+
+class LigneVenteQuerySet(models.QuerySet):
+    """
+    Montants des lignes de vente (commande ou facture) calculés en SQL.
+    Mêmes formules que les propriétés sous_total / montant_tva / total, sans
+    arrondi par ligne : l'arrondi à 2 décimales se fait sur les totaux.
+    """
+    
+    def avec_montants(self):
+        montant_ht = _montant(
+            F('quantite') * F('prix_unitaire') * (Value(Decimal('1')) - F('remise') * Value(Decimal('0.01')))
+        )
+        montant_tva = _montant(montant_ht * F('taux_tva') * Value(Decimal('0.01')))
+        return self.annotate(
+            montant_ht=montant_ht,
+            montant_tva_ligne=montant_tva,
+            montant_ttc=_montant(montant_ht + montant_tva),
+        )
+    
+    def totaux(self):
+        """Sous-total, TVA et total des lignes en une requête"""
+        resultat = self.avec_montants().order_by().aggregate(
+            sous_total=Sum('montant_ht'),
+            montant_tva=Sum('montant_tva_ligne'),
+        )
+        sous_total = resultat['sous_total'] or Decimal('0')
+        montant_tva = resultat['montant_tva'] or Decimal('0')
+        return {'sous_total': sous_total, 'montant_tva': montant_tva, 'total': sous_total + montant_tva}
+
 class LigneCommandeVente(models.Model):
     """Modèle pour les lignes de commande de vente"""
     commande = models.ForeignKey(CommandeVente, on_delete=models.CASCADE, verbose_name="Commande")
@@ -51,6 +86,8 @@ class LigneCommandeVente(models.Model):
     remise = models.DecimalField(max_digits=5, decimal_places=2, default=0, verbose_name="Remise (%)")
     taux_tva = models.DecimalField(max_digits=5, decimal_places=2, default=0, verbose_name="Taux TVA (%)")
     
+    objects = LigneVenteQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Ligne de commande de vente"
         verbose_name_plural = "Lignes de commande de vente"
@@ -94,11 +131,18 @@ class Facture(models.Model):
     montant_paye = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Montant payé")
     notes = models.TextField(blank=True, verbose_name="Notes")
     date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    date_modification = models.DateTimeField(auto_now=True, verbose_name="Date de modification")
     
     class Meta:
         verbose_name = "Facture"
         verbose_name_plural = "Factures"
         ordering = ['-date_creation']
+        indexes = [
+            models.Index(fields=['statut', 'date_facture']),
+            models.Index(fields=['client', 'statut']),
+            models.Index(fields=['date_echeance']),
+            models.Index(fields=['-date_facture', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.numero_facture} - {self.client.nom}"
@@ -108,6 +152,76 @@ class Facture(models.Model):
         """Calcule le solde restant de la facture"""
         return self.total - self.montant_paye
     
+    @classmethod
+    def marquer_en_retard(cls, date_reference=None):
+        """
+        Passe en EN_RETARD les factures envoyées échues avec un solde ouvert
+        (un brouillon n'est pas encore dû, il n'est jamais mis en retard).
+        
+        La mise à jour se fait en un seul UPDATE ; chaque facture modifiée est
+        tracée dans HistoriqueStatutFacture pour que les relances et les
+        notifications exploitent ce delta sans rescanner les factures.
+        L'UPDATE ne déclenche pas les signaux : les tranches de
+        FaitVenteJournalier des factures modifiées sont recalculées à la
+        validation de la transaction. L'encours client ne dépend pas du
+        statut retard et n'est pas touché.
+        Retourne la liste des ids passés en retard.
+        """
+        from .analytique import planifier_recalcul
+        
+        date_reference = date_reference or timezone.now().date()
+        
+        with transaction.atomic():
+            echues = list(cls.objects.select_for_update().filter(
+                date_echeance__lt=date_reference,
+                total__gt=F('montant_paye'),
+                statut='ENVOYEE',
+            ).values_list('pk', 'date_facture', 'client_id'))
+            if not echues:
+                return []
+            ids = [facture_id for facture_id, _, _ in echues]
+            
+            cls.objects.filter(pk__in=ids).update(
+                statut='EN_RETARD',
+                date_modification=timezone.now(),
+            )
+            
+            HistoriqueStatutFacture.objects.bulk_create([
+                HistoriqueStatutFacture(
+                    facture_id=facture_id,
+                    ancien_statut='ENVOYEE',
+                    nouveau_statut='EN_RETARD',
+                    origine='ECHEANCE',
+                )
+                for facture_id in ids
+            ])
+            
+            for _, jour, client_id in echues:
+                planifier_recalcul(jour, client_id)
+        
+        return ids
+    
+class HistoriqueStatutFacture(models.Model):
+    """Trace des changements de statut des factures (delta pour relances et notifications)"""
+    ORIGINES = [
+        ('ECHEANCE', 'Échéance dépassée'),
+        ('MANUEL', 'Manuel'),
+    ]
+    
+    facture = models.ForeignKey(Facture, on_delete=models.CASCADE, related_name='historique_statuts', verbose_name="Facture")
+    ancien_statut = models.CharField(max_length=20, choices=Facture.STATUTS, verbose_name="Ancien statut")
+    nouveau_statut = models.CharField(max_length=20, choices=Facture.STATUTS, verbose_name="Nouveau statut")
+    origine = models.CharField(max_length=20, choices=ORIGINES, default='MANUEL', verbose_name="Origine")
+    date_changement = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Date du changement")
+    
+    class Meta:
+        verbose_name = "Historique de statut de facture"
+        verbose_name_plural = "Historiques de statut de facture"
+        ordering = ['-date_changement']
+    
+    def __str__(self):
+        return f"{self.facture_id} : {self.ancien_statut} → {self.nouveau_statut}"
+    
 class LigneFacture(models.Model):
     """Modèle pour les lignes de facture"""
     facture = models.ForeignKey(Facture, on_delete=models.CASCADE, related_name='lignes', verbose_name="Facture")
@@ -117,6 +231,8 @@ class LigneFacture(models.Model):
     remise = models.DecimalField(max_digits=5, decimal_places=2, default=0, verbose_name="Remise (%)")
     taux_tva = models.DecimalField(max_digits=5, decimal_places=2, default=0, verbose_name="Taux TVA (%)")
     
+    objects = LigneVenteQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Ligne de facture"
         verbose_name_plural = "Lignes de facture"
@@ -140,3 +256,69 @@ class LigneFacture(models.Model):
     def total(self):
         """Calcule le total de la ligne"""
         return self.sous_total + self.montant_tva
+
+class CampagneRelance(models.Model):
+    """Exécution d'une campagne de relance des factures en retard"""
+    periode = models.CharField(max_length=7, verbose_name="Période", help_text="AAAA-MM")
+    date_execution = models.DateTimeField(auto_now_add=True, verbose_name="Date d'exécution")
+    nb_clients = models.PositiveIntegerField(default=0, verbose_name="Clients relancés")
+    nb_factures = models.PositiveIntegerField(default=0, verbose_name="Factures relancées")
+    montant_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Montant total relancé")
+    cree_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Lancée par")
+    
+    class Meta:
+        verbose_name = "Campagne de relance"
+        verbose_name_plural = "Campagnes de relance"
+        ordering = ['-date_execution']
+    
+    def __str__(self):
+        return f"Relances {self.periode} ({self.nb_clients} clients)"
+
+class RelanceClient(models.Model):
+    """Relance envoyée à un client : une seule par client et par période"""
+    campagne = models.ForeignKey(CampagneRelance, on_delete=models.CASCADE, related_name='relances', verbose_name="Campagne")
+    client = models.ForeignKey(Client, on_delete=models.PROTECT, related_name='relances', verbose_name="Client")
+    periode = models.CharField(max_length=7, verbose_name="Période")
+    factures = models.ManyToManyField(Facture, related_name='relances', verbose_name="Factures relancées")
+    montant_du = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Montant dû")
+    email = models.ForeignKey(EmailSortant, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Email")
+    date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    
+    class Meta:
+        verbose_name = "Relance client"
+        verbose_name_plural = "Relances clients"
+        unique_together = ['client', 'periode']
+        ordering = ['-date_creation']
+    
+    def __str__(self):
+        return f"Relance {self.periode} - {self.client.nom}"
+
+class FaitVenteJournalier(models.Model):
+    """
+    Ventes agrégées par jour, client, produit et entrepôt (table de faits).
+    Alimentée à partir des lignes de facture par ventes/analytique.py ;
+    ne pas modifier à la main.
+    """
+    jour = models.DateField(verbose_name="Jour")
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='faits_ventes', verbose_name="Client")
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='faits_ventes', verbose_name="Produit")
+    entrepot = models.ForeignKey(Entrepot, on_delete=models.CASCADE, null=True, blank=True, related_name='faits_ventes', verbose_name="Entrepôt")
+    quantite = models.IntegerField(default=0, verbose_name="Quantité vendue")
+    montant_ht = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Chiffre d'affaires HT")
+    montant_tva = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Montant TVA")
+    cout_achat = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Coût d'achat")
+    marge = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Marge")
+    nb_factures = models.PositiveIntegerField(default=0, verbose_name="Nombre de factures")
+    
+    class Meta:
+        verbose_name = "Fait de vente journalier"
+        verbose_name_plural = "Faits de vente journaliers"
+        unique_together = ['jour', 'client', 'produit', 'entrepot']
+        ordering = ['-jour']
+        indexes = [
+            models.Index(fields=['jour']),
+            models.Index(fields=['produit', 'jour']),
+        ]
+    
+    def __str__(self):
+        return f"{self.jour} - {self.client_id} - {self.produit_id} : {self.montant_ht}"
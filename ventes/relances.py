@@ -0,0 +1,229 @@
+# ventes/relances.py
+"""
+Campagne de relance des factures en retard.
+
+Une campagne sélectionne en une requête toutes les factures en retard,
+regroupées par client, rend une lettre de relance PDF par client dans un pool
+de processus, puis envoie tous les emails sur une seule session SMTP via la
+file d'envoi. Chaque relance est enregistrée (RelanceClient, unique par
+client et par période) pour qu'un client ne soit jamais relancé deux fois
+sur la même période : un client relancé entre-temps par une campagne
+simultanée est simplement écarté de celle-ci.
+
+Les enregistrements se font par lots (bulk_create) sans compter sur le
+retour des clés primaires, que tous les moteurs ne fournissent pas : les
+relances créées sont relues par campagne, les emails par pièce jointe.
+"""
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.html import escape
+
+from base.emails import envoyer_lot
+from base.models import EmailSortant
+from .documents import rendre_releve_pdf
+from .models import Facture, CampagneRelance, RelanceClient
+
+CHAMPS_FACTURE = ['id', 'numero_facture', 'date_facture', 'date_echeance', 'total', 'montant_paye']
+CHAMPS_CLIENT = ['client_id', 'client__nom', 'client__code', 'client__email', 'client__adresse', 'client__ville']
+
+
+def _donnees_releve(lignes, aujourd_hui):
+    """Construit les données (sérialisables) d'un relevé à partir des lignes values() d'un client"""
+    premiere = lignes[0]
+    factures = []
+    total_du = Decimal('0')
+    for ligne in lignes:
+        solde = ligne['total'] - ligne['montant_paye']
+        total_du += solde
+        factures.append({
+            'id': ligne['id'],
+            'numero': ligne['numero_facture'],
+            'date_facture': ligne['date_facture'].strftime('%d/%m/%Y'),
+            'date_echeance': ligne['date_echeance'].strftime('%d/%m/%Y'),
+            'jours_retard': (aujourd_hui - ligne['date_echeance']).days,
+            'total': ligne['total'],
+            'solde': solde,
+        })
+
+    return {
+        'site': getattr(settings, 'SITE_NAME', 'ERP MEA'),
+        'date': aujourd_hui.strftime('%d/%m/%Y'),
+        'client': {
+            'id': premiere['client_id'],
+            'nom': premiere['client__nom'],
+            'code': premiere['client__code'],
+            'email': premiere['client__email'],
+            'adresse': premiere['client__adresse'],
+            'ville': premiere['client__ville'],
+        },
+        'factures': factures,
+        'total_du': total_du,
+    }
+
+
+def donnees_releve_relance(relance):
+    """Données du relevé d'une relance déjà enregistrée (pour un nouveau rendu)"""
+    lignes = list(
+        relance.factures.order_by('date_echeance', 'id').values(*CHAMPS_FACTURE, *CHAMPS_CLIENT)
+    )
+    return _donnees_releve(lignes, timezone.localdate(relance.date_creation))
+
+
+def _corps_email(donnees):
+    lignes = ''.join(
+        f"""
+                    <tr>
+                        <td style="padding: 5px;">{escape(facture['numero'])}</td>
+                        <td style="padding: 5px;">{facture['date_echeance']}</td>
+                        <td style="padding: 5px; text-align: right;">{facture['solde']:,.0f} FCFA</td>
+                    </tr>"""
+        for facture in donnees['factures']
+    )
+    return f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+                <h2 style="color: #f59e0b; border-bottom: 2px solid #f59e0b; padding-bottom: 10px;">
+                    Relance - factures en retard
+                </h2>
+
+                <p>Bonjour {escape(donnees['client']['nom'])},</p>
+
+                <p>Sauf erreur de notre part, les factures suivantes restent impayées à ce jour :</p>
+
+                <table style="width: 100%; background: #f8fafc; border-radius: 8px; margin: 20px 0;">
+                    <tr>
+                        <th style="padding: 5px; text-align: left;">Facture</th>
+                        <th style="padding: 5px; text-align: left;">Échéance</th>
+                        <th style="padding: 5px; text-align: right;">Solde</th>
+                    </tr>{lignes}
+                    <tr>
+                        <td colspan="2" style="padding: 5px;"><strong>Total dû</strong></td>
+                        <td style="padding: 5px; text-align: right;"><strong style="color: #f59e0b;">{donnees['total_du']:,.0f} FCFA</strong></td>
+                    </tr>
+                </table>
+
+                <p>Vous trouverez le relevé détaillé en pièce jointe. Si votre paiement a été effectué entre-temps, merci de ne pas tenir compte de ce message.</p>
+
+                <p>Cordialement,<br>
+                <strong>{escape(donnees['site'])}</strong></p>
+            </div>
+        </body>
+        </html>
+        """
+
+
+def _rendre_releves(releves, processus):
+    """Rend les PDF des relevés, en parallèle si plusieurs processus sont demandés"""
+    if processus == 1 or len(releves) < 2:
+        return [rendre_releve_pdf(donnees) for donnees in releves]
+
+    # Les processus fils ne touchent pas à la base : on ferme les connexions
+    # avant le fork pour qu'ils n'héritent pas de sockets ouvertes.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processus) as pool:
+        return list(pool.map(rendre_releve_pdf, releves, chunksize=20))
+
+
+def lancer_relances(periode=None, utilisateur=None, processus=None, envoyer=True):
+    """
+    Exécute une campagne de relance et retourne la CampagneRelance créée,
+    ou None s'il n'y a aucun client à relancer pour la période.
+    """
+    aujourd_hui = timezone.localdate()
+    periode = periode or aujourd_hui.strftime('%Y-%m')
+
+    # S'assurer que les statuts de retard sont à jour avant la sélection
+    Facture.marquer_en_retard(aujourd_hui)
+
+    factures = (
+        Facture.objects
+        .filter(statut='EN_RETARD', total__gt=F('montant_paye'), client__est_actif=True)
+        .exclude(client__email='')
+        .exclude(client__relances__periode=periode)
+        .order_by('client_id', 'date_echeance', 'id')
+        .values(*CHAMPS_FACTURE, *CHAMPS_CLIENT)
+    )
+    releves = [
+        _donnees_releve(list(lignes), aujourd_hui)
+        for _, lignes in itertools.groupby(factures.iterator(chunk_size=2000), key=itemgetter('client_id'))
+    ]
+    if not releves:
+        return None
+
+    pdfs = _rendre_releves(releves, processus)
+
+    with transaction.atomic():
+        campagne = CampagneRelance.objects.create(periode=periode, cree_par=utilisateur)
+
+        # Un client relancé entre-temps (autre campagne sur la même période)
+        # est ignoré par la contrainte unique (client, période), puis écarté
+        RelanceClient.objects.bulk_create([
+            RelanceClient(
+                campagne=campagne,
+                client_id=donnees['client']['id'],
+                periode=periode,
+                montant_du=donnees['total_du'],
+            )
+            for donnees in releves
+        ], ignore_conflicts=True)
+        relance_ids = dict(RelanceClient.objects.filter(campagne=campagne).values_list('client_id', 'pk'))
+        if not relance_ids:
+            campagne.delete()
+            return None
+
+        retenus = [
+            (donnees, pdf, relance_ids[donnees['client']['id']])
+            for donnees, pdf in zip(releves, pdfs)
+            if donnees['client']['id'] in relance_ids
+        ]
+        campagne.nb_clients = len(retenus)
+        campagne.nb_factures = sum(len(donnees['factures']) for donnees, _, _ in retenus)
+        campagne.montant_total = sum(donnees['total_du'] for donnees, _, _ in retenus)
+        campagne.save(update_fields=['nb_clients', 'nb_factures', 'montant_total'])
+
+        EmailSortant.objects.bulk_create([
+            EmailSortant(
+                sujet=f"Relance - factures en retard - {donnees['client']['nom']}",
+                corps=_corps_email(donnees),
+                est_html=True,
+                destinataires=donnees['client']['email'],
+                type_piece_jointe='relance',
+                id_piece_jointe=relance_id,
+            )
+            for donnees, _, relance_id in retenus
+        ])
+        email_ids = dict(
+            EmailSortant.objects
+            .filter(type_piece_jointe='relance', id_piece_jointe__in=list(relance_ids.values()))
+            .values_list('id_piece_jointe', 'pk')
+        )
+        RelanceClient.objects.bulk_update(
+            [RelanceClient(pk=relance_id, email_id=email_id) for relance_id, email_id in email_ids.items()],
+            ['email'],
+        )
+
+        FacturesRelancees = RelanceClient.factures.through
+        FacturesRelancees.objects.bulk_create([
+            FacturesRelancees(relanceclient_id=relance_id, facture_id=facture['id'])
+            for donnees, _, relance_id in retenus
+            for facture in donnees['factures']
+        ])
+
+    caches['documents'].set_many({
+        f'pdf:relance:{relance_id}': pdf for _, pdf, relance_id in retenus
+    })
+
+    if envoyer:
+        envoyer_lot(taille=len(email_ids), ids=list(email_ids.values()))
+
+    return campagne
@@ -0,0 +1,95 @@
+# ventes/signals.py - Mise à jour de la table de faits des ventes et de l'encours client
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .analytique import planifier_recalcul
+from .credit import contribution_commande, contribution_facture, appliquer_variation
+from .models import Facture, LigneFacture, LigneCommandeVente, CommandeVente
+
+
+@receiver(pre_save, sender=Facture)
+def memoriser_etat_facture(sender, instance, **kwargs):
+    """Retient l'état d'origine (le client d'une facture peut être modifié)"""
+    instance._etat_initial = None
+    if instance.pk:
+        instance._etat_initial = (
+            Facture.objects
+            .filter(pk=instance.pk)
+            .values('date_facture', 'client_id', 'statut', 'total', 'montant_paye')
+            .first()
+        )
+
+
+def _encours_facture(facture):
+    return facture['client_id'], contribution_facture(facture['statut'], facture['total'], facture['montant_paye'])
+
+
+@receiver(post_save, sender=Facture)
+def facture_enregistree(sender, instance, **kwargs):
+    etat_initial = getattr(instance, '_etat_initial', None)
+    if etat_initial:
+        planifier_recalcul(etat_initial['date_facture'], etat_initial['client_id'])
+    planifier_recalcul(instance.date_facture, instance.client_id)
+
+    appliquer_variation(
+        _encours_facture(etat_initial) if etat_initial else None,
+        (instance.client_id, contribution_facture(instance.statut, instance.total, instance.montant_paye)),
+    )
+
+
+@receiver(post_delete, sender=Facture)
+def facture_supprimee(sender, instance, **kwargs):
+    planifier_recalcul(instance.date_facture, instance.client_id)
+    appliquer_variation(
+        (instance.client_id, contribution_facture(instance.statut, instance.total, instance.montant_paye)),
+        None,
+    )
+
+
+@receiver(post_save, sender=LigneFacture)
+@receiver(post_delete, sender=LigneFacture)
+def ligne_facture_modifiee(sender, instance, **kwargs):
+    tranche = Facture.objects.filter(pk=instance.facture_id).values_list('date_facture', 'client_id').first()
+    if tranche:
+        planifier_recalcul(*tranche)
+
+
+@receiver(post_save, sender=LigneCommandeVente)
+@receiver(post_delete, sender=LigneCommandeVente)
+def ligne_commande_modifiee(sender, instance, **kwargs):
+    """Les factures sans lignes propres reprennent les lignes de leur commande"""
+    tranches = (
+        Facture.objects
+        .filter(commande_vente_id=instance.commande_id, lignes__isnull=True)
+        .values_list('date_facture', 'client_id')
+        .distinct()
+    )
+    for tranche in tranches:
+        planifier_recalcul(*tranche)
+
+
+# Encours client : commandes confirmées non facturées
+
+@receiver(pre_save, sender=CommandeVente)
+def memoriser_etat_commande(sender, instance, **kwargs):
+    instance._etat_initial = None
+    if instance.pk:
+        instance._etat_initial = (
+            CommandeVente.objects.filter(pk=instance.pk).values('client_id', 'statut', 'total').first()
+        )
+
+
+@receiver(post_save, sender=CommandeVente)
+def commande_enregistree(sender, instance, **kwargs):
+    etat_initial = getattr(instance, '_etat_initial', None)
+    appliquer_variation(
+        (etat_initial['client_id'], contribution_commande(etat_initial['statut'], etat_initial['total']))
+        if etat_initial else None,
+        (instance.client_id, contribution_commande(instance.statut, instance.total)),
+    )
+
+
+@receiver(post_delete, sender=CommandeVente)
+def commande_supprimee(sender, instance, **kwargs):
+    appliquer_variation((instance.client_id, contribution_commande(instance.statut, instance.total)), None)
@@ -1,3 +1,574 @@
-from django.test import TestCase
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import Client as TestClient, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from base.models import Client, EmailSortant
+from stock.models import Produit, Entrepot, MouvementStock
+from . import documents, relances
+from .analytique import reconstruire_faits
+from .credit import recalculer_encours
+from .models import (
+    CampagneRelance, CommandeVente, LigneCommandeVente, Facture, FaitVenteJournalier, HistoriqueStatutFacture,
+    LigneFacture, RelanceClient,
+)
+from .views import filtrer_factures
+
+
+class DonneesCredit:
+    """Client, entrepôt et produit en stock communs aux tests d'encours"""
+
+    def creer_donnees(self):
+        self.utilisateur = User.objects.create_user('vendeur', password='secret')
+        self.client_vente = Client.objects.create(
+            code='C001', nom='Client test', email='client@example.com', telephone='0',
+            adresse='-', ville='Dakar', pays='Sénégal', limite_credit=Decimal('1000'),
+        )
+        self.entrepot = Entrepot.objects.create(code='E01', nom='Principal', adresse='-', responsable=self.utilisateur)
+        self.produit = Produit.objects.create(
+            code='P001', nom='Produit test', prix_achat=Decimal('50'), prix_vente=Decimal('100'), taux_tva=Decimal('0'),
+        )
+        MouvementStock.objects.create(
+            produit=self.produit, entrepot=self.entrepot, type_mouvement='ENTREE', quantite=1000, reference='INIT',
+        )
+
+    def creer_commande(self, numero, quantite):
+        commande = CommandeVente.objects.create(
+            numero_commande=numero, client=self.client_vente, entrepot=self.entrepot, date_livraison=date.today(),
+        )
+        LigneCommandeVente.objects.create(
+            commande=commande, produit=self.produit, quantite=quantite, prix_unitaire=self.produit.prix_vente,
+        )
+        commande.calculer_totaux()
+        return commande
+
+    def encours(self):
+        return Client.objects.get(pk=self.client_vente.pk).encours_credit
+
+
+class EncoursCreditTests(DonneesCredit, TestCase):
+
+    def setUp(self):
+        self.creer_donnees()
+
+    def test_cycle_commande_facture_paiement(self):
+        commande = self.creer_commande('CV-001', 3)
+        self.assertEqual(self.encours(), 0)
+
+        commande.statut = 'CONFIRME'
+        commande.save()
+        self.assertEqual(self.encours(), Decimal('300'))
+
+        commande.statut = 'EXPEDIE'
+        commande.save()
+        self.assertEqual(self.encours(), Decimal('300'))
+
+        # La facture reprend la dette de la commande
+        facture = Facture.objects.create(
+            numero_facture='FA-001', commande_vente=commande, client=self.client_vente, date_echeance=date.today(),
+            sous_total=commande.sous_total, montant_tva=commande.montant_tva, total=commande.total,
+        )
+        commande.statut = 'FACTURE'
+        commande.save()
+        self.assertEqual(self.encours(), Decimal('300'))
+
+        facture.montant_paye = Decimal('100')
+        facture.save()
+        self.assertEqual(self.encours(), Decimal('200'))
+
+        facture.montant_paye = Decimal('300')
+        facture.statut = 'PAYEE'
+        facture.save()
+        self.assertEqual(self.encours(), 0)
+
+    def test_annulation_et_suppression(self):
+        commande = self.creer_commande('CV-001', 2)
+        commande.statut = 'CONFIRME'
+        commande.save()
+        commande.statut = 'ANNULE'
+        commande.save()
+        self.assertEqual(self.encours(), 0)
+
+        facture = Facture.objects.create(
+            numero_facture='FA-001', client=self.client_vente, date_echeance=date.today(),
+            sous_total=Decimal('400'), montant_tva=0, total=Decimal('400'),
+        )
+        self.assertEqual(self.encours(), Decimal('400'))
+        facture.delete()
+        self.assertEqual(self.encours(), 0)
+
+    def test_instances_perimees(self):
+        """Deux commandes confirmées à partir d'instances client lues avant la première mise à jour"""
+        premiere = self.creer_commande('CV-001', 2)
+        seconde = self.creer_commande('CV-002', 3)
+        premiere.client, seconde.client = Client.objects.get(pk=self.client_vente.pk), Client.objects.get(pk=self.client_vente.pk)
+
+        premiere.statut = 'CONFIRME'
+        premiere.save()
+        seconde.statut = 'CONFIRME'
+        seconde.save()
+        self.assertEqual(self.encours(), Decimal('500'))
+
+    def test_recalcul_identique(self):
+        commande = self.creer_commande('CV-001', 2)
+        commande.statut = 'CONFIRME'
+        commande.save()
+        Facture.objects.create(
+            numero_facture='FA-001', client=self.client_vente, date_echeance=date.today(),
+            sous_total=Decimal('400'), montant_tva=0, total=Decimal('400'), montant_paye=Decimal('150'),
+        )
+        maintenu = self.encours()
+
+        Client.objects.update(encours_credit=0)
+        recalculer_encours()
+        self.assertEqual(self.encours(), maintenu)
+        self.assertEqual(maintenu, Decimal('450'))
+
+        # Reprise des clients existants par la migration
+        Client.objects.update(encours_credit=0)
+        import_module('ventes.migrations.0009_calculer_encours_credit').calculer_encours_credit(django_apps, None)
+        self.assertEqual(self.encours(), maintenu)
+
+    def test_confirmation_bloquee_au_dela_de_la_limite(self):
+        self.client.force_login(self.utilisateur)
+        premiere = self.creer_commande('CV-001', 6)
+        seconde = self.creer_commande('CV-002', 5)
+
+        self.client.post(reverse('ventes:confirmer_commande_vente', args=[premiere.pk]))
+        self.client.post(reverse('ventes:confirmer_commande_vente', args=[seconde.pk]))
+
+        premiere.refresh_from_db()
+        seconde.refresh_from_db()
+        self.assertEqual(premiere.statut, 'CONFIRME')
+        self.assertEqual(seconde.statut, 'BROUILLON')
+        self.assertEqual(self.encours(), Decimal('600'))
+
+    def test_confirmation_verrouille_commande_et_client(self):
+        self.client.force_login(self.utilisateur)
+        commande = self.creer_commande('CV-001', 2)
+        verrous = []
+        select_for_update = QuerySet.select_for_update
+        niveau_test = len(connection.atomic_blocks)
+
+        def espion(queryset, *args, **kwargs):
+            verrous.append((queryset.model, len(connection.atomic_blocks) > niveau_test))
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'select_for_update', espion):
+            self.client.post(reverse('ventes:confirmer_commande_vente', args=[commande.pk]))
+
+        # Commande puis client verrouillés dans la transaction de la vue
+        self.assertEqual(verrous, [(CommandeVente, True), (Client, True)])
+        self.assertEqual(CommandeVente.objects.get(pk=commande.pk).statut, 'CONFIRME')
+
+    @override_settings(VENTES_BLOCAGE_LIMITE_CREDIT=False)
+    def test_confirmation_avertie_sans_blocage(self):
+        self.client.force_login(self.utilisateur)
+        commande = self.creer_commande('CV-001', 11)
+
+        self.client.post(reverse('ventes:confirmer_commande_vente', args=[commande.pk]))
+
+        commande.refresh_from_db()
+        self.assertEqual(commande.statut, 'CONFIRME')
+        self.assertEqual(self.encours(), Decimal('1100'))
+
+
+class MarquerEnRetardTests(DonneesCredit, TestCase):
+    """Commande marquer_factures_en_retard : factures envoyées échues seulement"""
+
+    def setUp(self):
+        self.creer_donnees()
+        echeance = date.today() - timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.factures = {}
+            for numero, statut, paye in [
+                ('FA-ENV', 'ENVOYEE', Decimal('0')),
+                ('FA-BRO', 'BROUILLON', Decimal('0')),
+                ('FA-PAY', 'ENVOYEE', Decimal('300')),
+            ]:
+                commande = self.creer_commande(f'CV-{numero}', 3)
+                self.factures[numero] = Facture.objects.create(
+                    numero_facture=numero, commande_vente=commande, client=self.client_vente,
+                    date_echeance=echeance, statut=statut, montant_paye=paye,
+                    sous_total=commande.sous_total, montant_tva=commande.montant_tva, total=commande.total,
+                )
+
+    def faits(self):
+        return sorted(FaitVenteJournalier.objects.values_list('jour', 'client_id', 'produit_id', 'quantite', 'montant_ht', 'nb_factures'))
+
+    def test_commande(self):
+        encours = self.encours()
+        sortie = StringIO()
+        with self.captureOnCommitCallbacks(execute=True) as rappels:
+            call_command('marquer_factures_en_retard', stdout=sortie)
+        self.assertIn('1 facture(s) passée(s) en retard', sortie.getvalue())
+        # Les faits des factures modifiées sont recalculés à la validation
+        self.assertTrue(rappels)
+
+        statuts = dict(Facture.objects.values_list('numero_facture', 'statut'))
+        self.assertEqual(statuts, {'FA-ENV': 'EN_RETARD', 'FA-BRO': 'BROUILLON', 'FA-PAY': 'ENVOYEE'})
+        historique = HistoriqueStatutFacture.objects.get()
+        self.assertEqual(
+            (historique.facture_id, historique.ancien_statut, historique.nouveau_statut, historique.origine),
+            (self.factures['FA-ENV'].pk, 'ENVOYEE', 'EN_RETARD', 'ECHEANCE'),
+        )
+        self.assertEqual(self.encours(), encours)
+
+        # Déjà en retard : rien à faire au second passage
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('marquer_factures_en_retard', stdout=StringIO())
+        self.assertEqual(HistoriqueStatutFacture.objects.count(), 1)
+
+        faits = self.faits()
+        self.assertEqual(len(faits), 1)
+        reconstruire_faits()
+        self.assertEqual(self.faits(), faits)
+
+    def test_date_de_reference(self):
+        veille = (date.today() - timedelta(days=1)).isoformat()
+        call_command('marquer_factures_en_retard', date=veille, stdout=StringIO())
+        self.assertFalse(Facture.objects.filter(statut='EN_RETARD').exists())
+
+
+class ListeFacturesTests(DonneesCredit, TestCase):
+    """Filtres de la liste des factures et pagination sans second comptage"""
+
+    def setUp(self):
+        self.creer_donnees()
+        self.autre_client = Client.objects.create(
+            code='C002', nom='Autre client', email='autre@example.com', telephone='0',
+            adresse='-', ville='Dakar', pays='Sénégal',
+        )
+        aujourdhui = date.today()
+        self.factures = {}
+        for i, (client, statut, total, paye, jours) in enumerate([
+            (self.client_vente, 'ENVOYEE', '100', '0', 0),
+            (self.client_vente, 'PAYEE', '200', '200', 10),
+            (self.client_vente, 'EN_RETARD', '300', '50', 40),
+            (self.autre_client, 'ENVOYEE', '400', '100', 5),
+            (self.autre_client, 'BROUILLON', '500', '0', 60),
+        ]):
+            commande = CommandeVente.objects.create(
+                numero_commande=f'CV-{i}', client=client, entrepot=self.entrepot, date_livraison=aujourdhui,
+            )
+            self.factures[i] = Facture.objects.create(
+                numero_facture=f'FA-{i}', commande_vente=commande, client=client, statut=statut,
+                date_echeance=aujourdhui + timedelta(days=30 - jours),
+                sous_total=Decimal(total), montant_tva=0, total=Decimal(total), montant_paye=Decimal(paye),
+            )
+            Facture.objects.filter(pk=self.factures[i].pk).update(date_facture=aujourdhui - timedelta(days=jours))
+
+    def numeros(self, **parametres):
+        factures, _ = filtrer_factures(parametres)
+        return sorted(factures.values_list('numero_facture', flat=True))
+
+    def test_filtres(self):
+        aujourdhui = date.today()
+        self.assertEqual(len(self.numeros()), 5)
+        self.assertEqual(self.numeros(statut='ENVOYEE'), ['FA-0', 'FA-3'])
+        self.assertEqual(self.numeros(client=str(self.autre_client.pk)), ['FA-3', 'FA-4'])
+        self.assertEqual(
+            self.numeros(date_debut=(aujourdhui - timedelta(days=10)).isoformat(), date_fin=aujourdhui.isoformat()),
+            ['FA-0', 'FA-1', 'FA-3'],
+        )
+        self.assertEqual(self.numeros(echeance_fin=aujourdhui.isoformat()), ['FA-2', 'FA-4'])
+        self.assertEqual(self.numeros(solde='ouvert'), ['FA-0', 'FA-2', 'FA-3', 'FA-4'])
+        self.assertEqual(self.numeros(solde='solde'), ['FA-1'])
+        self.assertEqual(self.numeros(solde_min='300'), ['FA-3', 'FA-4'])
+        self.assertEqual(self.numeros(recherche='autre', statut='ENVOYEE'), ['FA-3'])
+        # Paramètres invalides : ignorés
+        self.assertEqual(len(self.numeros(date_debut='31/12/2025', client='x', solde_min='abc')), 5)
+
+    def test_pagination(self):
+        self.client.force_login(self.utilisateur)
+        url = reverse('ventes:liste_factures')
+        with mock.patch('ventes.views.FACTURES_PAR_PAGE', 2):
+            with CaptureQueriesContext(connection) as requetes:
+                reponse = self.client.get(url, {'statut': 'ENVOYEE', 'page': 1})
+            # Le nombre de factures vient de l'agrégat des totaux : pas de COUNT(*) du paginateur
+            self.assertFalse(any('__count' in requete['sql'] for requete in requetes))
+            contenu = reponse.content.decode()
+            self.assertIn('sur 2 facture(s)', contenu)
+            self.assertNotIn('FA-1', contenu)
+
+            # Dernière page, tri par date de facture décroissante
+            contenu = self.client.get(url, {'page': 3}).content.decode()
+        self.assertIn('Affichage de 5 à 5 sur 5 facture(s)', contenu)
+        self.assertIn('FA-4', contenu)
+        self.assertNotIn('FA-0', contenu)
+
+
+class MontantsLignesTests(DonneesCredit, TestCase):
+    """Montants calculés en SQL (avec_montants, totaux) identiques aux propriétés des lignes"""
+
+    LIGNES = [
+        # quantité, prix unitaire, remise (%), TVA (%)
+        (7, Decimal('19.99'), Decimal('12.5'), Decimal('18')),
+        (3, Decimal('1333.33'), Decimal('7.25'), Decimal('5.5')),
+        (13, Decimal('0.37'), Decimal('0'), Decimal('18')),
+        (1, Decimal('999.99'), Decimal('33.33'), Decimal('0')),
+    ]
+
+    def setUp(self):
+        self.creer_donnees()
+
+    @staticmethod
+    def centimes(*montants):
+        return tuple(montant.quantize(Decimal('0.01')) for montant in montants)
+
+    def verifier(self, lignes):
+        for ligne in lignes.avec_montants():
+            self.assertEqual(
+                self.centimes(ligne.montant_ht, ligne.montant_tva_ligne, ligne.montant_ttc),
+                self.centimes(ligne.sous_total, ligne.montant_tva, ligne.total),
+            )
+        totaux = lignes.totaux()
+        self.assertEqual(
+            self.centimes(totaux['sous_total'], totaux['montant_tva'], totaux['total']),
+            self.centimes(
+                sum(ligne.sous_total for ligne in lignes),
+                sum(ligne.montant_tva for ligne in lignes),
+                sum(ligne.total for ligne in lignes),
+            ),
+        )
+        return totaux
+
+    def test_lignes_de_commande_et_de_facture(self):
+        commande = CommandeVente.objects.create(
+            numero_commande='CV-001', client=self.client_vente, entrepot=self.entrepot, date_livraison=date.today(),
+        )
+        facture = Facture.objects.create(
+            numero_facture='FA-001', commande_vente=commande, client=self.client_vente, date_echeance=date.today(),
+            sous_total=0, montant_tva=0, total=0,
+        )
+        for quantite, prix, remise, tva in self.LIGNES:
+            LigneCommandeVente.objects.create(
+                commande=commande, produit=self.produit, quantite=quantite, prix_unitaire=prix, remise=remise, taux_tva=tva,
+            )
+            LigneFacture.objects.create(
+                facture=facture, produit=self.produit, quantite=quantite, prix_unitaire=prix, remise=remise, taux_tva=tva,
+            )
+
+        totaux = self.verifier(commande.lignecommandevente_set.all())
+        self.verifier(facture.lignes.all())
+
+        # Totaux enregistrés sur la commande, arrondis au centime
+        commande.calculer_totaux()
+        commande.refresh_from_db()
+        self.assertEqual(
+            (commande.sous_total, commande.montant_tva, commande.total),
+            self.centimes(totaux['sous_total'], totaux['montant_tva'], totaux['total']),
+        )
+
+
+class FaitsVentesTests(DonneesCredit, TestCase):
+    """Table de faits tenue à jour par les signaux, identique à une reconstruction complète"""
+
+    def setUp(self):
+        self.creer_donnees()
+
+    def creer_facture(self, numero, quantite, lignes_propres=False):
+        with self.captureOnCommitCallbacks(execute=True):
+            commande = self.creer_commande(f'CV-{numero}', quantite)
+            facture = Facture.objects.create(
+                numero_facture=numero, commande_vente=commande, client=self.client_vente,
+                date_echeance=date.today(), statut='ENVOYEE',
+                sous_total=commande.sous_total, montant_tva=commande.montant_tva, total=commande.total,
+            )
+            if lignes_propres:
+                LigneFacture.objects.create(
+                    facture=facture, produit=self.produit, quantite=quantite,
+                    prix_unitaire=Decimal('100'), remise=Decimal('10'), taux_tva=Decimal('18'),
+                )
+        return facture
+
+    def faits(self):
+        return list(FaitVenteJournalier.objects.order_by('jour', 'client', 'produit').values_list(
+            'jour', 'client_id', 'produit_id', 'entrepot_id', 'quantite', 'montant_ht', 'montant_tva',
+            'cout_achat', 'marge', 'nb_factures',
+        ))
+
+    def test_faits_tenus_par_les_signaux(self):
+        # Facture sans lignes propres : lignes de la commande
+        facture = self.creer_facture('FA-1', 3)
+        self.assertEqual(
+            [fait[4:] for fait in self.faits()],
+            [(3, Decimal('300'), Decimal('0'), Decimal('150'), Decimal('150'), 1)],
+        )
+
+        # Seconde facture du jour avec ses propres lignes (remise 10 %, TVA 18 %) : même fait
+        remisee = self.creer_facture('FA-2', 2, lignes_propres=True)
+        self.assertEqual(
+            [fait[4:] for fait in self.faits()],
+            [(5, Decimal('480'), Decimal('32.40'), Decimal('250'), Decimal('230'), 2)],
+        )
+
+        # Ligne de commande modifiée : le fait de la facture qui la reprend est recalculé
+        with self.captureOnCommitCallbacks(execute=True):
+            ligne = facture.commande_vente.lignecommandevente_set.get()
+            ligne.quantite = 4
+            ligne.save()
+        self.assertEqual(self.faits()[0][4], 6)
+
+        # Facture annulée puis supprimée : plus comptée
+        with self.captureOnCommitCallbacks(execute=True):
+            remisee.statut = 'ANNULEE'
+            remisee.save()
+        self.assertEqual([fait[4:6] for fait in self.faits()], [(4, Decimal('400'))])
+        with self.captureOnCommitCallbacks(execute=True):
+            facture.delete()
+        self.assertEqual(self.faits(), [])
+
+    def test_reconstruction_et_migration_identiques(self):
+        self.creer_facture('FA-1', 3)
+        self.creer_facture('FA-2', 2, lignes_propres=True)
+        faits = self.faits()
+        self.assertTrue(faits)
+
+        self.assertEqual(reconstruire_faits(), len(faits))
+        self.assertEqual(self.faits(), faits)
+
+        # Remplissage initial de la table par la migration
+        FaitVenteJournalier.objects.all().delete()
+        import_module('ventes.migrations.0008_remplir_faits_ventes').remplir_faits_ventes(django_apps, None)
+        self.assertEqual(self.faits(), faits)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'documents': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'documents-tests'},
+})
+class DocumentsPDFTests(DonneesCredit, TestCase):
+    """PDF rendus une fois par version de contenu, lignes et client compris"""
+
+    def setUp(self):
+        self.creer_donnees()
+        commande = self.creer_commande('CV-001', 2)
+        self.facture = Facture.objects.create(
+            numero_facture='FA-001', commande_vente=commande, client=self.client_vente,
+            date_echeance=date.today(), sous_total=commande.sous_total, montant_tva=commande.montant_tva,
+            total=commande.total,
+        )
+
+    def rendus(self, modifier=None):
+        """Nombre de rendus complets pour deux demandes du PDF, après `modifier`"""
+        if modifier:
+            modifier()
+        facture = Facture.objects.select_related('client', 'commande_vente').get(pk=self.facture.pk)
+        with mock.patch.object(documents, 'rendre_facture_pdf', wraps=documents.rendre_facture_pdf) as rendre:
+            premier = documents.pdf_facture(facture)
+            self.assertEqual(documents.pdf_facture(facture), premier)
+        return rendre.call_count
+
+    def test_cle_de_cache_suit_le_contenu(self):
+        self.assertEqual(self.rendus(), 1)
+        self.assertEqual(self.rendus(), 0)
+        # Ni la facture ni la commande ne sont enregistrées : la clé change quand même
+        self.assertEqual(self.rendus(lambda: LigneCommandeVente.objects.update(quantite=3)), 1)
+        self.assertEqual(self.rendus(lambda: Produit.objects.update(nom='Produit renommé')), 1)
+        self.assertEqual(self.rendus(lambda: Client.objects.update(nom='Client renommé')), 1)
+        self.assertEqual(self.rendus(), 0)
+
+    def test_mesure_froid_et_cache(self):
+        sortie = StringIO()
+        call_command('mesurer_rendu_pdf', 'facture', str(self.facture.pk), repetitions=2, stdout=sortie)
+        self.assertIn('En cache', sortie.getvalue())
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'documents': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'relances-tests'},
+})
+class RelancesTests(DonneesCredit, TestCase):
+    """Campagne de relance : une relance par client et par période, emails échappés"""
+
+    def setUp(self):
+        self.creer_donnees()
+        self.autre_client = Client.objects.create(
+            code='C002', nom='<script>Dupont & fils</script>', email='dupont@example.com', telephone='0',
+            adresse='-', ville='Thiès', pays='Sénégal',
+        )
+        for numero, client in [('FA-001', self.client_vente), ('FA-002', self.autre_client), ('FA-003', self.autre_client)]:
+            Facture.objects.create(
+                numero_facture=numero, client=client, statut='ENVOYEE', date_echeance=date.today() - timedelta(days=10),
+                sous_total=Decimal('100'), montant_tva=Decimal('0'), total=Decimal('100'),
+            )
+
+    def test_campagne(self):
+        campagne = relances.lancer_relances(periode='2026-10', processus=1)
+        self.assertEqual((campagne.nb_clients, campagne.nb_factures, campagne.montant_total), (2, 3, Decimal('300')))
+
+        relance = RelanceClient.objects.get(client=self.autre_client)
+        self.assertEqual(sorted(relance.factures.values_list('numero_facture', flat=True)), ['FA-002', 'FA-003'])
+        self.assertEqual((relance.email.type_piece_jointe, relance.email.id_piece_jointe), ('relance', relance.pk))
+        self.assertIn('Bonjour &lt;script&gt;Dupont &amp; fils&lt;/script&gt;,', relance.email.corps)
+        self.assertNotIn('<script>', relance.email.corps)
+
+        # Emails envoyés avec leur relevé PDF
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertTrue(all(message.attachments for message in mail.outbox))
+
+        # Même période : personne à relancer
+        self.assertIsNone(relances.lancer_relances(periode='2026-10', processus=1))
+
+    def test_client_relance_par_une_campagne_simultanee(self):
+        rendre = relances._rendre_releves
+
+        def campagne_concurrente(releves, processus):
+            # Pendant le rendu des PDF, une autre campagne relance déjà un client
+            RelanceClient.objects.create(
+                campagne=CampagneRelance.objects.create(periode='2026-10'),
+                client=self.autre_client, periode='2026-10', montant_du=Decimal('200'),
+            )
+            return rendre(releves, processus)
+
+        with mock.patch.object(relances, '_rendre_releves', campagne_concurrente):
+            campagne = relances.lancer_relances(periode='2026-10', processus=1, envoyer=False)
+
+        self.assertEqual((campagne.nb_clients, campagne.nb_factures), (1, 1))
+        self.assertEqual(list(campagne.relances.values_list('client_id', flat=True)), [self.client_vente.pk])
+        self.assertEqual(EmailSortant.objects.count(), 1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class EncoursCreditConcurrenceTests(DonneesCredit, TransactionTestCase):
+    """Confirmations simultanées par la vue : le verrou sur le client sérialise les vérifications"""
+
+    def setUp(self):
+        self.creer_donnees()
+
+    def test_confirmations_simultanees(self):
+        commandes = [self.creer_commande(f'CV-{i:03d}', 3) for i in range(6)]
+        depart = threading.Barrier(len(commandes))
+
+        def confirmer(commande_id):
+            try:
+                navigateur = TestClient()
+                navigateur.force_login(self.utilisateur)
+                depart.wait()
+                navigateur.post(reverse('ventes:confirmer_commande_vente', args=[commande_id]))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirmer, args=(commande.pk,)) for commande in commandes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Limite 1000, commandes de 300 : trois confirmations au plus
+        confirmees = CommandeVente.objects.filter(statut='CONFIRME')
+        self.assertEqual(confirmees.count(), 3)
+        self.assertEqual(self.encours(), sum(commande.total for commande in confirmees))
@@ -6,15 +6,20 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
 from django.http import HttpResponse, JsonResponse
-from django.db.models import Q, Sum
+from django.core.paginator import Paginator
+from django.db.models import Q, Sum, Count, F
+from django.db.models.functions import Coalesce
 from datetime import datetime, timedelta
 from datetime import date
 from django.utils import timezone 
 from decimal import Decimal, InvalidOperation  # AJOUT: Import Decimal
 from .models import CommandeVente, LigneCommandeVente, Facture
+from .documents import pdf_commande, pdf_facture
+from .credit import verifier_limite_credit
 from stock.models import Produit, MouvementStock, Entrepot  # Entrepot importé d'ici
+from stock.tarifs import tarifs_produits
 from base.models import Client
-from django.core.mail import EmailMessage
+from base.emails import mettre_en_file
 from django.conf import settings
 from io import BytesIO
 
@@ -24,9 +29,10 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import cm
 
-import csv
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from base.exports import (
+    Colonne, DefinitionExport, format_date, format_choix, reponse_csv, reponse_xlsx,
+    reponse_export_differe, nom_fichier_horodate,
+)
 
 # ========== GESTION DES COMMANDES DE VENTE ==========
 
@@ -245,7 +251,8 @@ def modifier_commande_vente(request, pk):
 @transaction.atomic
 def confirmer_commande_vente(request, pk):
     """Vue pour confirmer une commande de vente"""
-    commande = get_object_or_404(CommandeVente, pk=pk)
+    commandes = CommandeVente.objects.select_for_update() if request.method == 'POST' else CommandeVente.objects
+    commande = get_object_or_404(commandes, pk=pk)
     
     if commande.statut != 'BROUILLON':
         messages.error(request, 'Cette commande ne peut pas être confirmée.')
@@ -270,6 +277,19 @@ def confirmer_commande_vente(request, pk):
             }
             return render(request, 'ventes/erreur_confirmation.jinja', contexte)
         
+        # Vérifier la limite de crédit (le client reste verrouillé jusqu'à la fin de la transaction)
+        depassement = verifier_limite_credit(commande)
+        if depassement:
+            message = (
+                f"Limite de crédit dépassée pour {commande.client.nom} : "
+                f"encours {depassement['encours']:,.0f} FCFA + commande {depassement['montant']:,.0f} FCFA "
+                f"> limite {depassement['limite']:,.0f} FCFA."
+            )
+            if settings.VENTES_BLOCAGE_LIMITE_CREDIT:
+                messages.error(request, message)
+                return redirect('ventes:details_commande_vente', pk=pk)
+            messages.warning(request, message)
+        
         # Confirmer la commande
         commande.statut = 'CONFIRME'
         commande.save()
@@ -486,30 +506,112 @@ def supprimer_commande_vente(request, pk):
 
 # ========== GESTION DES FACTURES ==========
 
-@login_required
-def liste_factures(request):
-    """Vue pour afficher la liste des factures"""
-    filtre_statut = request.GET.get('statut', '')
-    recherche = request.GET.get('recherche', '')
-    
-    factures = Facture.objects.select_related('client', 'commande_vente')
-    
-    if filtre_statut:
-        factures = factures.filter(statut=filtre_statut)
-    
-    if recherche:
+FACTURES_PAR_PAGE = 50
+
+
+def _date_parametre(valeur):
+    """Date AAAA-MM-JJ d'un paramètre GET, None si absente ou invalide"""
+    try:
+        return date.fromisoformat(valeur) if valeur else None
+    except ValueError:
+        return None
+
+
+def _montant_parametre(valeur):
+    try:
+        return Decimal(valeur) if valeur else None
+    except InvalidOperation:
+        return None
+
+
+def filtrer_factures(parametres):
+    """
+    Applique les filtres de la liste des factures. Chaque filtre correspond à
+    un index de Facture : (statut, date_facture), (client, statut), date_echeance.
+    """
+    filtres = {
+        'statut': parametres.get('statut', ''),
+        'recherche': parametres.get('recherche', '').strip(),
+        'client': parametres.get('client', ''),
+        'date_debut': _date_parametre(parametres.get('date_debut')),
+        'date_fin': _date_parametre(parametres.get('date_fin')),
+        'echeance_debut': _date_parametre(parametres.get('echeance_debut')),
+        'echeance_fin': _date_parametre(parametres.get('echeance_fin')),
+        'solde': parametres.get('solde', ''),
+        'solde_min': _montant_parametre(parametres.get('solde_min')),
+    }
+
+    factures = Facture.objects.all()
+
+    if filtres['statut']:
+        factures = factures.filter(statut=filtres['statut'])
+    if filtres['client'].isdigit():
+        factures = factures.filter(client_id=int(filtres['client']))
+    if filtres['date_debut']:
+        factures = factures.filter(date_facture__gte=filtres['date_debut'])
+    if filtres['date_fin']:
+        factures = factures.filter(date_facture__lte=filtres['date_fin'])
+    if filtres['echeance_debut']:
+        factures = factures.filter(date_echeance__gte=filtres['echeance_debut'])
+    if filtres['echeance_fin']:
+        factures = factures.filter(date_echeance__lte=filtres['echeance_fin'])
+
+    if filtres['solde'] == 'ouvert':
+        factures = factures.filter(total__gt=F('montant_paye'))
+    elif filtres['solde'] == 'solde':
+        factures = factures.filter(total__lte=F('montant_paye'))
+    if filtres['solde_min'] is not None:
+        factures = factures.filter(total__gte=F('montant_paye') + filtres['solde_min'])
+
+    if filtres['recherche']:
         factures = factures.filter(
-            Q(numero_facture__icontains=recherche) |
-            Q(client__nom__icontains=recherche)
+            Q(numero_facture__icontains=filtres['recherche']) |
+            Q(client__nom__icontains=filtres['recherche'])
         )
-    
-    factures = factures.order_by('-date_creation')
-    
+
+    return factures, filtres
+
+
+@login_required
+def liste_factures(request):
+    """Vue pour afficher la liste des factures (paginée)"""
+    factures, filtres = filtrer_factures(request.GET)
+
+    # Totaux de la sélection complète (pas seulement de la page) en une requête
+    totaux = factures.aggregate(
+        nombre=Count('id'),
+        total_general=Coalesce(Sum('total'), Decimal('0')),
+        total_paye=Coalesce(Sum('montant_paye'), Decimal('0')),
+        factures_payees=Count('id', filter=Q(statut='PAYEE')),
+        factures_en_retard=Count('id', filter=Q(statut='EN_RETARD')),
+    )
+    totaux['total_solde'] = totaux['total_general'] - totaux['total_paye']
+
+    paginator = Paginator(
+        factures.select_related('client', 'commande_vente').order_by('-date_facture', '-id'),
+        FACTURES_PAR_PAGE,
+    )
+    paginator.count = totaux['nombre']  # déjà compté : pas de second COUNT(*)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    # Paramètres à conserver dans les liens de pagination et les filtres rapides
+    parametres = request.GET.copy()
+    parametres.pop('page', None)
+    parametres_sans_statut = parametres.copy()
+    parametres_sans_statut.pop('statut', None)
+
     contexte = {
-        'factures': factures,
-        'filtre_statut': filtre_statut,
-        'recherche': recherche,
+        'factures': page_obj,
+        'page_obj': page_obj,
+        'totaux': totaux,
+        'filtres': filtres,
+        'filtre_statut': filtres['statut'],
+        'recherche': filtres['recherche'],
+        'filtres_actifs': any(valeur not in (None, '') for valeur in filtres.values()),
+        'parametres': parametres.urlencode(),
+        'parametres_sans_statut': parametres_sans_statut.urlencode(),
         'statuts': Facture.STATUTS,
+        'clients': Client.objects.filter(est_actif=True).order_by('nom').values('id', 'nom'),
         'aujourdhui': date.today().isoformat(),
     }
     
@@ -576,7 +678,9 @@ def envoyer_facture(request, pk):
 @transaction.atomic
 def enregistrer_paiement(request, pk):
     """Vue pour enregistrer un paiement sur une facture"""
-    facture = get_object_or_404(Facture, pk=pk)
+    # Verrouiller la facture : deux paiements simultanés ne doivent pas s'écraser
+    factures = Facture.objects.select_for_update() if request.method == 'POST' else Facture.objects
+    facture = get_object_or_404(factures, pk=pk)
     
     if request.method == 'POST':
         # Récupérer les données du formulaire
@@ -667,16 +771,15 @@ def facture_pdf(request, pk):
 @login_required
 def obtenir_prix_produit(request, pk):
     """API AJAX pour obtenir le prix d'un produit"""
-    try:
-        produit = Produit.objects.get(pk=pk)
-        return JsonResponse({
-            'succes': True,
-            'prix_vente': float(produit.prix_vente),
-            'taux_tva': float(produit.taux_tva),
-            'stock_actuel': produit.stock_actuel,
-        })
-    except Produit.DoesNotExist:
+    tarif = tarifs_produits([pk]).get(pk)
+    if tarif is None:
         return JsonResponse({'succes': False, 'erreur': 'Produit non trouvé'})
+    return JsonResponse({
+        'succes': True,
+        'prix_vente': tarif['prix_vente'],
+        'taux_tva': tarif['taux_tva'],
+        'stock_actuel': tarif['stock_actuel'],
+    })
     
 
 
@@ -702,183 +805,8 @@ def telecharger_commande_pdf(request, pk):
     """
     Télécharger la commande en PDF avec mise en page professionnelle
     """
-    commande = get_object_or_404(CommandeVente, pk=pk)
-    lignes = commande.lignecommandevente_set.select_related('produit').all()
-    
-    # Créer le buffer pour le PDF
-    buffer = BytesIO()
-    
-    # Créer le document PDF
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        topMargin=2*cm,
-        bottomMargin=2*cm,
-        leftMargin=2*cm,
-        rightMargin=2*cm
-    )
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # ========== EN-TÊTE ==========
-    # Style pour le titre
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#6366f1'),
-        spaceAfter=30,
-        alignment=1,  # Centré
-    )
-    
-    title = Paragraph(f"Commande {commande.numero_commande}", title_style)
-    elements.append(title)
-    
-    # Date d'impression
-    date_style = ParagraphStyle(
-        'DateStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.grey,
-        alignment=1,
-    )
-    date_text = Paragraph(f"Imprimé le {datetime.now().strftime('%d/%m/%Y à %H:%M')}", date_style)
-    elements.append(date_text)
-    elements.append(Spacer(1, 30))
-    
-    # ========== INFORMATIONS COMMANDE ==========
-    info_data = [
-        ['Client:', commande.client.nom],
-        ['Code client:', commande.client.code or '-'],
-        ['Entrepôt:', commande.entrepot.nom],
-        ['Date commande:', commande.date_commande.strftime('%d/%m/%Y')],
-        ['Date livraison:', commande.date_livraison.strftime('%d/%m/%Y') if commande.date_livraison else '-'],
-        ['Statut:', commande.get_statut_display()],
-    ]
-    
-    info_table = Table(info_data, colWidths=[4*cm, 12*cm])
-    info_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#64748b')),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#1e293b')),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('LEFTPADDING', (0, 0), (-1, -1), 12),
-    ]))
-    
-    elements.append(info_table)
-    elements.append(Spacer(1, 30))
-    
-    # ========== LIGNES DE COMMANDE ==========
-    # Titre section
-    section_style = ParagraphStyle(
-        'SectionTitle',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#1e293b'),
-        spaceAfter=15,
-    )
-    elements.append(Paragraph("Lignes de commande", section_style))
-    
-    # Données du tableau
-    table_data = [['Produit', 'Qté', 'Prix unit.', 'Remise', 'TVA', 'Total']]
-    
-    for ligne in lignes:
-        table_data.append([
-            ligne.produit.nom if ligne.produit else 'Produit supprimé',
-            str(ligne.quantite),
-            f"{ligne.prix_unitaire:,.0f} FCFA",
-            f"{ligne.remise}%" if ligne.remise else "0%",
-            f"{ligne.taux_tva}%",
-            f"{ligne.total:,.0f} FCFA",
-        ])
-    
-    # Ajouter les totaux
-    table_data.append(['', '', '', '', 'Sous-total:', f"{commande.sous_total:,.0f} FCFA"])
-    table_data.append(['', '', '', '', 'TVA:', f"{commande.montant_tva:,.0f} FCFA"])
-    table_data.append(['', '', '', '', 'TOTAL:', f"{commande.total:,.0f} FCFA"])
-    
-    # Créer le tableau
-    table = Table(table_data, colWidths=[6*cm, 1.5*cm, 2.5*cm, 1.5*cm, 2*cm, 3*cm])
-    table.setStyle(TableStyle([
-        # En-tête
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        
-        # Contenu
-        ('BACKGROUND', (0, 1), (-1, -4), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -4), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -4), 0.5, colors.HexColor('#e2e8f0')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-        
-        # Lignes de totaux
-        ('BACKGROUND', (0, -3), (-1, -2), colors.HexColor('#f8fafc')),
-        ('FONTNAME', (4, -3), (-1, -1), 'Helvetica-Bold'),
-        ('ALIGN', (4, -3), (-1, -1), 'RIGHT'),
-        ('ALIGN', (5, -3), (-1, -1), 'RIGHT'),
-        
-        # Ligne total final
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e0e7ff')),
-        ('TEXTCOLOR', (4, -1), (-1, -1), colors.HexColor('#6366f1')),
-        ('FONTSIZE', (4, -1), (-1, -1), 11),
-        
-        # Lignes alternées
-        ('ROWBACKGROUNDS', (0, 1), (-1, -4), [colors.white, colors.HexColor('#f8fafc')]),
-    ]))
-    
-    elements.append(table)
-    
-    # ========== NOTES ==========
-    if commande.notes:
-        elements.append(Spacer(1, 30))
-        elements.append(Paragraph("Notes", section_style))
-        
-        notes_style = ParagraphStyle(
-            'NotesStyle',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#78350f'),
-            leftIndent=10,
-            rightIndent=10,
-        )
-        notes_text = Paragraph(commande.notes, notes_style)
-        elements.append(notes_text)
-    
-    # ========== FOOTER ==========
-    elements.append(Spacer(1, 40))
-    footer_style = ParagraphStyle(
-        'FooterStyle',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=1,
-    )
-    footer_text = Paragraph(
-        f"Document généré automatiquement - {getattr(settings, 'SITE_NAME', 'ERP MEA')}",
-        footer_style
-    )
-    elements.append(footer_text)
-    
-    # Construire le PDF
-    doc.build(elements)
-    
-    # Récupérer le PDF
-    pdf = buffer.getvalue()
-    buffer.close()
+    commande = get_object_or_404(CommandeVente.objects.select_related('client', 'entrepot'), pk=pk)
+    pdf = pdf_commande(commande)
     
     # Créer la réponse HTTP
     response = HttpResponse(content_type='application/pdf')
@@ -893,7 +821,7 @@ def envoyer_commande_email(request, pk):
     """
     Envoyer la commande par email au client
     """
-    commande = get_object_or_404(CommandeVente, pk=pk)
+    commande = get_object_or_404(CommandeVente.objects.select_related('client', 'entrepot'), pk=pk)
     
     # Vérifier que le client a un email
     if not commande.client.email:
@@ -901,73 +829,6 @@ def envoyer_commande_email(request, pk):
         return redirect('ventes:details_commande_vente', pk=pk)
     
     try:
-        # Générer le PDF de la commande
-        lignes = commande.lignecommandevente_set.select_related('produit').all()
-        
-        # Créer le buffer pour le PDF
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm, leftMargin=2*cm, rightMargin=2*cm)
-        
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Titre
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=24, 
-                                     textColor=colors.HexColor('#6366f1'), spaceAfter=30, alignment=1)
-        elements.append(Paragraph(f"Commande {commande.numero_commande}", title_style))
-        elements.append(Spacer(1, 20))
-        
-        # Informations
-        info_data = [
-            ['Client:', commande.client.nom],
-            ['Date commande:', commande.date_commande.strftime('%d/%m/%Y')],
-            ['Date livraison:', commande.date_livraison.strftime('%d/%m/%Y') if commande.date_livraison else '-'],
-            ['Statut:', commande.get_statut_display()],
-        ]
-        
-        info_table = Table(info_data, colWidths=[4*cm, 12*cm])
-        info_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('PADDING', (0, 0), (-1, -1), 8),
-        ]))
-        elements.append(info_table)
-        elements.append(Spacer(1, 20))
-        
-        # Lignes de commande
-        table_data = [['Produit', 'Quantité', 'Prix unitaire', 'Total']]
-        for ligne in lignes:
-            table_data.append([
-                ligne.produit.nom if ligne.produit else '-',
-                str(ligne.quantite),
-                f"{ligne.prix_unitaire:,.0f} FCFA",
-                f"{ligne.total:,.0f} FCFA",
-            ])
-        
-        table_data.append(['', '', 'TOTAL:', f"{commande.total:,.0f} FCFA"])
-        
-        table = Table(table_data, colWidths=[7*cm, 2*cm, 3.5*cm, 3.5*cm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -2), 0.5, colors.HexColor('#e2e8f0')),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e0e7ff')),
-            ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
-            ('ALIGN', (2, -1), (-1, -1), 'RIGHT'),
-        ]))
-        elements.append(table)
-        
-        if commande.notes:
-            elements.append(Spacer(1, 20))
-            elements.append(Paragraph(f"<b>Notes:</b> {commande.notes}", styles['Normal']))
-        
-        doc.build(elements)
-        pdf = buffer.getvalue()
-        buffer.close()
-        
         # Préparer l'email
         subject = f'Commande {commande.numero_commande} - {commande.client.nom}'
         
@@ -1019,22 +880,16 @@ def envoyer_commande_email(request, pk):
         </html>
         """
         
-        # Créer l'email
-        email = EmailMessage(
-            subject=subject,
-            body=html_message,
-            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@erp-mea.com'),
-            to=[commande.client.email],
+        # Mettre l'email en file d'envoi, le PDF est joint au moment de l'envoi
+        mettre_en_file(
+            sujet=subject,
+            corps=html_message,
+            destinataires=[commande.client.email],
+            est_html=True,
+            piece_jointe=('commande_vente', commande.pk),
         )
-        email.content_subtype = 'html'  # Email en HTML
-        
-        # Attacher le PDF
-        email.attach(f'commande_{commande.numero_commande}.pdf', pdf, 'application/pdf')
-        
-        # Envoyer l'email
-        email.send()
         
-        messages.success(request, f'La commande a été envoyée par email à {commande.client.email}')
+        messages.success(request, f'La commande a été mise en file d\'envoi pour {commande.client.email}')
         
     except Exception as e:
         messages.error(request, f'Erreur lors de l\'envoi de l\'email: {str(e)}')
@@ -1070,189 +925,10 @@ def imprimer_facture(request, pk):
 @login_required
 def telecharger_facture_pdf(request, pk):
     """
-    Télécharger la facture en PDF - VERSION CORRIGÉE SANS CHAMPS MANQUANTS
+    Télécharger la facture en PDF
     """
-    facture = get_object_or_404(Facture, pk=pk)
-    lignes = facture.lignes.select_related('produit').all()
-    
-    # Calculer le solde
-    total = facture.total if facture.total else 0
-    paye = facture.montant_paye if facture.montant_paye else 0
-    solde = total - paye
-    
-    # Calculer le taux de TVA (18% par défaut)
-    taux_tva = 18
-    if facture.montant_tva and facture.sous_total and facture.sous_total > 0:
-       taux_tva = round((facture.montant_tva / facture.sous_total) * 100, 2)
-
-   
-
-    # Créer le buffer pour le PDF
-    buffer = BytesIO()
-    
-    # Créer le document PDF
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        topMargin=2*cm,
-        bottomMargin=2*cm,
-        leftMargin=2*cm,
-        rightMargin=2*cm
-    )
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # ========== EN-TÊTE ==========
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=28,
-        textColor=colors.HexColor('#6366f1'),
-        spaceAfter=30,
-        alignment=1,
-    )
-    
-    title = Paragraph(f"FACTURE {facture.numero_facture}", title_style)
-    elements.append(title)
-    
-    # Date d'impression
-    date_style = ParagraphStyle(
-        'DateStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.grey,
-        alignment=1,
-    )
-    date_text = Paragraph(f"Imprimé le {datetime.now().strftime('%d/%m/%Y à %H:%M')}", date_style)
-    elements.append(date_text)
-    elements.append(Spacer(1, 30))
-    
-    # ========== INFORMATIONS FACTURE ==========
-    info_data = [
-        ['Client:', facture.client.nom],
-        ['Code client:', facture.client.code or '-'],
-        ['Date facture:', facture.date_facture.strftime('%d/%m/%Y') if facture.date_facture else 
-                         facture.date_creation.strftime('%d/%m/%Y') if facture.date_creation else '-'],
-        ['Date échéance:', facture.date_echeance.strftime('%d/%m/%Y') if facture.date_echeance else '-'],
-        ['Statut:', facture.get_statut_display()],
-    ]
-    
-    info_table = Table(info_data, colWidths=[4*cm, 12*cm])
-    info_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#64748b')),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#1e293b')),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('LEFTPADDING', (0, 0), (-1, -1), 12),
-    ]))
-    
-    elements.append(info_table)
-    elements.append(Spacer(1, 30))
-    
-    # ========== LIGNES DE FACTURE ==========
-    section_style = ParagraphStyle(
-        'SectionTitle',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#1e293b'),
-        spaceAfter=15,
-    )
-    elements.append(Paragraph("Articles facturés", section_style))
-    
-    # Données du tableau
-    table_data = [['Description', 'Qté', 'Prix unit.', 'Total']]
-    
-    for ligne in lignes:
-        table_data.append([
-            ligne.produit.nom if ligne.produit else 'Produit supprimé',
-            str(ligne.quantite),
-            f"{ligne.prix_unitaire:,.0f} FCFA",
-            f"{(ligne.prix_unitaire * ligne.quantite):,.0f} FCFA",
-        ])
-    
-    # Ajouter les totaux
-    table_data.append(['', '', 'Sous-total HT:', f"{facture.sous_total:,.0f} FCFA" if facture.sous_total else '0 FCFA'])
-    if facture.montant_tva and facture.montant_tva > 0:
-        table_data.append(['', '', f'TVA ({taux_tva}%):', f"{facture.montant_tva:,.0f} FCFA"])
-    table_data.append(['', '', 'TOTAL TTC:', f"{total:,.0f} FCFA"])
-    table_data.append(['', '', 'Montant payé:', f"{paye:,.0f} FCFA"])
-    table_data.append(['', '', 'SOLDE:', f"{solde:,.0f} FCFA"])
-    
-    # Créer le tableau
-    table = Table(table_data, colWidths=[9*cm, 2*cm, 2.5*cm, 3*cm])
-    table.setStyle(TableStyle([
-        # En-tête
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        
-        # Contenu
-        ('BACKGROUND', (0, 1), (-1, -6), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -6), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -6), 0.5, colors.HexColor('#e2e8f0')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-        
-        # Lignes de totaux
-        ('BACKGROUND', (0, -5), (-1, -2), colors.HexColor('#f8fafc')),
-        ('FONTNAME', (2, -5), (-1, -1), 'Helvetica-Bold'),
-        ('ALIGN', (2, -5), (-1, -1), 'RIGHT'),
-        ('ALIGN', (3, -5), (-1, -1), 'RIGHT'),
-        
-        # Ligne total TTC
-        ('BACKGROUND', (0, -3), (-1, -3), colors.HexColor('#e0e7ff')),
-        ('TEXTCOLOR', (2, -3), (-1, -3), colors.HexColor('#6366f1')),
-        ('FONTSIZE', (2, -3), (-1, -3), 11),
-        
-        # Ligne solde final
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fef3c7') if solde > 0 else colors.HexColor('#dcfce7')),
-        ('TEXTCOLOR', (2, -1), (-1, -1), colors.HexColor('#f59e0b') if solde > 0 else colors.HexColor('#10b981')),
-        ('FONTSIZE', (2, -1), (-1, -1), 12),
-        
-        # Lignes alternées
-        ('ROWBACKGROUNDS', (0, 1), (-1, -6), [colors.white, colors.HexColor('#f8fafc')]),
-    ]))
-    
-    elements.append(table)
-    
-    # ========== REMARQUES (SUPPRIMÉ - CHAMP N'EXISTE PAS) ==========
-    # Anciennement: if facture.remarques: ...
-    # Maintenant: On ne fait rien car le champ n'existe pas
-    
-    # ========== FOOTER ==========
-    elements.append(Spacer(1, 40))
-    footer_style = ParagraphStyle(
-        'FooterStyle',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=1,
-    )
-    footer_text = Paragraph(
-        f"Document généré automatiquement - {getattr(settings, 'SITE_NAME', 'ERP MEA')}",
-        footer_style
-    )
-    elements.append(footer_text)
-    
-    # Construire le PDF
-    doc.build(elements)
-    
-    # Récupérer le PDF
-    pdf = buffer.getvalue()
-    buffer.close()
+    facture = get_object_or_404(Facture.objects.select_related('client', 'commande_vente'), pk=pk)
+    pdf = pdf_facture(facture)
     
     # Créer la réponse HTTP avec téléchargement direct
     response = HttpResponse(content_type='application/pdf')
@@ -1265,9 +941,9 @@ def telecharger_facture_pdf(request, pk):
 @login_required
 def envoyer_facture_email(request, pk):
     """
-    Envoyer la facture par email - VERSION FINALE SANS CHAMPS MANQUANTS
+    Envoyer la facture par email
     """
-    facture = get_object_or_404(Facture, pk=pk)
+    facture = get_object_or_404(Facture.objects.select_related('client', 'commande_vente'), pk=pk)
     
     if request.method == 'POST':
         # Vérifier que le client a un email
@@ -1278,93 +954,10 @@ def envoyer_facture_email(request, pk):
             return redirect('ventes:details_facture', pk=pk)
         
         try:
-            # Générer le PDF de la facture
-            lignes = facture.lignes.select_related('produit').all()
             total = facture.total if facture.total else 0
             paye = facture.montant_paye if facture.montant_paye else 0
             solde = total - paye
             
-            # Calculer le taux de TVA
-            taux_tva = 18
-            if facture.montant_tva and facture.sous_total and facture.sous_total > 0:
-                taux_tva = round((facture.montant_tva / facture.sous_total) * 100, 2)
-            
-            # Créer le buffer pour le PDF
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm, leftMargin=2*cm, rightMargin=2*cm)
-            
-            elements = []
-            styles = getSampleStyleSheet()
-            
-            # Titre
-            title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=28, 
-                                         textColor=colors.HexColor('#6366f1'), spaceAfter=30, alignment=1)
-            elements.append(Paragraph(f"FACTURE {facture.numero_facture}", title_style))
-            elements.append(Spacer(1, 20))
-            
-            # Informations
-            info_data = [
-                ['Client:', facture.client.nom],
-                ['Date facture:', facture.date_facture.strftime('%d/%m/%Y') if facture.date_facture else 
-                                 facture.date_creation.strftime('%d/%m/%Y') if facture.date_creation else '-'],
-                ['Date échéance:', facture.date_echeance.strftime('%d/%m/%Y') if facture.date_echeance else '-'],
-                ['Statut:', facture.get_statut_display()],
-            ]
-            
-            info_table = Table(info_data, colWidths=[4*cm, 12*cm])
-            info_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('PADDING', (0, 0), (-1, -1), 8),
-            ]))
-            elements.append(info_table)
-            elements.append(Spacer(1, 20))
-            
-            # Lignes de facture
-            table_data = [['Description', 'Quantité', 'Prix unitaire', 'Total']]
-            for ligne in lignes:
-                table_data.append([
-                    ligne.produit.nom if ligne.produit else '-',
-                    str(ligne.quantite),
-                    f"{ligne.prix_unitaire:,.0f} FCFA",
-                    f"{(ligne.prix_unitaire * ligne.quantite):,.0f} FCFA",
-                ])
-            
-            # Totaux
-            table_data.append(['', '', 'Sous-total HT:', f"{facture.sous_total:,.0f} FCFA" if facture.sous_total else '0 FCFA'])
-            if facture.montant_tva and facture.montant_tva > 0:
-                table_data.append(['', '', f'TVA ({taux_tva}%):', f"{facture.montant_tva:,.0f} FCFA"])
-            table_data.append(['', '', 'TOTAL TTC:', f"{total:,.0f} FCFA"])
-            table_data.append(['', '', 'Montant payé:', f"{paye:,.0f} FCFA"])
-            table_data.append(['', '', 'SOLDE:', f"{solde:,.0f} FCFA"])
-            
-            table = Table(table_data, colWidths=[8*cm, 2*cm, 3*cm, 3*cm])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -6), 0.5, colors.HexColor('#e2e8f0')),
-                ('BACKGROUND', (0, -5), (-1, -2), colors.HexColor('#f8fafc')),
-                ('BACKGROUND', (0, -3), (-1, -3), colors.HexColor('#e0e7ff')),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fef3c7') if solde > 0 else colors.HexColor('#dcfce7')),
-                ('FONTNAME', (2, -5), (-1, -1), 'Helvetica-Bold'),
-                ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-                ('ALIGN', (2, -5), (-1, -1), 'RIGHT'),
-                ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('PADDING', (0, 0), (-1, -1), 8),
-            ]))
-            elements.append(table)
-            
-            # REMARQUES SUPPRIMÉES - Le champ n'existe pas
-            # if facture.remarques: ...
-            
-            doc.build(elements)
-            pdf = buffer.getvalue()
-            buffer.close()
-            
             # Préparer l'email
             subject = f'Facture {facture.numero_facture} - {facture.client.nom}'
             
@@ -1416,26 +1009,20 @@ def envoyer_facture_email(request, pk):
             </html>
             """
             
-            # Créer l'email
-            email = EmailMessage(
-                subject=subject,
-                body=html_message,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@erp-mea.com'),
-                to=[facture.client.email],
+            # Mettre l'email en file d'envoi, le PDF est joint au moment de l'envoi
+            mettre_en_file(
+                sujet=subject,
+                corps=html_message,
+                destinataires=[facture.client.email],
+                est_html=True,
+                piece_jointe=('facture', facture.pk),
             )
-            email.content_subtype = 'html'
-            
-            # Attacher le PDF
-            email.attach(f'facture_{facture.numero_facture}.pdf', pdf, 'application/pdf')
-            
-            # Envoyer l'email
-            email.send()
             
             # Mettre à jour le statut
             facture.statut = 'ENVOYEE'
             facture.save()
             
-            messages.success(request, f'La facture a été envoyée par email à {facture.client.email}')
+            messages.success(request, f'La facture a été mise en file d\'envoi pour {facture.client.email}')
             
         except Exception as e:
             messages.error(request, f'Erreur lors de l\'envoi de l\'email: {str(e)}')
@@ -1447,557 +1034,80 @@ def envoyer_facture_email(request, pk):
         'facture': facture,
     }
     return render(request, 'ventes/envoyer_facture.jinja', contexte)
+
+# ========== EXPORT DES COMMANDES DE VENTE ==========
+
+COLONNES_EXPORT_COMMANDES = [
+    Colonne('N° Commande', 'numero_commande'),
+    Colonne('Client', 'client__nom', largeur=30),
+    Colonne('Date Commande', 'date_commande', format=format_date),
+    Colonne('Date Livraison', 'date_livraison', format=format_date),
+    Colonne('Statut', 'statut', format=format_choix(CommandeVente.STATUTS)),
+    Colonne('Entrepôt', 'entrepot__nom', largeur=20),
+    Colonne('Sous-total', 'sous_total', montant=True, total=True),
+    Colonne('TVA', 'montant_tva', montant=True, total=True),
+    Colonne('Total', 'total', montant=True, total=True),
+    Colonne('Créé par', 'cree_par__username'),
+]
+
+
+def filtrer_commandes_export(parametres):
+    """Commandes à exporter selon les paramètres de la liste (statut, recherche ou sélection)"""
+    filtre_statut = parametres.get('statut', '')
+    recherche = parametres.get('recherche', '')
+    ids = parametres.get('ids', '')
+    
+    commandes = CommandeVente.objects.all()
+    
+    # Si des IDs spécifiques sont fournis (sélection)
+    if ids:
+        liste_ids = [int(id) for id in ids.split(',') if id.isdigit()]
+        commandes = commandes.filter(id__in=liste_ids)
+    else:
+        # Sinon appliquer les filtres normaux
+        if filtre_statut:
+            commandes = commandes.filter(statut=filtre_statut)
+        
+        if recherche:
+            commandes = commandes.filter(
+                Q(numero_commande__icontains=recherche) |
+                Q(client__nom__icontains=recherche)
+            )
+    
+    return commandes.order_by('-date_creation')
+
+
+EXPORT_COMMANDES_VENTE = DefinitionExport(
+    "Commandes de Vente", 'commandes_vente', COLONNES_EXPORT_COMMANDES, filtrer_commandes_export
+)
+
+
+@login_required
+def exporter_commandes_vente(request):
     """
-    Envoyer la facture par email au client
+    Vue pour exporter les commandes de vente en Excel, CSV ou PDF
     """
-    facture = get_object_or_404(Facture, pk=pk)
-    
-    if request.method == 'POST':
-        # Vérifier que le client a un email
-        if not facture.client.email:
-            messages.warning(request, f'Le client {facture.client.nom} n\'a pas d\'adresse email. La facture a été marquée comme "Envoyée".')
-            facture.statut = 'ENVOYEE'
-            facture.save()
-            return redirect('ventes:details_facture', pk=pk)
-        
-        try:
-            # Générer le PDF de la facture
-            lignes = facture.lignes.select_related('produit').all()
-            total = facture.total if facture.total else 0
-            paye = facture.montant_paye if facture.montant_paye else 0
-            solde = total - paye
-            
-            # Calculer le taux de TVA
-            taux_tva = 18  # Taux par défaut
-            if facture.montant_tva and facture.sous_total and facture.sous_total > 0:
-                taux_tva = round((facture.montant_tva / facture.sous_total) * 100, 2)
-            
-            # Créer le buffer pour le PDF
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm, leftMargin=2*cm, rightMargin=2*cm)
-            
-            elements = []
-            styles = getSampleStyleSheet()
-            
-            # Titre
-            title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=28, 
-                                         textColor=colors.HexColor('#6366f1'), spaceAfter=30, alignment=1)
-            elements.append(Paragraph(f"FACTURE {facture.numero_facture}", title_style))
-            elements.append(Spacer(1, 20))
-            
-            # Informations
-            info_data = [
-                ['Client:', facture.client.nom],
-                ['Date facture:', facture.date_facture.strftime('%d/%m/%Y') if facture.date_facture else 
-                                 facture.date_creation.strftime('%d/%m/%Y') if facture.date_creation else '-'],
-                ['Date échéance:', facture.date_echeance.strftime('%d/%m/%Y') if facture.date_echeance else '-'],
-                ['Statut:', facture.get_statut_display()],
-            ]
-            
-            info_table = Table(info_data, colWidths=[4*cm, 12*cm])
-            info_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('PADDING', (0, 0), (-1, -1), 8),
-            ]))
-            elements.append(info_table)
-            elements.append(Spacer(1, 20))
-            
-            # Lignes de facture
-            table_data = [['Description', 'Quantité', 'Prix unitaire', 'Total']]
-            for ligne in lignes:
-                table_data.append([
-                    ligne.produit.nom if ligne.produit else '-',
-                    str(ligne.quantite),
-                    f"{ligne.prix_unitaire:,.0f} FCFA",
-                    f"{(ligne.prix_unitaire * ligne.quantite):,.0f} FCFA",
-                ])
-            
-            # Totaux
-            table_data.append(['', '', 'Sous-total HT:', f"{facture.sous_total:,.0f} FCFA" if facture.sous_total else '0 FCFA'])
-            if facture.montant_tva and facture.montant_tva > 0:
-                table_data.append(['', '', f'TVA ({taux_tva}%):', f"{facture.montant_tva:,.0f} FCFA"])
-            table_data.append(['', '', 'TOTAL TTC:', f"{total:,.0f} FCFA"])
-            table_data.append(['', '', 'Montant payé:', f"{paye:,.0f} FCFA"])
-            table_data.append(['', '', 'SOLDE:', f"{solde:,.0f} FCFA"])
-            
-            table = Table(table_data, colWidths=[8*cm, 2*cm, 3*cm, 3*cm])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -6), 0.5, colors.HexColor('#e2e8f0')),
-                ('BACKGROUND', (0, -5), (-1, -2), colors.HexColor('#f8fafc')),
-                ('BACKGROUND', (0, -3), (-1, -3), colors.HexColor('#e0e7ff')),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fef3c7') if solde > 0 else colors.HexColor('#dcfce7')),
-                ('FONTNAME', (2, -5), (-1, -1), 'Helvetica-Bold'),
-                ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-                ('ALIGN', (2, -5), (-1, -1), 'RIGHT'),
-                ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('PADDING', (0, 0), (-1, -1), 8),
-            ]))
-            elements.append(table)
-            
-            if facture.remarques:
-                elements.append(Spacer(1, 20))
-                elements.append(Paragraph(f"<b>Remarques:</b> {facture.remarques}", styles['Normal']))
-            
-            doc.build(elements)
-            pdf = buffer.getvalue()
-            buffer.close()
-            
-            # Préparer l'email
-            subject = f'Facture {facture.numero_facture} - {facture.client.nom}'
-            
-            # Corps de l'email en HTML
-            html_message = f"""
-            <html>
-            <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                    <h2 style="color: #6366f1; border-bottom: 2px solid #6366f1; padding-bottom: 10px;">
-                        Facture {facture.numero_facture}
-                    </h2>
-                    
-                    <p>Bonjour {facture.client.nom},</p>
-                    
-                    <p>Veuillez trouver ci-joint votre facture.</p>
-                    
-                    <div style="background: #f8fafc; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                        <table style="width: 100%;">
-                            <tr>
-                                <td style="padding: 5px;"><strong>Numéro de facture:</strong></td>
-                                <td style="padding: 5px;">{facture.numero_facture}</td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 5px;"><strong>Date:</strong></td>
-                                <td style="padding: 5px;">{facture.date_facture.strftime('%d/%m/%Y') if facture.date_facture else facture.date_creation.strftime('%d/%m/%Y') if facture.date_creation else '-'}</td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 5px;"><strong>Montant total:</strong></td>
-                                <td style="padding: 5px;"><strong style="color: #6366f1;">{total:,.0f} FCFA</strong></td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 5px;"><strong>Solde restant:</strong></td>
-                                <td style="padding: 5px;"><strong style="color: {'#f59e0b' if solde > 0 else '#10b981'};">{solde:,.0f} FCFA</strong></td>
-                            </tr>
-                        </table>
-                    </div>
-                    
-                    <p>Pour toute question, n'hésitez pas à nous contacter.</p>
-                    
-                    <p>Cordialement,<br>
-                    <strong>{getattr(settings, 'SITE_NAME', 'ERP MEA')}</strong></p>
-                    
-                    <hr style="margin: 30px 0; border: none; border-top: 1px solid #e2e8f0;">
-                    <p style="font-size: 12px; color: #64748b;">
-                        Cet email a été généré automatiquement. Merci de ne pas y répondre.
-                    </p>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Créer l'email
-            email = EmailMessage(
-                subject=subject,
-                body=html_message,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@erp-mea.com'),
-                to=[facture.client.email],
-            )
-            email.content_subtype = 'html'  # Email en HTML
-            
-            # Attacher le PDF
-            email.attach(f'facture_{facture.numero_facture}.pdf', pdf, 'application/pdf')
-            
-            # Envoyer l'email
-            email.send()
-            
-            # Mettre à jour le statut de la facture
-            facture.statut = 'ENVOYEE'
-            facture.save()
-            
-            messages.success(request, f'La facture a été envoyée par email à {facture.client.email}')
-            
-        except Exception as e:
-            messages.error(request, f'Erreur lors de l\'envoi de l\'email: {str(e)}')
-        
-        return redirect('ventes:details_facture', pk=pk)
-    
-    # GET - Afficher la page de confirmation
-    contexte = {
-        'facture': facture,
-    }
-    return render(request, 'ventes/envoyer_facture.jinja', contexte)
-
-    """
-    Envoyer la facture par email au client
-    """
-    facture = get_object_or_404(Facture, pk=pk)
-    
-    if request.method == 'POST':
-        # Vérifier que le client a un email
-        if not facture.client.email:
-            messages.warning(request, f'Le client {facture.client.nom} n\'a pas d\'adresse email. La facture a été marquée comme "Envoyée".')
-            facture.statut = 'ENVOYEE'
-            facture.save()
-            return redirect('ventes:details_facture', pk=pk)
-        
-        try:
-            # Générer le PDF de la facture
-            lignes = facture.lignes.select_related('produit').all()
-            total = facture.total if facture.total else 0
-            paye = facture.montant_paye if facture.montant_paye else 0
-            solde = total - paye
-            
-            # Créer le buffer pour le PDF
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm, leftMargin=2*cm, rightMargin=2*cm)
-            
-            elements = []
-            styles = getSampleStyleSheet()
-            
-            # Titre
-            title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=28, 
-                                         textColor=colors.HexColor('#6366f1'), spaceAfter=30, alignment=1)
-            elements.append(Paragraph(f"FACTURE {facture.numero_facture}", title_style))
-            elements.append(Spacer(1, 20))
-            
-            # Informations
-            info_data = [
-                ['Client:', facture.client.nom],
-                ['Date facture:', facture.date_facture.strftime('%d/%m/%Y') if facture.date_facture else 
-                                 facture.date_creation.strftime('%d/%m/%Y') if facture.date_creation else '-'],
-                ['Date échéance:', facture.date_echeance.strftime('%d/%m/%Y') if facture.date_echeance else '-'],
-                ['Statut:', facture.get_statut_display()],
-            ]
-            
-            info_table = Table(info_data, colWidths=[4*cm, 12*cm])
-            info_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('PADDING', (0, 0), (-1, -1), 8),
-            ]))
-            elements.append(info_table)
-            elements.append(Spacer(1, 20))
-            
-            # Lignes de facture
-            table_data = [['Description', 'Quantité', 'Prix unitaire', 'Total']]
-            for ligne in lignes:
-                table_data.append([
-                    ligne.produit.nom if ligne.produit else '-',
-                    str(ligne.quantite),
-                    f"{ligne.prix_unitaire:,.0f} FCFA",
-                    f"{(ligne.prix_unitaire * ligne.quantite):,.0f} FCFA",
-                ])
-            
-            table_data.append(['', '', 'TOTAL TTC:', f"{total:,.0f} FCFA"])
-            table_data.append(['', '', 'Montant payé:', f"{paye:,.0f} FCFA"])
-            table_data.append(['', '', 'SOLDE:', f"{solde:,.0f} FCFA"])
-            
-            table = Table(table_data, colWidths=[8*cm, 2*cm, 3*cm, 3*cm])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -4), 0.5, colors.HexColor('#e2e8f0')),
-                ('BACKGROUND', (0, -3), (-1, -3), colors.HexColor('#e0e7ff')),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fef3c7') if solde > 0 else colors.HexColor('#dcfce7')),
-                ('FONTNAME', (2, -3), (-1, -1), 'Helvetica-Bold'),
-                ('ALIGN', (2, -3), (-1, -1), 'RIGHT'),
-            ]))
-            elements.append(table)
-            
-            if facture.remarques:
-                elements.append(Spacer(1, 20))
-                elements.append(Paragraph(f"<b>Remarques:</b> {facture.remarques}", styles['Normal']))
-            
-            doc.build(elements)
-            pdf = buffer.getvalue()
-            buffer.close()
-            
-            # Préparer l'email
-            subject = f'Facture {facture.numero_facture} - {facture.client.nom}'
-            
-            # Corps de l'email en HTML
-            html_message = f"""
-            <html>
-            <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                    <h2 style="color: #6366f1; border-bottom: 2px solid #6366f1; padding-bottom: 10px;">
-                        Facture {facture.numero_facture}
-                    </h2>
-                    
-                    <p>Bonjour {facture.client.nom},</p>
-                    
-                    <p>Veuillez trouver ci-joint votre facture.</p>
-                    
-                    <div style="background: #f8fafc; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                        <table style="width: 100%;">
-                            <tr>
-                                <td style="padding: 5px;"><strong>Numéro de facture:</strong></td>
-                                <td style="padding: 5px;">{facture.numero_facture}</td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 5px;"><strong>Date:</strong></td>
-                                <td style="padding: 5px;">{facture.date_facture.strftime('%d/%m/%Y') if facture.date_facture else facture.date_creation.strftime('%d/%m/%Y') if facture.date_creation else '-'}</td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 5px;"><strong>Montant total:</strong></td>
-                                <td style="padding: 5px;"><strong style="color: #6366f1;">{total:,.0f} FCFA</strong></td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 5px;"><strong>Solde restant:</strong></td>
-                                <td style="padding: 5px;"><strong style="color: {'#f59e0b' if solde > 0 else '#10b981'};">{solde:,.0f} FCFA</strong></td>
-                            </tr>
-                        </table>
-                    </div>
-                    
-                    <p>Pour toute question, n'hésitez pas à nous contacter.</p>
-                    
-                    <p>Cordialement,<br>
-                    <strong>{getattr(settings, 'SITE_NAME', 'ERP MEA')}</strong></p>
-                    
-                    <hr style="margin: 30px 0; border: none; border-top: 1px solid #e2e8f0;">
-                    <p style="font-size: 12px; color: #64748b;">
-                        Cet email a été généré automatiquement. Merci de ne pas y répondre.
-                    </p>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Créer l'email
-            email = EmailMessage(
-                subject=subject,
-                body=html_message,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@erp-mea.com'),
-                to=[facture.client.email],
-            )
-            email.content_subtype = 'html'  # Email en HTML
-            
-            # Attacher le PDF
-            email.attach(f'facture_{facture.numero_facture}.pdf', pdf, 'application/pdf')
-            
-            # Envoyer l'email
-            email.send()
-            
-            # Mettre à jour le statut de la facture
-            facture.statut = 'ENVOYEE'
-            facture.save()
-            
-            messages.success(request, f'La facture a été envoyée par email à {facture.client.email}')
-            
-        except Exception as e:
-            messages.error(request, f'Erreur lors de l\'envoi de l\'email: {str(e)}')
-        
-        return redirect('ventes:details_facture', pk=pk)
-    
-    # GET - Afficher la page de confirmation
-    contexte = {
-        'facture': facture,
-    }
-    return render(request, 'ventes/envoyer_facture.jinja', contexte)
-
-# ========== FONCTION D'EXPORTATION POUR COMMANDES DE VENTE ==========
-
-import csv
-from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-
-@login_required
-def exporter_commandes_vente(request):
-    """
-    Vue pour exporter les commandes de vente en Excel, CSV ou PDF
-    """
-    format_export = request.GET.get('format', 'excel')
-    filtre_statut = request.GET.get('statut', '')
-    recherche = request.GET.get('recherche', '')
-    ids = request.GET.get('ids', '')
-    
-    # Filtrer les commandes
-    commandes = CommandeVente.objects.select_related('client', 'entrepot', 'cree_par')
-    
-    # Si des IDs spécifiques sont fournis (sélection)
-    if ids:
-        liste_ids = [int(id) for id in ids.split(',') if id.isdigit()]
-        commandes = commandes.filter(id__in=liste_ids)
-    else:
-        # Sinon appliquer les filtres normaux
-        if filtre_statut:
-            commandes = commandes.filter(statut=filtre_statut)
-        
-        if recherche:
-            commandes = commandes.filter(
-                Q(numero_commande__icontains=recherche) |
-                Q(client__nom__icontains=recherche)
-            )
-    
-    commandes = commandes.order_by('-date_creation')
+    format_export = request.GET.get('format', 'excel')
+    commandes = filtrer_commandes_export(request.GET)
+
+    # Gros volumes : le fichier est produit en arrière-plan (voir « Mes exports »)
+    if request.GET.get('arriere_plan') and format_export in ('excel', 'csv'):
+        return reponse_export_differe(request, 'commandes_vente')
     
     # Appeler la fonction appropriée selon le format
     if format_export == 'excel':
-        return exporter_commandes_excel(commandes)
+        return reponse_xlsx(
+            commandes, COLONNES_EXPORT_COMMANDES,
+            nom_fichier_horodate('commandes_vente', 'xlsx'), "Commandes de Vente"
+        )
     elif format_export == 'csv':
-        return exporter_commandes_csv(commandes)
+        return reponse_csv(commandes, COLONNES_EXPORT_COMMANDES, nom_fichier_horodate('commandes_vente', 'csv'))
     elif format_export == 'pdf':
-        return exporter_commandes_pdf(commandes)
+        return exporter_commandes_pdf(commandes.select_related('client'))
     else:
         return HttpResponse("Format non supporté", status=400)
 
 
-def exporter_commandes_excel(commandes):
-    """Exporter les commandes en format Excel"""
-    from datetime import datetime
-    
-    # Créer un workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Commandes de Vente"
-    
-    # Styles
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="6366F1", end_color="6366F1", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # En-têtes
-    headers = [
-        'N° Commande',
-        'Client',
-        'Date Commande',
-        'Date Livraison',
-        'Statut',
-        'Entrepôt',
-        'Sous-total',
-        'TVA',
-        'Total',
-        'Créé par'
-    ]
-    
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    # Données
-    for row_idx, commande in enumerate(commandes, start=2):
-        data_row = [
-            commande.numero_commande,
-            commande.client.nom,
-            commande.date_commande.strftime('%d/%m/%Y'),
-            commande.date_livraison.strftime('%d/%m/%Y') if commande.date_livraison else '',
-            commande.get_statut_display(),
-            commande.entrepot.nom if commande.entrepot else '',
-            float(commande.sous_total),
-            float(commande.montant_tva),
-            float(commande.total),
-            commande.cree_par.username if commande.cree_par else ''
-        ]
-        
-        for col_idx, value in enumerate(data_row, start=1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            cell.value = value
-            cell.border = border
-            
-            # Alignement pour les montants
-            if col_idx in [7, 8, 9]:
-                cell.alignment = Alignment(horizontal="right")
-                cell.number_format = '#,##0.00'
-    
-    # Ajuster la largeur des colonnes
-    column_widths = [15, 30, 15, 15, 15, 20, 15, 15, 15, 15]
-    for i, width in enumerate(column_widths, start=1):
-        ws.column_dimensions[chr(64 + i)].width = width
-    
-    # Ligne de total
-    total_row = len(commandes) + 2
-    ws.cell(row=total_row, column=6).value = "TOTAL:"
-    ws.cell(row=total_row, column=6).font = Font(bold=True)
-    ws.cell(row=total_row, column=7).value = sum(float(c.sous_total) for c in commandes)
-    ws.cell(row=total_row, column=7).font = Font(bold=True)
-    ws.cell(row=total_row, column=7).number_format = '#,##0.00'
-    ws.cell(row=total_row, column=8).value = sum(float(c.montant_tva) for c in commandes)
-    ws.cell(row=total_row, column=8).font = Font(bold=True)
-    ws.cell(row=total_row, column=8).number_format = '#,##0.00'
-    ws.cell(row=total_row, column=9).value = sum(float(c.total) for c in commandes)
-    ws.cell(row=total_row, column=9).font = Font(bold=True)
-    ws.cell(row=total_row, column=9).number_format = '#,##0.00'
-    
-    # Sauvegarder dans un buffer
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    # Préparer la réponse
-    response = HttpResponse(
-        buffer.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    filename = f"commandes_vente_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
-
-
-def exporter_commandes_csv(commandes):
-    """Exporter les commandes en format CSV"""
-    from datetime import datetime
-    
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    filename = f"commandes_vente_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    # Ajouter BOM UTF-8 pour Excel
-    response.write('\ufeff')
-    
-    writer = csv.writer(response, delimiter=';')
-    
-    # En-têtes
-    writer.writerow([
-        'N° Commande',
-        'Client',
-        'Date Commande',
-        'Date Livraison',
-        'Statut',
-        'Entrepôt',
-        'Sous-total',
-        'TVA',
-        'Total',
-        'Créé par'
-    ])
-    
-    # Données
-    for commande in commandes:
-        writer.writerow([
-            commande.numero_commande,
-            commande.client.nom,
-            commande.date_commande.strftime('%d/%m/%Y'),
-            commande.date_livraison.strftime('%d/%m/%Y') if commande.date_livraison else '',
-            commande.get_statut_display(),
-            commande.entrepot.nom if commande.entrepot else '',
-            f"{commande.sous_total:.2f}",
-            f"{commande.montant_tva:.2f}",
-            f"{commande.total:.2f}",
-            commande.cree_par.username if commande.cree_par else ''
-        ])
-    
-    return response
-
-
 def exporter_commandes_pdf(commandes):
     """Exporter les commandes en format PDF"""
     from datetime import datetime
@@ -2080,276 +1190,4 @@ def exporter_commandes_pdf(commandes):
     filename = f"commandes_vente_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     
-    return response# ========== FONCTION D'EXPORTATION POUR COMMANDES DE VENTE ==========
-
-@login_required
-def exporter_commandes_vente(request):
-    """
-    Vue pour exporter les commandes de vente en Excel, CSV ou PDF
-    """
-    format_export = request.GET.get('format', 'excel')
-    filtre_statut = request.GET.get('statut', '')
-    recherche = request.GET.get('recherche', '')
-    ids = request.GET.get('ids', '')
-    
-    # Filtrer les commandes
-    commandes = CommandeVente.objects.select_related('client', 'entrepot', 'cree_par')
-    
-    # Si des IDs spécifiques sont fournis (sélection)
-    if ids:
-        liste_ids = [int(id) for id in ids.split(',') if id.isdigit()]
-        commandes = commandes.filter(id__in=liste_ids)
-    else:
-        # Sinon appliquer les filtres normaux
-        if filtre_statut:
-            commandes = commandes.filter(statut=filtre_statut)
-        
-        if recherche:
-            commandes = commandes.filter(
-                Q(numero_commande__icontains=recherche) |
-                Q(client__nom__icontains=recherche)
-            )
-    
-    commandes = commandes.order_by('-date_creation')
-    
-    # Appeler la fonction appropriée selon le format
-    if format_export == 'excel':
-        return exporter_commandes_excel(commandes)
-    elif format_export == 'csv':
-        return exporter_commandes_csv(commandes)
-    elif format_export == 'pdf':
-        return exporter_commandes_pdf(commandes)
-    else:
-        return HttpResponse("Format non supporté", status=400)
-
-
-def exporter_commandes_excel(commandes):
-    """Exporter les commandes en format Excel"""
-    from datetime import datetime
-    
-    # Créer un workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Commandes de Vente"
-    
-    # Styles
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="6366F1", end_color="6366F1", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # En-têtes
-    headers = [
-        'N° Commande',
-        'Client',
-        'Date Commande',
-        'Date Livraison',
-        'Statut',
-        'Entrepôt',
-        'Sous-total',
-        'TVA',
-        'Total',
-        'Créé par'
-    ]
-    
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    # Données
-    for row_idx, commande in enumerate(commandes, start=2):
-        data_row = [
-            commande.numero_commande,
-            commande.client.nom,
-            commande.date_commande.strftime('%d/%m/%Y'),
-            commande.date_livraison.strftime('%d/%m/%Y') if commande.date_livraison else '',
-            commande.get_statut_display(),
-            commande.entrepot.nom if commande.entrepot else '',
-            float(commande.sous_total),
-            float(commande.montant_tva),
-            float(commande.total),
-            commande.cree_par.username if commande.cree_par else ''
-        ]
-        
-        for col_idx, value in enumerate(data_row, start=1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            cell.value = value
-            cell.border = border
-            
-            # Alignement pour les montants
-            if col_idx in [7, 8, 9]:
-                cell.alignment = Alignment(horizontal="right")
-                cell.number_format = '#,##0.00'
-    
-    # Ajuster la largeur des colonnes
-    column_widths = [15, 30, 15, 15, 15, 20, 15, 15, 15, 15]
-    for i, width in enumerate(column_widths, start=1):
-        ws.column_dimensions[chr(64 + i)].width = width
-    
-    # Ligne de total
-    total_row = len(commandes) + 2
-    ws.cell(row=total_row, column=6).value = "TOTAL:"
-    ws.cell(row=total_row, column=6).font = Font(bold=True)
-    ws.cell(row=total_row, column=7).value = sum(float(c.sous_total) for c in commandes)
-    ws.cell(row=total_row, column=7).font = Font(bold=True)
-    ws.cell(row=total_row, column=7).number_format = '#,##0.00'
-    ws.cell(row=total_row, column=8).value = sum(float(c.montant_tva) for c in commandes)
-    ws.cell(row=total_row, column=8).font = Font(bold=True)
-    ws.cell(row=total_row, column=8).number_format = '#,##0.00'
-    ws.cell(row=total_row, column=9).value = sum(float(c.total) for c in commandes)
-    ws.cell(row=total_row, column=9).font = Font(bold=True)
-    ws.cell(row=total_row, column=9).number_format = '#,##0.00'
-    
-    # Sauvegarder dans un buffer
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    # Préparer la réponse
-    response = HttpResponse(
-        buffer.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    filename = f"commandes_vente_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
-
-
-def exporter_commandes_csv(commandes):
-    """Exporter les commandes en format CSV"""
-    from datetime import datetime
-    
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    filename = f"commandes_vente_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    # Ajouter BOM UTF-8 pour Excel
-    response.write('\ufeff')
-    
-    writer = csv.writer(response, delimiter=';')
-    
-    # En-têtes
-    writer.writerow([
-        'N° Commande',
-        'Client',
-        'Date Commande',
-        'Date Livraison',
-        'Statut',
-        'Entrepôt',
-        'Sous-total',
-        'TVA',
-        'Total',
-        'Créé par'
-    ])
-    
-    # Données
-    for commande in commandes:
-        writer.writerow([
-            commande.numero_commande,
-            commande.client.nom,
-            commande.date_commande.strftime('%d/%m/%Y'),
-            commande.date_livraison.strftime('%d/%m/%Y') if commande.date_livraison else '',
-            commande.get_statut_display(),
-            commande.entrepot.nom if commande.entrepot else '',
-            f"{commande.sous_total:.2f}",
-            f"{commande.montant_tva:.2f}",
-            f"{commande.total:.2f}",
-            commande.cree_par.username if commande.cree_par else ''
-        ])
-    
     return response
-
-
-def exporter_commandes_pdf(commandes):
-    """Exporter les commandes en format PDF"""
-    from datetime import datetime
-    
-    buffer = BytesIO()
-    
-    # Créer le document PDF en paysage
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=unescape(A4),
-        rightMargin=1*cm,
-        leftMargin=1*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
-    )
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Titre
-    title_style = styles['Heading1']
-    title_style.alignment = 1  # Centré
-    title = Paragraph(f"Liste des Commandes de Vente - {datetime.now().strftime('%d/%m/%Y')}", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Préparer les données du tableau
-    data = [['N° Commande', 'Client', 'Date Commande', 'Date Livraison', 'Statut', 'Total']]
-    
-    for commande in commandes:
-        data.append([
-            commande.numero_commande,
-            commande.client.nom[:25],  # Tronquer si trop long
-            commande.date_commande.strftime('%d/%m/%Y'),
-            commande.date_livraison.strftime('%d/%m/%Y') if commande.date_livraison else '',
-            commande.get_statut_display(),
-            f"{commande.total:,.0f} FCFA"
-        ])
-    
-    # Ajouter ligne de total
-    total_general = sum(c.total for c in commandes)
-    data.append(['', '', '', '', 'TOTAL:', f"{total_general:,.0f} FCFA"])
-    
-    # Créer le tableau
-    table = Table(data, colWidths=[4*cm, 5*cm, 3*cm, 3*cm, 3*cm, 3.5*cm])
-    
-    # Style du tableau
-    table.setStyle(TableStyle([
-        # En-tête
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366F1')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        
-        # Corps du tableau
-        ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
-        
-        # Ligne de total
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#E5E7EB')),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 10),
-        ('ALIGN', (5, -1), (5, -1), 'RIGHT'),
-    ]))
-    
-    elements.append(table)
-    
-    # Construire le PDF
-    doc.build(elements)
-    
-    # Préparer la réponse
-    buffer.seek(0)
-    response = HttpResponse(buffer.read(), content_type='application/pdf')
-    filename = f"commandes_vente_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
\ No newline at end of file